@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Benchmark nerdle/bundle.py against json on each game's output files: size on disk and time to read.
+
+Workloads (one per game, from the files in [game]/output/):
+    - crossnerdle: questions and answers files (grids of one character strings, solveLists)
+    - nanagrams: the puzzle files of every length (answers as json text inside the json)
+    - shuffleNumbers / shuffleWords: _A, _Q and move files
+    - targets: calculations, questions and solutions files
+
+For each workload:
+    - json / bundle / zlib: bytes of the files as they are (json as json.dump writes it, as the creator scripts do)
+    - loads / decode / decodeZlib: best time to read all the files with their puzzles repeated --copies times (as a
+      stand in for a large batch; not used for sizes, as zlib would just find the repeats)
+Every bundle is checked to decode to exactly the json value (and to dump to exactly the json text) before timing.
+
+Usage (from the repository root):
+    python benchmarks/bench_bundle.py
+    python benchmarks/bench_bundle.py --copies 5000 --repeat 5
+
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+#shared nerdle modules live in the repository root
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from nerdle import bundle
+
+GAMES = {
+    'crossnerdle': 'crossnerdle/output/*.json',
+    'nanagrams': 'nanagrams/output/*.json',
+    'shuffleNumbers': 'shuffleNumbers/output/*.json',
+    'shuffleWords': 'shuffleWords/output/*.json',
+    'targets': 'targets/output/*.json',
+}
+
+
+def workload(pattern, copies):
+    #{file name: json value with its puzzles repeated}
+    files = {}
+    for path in sorted(glob.glob(os.path.join(ROOT, pattern))):
+        with open(path) as f:
+            value = json.load(f)
+        files[os.path.basename(path)] = value*copies if isinstance(value, list) else value
+    return(files)
+
+
+def best(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times += [time.perf_counter()-start]
+    return(min(times))
+
+
+def firstDifference(files, decoded):
+    #the first file and puzzle that does not come back the same (as json, so key order counts)
+    for name, value in files.items():
+        if name not in decoded:
+            return(name+" missing")
+        back = decoded[name]
+        if json.dumps(back)==json.dumps(value):
+            continue
+        if isinstance(value, list) and isinstance(back, list):
+            for i, (a, b) in enumerate(zip(value, back)):
+                if json.dumps(a)!=json.dumps(b):
+                    return(name+" #"+str(i)+" "+json.dumps(a)+" decoded as "+json.dumps(b))
+            return(name+" has %d puzzles, decoded %d" % (len(value), len(back)))
+        return(name+" decoded as "+json.dumps(back)[:200])
+    return("extra files "+", ".join([name for name in decoded if name not in files]))
+
+
+def benchmark(copies=300, repeat=3):
+    results = {}
+    for game, pattern in GAMES.items():
+        row = {}
+        for n in [1, copies]:
+            files = workload(pattern, n)
+            if not files:
+                break
+            texts = [json.dumps(value) for value in files.values()]
+            raw = bundle.encode(files, compress=False)
+            packed = bundle.encode(files)
+            for data in [raw, packed]:
+                decoded = bundle.decode(data)
+                if decoded!=files or [json.dumps(value) for value in decoded.values()]!=texts:
+                    raise SystemExit("MISMATCH "+game+": "+firstDifference(files, decoded))
+            if n==1:
+                row = {'json': sum([len(text.encode('utf-8')) for text in texts]), 'bundle': len(raw), 'zlib': len(packed)}
+        if not row:
+            continue
+        results[game] = dict(row, **{
+            'loads': best(lambda: [json.loads(text) for text in texts], repeat),
+            'decode': best(lambda: bundle.decode(raw), repeat),
+            'decodeZlib': best(lambda: bundle.decode(packed), repeat),
+        })
+    return(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark nerdle.bundle against json")
+    parser.add_argument('--copies', type=int, default=300, help="times each file's puzzles are repeated")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results = benchmark(args.copies, args.repeat)
+    print("kilobytes of the output files, milliseconds to read "+str(args.copies)+" copies (best of "+str(args.repeat)+")")
+    labels = ['json', 'bundle', 'zlib', 'loads', 'decode', 'decodeZlib']
+    print("game".ljust(16)+"".join(label.rjust(12) for label in labels+['size', 'speedup']))
+    for game, row in results.items():
+        print(game.ljust(16)+"".join(str(round(row[label]/1e3, 2)).rjust(12) for label in labels[:3])
+              +"".join(str(round(row[label]*1e3, 1)).rjust(12) for label in labels[3:])
+              +(str(round(row['json']/row['zlib'], 1))+"x").rjust(12)+(str(round(row['loads']/row['decode'], 1))+"x").rjust(12))
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Benchmark nerdle/evaluator.py against python eval() on the calculations each generator evaluates.
+
+Workloads:
+    - words: left hand sides of the length 8 word list (crossnerdle re-check)
+    - shuffle: nsnsn calculations with numbers 1-50 (shuffleCreator permutations)
+    - targets: bracketed calculations built from a 6 number keyboard (targets minCalc / minCalcOrdered)
+
+For each workload the time per calculation is reported for:
+    - eval: python eval()
+    - exact / float: evaluator with an empty cache (every calculation is parsed)
+    - cached: evaluator again on the same calculations (memoised results)
+
+Results are checked against eval before timing (float mode must be identical, exact mode within rounding).
+
+Usage (from the repository root):
+    python benchmarks/bench_evaluator.py
+    python benchmarks/bench_evaluator.py --n 50000 --repeat 5
+
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import evaluator, lexicon
+
+
+def wordsWorkload(n, rng):
+    words = lexicon.loadWords(8)
+    return([w.split('=')[0] for w in rng.sample(words, min(n, len(words)))])
+
+
+def shuffleWorkload(n, rng):
+    numbers = [str(x+1) for x in range(50)]
+    return(["".join([rng.choice(numbers), rng.choice('+-*/'), rng.choice(numbers), rng.choice('+-*/'), rng.choice(numbers)]) for _ in range(n)])
+
+
+def targetsWorkload(n, rng):
+    keyboard = [str(x) for x in rng.sample(range(1, 13), 5)]+['75']
+    shapes = ["({0}{s0}{1}){s1}{2}", "({0}{s0}{1}){s1}({2}{s2}{3})", "({0}{s0}{1}){s1}({2}{s2}{3}){s3}{4}", "{0}{s0}({1}{s1}{2}){s2}{3}"]
+    calcs = []
+    for _ in range(n):
+        numbers = rng.sample(keyboard, 5)
+        symbols = dict(('s'+str(i), rng.choice('+-*/')) for i in range(4))
+        calcs += [rng.choice(shapes).format(*numbers, **symbols)]
+    return(calcs)
+
+
+def timeIt(function, calcs, repeat):
+    #best of repeat runs, seconds per calculation
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(calcs)
+        elapsed = time.perf_counter()-start
+        best = elapsed if best is None else min(best, elapsed)
+    return(best/len(calcs))
+
+
+def evalAll(calcs):
+    out = []
+    for c in calcs:
+        try:
+            out += [eval(c)]
+        except ZeroDivisionError:
+            out += [None]
+    return(out)
+
+
+def check(calcs):
+    expected = evalAll(calcs)
+    exact = evaluator.evaluateMany(calcs, errors=None)
+    approx = evaluator.evaluateMany(calcs, exact=False, errors=None)
+    #a disagreement fails the run (exit status 1), before anything is timed
+    for c, e, x, f in zip(calcs, expected, exact, approx):
+        if (e is None) != (x is None) or (e is None) != (f is None):
+            raise SystemExit("MISMATCH %s: division by zero in eval() %s, exact %s, float %s" % (c, e is None, x is None, f is None))
+        if f != e:
+            raise SystemExit("MISMATCH %s: eval() %r, exact %r, float %r (float should equal eval())" % (c, e, x, f))
+        if e is not None and abs(float(x)-e) > 1e-9*max(1, abs(e)):
+            raise SystemExit("MISMATCH %s: eval() %r, exact %r, float %r (exact not within rounding of eval())" % (c, e, x, f))
+
+
+def benchmark(n=20000, repeat=3, seed=0):
+    rng = random.Random(seed)
+    workloads = {'words': wordsWorkload(n, rng), 'shuffle': shuffleWorkload(n, rng), 'targets': targetsWorkload(n, rng)}
+    results = {}
+    for name, calcs in workloads.items():
+        check(calcs)
+        row = {'eval': timeIt(evalAll, calcs, repeat)}
+        for label, exact in [('exact', True), ('float', False)]:
+            best = None
+            for _ in range(repeat):
+                evaluator.clearCache()
+                t = timeIt(lambda c: evaluator.evaluateMany(c, exact=exact, errors=None), calcs, 1)
+                best = t if best is None else min(best, t)
+            row[label] = best
+        row['cached'] = timeIt(lambda c: evaluator.evaluateMany(c, errors=None), calcs, repeat)
+        results[name] = row
+    return(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmark nerdle.evaluator against eval()")
+    parser.add_argument('--n', type=int, default=20000, help="calculations per workload")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = benchmark(args.n, args.repeat, args.seed)
+    print("microseconds per calculation ("+str(args.n)+" calculations, best of "+str(args.repeat)+")")
+    print("workload".ljust(10)+"".join(label.rjust(10) for label in ['eval', 'exact', 'float', 'cached', 'speedup']))
+    for name, row in results.items():
+        print(name.ljust(10)+"".join(str(round(row[label]*1e6, 2)).rjust(10) for label in ['eval', 'exact', 'float', 'cached'])+(str(round(row['eval']/row['exact'], 1))+"x").rjust(10))
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Seeded benchmarks of every generator and of its hot functions, with a history of results and a regression check.
+
+Benchmarks:
+    - games: puzzles made one at a time with their seeded puzzle function (see nerdle/seeding.py and GAMES), so the
+      same puzzles are made on every run.  Data is loaded (see nerdle/batch.py WARM) before timing starts.
+      Reported: puzzles per second and p50 / p95 seconds per puzzle
+    - functions: the functions the creator scripts spend their time in (see FUNCTIONS), each called on a fixed set of
+      inputs made from a seeded random.Random and the repository's own puzzles.  Reported: seconds per call (best of
+      repeat runs over all inputs)
+
+History:
+    - each run is appended to benchmarks/history.json (one record per run: time, git commit, machine, python, results)
+    - the baseline for a benchmark is the median of its last --baseline runs on the same machine and python version
+      (with the same number of puzzles / inputs).  A benchmark more than --threshold slower than its baseline is a
+      regression, and the run exits with status 1 (so it can fail a CI job or a pre-merge check)
+
+Usage (from the repository root):
+    python benchmarks/bench_generators.py
+    python benchmarks/bench_generators.py --only nanagrams6 commutativeCheckSpecial --repeat 5
+    python benchmarks/bench_generators.py --threshold 0.1 --no-save      #check against history without adding to it
+
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import batch, games, lexicon, metrics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY = os.path.join(HERE, 'history.json')
+
+#game benchmarks: name -> (batch job, puzzles made)
+#targets takes minutes per puzzle, so only one is made
+GAMES = {
+    'nanagrams6': ({'game': 'nanagrams', 'length': 6}, 10),
+    'nanagrams9': ({'game': 'nanagrams', 'length': 9}, 5),
+    'crossnerdle1': ({'game': 'crossnerdle1'}, 3),
+    'crossnerdle2': ({'game': 'crossnerdle2'}, 5),
+    'targets': ({'game': 'targets'}, 1),
+    'shuffleNumbers-shuffle': ({'game': 'shuffleNumbers', 'mode': 'shuffle'}, 5),
+    'shuffleNumbers-swapBoth': ({'game': 'shuffleNumbers', 'mode': 'swapBoth'}, 5),
+    'shuffleWords': ({'game': 'shuffleWords'}, 3),
+}
+
+
+def nanagramPairs(rng, n=4, length=7):
+    #(a, b) answer pairs as compared by createPuzzle, for n questions
+    nanagrams = games.load('nanagrams')
+    questionWords, questionIds = nanagrams.questionCandidates(length, nanagrams.levelSettings(length)['maxDoubles'])
+    pairs = []
+    for _ in range(n):
+        question = [x for x in lexicon.toStrings(questionWords[[rng.choice(questionIds)]])[0] if x!='=']
+        answers = []
+        for answerLength in [x for x in [3,5,6,7] if x<=length]:
+            index = nanagrams.answerIndex(answerLength)
+            answers += index.words(index.within(question))
+        pairs += [(a, b) for a in answers for b in answers if a!=b]
+    return(pairs)
+
+
+def crossnerdleAnswers():
+    crossnerdle2 = games.load('crossnerdle2')
+    return(crossnerdle2.loadAnswers())
+
+
+def blanked(word, rng, blanks):
+    #word with blanks random cells replaced by '_'
+    word = list(word)
+    for i in rng.sample(range(len(word)), min(blanks, len(word))):
+        word[i] = '_'
+    return(word)
+
+
+def patternMatchCalls(rng, n=2000):
+    crossnerdle1 = games.load('crossnerdle1')
+    words = []
+    for puzzle in crossnerdleAnswers()[:20]:
+        _, _, acrossList, downList = crossnerdle1.findWords(["".join(row) for row in puzzle])
+        words += [w['patternIn'] for w in acrossList+downList if crossnerdle1.hasWordList(w['patternIn'])]
+    return([(blanked(w, rng, rng.randint(1, len(w)-1)),) for w in rng.choices(words, k=n)], {'rng': rng})
+
+
+def findPosQuickCalls(rng, n=2000):
+    crossnerdle2 = games.load('crossnerdle2')
+    calls = []
+    for puzzle in crossnerdleAnswers()[:20]:
+        template = np.array(puzzle)
+        across, down = crossnerdle2.findWords(template)
+        for row, (start, end) in across:
+            word = list(template[row, start:end+1])
+            if len(word)<=9:
+                calls += [(word, blanked(word, rng, 1))]
+    return(rng.choices(calls, k=n), {})
+
+
+def findPosCalls(rng, n=5):
+    #full solve of questions with cells removed (as at the end of gen)
+    crossnerdle2 = games.load('crossnerdle2')
+    calls = []
+    for puzzle in rng.sample(crossnerdleAnswers(), n):
+        template = np.array(puzzle)
+        across, down = crossnerdle2.findWords(template)
+        question, _, _ = crossnerdle2.gen(template, across, down, rng)
+        calls += [(question, across, down)]
+    return(calls, {})
+
+
+def targetsCalculations(rng, n=5):
+    #bracketed calculations of 2-6 keyboard numbers, as checked by createPuzzle
+    targets = games.load('targets')
+    calcs = []
+    for _ in range(n):
+        numbers = rng.sample(targets.numberListBottom, targets.nFromBottom)+rng.choices(targets.numberListTop, k=targets.nFromTop)
+        calc = ''
+        for j, group in enumerate(rng.choice(targets.nGroupsInAnswer)):
+            selected = [str(x) for x in rng.sample(numbers, group)]
+            calc += (selected[0] if group==1 else "("+selected[0]+rng.choice(targets.symbols)+selected[1]+")")
+            calc += rng.choice(targets.symbols)
+        calcs += [(calc[:-1],)]
+    return(calcs, {})
+
+
+def disallowedCalls(rng, n=3, size=4):
+    targets = games.load('targets')
+    calls = []
+    for _ in range(n):
+        question = rng.sample(targets.numberListBottom, targets.nFromBottom)+rng.choices(targets.numberListTop, k=targets.nFromTop)
+        calls += [(sorted(question), size)]
+    return(calls, {})
+
+
+def minSwapCalls(rng, n=4):
+    shuffleNumbers = games.load('shuffleNumbers')
+    calls = []
+    for i in range(n):
+        puzzle = shuffleNumbers.seededPuzzle(i, 'bench', 'swapBoth')
+        calls += [(puzzle['answer'], puzzle['question'])]
+    return(calls, {'rng': rng})
+
+
+def under5Calls(rng, n=2):
+    shuffleWords = games.load('shuffleWords')
+    calls = []
+    for grid in rng.sample(shuffleWords.loadAnswers(), n):
+        calls += [(grid, shuffleWords.unShuffle(grid, 6, rng=rng)[0])]
+    return(calls, {})
+
+
+def allGamesCalls(rng, n=5, words=300):
+    #magic squares starting from a few words, searching a word list made from the known squares' rows
+    import pandas as pd
+    shuffleWords = games.load('shuffleWords')
+    rows = sorted(set(["".join(row) for grid in shuffleWords.loadAnswers() for row in grid]))
+    perms = pd.DataFrame({'words': rng.sample(rows, min(words, len(rows)))})
+    return([(perms, 9999, i, i+1) for i in range(n)], {})
+
+
+#function benchmarks: name -> (game, function name, inputs function(rng) -> (list of args, keyword args))
+FUNCTIONS = {
+    'commutativeCheckSpecial': ('nanagrams', 'commutativeCheckSpecial', lambda rng: (nanagramPairs(rng), {})),
+    'checkRearrangement': ('nanagrams', 'checkRearrangement', lambda rng: (nanagramPairs(rng), {})),
+    'patternMatch': ('crossnerdle1', 'patternMatch', patternMatchCalls),
+    'find_pos_quick': ('crossnerdle2', 'find_pos_quick', findPosQuickCalls),
+    'find_pos': ('crossnerdle2', 'find_pos', findPosCalls),
+    'minCalcOrdered': ('targets', 'minCalcOrdered', targetsCalculations),
+    'createDisallowed': ('targets', 'createDisallowed', disallowedCalls),
+    'findSolutionMinSwap': ('shuffleNumbers', 'findSolutionMinSwap', minSwapCalls),
+    'findSolutionAnyUnder5': ('shuffleWords', 'findSolutionAnyUnder5', under5Calls),
+    'create_all_games': ('shuffleWords', 'create_all_games', allGamesCalls),
+}
+
+
+def benchGame(job, count, batchId):
+    #-> {'puzzles', 'seconds', 'puzzlesPerSecond', 'p50', 'p95'} for making count puzzles of a job
+    module = games.load(job['game'])
+    if job['game'] in batch.WARM:
+        batch.WARM[job['game']](module, job)
+    _, puzzle = batch.SEEDED[job['game']](module, job)
+    latencies = []
+    for index in range(count):
+        start = time.perf_counter()
+        puzzle(index, batchId)
+        latencies += [time.perf_counter()-start]
+    seconds = sum(latencies)
+    return({'puzzles': count, 'seconds': round(seconds, 6), 'puzzlesPerSecond': round(count/seconds, 6),
+            'p50': round(float(np.percentile(latencies, 50)), 6), 'p95': round(float(np.percentile(latencies, 95)), 6)})
+
+
+def benchFunction(game, name, inputs, seed, repeat):
+    #-> {'calls', 'perCall'}: best of repeat runs over every input, seconds per call
+    function = getattr(games.load(game), name)
+    calls, kwargs = inputs(random.Random(seed))
+    best = None
+    for _ in range(repeat):
+        #functions that change their arguments (eg find_pos) get a fresh copy each run
+        args = [[a.copy() if hasattr(a, 'copy') else a for a in call] for call in calls]
+        start = time.perf_counter()
+        for a in args:
+            function(*a, **kwargs)
+        elapsed = time.perf_counter()-start
+        best = elapsed if best is None else min(best, elapsed)
+    return({'calls': len(calls), 'perCall': round(best/len(calls), 9)})
+
+
+def benchmark(only=None, seed=0, repeat=3):
+    #-> {'games': {name: ...}, 'functions': {name: ...}} for the benchmarks named in only (default all)
+    batchId = 'bench-'+str(seed)
+    results = {'games': {}, 'functions': {}}
+    for name, (job, count) in GAMES.items():
+        if only is None or name in only:
+            print("game", name, end=" ", flush=True)
+            results['games'][name] = benchGame(job, count, batchId)
+            print(results['games'][name], flush=True)
+    for name, (game, function, inputs) in FUNCTIONS.items():
+        if only is None or name in only:
+            print("function", name, end=" ", flush=True)
+            results['functions'][name] = benchFunction(game, function, inputs, seed, repeat)
+            print(results['functions'][name], flush=True)
+    return(results)
+
+
+def gitCommit():
+    try:
+        return(subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE, capture_output=True, text=True).stdout.strip() or None)
+    except OSError:
+        return(None)
+
+
+def machine():
+    return({'node': platform.node(), 'machine': platform.machine(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'python': platform.python_version()})
+
+
+def loadHistory(path=HISTORY):
+    if not os.path.exists(path):
+        return([])
+    with open(path) as f:
+        return(json.load(f))
+
+
+def saveHistory(history, path=HISTORY):
+    with open(path, 'w') as f:
+        json.dump(history, f, indent=1)
+
+
+def timings(results):
+    #benchmark -> (size, seconds) compared between runs: mean seconds per puzzle, or seconds per call
+    out = {}
+    for name, r in results.get('games', {}).items():
+        out['game '+name] = (r['puzzles'], r['seconds']/r['puzzles'])
+    for name, r in results.get('functions', {}).items():
+        out['function '+name] = (r['calls'], r['perCall'])
+    return(out)
+
+
+def regressions(results, history, threshold=0.2, baseline=5):
+    #-> list of (benchmark, seconds, baseline seconds, slowdown) more than threshold slower than the median of the
+    #last baseline runs on this machine (see History)
+    here = machine()
+    previous = [timings(run['results']) for run in history if run.get('machine')==here]
+    found = []
+    for name, (size, seconds) in timings(results).items():
+        past = [t[name][1] for t in previous if name in t and t[name][0]==size][-baseline:]
+        if past:
+            median = statistics.median(past)
+            slowdown = seconds/median-1
+            print("%-40s %12.6f  baseline %12.6f (%d runs)  %+6.1f%%" % (name, seconds, median, len(past), slowdown*100))
+            if slowdown>threshold:
+                found += [(name, seconds, median, slowdown)]
+    return(found)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="seeded benchmarks of the nerdle generators and their hot functions")
+    parser.add_argument('--only', nargs='+', default=None, help="benchmark names (see GAMES and FUNCTIONS), default all")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help="runs per function benchmark (best is kept)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="fail if a benchmark is this much slower than its baseline (0.2 = 20%%)")
+    parser.add_argument('--baseline', type=int, default=5, help="runs in the history the baseline is the median of")
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--no-save', action='store_true', help="do not add this run to the history")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.only or [] if name not in GAMES and name not in FUNCTIONS]
+    if unknown:
+        raise SystemExit("unknown benchmark "+", ".join(unknown)+", choose from: "+", ".join(list(GAMES)+list(FUNCTIONS)))
+
+    #the generators' progress output would be timed too
+    metrics.configure(enabled=False, verbosity=0)
+    results = benchmark(args.only, args.seed, args.repeat)
+
+    history = loadHistory(args.history)
+    print()
+    found = regressions(results, history, args.threshold, args.baseline)
+    if not args.no_save:
+        history += [{'time': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': gitCommit(), 'machine': machine(),
+                     'seed': args.seed, 'repeat': args.repeat, 'results': results}]
+        saveHistory(history, args.history)
+        print("saved to", args.history)
+    if found:
+        for name, seconds, median, slowdown in found:
+            print("REGRESSION %s: %.6fs vs baseline %.6fs (%+.1f%%)" % (name, seconds, median, slowdown*100))
+        raise SystemExit(1)
@@ -3,8 +3,8 @@
 @author: richard mann, nerdle
 
 File inputs:
-    - Word lists: exhaustive lists of valid calculations of length 3 to 9
-    - Blank crossword patterns [filestem].txt (with maximum calc length being 9)
+    - Word lists: exhaustive lists of valid calculations of length 3 to 9 (10 to 12 are generated by nerdle/enumerator.py on first use)
+    - Blank crossword patterns [filestem].txt (with maximum calc length being 12)
     - Blank crossword pattern specification:
         X = black square (cannot be used)
         _ = white square (to be filled)
@@ -20,12 +20,24 @@ File output:
     - Completed crossnerdle puzzles with no missing squares
     - n puzzles per pattern generated - see setting params
     - saved to [filestem]_answers.json - see setting params
+
+Usage:
+    - script: set params below and run from this folder
+    - library (nothing runs on import; word lists and indexes are loaded once per process and reused by later calls,
+      and each pattern's possible words are kept in the artifact cache, see nerdle/cache.py):
+        from crossnerdle import crossnerd_generator_1_answer as answers
+        puzzles = answers.fillPattern(["_____X_", ...], count=5, seed=1)
+        puzzles = answers.generate(answers.loadPatterns(), countPerPattern=1, seed=1)
+        puzzles = answers.generate(answers.loadPatterns(), countPerPattern=1, batchId='2024-06')  #puzzle i seeded on its own (see nerdle/seeding.py)
+        answers.savePuzzles(puzzles)
+        #no repeats of grids published before (see nerdle/dedupe.py)
+        published = dedupe.loadIndex('crossnerdle1')
+        puzzles = answers.generate(answers.loadPatterns(), countPerPattern=1, seed=1, seen=published)
+        published.addAll([answers.duplicateKey(p) for p in puzzles])
     
 """
 
 import random
-import pandas as pd
-import cv2
 import numpy as np
 import os
 import datetime
@@ -33,9 +45,16 @@ import itertools
 import ast
 import json  
 import sys
-import pandas
 
-# setting params
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import cache, dedupe, enumerator, evaluator, lexicon, memory, metrics, patternindex, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#folder holding this script (input / output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# setting params (defaults for generate)
 
 #fileStem specifes .txt file to read in for puzzles and is retained as prefix for output file
 fileStem = 'patterns7x7_to_10x10-x4'
@@ -44,78 +63,58 @@ targetPerPattern=1
 
 
 
-# read in exhaustive word lists
-#note: these files do not include words with leading zeros even though we check that puzzles cannot be solved with leading zeros in question generator to avoid confusion
-words9 = pandas.read_csv('input/nerdlewords9.txt', header=None, names=['word'])
-words9 = words9[words9.word.apply(lambda x: x[4]!="=")] #remove words such as 1234=1234
-words8 = pandas.read_csv('input/nerdlewords8.txt', header=None, names=['word'])
-words7 = pandas.read_csv('input/nerdlewords7.txt', header=None, names=['word'])
-words6 = pandas.read_csv('input/nerdlewords6.txt', header=None, names=['word'])
-words5 = pandas.read_csv('input/nerdlewords5.txt', header=None, names=['word'])
-words3 = pd.DataFrame(['1=1','2=2','3=3','4=4','5=5','6=6','7=7','8=8','9=9'], columns=['word'])  #intentionally omits 0=0 as this breaks the leading zero rule
-
-def patternMatch(toMatch,returnAll=False, impossibles=[]):
-    if len(toMatch)>9 or len(toMatch) in [2,4]:
+# exhaustive word lists, read in the first time a pattern of that length is matched
+wordsByLength = {}
+#positional indexes of them (cleared when over a memory budget, see nerdle/memory.py)
+patternIndexes = {}
+memory.register('pattern indexes', patternIndexes.clear)
+
+def wordList(length):
+    #note: these files do not include words with leading zeros even though we check that puzzles cannot be solved with leading zeros in question generator to avoid confusion
+    #word lists are compiled uint8 arrays (one row per word, see nerdle/lexicon.py), opened as read-only memmaps
+    #long calculations (10+) are generated the first time a pattern needs them
+    if length not in wordsByLength:
+        with metrics.stage('lexicon load'):
+            words = lexicon.loadLexicon(length)
+        if length==9:
+            words = words[words[:,4]!=ord("=")] #remove words such as 1234=1234
+        if length==3:
+            words = words[words[:,0]!=ord("0")]  #intentionally omits 0=0 as this breaks the leading zero rule
+        wordsByLength[length] = words
+    return(wordsByLength[length])
+
+def patternIndex(length):
+    #positional bitset index (see nerdle/patternindex.py), built the first time a pattern of that length is matched
+    if length not in patternIndexes:
+        words = wordList(length)
+        with metrics.stage('pattern index build'):
+            patternIndexes[length] = patternindex.PatternIndex(words)
+    return(patternIndexes[length])
+
+def hasWordList(toMatch):
+    return((len(toMatch)<=enumerator.MAX_LENGTH) & (len(toMatch) not in [2,4]))
+
+def patternMatch(toMatch,returnAll=False, impossibles=[], rng=random):
+    toMatch="".join(toMatch)
+    if not hasWordList(toMatch):
         if "_" in toMatch:
-            print("no word list exists for length", len(toMatch), toMatch)
-            sys.exit()
-        else:
+            raise ValueError("no word list exists for length "+str(len(toMatch))+" "+toMatch)
+        elif returnAll:
             return([toMatch])
-        
-    if len(toMatch)==9:
-        words=words9.copy()
-    if len(toMatch)==8:
-        words=words8.copy()
-    if len(toMatch)==7:
-        words=words7.copy()
-    if len(toMatch)==6:
-        words=words6.copy()
-    if len(toMatch)==5:
-        words=words5.copy()
-    if len(toMatch)==3:
-        words=words3.copy()
-    for j in range(len(toMatch)):
-        if len(words)>0: 
-            if toMatch[j]=="n": 
-                words=words[words.word.apply(lambda x: x[j] in '0123456789')]
-            elif toMatch[j]=="s": 
-                words=words[words.word.apply(lambda x: x[j] in '+-/*')]
-            elif toMatch[j]!="_": 
-                words=words[words.word.apply(lambda x: x[j]==toMatch[j])]
-    
-    if impossibles!=[]:                
-        #remove impossibles
-        if len(toMatch)!=len(impossibles):
-            print("mismatch in field lenghts") 
-            return("fail")
         else:
-            for j in range(len(toMatch)):
-                if len(words)>0:
-                    words=words[words.word.apply(lambda x: x[j] not in impossibles[j])]
+            return(toMatch)
 
-    if len(words)==0:
+    if (impossibles!=[]) & (len(toMatch)!=len(impossibles)):
+        print("mismatch in field lenghts") 
         return("fail")
-    if returnAll:
-        return(words['word'].tolist())
-    else:    
-        return(words.sample().iloc[0]['word'])
-
-def patternMatchWordList(toMatch, wordList, returnAll=False):
-    for j in range(len(toMatch)):
-        if len(wordList)>0: 
-            if toMatch[j]=="n": 
-                wordList=[x for x in wordList if x[j] in '0123456789' ]
-            elif toMatch[j]=="s": 
-                wordList=[x for x in wordList if x[j] in '+-/*']
-            elif toMatch[j]!="_": 
-                wordList=[x for x in wordList if x[j] == toMatch[j]]
-    
-    if len(wordList)==0:
+
+    match = patternIndex(len(toMatch)).query(toMatch, impossibles)
+    if match.count==0:
         return("fail")
     if returnAll:
-        return(wordList)
+        return(match.words())
     else:    
-        return(random.choice(wordList))
+        return(match.choice(rng))
 
 
 def findWords(pattern):
@@ -166,44 +165,46 @@ def findWords(pattern):
     return(across, down, acrossList, downList)
 
 def findImpossibles(toMatch):
-    words = patternMatch(toMatch,returnAll=True,impossibles=[])
-    possibles = []
+    #characters that no matching word has at each position
+    if hasWordList(toMatch):
+        possibles = patternIndex(len(toMatch)).query(toMatch).possible
+    else:
+        possibles = patternMatch(toMatch,returnAll=True,impossibles=[])[0]
     impossibles = []
     
-    for l in range(len(toMatch)):
-        possible = list(set([word[l] for word in words]))
-        possibles+=[possible]
-    
+    for possible in possibles:
         allLetters = '0123456789=+-/*'
         impossible = [x for x in allLetters if x not in possible]
         impossibles+=[impossible]
     return(impossibles)
 
-#input grid pattern
-with open('input/'+fileStem+'.txt') as f:
-    patterns = json.load(f)
+def preparePattern(pattern):
+    #blank pattern (list of strings, see File inputs) -> (patternList, patternImpossible, acrossList, downList) for fillPattern
+    #raises ValueError if the pattern cannot be filled
+    #kept in the artifact cache (see nerdle/cache.py), keyed on the pattern, the word lists it uses and this script
+    _,_,acrossList, downList = findWords(pattern)
+    files = []
+    for length in sorted(set([w['length'] for w in acrossList+downList if hasWordList(w['patternIn'])])):
+        wordList(length)
+        files += [lexicon.compiledPath(length)]
+    prepared = cache.cached('crossnerdlePattern', lambda: list(buildPattern(pattern)), params={'pattern': pattern},
+                            files=files, code=[__file__, patternindex])
+    return(tuple(prepared))
 
-puzzleList=[]
+def buildPattern(pattern):
+    #preparePattern without the cache
 
-#select pattern
-for patternNo, pattern in enumerate(patterns[0:]):
-    print()
-    print()
-    print("*******PATTERN NUMBER", patternNo)
-    counter=0
-    success=0
-    
     #convert list of strings to list of lists
     patternList = [] 
     for p in pattern:
         newp = [" " if x=="X" else x for x in list(p)]
         patternList+=[newp]
     
-    print("**Finding words**")
+    metrics.log(2, "**Finding words**")
     _,_,acrossList, downList = findWords(pattern)
 
     #check if puzzle is possible
-    print("**Finding impossibles**")
+    metrics.log(2, "**Finding impossibles**")
     patternImpossible = [([[]]*len(pattern[0])).copy() for y in range(len(pattern))]
     allLetters = '0123456789=+-/*'
 
@@ -213,9 +214,7 @@ for patternNo, pattern in enumerate(patterns[0:]):
         for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
             patternImpossible[y][x]=impossibles[n]
             if len(patternImpossible[y][x])==len(allLetters):
-                print("puzzle not possible across @ x,y",x,y)
-                print(across)
-                sys.exit()
+                raise ValueError("puzzle not possible across @ x,y "+str(x)+","+str(y)+" "+str(across))
     
     for down in downList:
         if "_" in down:
@@ -224,14 +223,12 @@ for patternNo, pattern in enumerate(patterns[0:]):
             for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
                 patternImpossible[y][x]=list(set(patternImpossible[y][x]+impossibles[n]))
                 if len(patternImpossible[y][x])==len(allLetters):
-                    print("puzzle not possible down @ x,y",x,y)
-                    print(down)
-                    sys.exit()
+                    raise ValueError("puzzle not possible down @ x,y "+str(x)+","+str(y)+" "+str(down))
                 
-    print("**Calculating possible word lists")
+    metrics.log(2, "**Calculating possible word lists")
     
     for m,across in enumerate(acrossList):
-        print("across", m, end="; ")
+        metrics.log(2, "across", m, end="; ")
         y = across['start'][1]
         impossibles=[]
         for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
@@ -239,11 +236,10 @@ for patternNo, pattern in enumerate(patterns[0:]):
         acrossList[m]['impossibles']=impossibles
         acrossList[m]['possibleWords']=patternMatch(across['patternIn'],returnAll=True,impossibles=impossibles)
         if acrossList[m]['possibleWords']=="fail":
-            print("no possible words, across", across)
-            sys.exit()
+            raise ValueError("no possible words, across "+str(across))
 
     for m,down in enumerate(downList):
-        print("down", m, end="; ")
+        metrics.log(2, "down", m, end="; ")
         x = down['start'][0]
         impossibles=[]
         for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
@@ -251,8 +247,7 @@ for patternNo, pattern in enumerate(patterns[0:]):
         downList[m]['impossibles']=impossibles
         downList[m]['possibleWords']=patternMatch(down['patternIn'],returnAll=True,impossibles=impossibles)
         if downList[m]['possibleWords']=="fail":
-            print("no possible words, down", down)
-            sys.exit()
+            raise ValueError("no possible words, down "+str(down))
 
     #sort by criteria
     def lenFunc(e):
@@ -261,15 +256,36 @@ for patternNo, pattern in enumerate(patterns[0:]):
     
     downList.sort(key=lenFunc)
     acrossList.sort(key=lenFunc)
+    return(patternList, patternImpossible, acrossList, downList)
+
+def duplicateKey(puzzle):
+    #puzzles with the same solved grid are the same puzzle (see nerdle/dedupe.py)
+    return(dedupe.contentKey(puzzle))
+
+def fillPattern(pattern, count=targetPerPattern, seed=None, rng=None, puzzleList=None, sink=None, patternNo=0, seen=()):
+    #count completed puzzles (lists of lists of characters) for one pattern
+    #puzzleList: puzzles already found (eg for other patterns), which are not repeated and are added to
+    #sink: JsonlSink (see nerdle/sink.py) each new puzzle is appended to
+    #seen: keys (see duplicateKey) of other puzzles not to repeat, eg dedupe.loadIndex('crossnerdle1')
+    rng = rng or random.Random(seed)
+    puzzleList = [] if puzzleList is None else puzzleList
+    found = len(puzzleList)
+    #seen is not copied (it can be the whole published index), only this call's keys are kept
+    keys = set([duplicateKey(p) for p in puzzleList])
+    with metrics.stage('candidate enumeration'):
+        patternList, patternImpossible, acrossList, downList = preparePattern(pattern)
+
+    counter=0
+    success=0
     failMatchA=[]
     failMatchPreviousA=['x']
     failMatchD=[]
     failMatchPreviousD=['x']
     failMatchCount=0
     
-    while success<targetPerPattern:    
+    while success<count:    
         counter+=1
-        print("*** Pattern", patternNo, "of", len(patterns), "attempt", counter,"; success", success, "of", targetPerPattern, "cumulative:", len(puzzleList))
+        metrics.log(1, "*** Pattern", patternNo, "attempt", counter,"; success", success, "of", count, "cumulative:", len(puzzleList))
         
 
         
@@ -281,158 +297,163 @@ for patternNo, pattern in enumerate(patterns[0:]):
         maxReached=0
         best=[]
         i=0
-        while (attempts<maxAttempts) & (fail==True):
-            if best!=[]:
-                attemptList = [b.copy() for b in best]
-
-            #for p in attemptList:
-            #    print(" ".join(p))
-            #input("Press Enter to continue...")
-
-            #if too many fails or every 500 attempts, start from scratch
-            if (failMatchCount>10) | (attempts%500==499):
-                print("resetting", failMatchCount, end=" ")
-                attemptList=[x.copy() for x in patternList.copy()] 
-                best=[]
-                failMatchCount=0
+        with metrics.stage('grid fill'):
+            while (attempts<maxAttempts) & (fail==True):
+                if best!=[]:
+                    attemptList = [b.copy() for b in best]
+
+                #for p in attemptList:
+                #    print(" ".join(p))
+                #input("Press Enter to continue...")
+
+                #if too many fails or every 500 attempts, start from scratch
+                if (failMatchCount>10) | (attempts%500==499):
+                    metrics.count('grid fill restarts')
+                    metrics.log(2, "resetting", failMatchCount, end=" ")
+                    attemptList=[x.copy() for x in patternList.copy()] 
+                    best=[]
+                    failMatchCount=0
             
-            attempts+=1
-            if attempts%100==0:
-                print(attempts, i, end=" ")   
-
-            #choose number of words to replace and reset to input pattern - across
-            replacements = random.randint(1,len(acrossList))
-            replacementList = random.sample(range(0,len(acrossList)),replacements)
-            #replace all replacementList            
-            for j in replacementList:
-                across = acrossList[j]
-                y = across['start'][1]
-                for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
-                    if across['patternIn'][n] in "ns=_": 
-                        attemptList[y][x]=across['patternIn'][n]
-
-            #choose number of words to replace and reset to input pattern - down
-            replacements = random.randint(1,len(downList))
-            replacementList = random.sample(range(0,len(downList)),replacements)
-            #replace all replacementList            
-            for j in replacementList:
-                down = downList[j]
-                x = down['start'][0]
-                for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
-                    if down['patternIn'][n] in "ns=_":
-                        attemptList[y][x]=down['patternIn'][n]
-            '''
-            print("checkpoint after replacement")
-            for a in attemptList:
-                print(a)
-            '''
+                attempts+=1
+                metrics.count('grid fill attempts')
+                if attempts%100==0:
+                    metrics.log(2, attempts, i, end=" ")   
+
+                #choose number of words to replace and reset to input pattern - across
+                replacements = rng.randint(1,len(acrossList))
+                replacementList = rng.sample(range(0,len(acrossList)),replacements)
+                #replace all replacementList            
+                for j in replacementList:
+                    across = acrossList[j]
+                    y = across['start'][1]
+                    for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
+                        if across['patternIn'][n] in "ns=_": 
+                            attemptList[y][x]=across['patternIn'][n]
+
+                #choose number of words to replace and reset to input pattern - down
+                replacements = rng.randint(1,len(downList))
+                replacementList = rng.sample(range(0,len(downList)),replacements)
+                #replace all replacementList            
+                for j in replacementList:
+                    down = downList[j]
+                    x = down['start'][0]
+                    for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
+                        if down['patternIn'][n] in "ns=_":
+                            attemptList[y][x]=down['patternIn'][n]
+                '''
+                print("checkpoint after replacement")
+                for a in attemptList:
+                    print(a)
+                '''
             
-            #start with the shortest words to solve
-            i=0
-            fail=False
-            failDirection=''
-            failLocation=[]
-            while (i<max(len(acrossList),len(downList))) & (fail==False):
+                #start with the shortest words to solve
+                i=0
+                fail=False
+                failDirection=''
+                failLocation=[]
+                while (i<max(len(acrossList),len(downList))) & (fail==False):
                 
-                #solve across
-                if len(acrossList)>i:
-                    
-                    direction="across" 
-                    across = acrossList[i]
-                    y = across['start'][1]
-                    toMatch = []
-                    impossibles = []
-                    for x in range(across['start'][0],across['start'][0]+across['length'],1):
-                        toMatch += attemptList[y][x]
-                        impossibles += [patternImpossible[y][x]]
+                    #solve across
+                    if len(acrossList)>i:
                     
-                    #find calc to match pattern from word list.  
-                    attempt = patternMatchWordList(toMatch, across['possibleWords'], returnAll=False)
-                    if attempt=='fail':
-                        fail=True
-                        failDirection=direction
-                        failLocation=acrossList[i]['start']
-                        failMatchA=toMatch
-                        if failMatchA==failMatchPreviousA:
-                            failMatchCount+=1
-                        else:
-                            failMatchCount=0
-                        failMatchPreviousA=failMatchA.copy()
-                        #print("failMatchA , yx, Count", failMatchA, y,x, failMatchA==failMatchPreviousA, failMatchCount)
-
-                        #clear failed word
+                        direction="across" 
+                        across = acrossList[i]
                         y = across['start'][1]
-                        for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
-                            if across['patternIn'][n] == "_": 
-                                attemptList[y][x]="_"
-
-
-
-                    else: 
-                        for pos,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
-                            attemptList[y][x]=attempt[pos]
+                        toMatch = []
+                        impossibles = []
+                        for x in range(across['start'][0],across['start'][0]+across['length'],1):
+                            toMatch += attemptList[y][x]
+                            impossibles += [patternImpossible[y][x]]
                     
-                    '''
-                    print("checkpoint after solving one iteration", i, 'across')
-                    for a in attemptList:
-                        print(a)        
-                    '''
+                        #find calc to match pattern (and impossibles, so only from possibleWords) from word list.  
+                        attempt = patternMatch(toMatch, returnAll=False, impossibles=impossibles, rng=rng)
+                        if attempt=='fail':
+                            metrics.reject('no word fits (grid fill)')
+                            fail=True
+                            failDirection=direction
+                            failLocation=acrossList[i]['start']
+                            failMatchA=toMatch
+                            if failMatchA==failMatchPreviousA:
+                                failMatchCount+=1
+                            else:
+                                failMatchCount=0
+                            failMatchPreviousA=failMatchA.copy()
+                            #print("failMatchA , yx, Count", failMatchA, y,x, failMatchA==failMatchPreviousA, failMatchCount)
+
+                            #clear failed word
+                            y = across['start'][1]
+                            for n,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
+                                if across['patternIn'][n] == "_": 
+                                    attemptList[y][x]="_"
+
+
+
+                        else: 
+                            for pos,x in enumerate(range(across['start'][0],across['start'][0]+across['length'],1)):
+                                attemptList[y][x]=attempt[pos]
                     
-                #solve down
-                if len(downList)>i:
-                    direction="down" 
-                    down = downList[i]
-                    x = down['start'][0]
-                    toMatch = []
-                    impossibles = []
-                    for y in range(down['start'][1],down['start'][1]+down['length'],1):
-                        #print(x,y) 
-                        toMatch += attemptList[y][x]
-                        impossibles += [patternImpossible[y][x]]
+                        '''
+                        print("checkpoint after solving one iteration", i, 'across')
+                        for a in attemptList:
+                            print(a)        
+                        '''
+                    
+                    #solve down
+                    if len(downList)>i:
+                        direction="down" 
+                        down = downList[i]
+                        x = down['start'][0]
+                        toMatch = []
+                        impossibles = []
+                        for y in range(down['start'][1],down['start'][1]+down['length'],1):
+                            #print(x,y) 
+                            toMatch += attemptList[y][x]
+                            impossibles += [patternImpossible[y][x]]
         
-                    #find calc to match pattern from word list.  
-                    attempt = patternMatchWordList(toMatch, down['possibleWords'], returnAll=False)
-                    if attempt=='fail':
-                        fail=True
-                        failDirection=direction
-                        failLocation=downList[i]['start']
-                        failMatchD=toMatch
-                        if failMatchD==failMatchPreviousD:
-                            failMatchCount+=1
-                        else:
-                            failMatchCount=0
-                        failMatchPreviousD=failMatchD.copy()
-                        #print("failMatchD , yx, Count", failMatchD, y,x, failMatchD==failMatchPreviousD, failMatchCount)
+                        #find calc to match pattern (and impossibles, so only from possibleWords) from word list.  
+                        attempt = patternMatch(toMatch, returnAll=False, impossibles=impossibles, rng=rng)
+                        if attempt=='fail':
+                            metrics.reject('no word fits (grid fill)')
+                            fail=True
+                            failDirection=direction
+                            failLocation=downList[i]['start']
+                            failMatchD=toMatch
+                            if failMatchD==failMatchPreviousD:
+                                failMatchCount+=1
+                            else:
+                                failMatchCount=0
+                            failMatchPreviousD=failMatchD.copy()
+                            #print("failMatchD , yx, Count", failMatchD, y,x, failMatchD==failMatchPreviousD, failMatchCount)
 
                         
-                        #clear failed word
-                        x = down['start'][0]
-                        for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
-                            if down['patternIn'][n] == "_":
-                                attemptList[y][x]="_"
+                            #clear failed word
+                            x = down['start'][0]
+                            for n,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
+                                if down['patternIn'][n] == "_":
+                                    attemptList[y][x]="_"
 
                         
-                    else: 
-                        for pos,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
-                            attemptList[y][x]=attempt[pos]
+                        else: 
+                            for pos,y in enumerate(range(down['start'][1],down['start'][1]+down['length'],1)):
+                                attemptList[y][x]=attempt[pos]
         
+                        '''
+                        print("checkpoint after solving one iteration", i, 'down')
+                        for a in attemptList:
+                            print(a)        
+                        '''
+                    
+                    i+=1
+                if i>=maxReached: 
+                    maxReached = i 
+                    best = attemptList.copy() 
+                    #print("reached",i, "faildirection", failDirection, "faillocation", failLocation, "matchA", failMatchA,"matchD", failMatchD)
                     '''
-                    print("checkpoint after solving one iteration", i, 'down')
-                    for a in attemptList:
-                        print(a)        
+                    for p in attemptList:
+                        print(" ".join(p))
                     '''
-                    
-                i+=1
-            if i>=maxReached: 
-                maxReached = i 
-                best = attemptList.copy() 
-                #print("reached",i, "faildirection", failDirection, "faillocation", failLocation, "matchA", failMatchA,"matchD", failMatchD)
-                '''
-                for p in attemptList:
-                    print(" ".join(p))
-                '''
                 
-        print()
+        metrics.log(2)
 
         '''
         print("checkpoint after solving all iterations")
@@ -447,15 +468,17 @@ for patternNo, pattern in enumerate(patterns[0:]):
         for w in wordsT:
             try:
                 [a,b]=w.split('=')
-                if (eval(a)!=eval(b)):
-                    print()
-                    print(a,b,"ERROR, RETRYING *********************************************")
+                if (evaluator.evaluate(a)!=evaluator.evaluate(b)):
+                    metrics.reject('invalid word on re-check')
+                    metrics.log(1)
+                    metrics.log(1, a,b,"ERROR, RETRYING *********************************************")
                     
                     fail=True
                     attemptList=[x.copy() for x in patternList.copy()] 
 
             except:
-                print("ERROR EVALUATING WORD", w, "*************************************")
+                metrics.reject('invalid word on re-check')
+                metrics.log(1, "ERROR EVALUATING WORD", w, "*************************************")
                 fail=True
                 attemptList=[x.copy() for x in patternList.copy()] 
                             
@@ -464,29 +487,102 @@ for patternNo, pattern in enumerate(patterns[0:]):
             #check duplicates
             puzzleJoined = ",".join(["".join(x.copy()) for x in attemptList.copy()]) 
             if "_" in puzzleJoined: 
-                print("__ error")
-                sys.exit()
-            puzzleListJoined=[",".join(["".join(x.copy()) for x in y]) for y in puzzleList.copy()]
-            if puzzleJoined in puzzleListJoined:
-                print("DUPLICATE PUZZLE")
+                raise RuntimeError("__ error")
+            key = duplicateKey(attemptList)
+            if key in seen or key in keys:
+                metrics.reject('duplicate puzzle')
+                metrics.log(1, "DUPLICATE PUZZLE")
             else:
-                print("SUCCESS")
+                metrics.count('puzzles')
+                metrics.log(1, "SUCCESS")
                 for p in attemptList:
-                    print(" ".join(p))
+                    metrics.log(1, " ".join(p))
 
                 success+=1
                 puzzleList+=[attemptList]
+                keys.add(key)
 
-                if len(puzzleList)%10==0:
-                    with open('output/'+fileStem+'_answers.json', 'w') as f:
-                        json.dump(puzzleList, f)
+                if sink is not None:
+                    sink.append(attemptList)
             
         else: 
-            print("FAILED")
-
-#save puzzles to file
-with open(fileStem+'_puzzleList.json', 'w') as f:
-    json.dump(puzzleList, f)
+            metrics.reject('grid fill attempts used up')
+            metrics.log(1, "FAILED")
+
+
+    return(puzzleList[found:])
+
+def loadPatterns(fileStem=fileStem):
+    #input grid pattern
+    with open(os.path.join(HERE, 'input', fileStem+'.txt')) as f:
+        return(json.load(f))
+
+def seededPuzzle(index, batchId, patterns, countPerPattern=targetPerPattern, seen=()):
+    #puzzle number index of batch batchId (pattern index//countPerPattern), the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    #seen: published keys not to repeat (see nerdle/dedupe.py)
+    patternNo = index//countPerPattern
+    return(fillPattern(patterns[patternNo], 1, rng=seeding.puzzleRng('crossnerdle1', batchId, index), patternNo=patternNo, seen=seen)[0])
+
+def removeDuplicates(puzzleList):
+    #seeded puzzles are made independently, so the same grid can come up twice: keep the first
+    newPuzzleList = []
+    keys = set()
+    for puzzle in puzzleList:
+        key = duplicateKey(puzzle)
+        if key in keys:
+            metrics.reject('duplicate puzzle')
+            metrics.log(1, "DUPLICATE PUZZLE")
+        else:
+            newPuzzleList+=[puzzle]
+            keys.add(key)
+    return(newPuzzleList)
+
+def generate(patterns, countPerPattern=targetPerPattern, seed=None, sink=None, batchId=None, seen=None):
+    #countPerPattern completed puzzles for each pattern, all different
+    #sink: JsonlSink (see nerdle/sink.py) - puzzles already in it are kept (resume) and each new one is appended
+    #batchId: if given, each puzzle is seeded from its index instead (see seededPuzzle) and duplicates are removed afterwards (so there may be fewer)
+    #seen: keys of puzzles not to repeat, eg dedupe.loadIndex('crossnerdle1') for those already published (see nerdle/dedupe.py)
+    puzzleList = [] if sink is None else sink.records()
+    if batchId is not None:
+        for i in range(len(puzzleList), len(patterns)*countPerPattern):
+            puzzleList+=[quarantine.seeded('crossnerdle1', lambda index, b: seededPuzzle(index, b, patterns, countPerPattern, seen or ()), i, batchId)]
+            if sink is not None:
+                sink.append(puzzleList[-1])
+        return(removeDuplicates(puzzleList))
+    rng = random.Random(seed)
+
+    #select pattern
+    for patternNo, pattern in enumerate(patterns):
+        #puzzles still needed for this pattern (fewer when resuming)
+        count = min(countPerPattern, (patternNo+1)*countPerPattern-len(puzzleList))
+        if count>0:
+            metrics.log(1)
+            metrics.log(1)
+            metrics.log(1, "*******PATTERN NUMBER", patternNo)
+            #a pattern that fails (or times out, the timeout being for the whole pattern) is skipped, keeping its puzzles made so far
+            quarantine.isolate('crossnerdle1', lambda: fillPattern(pattern, count, rng=rng, puzzleList=puzzleList, sink=sink, patternNo=patternNo, seen=seen or ()),
+                               quarantine.rngInputs(rng, seed=seed, pattern=patternNo, count=count))
+    return(puzzleList)
+
+def savePuzzles(puzzleList, fileStem=fileStem, outputDir=None):
+    #save puzzles to file (the answers file is read by crossnerd_generator_2_question.py)
+    with open(os.path.join(outputDir or os.path.join(HERE, 'output'), fileStem+'_answers.json'), 'w') as f:
+        json.dump(puzzleList, f)
+    with open(os.path.join(outputDir or HERE, fileStem+'_puzzleList.json'), 'w') as f:
+        json.dump(puzzleList, f)
+
+
+if __name__ == '__main__':
+    #puzzles are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', fileStem+'_answers.jsonl'), header={'game': 'crossnerdle1', 'fileStem': fileStem, 'countPerPattern': targetPerPattern})
+    #grids published by earlier runs are not repeated
+    published = dedupe.loadIndex('crossnerdle1')
+    puzzleList = generate(loadPatterns(fileStem), targetPerPattern, sink=sink, seen=published)
+    savePuzzles(puzzleList, fileStem)
+    published.addAll([duplicateKey(p) for p in puzzleList])
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(os.path.join(HERE, 'output', fileStem+'_answers_metrics.json'), game='crossnerdle1', fileStem=fileStem, countPerPattern=targetPerPattern)
 
 '''
 #print puzzles
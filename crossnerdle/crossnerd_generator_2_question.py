@@ -49,6 +49,15 @@ File output:
     - n puzzles per pattern generated - see setting params
     - Questions saved to [filestem]_questions.json - see setting params
     - Day list providing index to 7 equal-length lists of increasing difficulty saved to [fileStem]_dayIndex.json
+
+Usage:
+    - script: set params below and run from this folder
+    - library (nothing runs on import; word list indexes are built once per process and reused by later calls):
+        from crossnerdle import crossnerd_generator_2_question as questions
+        question = questions.createQuestion(answer, random.Random(1))
+        dayList, dayIndex = questions.generate(questions.loadAnswers(), seed=1)
+        dayList, dayIndex = questions.generate(questions.loadAnswers(), batchId='2024-06')  #question i seeded on its own (see nerdle/seeding.py)
+        questions.savePuzzles(dayList, dayIndex)
     
 """
 
@@ -56,19 +65,29 @@ File output:
 import numpy as np
 import re
 import random
-import cv2 #only required to visualise completed puzzles
 import json
 import sys
-import pandas as pd
+import os
+
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import features, lexicon, memory, metrics, patternindex, quarantine, seeding
+from nerdle.sink import JsonlSink
 
-# setting params
+#folder holding this script (input / output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# setting params (defaults for generate)
 
 #fileStem specifes .txt file to read in for puzzles and is retained as prefix for output file, in which case comment out call to 'visualise' function
 fileStem = 'patterns7x7_to_10x10-x4'
 
 fileAnswers=fileStem+'_answers.json'
-fileQuestions=fileStem+'_questions.json'
-fileDayIndex=fileStem+'_dayIndex.json'
+visualisePuzzles = True #if True, each question is drawn in a cv2 window as it is created (requires cv2)
+
+#word list indexes by length, built the first time they are needed (see wordIndex), cleared when over a memory budget (see nerdle/memory.py)
+wordIndexes = {}
+memory.register('word indexes', wordIndexes.clear)
 
 
 def prt(cn):
@@ -94,16 +113,14 @@ def find_pos_quick(word, wordNew):
     if len(ix)==1:
         ix=ix[0]
     else:
-        print("ERROR - MORE THAN ONE CHAR CHANGED")
-        sys.exit()
+        raise RuntimeError("ERROR - MORE THAN ONE CHAR CHANGED")
         
     #find all words that match word with char removed
     wordstrNew="".join(wordNew)
-    wordMatchNew = [x for x in wordslist[len(wordstrNew)] if re.search(wordstrNew.replace("_","([0-9]|[*+-=]|[\/])").replace("+","\+").replace("*","\*").replace("/","\/"), x) != None]
+    wordMatchNew = wordIndex(len(wordstrNew)).query(wordstrNew)
 
     #check how many possibilities at the position being removed other than the one we are removing
-    wordDiff = [x for x in wordMatchNew if x[ix]!=word[ix]]
-    if((len(wordMatchNew)>0) & (len(wordDiff)==0)):
+    if((wordMatchNew.count>0) & (wordMatchNew.possible[ix]==word[ix])):
         return([word])
     
     #non-unique solution
@@ -120,37 +137,34 @@ def find_pos_intersection(word1, wordNew1, word2, wordNew2):
     if len(ix1)==1:
         ix1=ix1[0]
     else:
-        print("ERROR - MORE THAN ONE CHAR CHANGED")
-        sys.exit()
+        raise RuntimeError("ERROR - MORE THAN ONE CHAR CHANGED")
 
     if len(ix2)==1:
         ix2=ix2[0]
     else:
-        print("ERROR - MORE THAN ONE CHAR CHANGED")
-        sys.exit()
+        raise RuntimeError("ERROR - MORE THAN ONE CHAR CHANGED")
         
     #find all words that match word with char removed
     wordstrNew1="".join(wordNew1)
-    wordMatchNew1 = [x for x in wordslist[len(wordstrNew1)] if re.search(wordstrNew1.replace("_","([0-9]|[*+-=]|[\/])").replace("+","\+").replace("*","\*").replace("/","\/"), x) != None]
+    wordMatchNew1 = wordIndex(len(wordstrNew1)).query(wordstrNew1)
 
     wordstrNew2="".join(wordNew2)
-    wordMatchNew2 = [x for x in wordslist[len(wordstrNew2)] if re.search(wordstrNew2.replace("_","([0-9]|[*+-=]|[\/])").replace("+","\+").replace("*","\*").replace("/","\/"), x) != None]
+    wordMatchNew2 = wordIndex(len(wordstrNew2)).query(wordstrNew2)
 
     #check how many possibilities at the position being removed other than the one we are removing
-    possChars1 = set([x[ix1] for x in wordMatchNew1])
-    possChars2 = set([x[ix2] for x in wordMatchNew2])
+    possChars1 = set(wordMatchNew1.possible[ix1])
+    possChars2 = set(wordMatchNew2.possible[ix2])
     
     #item can be removed only if this is the only solution in BOTH directions
     possChars12 = list(set(possChars1).intersection(possChars2))
     if(len(possChars12)==1):
        if possChars12[0]!=word1[ix1]:
-           print("only solution isn't the one we're looking for")
-           sys.exit()
+           raise RuntimeError("only solution isn't the one we're looking for")
        else:
-           print("intersection removable") 
-           print("across possibles", [x if i!=ix1 else "@" for i, x in enumerate(wordNew1)], possChars1)
-           print("down possibles", [x if i!=ix2 else "@" for i, x in enumerate(wordNew2)], possChars2)
-           print("only intersection", possChars12)
+           metrics.log(2, "intersection removable") 
+           metrics.log(2, "across possibles", [x if i!=ix1 else "@" for i, x in enumerate(wordNew1)], possChars1)
+           metrics.log(2, "down possibles", [x if i!=ix2 else "@" for i, x in enumerate(wordNew2)], possChars2)
+           metrics.log(2, "only intersection", possChars12)
            return(possChars12)
     
     #non-unique solution
@@ -173,26 +187,25 @@ def find_pos(cn, acr, dow):
         acrpos, dowpos = [], []
         for i, word in enumerate(acr):
             wordstr = ''.join(cn[word[0], word[1][0]:(word[1][1]+1)])
-            print(i,wordstr)
+            metrics.log(2, i,wordstr)
             if '_' in wordstr:
-                acrpos.append([x for x in wordslist[len(wordstr)] if re.search(wordstr.replace("_","([0-9]|[*+-=]|[\/])").replace("+","\+").replace("*","\*").replace("/","\/"), x) != None])
+                acrpos.append(wordIndex(len(wordstr)).query(wordstr))
                 if len(acrpos[i]) == 0:
                     #no solutions, give up and return 
-                    print("no solutions point 1")
-                    sys.exit() #return ([], np.nan, [])
+                    raise RuntimeError("no solutions point 1") #return ([], np.nan, [])
                 elif len(acrpos[i]) == 1:
                     #only 1 solution: adopt it
                     for m,k in enumerate(range(word[1][0],(word[1][1]+1))):
-                        if cn[word[0], k] != list(acrpos[i][0])[m]:
-                            solveList+=[{"R":word[0],"C":k,"A":list(acrpos[i][0])[m]}]
-                    cn[word[0], word[1][0]:(word[1][1]+1)] = list(acrpos[i][0])
+                        if cn[word[0], k] != list(acrpos[i].words()[0])[m]:
+                            solveList+=[{"R":word[0],"C":k,"A":list(acrpos[i].words()[0])[m]}]
+                    cn[word[0], word[1][0]:(word[1][1]+1)] = list(acrpos[i].words()[0])
                     found = True
                 else:
                     #more than one solution, adopt solution anyway for any digits where all solutions have same digit
                     for e in range(len(wordstr)):
                         if wordstr[e] == '_':
-                            posdig = [x[e] for x in acrpos[i]]
-                            if all(x==posdig[0] for x in posdig):
+                            posdig = acrpos[i].possible[e]
+                            if len(posdig)==1:
                                 solveList+=[{"R":word[0],"C":word[1][0]+e,"A":posdig[0]}]
                                 cn[word[0], word[1][0]+e] = posdig[0]
                                 found = True
@@ -201,25 +214,24 @@ def find_pos(cn, acr, dow):
         for i, word in enumerate(dow):
             wordstr = ''.join(cn[word[1][0]:(word[1][1]+1), word[0]])
             if '_' in wordstr:
-                dowpos.append([x for x in wordslist[len(wordstr)] if re.search(wordstr.replace("_","([0-9]|[*+-=]|[\/])").replace("+","\+").replace("*","\*").replace("/","\/"), x) != None])
+                dowpos.append(wordIndex(len(wordstr)).query(wordstr))
                 if len(dowpos[i]) == 0:
                     #no solutions, give up and return 
-                    print("no solutions point 2")
-                    sys.exit() #return ([], np.nan, [])
+                    raise RuntimeError("no solutions point 2") #return ([], np.nan, [])
 
                 elif len(dowpos[i]) == 1:
                     #only 1 solution: adopt it
                     for m,k in enumerate(range(word[1][0],(word[1][1]+1))):
-                        if cn[k, word[0]] != list(dowpos[i][0])[m]:
-                            solveList+=[{"R":k,"C":word[0],"A":list(dowpos[i][0])[m]}]
-                    cn[word[1][0]:(word[1][1]+1), word[0]] = list(dowpos[i][0])
+                        if cn[k, word[0]] != list(dowpos[i].words()[0])[m]:
+                            solveList+=[{"R":k,"C":word[0],"A":list(dowpos[i].words()[0])[m]}]
+                    cn[word[1][0]:(word[1][1]+1), word[0]] = list(dowpos[i].words()[0])
                     found = True
                 else:
                     #more than one solution, adopt solution anyway for any digits where all solutions have same digit
                     for e in range(len(wordstr)):
                         if wordstr[e] == '_':
-                            posdig = [x[e] for x in dowpos[i]]
-                            if all(x==posdig[0] for x in posdig):
+                            posdig = dowpos[i].possible[e]
+                            if len(posdig)==1:
                                 solveList+=[{"R":word[1][0]+e,"C":word[0],"A":posdig[0]}]
                                 cn[word[1][0]+e, word[0]] = posdig[0]
                                 found = True
@@ -241,7 +253,7 @@ def find_pos(cn, acr, dow):
             return ([], np.nan, [])
     return (cn, difficulty, solveList)
 
-def gen(temp, acr, dow):
+def gen(temp, acr, dow, rng=random):
     #generate puzzle by removing one letter at at time
 
     #choose a random letter (from a random word across or down) and remove from puzzle
@@ -256,13 +268,14 @@ def gen(temp, acr, dow):
     replaceables = 0
     for row in temp:
         replaceables+=len([x for x in row if x not in '@ X'])
-    print("replaceable cells:", replaceables) 
+    metrics.log(2, "replaceable cells:", replaceables) 
     while counter < replaceables:
-        if random.randint(0,1):
-            a = random.choice(acr)
+        metrics.count('removal attempts')
+        if rng.randint(0,1):
+            a = rng.choice(acr)
             ilist = [x for x in range(a[1][0], a[1][1]+1) if (temp[a[0],x] != '_') & (irremovablesAcr[a[0],x] != '$')]
             if len(ilist)>0: 
-                i = random.choice(ilist)
+                i = rng.choice(ilist)
                 tempc = np.copy(temp)
                 tempc[a[0], i] = '_'
                 irremovablesAcr[a[0], i] = '_'
@@ -280,16 +293,17 @@ def gen(temp, acr, dow):
                 if len(res)==0: 
                     irremovablesAcr[a[0], i] = '$'
                     irremovablesAcrCount+=1
-                    print("cells not removable across:", irremovablesAcrCount)
+                    metrics.reject('cell not removable')
+                    metrics.log(2, "cells not removable across:", irremovablesAcrCount)
                     #print(irremovablesAcr)
             else:
-                print("all acrosses checked and irremovable") 
+                metrics.log(2, "all acrosses checked and irremovable") 
                 res=[]
         else:
-            a = random.choice(dow)
+            a = rng.choice(dow)
             ilist = [x for x in range(a[1][0], a[1][1]+1) if (temp[x,a[0]] != '_') & (irremovablesDow[x,a[0]] != '$')]
             if len(ilist)>0: 
-                i = random.choice(ilist)
+                i = rng.choice(ilist)
                 tempc = np.copy(temp)
                 tempc[i, a[0]] = '_'
                 irremovablesDow[i,a[0]] = '_'
@@ -308,26 +322,28 @@ def gen(temp, acr, dow):
                 if len(res)==0: 
                     irremovablesDow[i,a[0]] = '$'
                     irremovablesDowCount+=1
-                    print("cells not removable down:", irremovablesDowCount)
+                    metrics.reject('cell not removable')
+                    metrics.log(2, "cells not removable down:", irremovablesDowCount)
                     #print(irremovablesDow)
             else:
-                print("all downs checked and irremovable") 
+                metrics.log(2, "all downs checked and irremovable") 
                 res=[]
         if len(res):
             temp = tempc.copy()
-            print("word, wordNew", word, wordNew)
-            print("item removed, restarting counter") 
+            metrics.count('cells removed')
+            metrics.log(2, "word, wordNew", word, wordNew)
+            metrics.log(2, "item removed, restarting counter") 
             #prt(temp)
             counter = 0
         else:
             counter += 1
-            print("Attempt", counter, end="..")
+            metrics.log(2, "Attempt", counter, end="..")
             
     #try to solve        
-    res, difficulty, solveList = find_pos(temp.copy(), acr.copy(), dow.copy())
+    with metrics.stage('solve check'):
+        res, difficulty, solveList = find_pos(temp.copy(), acr.copy(), dow.copy())
     if len(res)==0:
-        print("ERROR: CANNOT BE SOLVED") 
-        sys.exit() 
+        raise RuntimeError("ERROR: CANNOT BE SOLVED")
     
     tempList = "".join(["".join(x) for x in temp])
     replacements = len(tempList)-len(tempList.replace("_",""))
@@ -401,6 +417,8 @@ def findIntersections(across,down):
     return(intersectionList)
     
 def visualise(crossnum):
+    import cv2 #only required to visualise completed puzzles
+
     cellWidth=50
     patternShape = [len(crossnum[0]),len(crossnum)]
     
@@ -428,6 +446,8 @@ def visualise(crossnum):
     return(puzzle)
 
 def draw_complete(event,x,y,flags,param):
+    import cv2 #only required to visualise completed puzzles
+
     cellWidth=50
     font = cv2.FONT_HERSHEY_SIMPLEX
     fontScale = 1
@@ -454,59 +474,38 @@ def draw_complete(event,x,y,flags,param):
         cv2.imshow('image',puzzle) # to display the characters
         # Press q to stop writing
 
-#Load all allowed word lists (up to length 9)
-wordslist = {}
-for i in range(3, 10):
-    with open(r'input/nerdlewords-.txt'.replace('-',str(i)), 'r') as f:
-        wordslist[i] = [x.replace('\n','') for x in f.readlines()]
-
-#now with leading zeros - to ensure we don't create a question that can be solved with leading zeros
-wordslist = {}
-for i in range(3, 10):
-    with open(r'input/nerdlewords-z.txt'.replace('-',str(i)), 'r') as f:
-        wordslist[i] = [x.replace('\n','') for x in f.readlines()]
-
-#check length errors
-for l in range(3,10): 
-    for n in range(0,10):
-        errors = len([x for x in wordslist[l] if len(x)==n])
-        if (n!=l) & (errors>0):
-            print("ERRORS", l, n, errors)
-
-#file lengths
-for l in range(3,10): 
-    print("LENGTH", l, len(wordslist[l]))
-
-#add nnn=nnn
-for l in range(10,10000):
-    question = str(l)+"="+str(l)
-    wordslist[len(question)]+=[question]
-
-#file lengths
-for l in range(3,10): 
-    print("LENGTH", l, len(wordslist[l]))
-
-#Load list of answers
-with open('output/'+fileAnswers) as f:
-    puzzleList = json.load(f)
-
-questionList=[]
-
-for j,puzzle in enumerate(puzzleList[:]):
+def wordIndex(length):
+    #Load allowed word list (up to length 9) from the compiled lexicons (see nerdle/lexicon.py), the first time it is needed
+    #with leading zeros - to ensure we don't create a question that can be solved with leading zeros
+    #note: lengths are checked when the lexicons are compiled, so no length errors can occur here
+    #each list is held as a positional bitset index (see nerdle/patternindex.py) so pattern queries are a few ANDs
+    if length not in wordIndexes:
+        with metrics.stage('lexicon load'):
+            words = lexicon.loadLexicon(length, zeros=True)
+        
+        #add nnn=nnn (unless the list already has them)
+        identities = lexicon.fromStrings([str(l)+"="+str(l) for l in range(10,10000) if len(str(l)+"="+str(l))==length], length)
+        if len(words) & len(identities):
+            identities = identities[~np.isin(identities.view('S'+str(length)).ravel(), np.ascontiguousarray(words).view('S'+str(length)).ravel())]
+        
+        with metrics.stage('pattern index build'):
+            wordIndexes[length] = patternindex.PatternIndex(np.concatenate([words, identities]))
+        metrics.log(1, "LENGTH", length, wordIndexes[length].size)
+    return(wordIndexes[length])
+
+def createQuestion(puzzle, rng=random):
+    #question (dict of output columns, before difficulty grading) for one solved puzzle (list of lists of characters)
     template=np.array(puzzle)
 
     #find words in template
-    print()
-    print()
-    print()
-    print()
-    print("****puzzle", j)
     across, down = findWords(template)       
     intersectionList = findIntersections(across, down)
-    crossnum, difficulty, solveList = gen(template, across, down)
-    print() 
-    print("difficulty:", difficulty) 
-    prt(crossnum)
+    with metrics.stage('removal'):
+        crossnum, difficulty, solveList = gen(template, across, down, rng)
+    metrics.log(1) 
+    metrics.log(1, "difficulty:", difficulty) 
+    if metrics.verbosity>=1:
+        prt(crossnum)
 
     intersectionList = findIntersections(across, down)
     question = crossnum
@@ -519,7 +518,7 @@ for j,puzzle in enumerate(puzzleList[:]):
         word1 = [question[acr[0]][x] for x in range(acr[1][0],acr[1][1]+1)]
         word2 = [question[x][dow[0]] for x in range(dow[1][0],dow[1][1]+1)]
         if word1[intersection['acrPos']]=="_":
-            print("intersection already blank")
+            metrics.log(2, "intersection already blank")
         else:
             wordNew1 = word1.copy()
             wordNew2 = word2.copy()
@@ -527,16 +526,18 @@ for j,puzzle in enumerate(puzzleList[:]):
             wordNew2[intersection['dowPos']]="_"
 
             if (len(word1)<=9) & (len(word2)<=9):
-                res = find_pos_intersection(word1, wordNew1, word2, wordNew2)
+                with metrics.stage('intersection removal'):
+                    res = find_pos_intersection(word1, wordNew1, word2, wordNew2)
                 if len(res):
-                    print("intersection removable", acr[0],dow[0])
+                    metrics.log(2, "intersection removable", acr[0],dow[0])
                     question[acr[0]][dow[0]]="~"
                     replacements2+=1
                     solve = {"R":acr[0],"C":dow[0],"A":template[acr[0],dow[0]]}
 
                     solveList2= [solve]+solveList2
                 else:
-                    print("intersection cannot be removed")
+                    metrics.reject('intersection not removable')
+                    metrics.log(2, "intersection cannot be removed")
     difficulty['replacements2']=replacements2
     solveList = solveList2+solveList
 
@@ -547,110 +548,146 @@ for j,puzzle in enumerate(puzzleList[:]):
     output['solveList']=solveList
     
     wordList = []
-    n3digits = 0
-    nPlus = 0
-    nMinus = 0
-    nDivide = 0
-    nMultiply = 0
     for a in across:
-        word = "".join(template[a[0]][a[1][0]:a[1][1]+1])
-        n3 = len(re.findall('[0-9][0-9][0-9]', word))
-        wordList+=[word]
-        n3digits+=n3
-        nPlus+=len(word)-len(word.replace("+",""))
-        nMinus+=len(word)-len(word.replace("-",""))
-        nDivide+=len(word)-len(word.replace("/",""))
-        nMultiply+=len(word)-len(word.replace("*",""))
+        wordList+=["".join(template[a[0]][a[1][0]:a[1][1]+1])]
     for d in down:
-        word = "".join([template[r][d[0]] for r in range(d[1][0],d[1][1]+1)])
-        n3 = len(re.findall('[0-9][0-9][0-9]', word))
-        wordList+=[word]
-        n3digits+=n3
-        nPlus+=len(word)-len(word.replace("+",""))
-        nMinus+=len(word)-len(word.replace("-",""))
-        nDivide+=len(word)-len(word.replace("/",""))
-        nMultiply+=len(word)-len(word.replace("*",""))
-    
-    output['n3digits']=n3digits
-    output['nPlus']=nPlus
-    output['nMinus']=nMinus
-    output['nDivide']=nDivide
-    output['nMultiply']=nMultiply
-    output['wordList']=wordList
-
-    
-    questionList+=[output]
+        wordList+=["".join([template[r][d[0]] for r in range(d[1][0],d[1][1]+1)])]
 
-    cv2.destroyAllWindows()
-    puzzle=visualise(crossnum)    #hide this line if not running cv2
-    cv2.waitKey(100)
+    #difficulty counts summed over every word in the grid (see nerdle/features.py)
+    wordFeatures = features.computeFeatures(features.toRows(wordList))
+    for column in ['n3digits','nPlus','nMinus','nDivide','nMultiply']:
+        output[column]=int(wordFeatures[column].sum())
+    output['wordList']=wordList
+    metrics.count('puzzles')
     
-    with open('output/'+fileQuestions, 'w') as f:
-            json.dump(questionList, f)
-
-#add difficulty calculation
-
-
-for i,question in enumerate(questionList):
-    difficultyScore = 6.97*question['replacements']+174.6+(-46.2*question['nPlus']-46.8*question['nMinus']+65.2*question['nDivide']+7.5*question['nMultiply']+12.74)*0.9
-    print(i, difficultyScore)    
-    #normal daily difficulty calculations
-    if question['size']=="R7C7":
-        difficulty=0
-    elif question['size'] in "R8C8R9C9":
-        if difficultyScore > 403:
-            difficulty=4
-        elif difficultyScore > 382:
-            difficulty=3
-        elif difficultyScore > 354:
-            difficulty=2
-        else:
-            difficulty=1
-    elif question['size'] in "R10C10":
-        if difficultyScore > 404:
-            difficulty=6
-        else:
-            difficulty=5
+    return(output)
+
+def gradeQuestions(questionList):
+    #add difficulty calculation
+    for i,question in enumerate(questionList):
+        difficultyScore = 6.97*question['replacements']+174.6+(-46.2*question['nPlus']-46.8*question['nMinus']+65.2*question['nDivide']+7.5*question['nMultiply']+12.74)*0.9
+        metrics.log(2, i, difficultyScore)    
+        #normal daily difficulty calculations
+        if question['size']=="R7C7":
+            difficulty=0
+        elif question['size'] in "R8C8R9C9":
+            if difficultyScore > 403:
+                difficulty=4
+            elif difficultyScore > 382:
+                difficulty=3
+            elif difficultyScore > 354:
+                difficulty=2
+            else:
+                difficulty=1
+        elif question['size'] in "R10C10":
+            if difficultyScore > 404:
+                difficulty=6
+            else:
+                difficulty=5
 
-    questionList[i]['difficultyScore'] = difficultyScore
-    questionList[i]['difficulty'] = difficulty
-    
-#sort list by size then difficulty
+        questionList[i]['difficultyScore'] = difficultyScore
+        questionList[i]['difficulty'] = difficulty
+    return(questionList)
 
-questionList.sort(key=lambda x: x.get('difficultyScore'))
-#questionList.sort(key=lambda x: len(x.get('question')))
+def arrangeDays(questionList, rng=random):
+    #-> (questions in day order, day list index)
+    #sort list by size then difficulty
 
-#chunk into 7 lists of increasing difficulty
-mod7Length = len(questionList)
-mod7Length = max(7,mod7Length - mod7Length%7)
-weeks = max(1,int(mod7Length/7))
+    questionList.sort(key=lambda x: x.get('difficultyScore'))
+    #questionList.sort(key=lambda x: len(x.get('question')))
 
-dayList = [questionList[i:i + weeks] for i in range(0, mod7Length, weeks)]
+    #chunk into 7 lists of increasing difficulty
+    mod7Length = len(questionList)
+    mod7Length = max(7,mod7Length - mod7Length%7)
+    weeks = max(1,int(mod7Length/7))
 
-#randomise each list
-dayList = [random.sample(item, len(item))  for item in dayList]
+    dayList = [questionList[i:i + weeks] for i in range(0, mod7Length, weeks)]
 
-newDayList = []
-#join back into one list
-for i in range(weeks):
-    for j in range(7):
-        newDayList += [dayList[j][i]]
+    #randomise each list
+    dayList = [rng.sample(item, len(item))  for item in dayList]
 
+    newDayList = []
+    #join back into one list
+    for i in range(weeks):
+        for j in range(7):
+            newDayList += [dayList[j][i]]
 
 
-#generate day list index [note, in this case, day list index is simply in order of dayList but this approach allows flexibility for list to be reordered and still indexed]
-gamesDayList = list(range(0,weeks*7))
-gamesDayList = [gamesDayList[x*weeks:(x+1)*weeks] for x in range(7)]
 
-#save dayList and index to files
-with open('output/'+fileQuestions, 'w') as f:
-        json.dump(newDayList, f)
-with open('output/'+fileDayIndex, 'w') as f:
-        json.dump(newDayList, f)
+    #generate day list index [note, in this case, day list index is simply in order of dayList but this approach allows flexibility for list to be reordered and still indexed]
+    gamesDayList = list(range(0,weeks*7))
+    gamesDayList = [gamesDayList[x*weeks:(x+1)*weeks] for x in range(7)]
+    return(newDayList, gamesDayList)
 
+def showQuestion(crossnum):
+    import cv2 #only required to visualise completed puzzles
 
+    cv2.destroyAllWindows()
+    puzzle=visualise(crossnum)
+    cv2.waitKey(100)
 
-cv2.destroyAllWindows()    
+def loadAnswers(fileAnswers=fileAnswers):
+    #Load list of answers
+    with open(os.path.join(HERE, 'output', fileAnswers)) as f:
+        return(json.load(f))
+
+def seededPuzzle(index, batchId, answers):
+    #question for answers[index] in batch batchId, the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    return(createQuestion(answers[index], seeding.puzzleRng('crossnerdle2', batchId, index)))
+
+def finishQuestions(questionList, batchId):
+    #grade and arrange a whole batch of seeded questions -> (questions in day order, day list index)
+    gradeQuestions(questionList)
+    return(arrangeDays(questionList, seeding.stepRng('crossnerdle2', batchId, 'days')))
+
+def generate(answers, seed=None, sink=None, visualisePuzzles=False, batchId=None):
+    #graded questions for a list of solved puzzles -> (questions in day order, day list index)
+    #sink: JsonlSink (see nerdle/sink.py) - (ungraded) questions already in it are kept (resume) and each new one is appended
+    #batchId: if given, each question is seeded from its index instead (see seededPuzzle)
+    rng = random.Random(seed)
+    questionList = [] if sink is None else sink.records()
+    for j,puzzle in enumerate(answers):
+        if j<len(questionList):
+            continue
+        metrics.log(1)
+        metrics.log(1)
+        metrics.log(1)
+        metrics.log(1)
+        metrics.log(1, "****puzzle", j)
+        if batchId is None:
+            questionList+=[quarantine.retried('crossnerdle2', lambda: createQuestion(puzzle, rng), {'seed': seed, 'puzzle': j}, rng)]
+        else:
+            questionList+=[quarantine.seeded('crossnerdle2', lambda i, b: seededPuzzle(i, b, answers), j, batchId)]
+        if visualisePuzzles:
+            showQuestion(questionList[-1]['question'])
+        if sink is not None:
+            sink.append(questionList[-1])
+
+    if batchId is not None:
+        return(finishQuestions(questionList, batchId))
+    gradeQuestions(questionList)
+    return(arrangeDays(questionList, rng))
+
+def savePuzzles(newDayList, gamesDayList, fileStem=fileStem, outputDir=None):
+    #save dayList and index to files
+    with open(os.path.join(outputDir or os.path.join(HERE, 'output'), fileStem+'_questions.json'), 'w') as f:
+            json.dump(newDayList, f)
+    with open(os.path.join(outputDir or os.path.join(HERE, 'output'), fileStem+'_dayIndex.json'), 'w') as f:
+            json.dump(newDayList, f)
+
+
+if __name__ == '__main__':
+    #questions are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', fileStem+'_questions.jsonl'), header={'game': 'crossnerdle2', 'fileStem': fileStem})
+    newDayList, gamesDayList = generate(loadAnswers(fileAnswers), sink=sink, visualisePuzzles=visualisePuzzles)
+    savePuzzles(newDayList, gamesDayList, fileStem)
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(os.path.join(HERE, 'output', fileStem+'_questions_metrics.json'), game='crossnerdle2', fileStem=fileStem)
+
+    if visualisePuzzles:
+        import cv2
+        cv2.destroyAllWindows()    
 
 '''
 #analyse question list with histograms
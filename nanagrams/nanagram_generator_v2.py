@@ -30,20 +30,33 @@ File output:
         'fixed' - identifies which characters are fixed i.e. compulsory in the answer
         'questionCoded' - question including encoding of which characters are fixed
         'questionFixed' - fixed encoding arranged as string like question
+
+Usage:
+    - script: set params below and run from this folder, output saved to output/
+    - library (nothing runs on import; word lists and indexes are loaded once per process and reused by later calls):
+        from nanagrams import nanagram_generator_v2 as nanagrams
+        puzzles = nanagrams.generate(length=7, count=20, seed=1)
+        puzzles = nanagrams.generate(length=7, count=20, batchId='2024-06')  #puzzle i seeded on its own (see nerdle/seeding.py)
+        puzzle = nanagrams.seededPuzzle(17, '2024-06', length=7)            #puzzle 17 of that batch again
     
 """
 
 import random
-import pandas as pd
-import cv2
 import numpy as np
 import itertools 
 import json  
 import sys
-import pandas
-import cv2
+import os
+
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import anagramindex, dedupe, evaluator, features, lexicon, memory, metrics, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#folder holding this script (input / output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-# setting params
+# setting params (defaults for generate)
 
 #number of games to be created
 targetPuzzles = 10 #number of puzzles to be produced
@@ -54,16 +67,16 @@ maxSolutions = 20 #maximum number of answers - don't want too many answers to fi
 maxAtTargetLength = 3 #max number of possible answers (exc commutatives) that include all characters i.e. length answer = length question
 visualisePuzzles = False #if True, script will visualise puzzles in cv2 window (space to rearrange, escape to close)
 
-if targetLength == 6:
-    minSolutions = 1
-    maxDoubles = 2
-    maxAtTargetLength = 6 
-if targetLength == 7:
-    minSolutions = 6
-    maxAtTargetLength = 6 
+#settings that differ for the easier levels
+LEVEL_SETTINGS = {6: {'minSolutions': 1, 'maxDoubles': 2, 'maxAtTargetLength': 6},
+                  7: {'minSolutions': 6, 'maxAtTargetLength': 6}}
 
 filePrefix = 'nanagramPuzzles' 
 
+#per-process cache of question candidates (see questionCandidates), cleared when over a memory budget (see nerdle/memory.py)
+_questions = {}
+memory.register('question candidates', _questions.clear)
+
 
 def components(a):
     [al, ar] = a.split("=")
@@ -112,19 +125,20 @@ def commutativeCheckSpecial(a,b):
     morphA = a.replace(double,str(int(double)+1))
     #morphB = b.replace(double,str(int(double)+1))
     
-    if not (eval(morphA.replace('=','=='))):
+    if not evaluator.isValid(morphA):
         return (True)
     
     #Is till commutative if replace one of doubles with something else (check both combos)?
     morph1A = morphAtemplate.replace('X',str(int(double)+1)).replace('Y',double).split('=')[0]
     morph1B = morphBtemplate.replace('X',str(int(double)+1)).replace('Y',double).split('=')[0]
-    morph1A = morph1A+'='+str(eval(morph1A))
-    morph1B = morph1B+'='+str(eval(morph1B))
+    #exact values (eg 7/2) so the new right hand sides compare equal to the left hand sides
+    morph1A = morph1A+'='+str(evaluator.evaluate(morph1A))
+    morph1B = morph1B+'='+str(evaluator.evaluate(morph1B))
 
     #morph2A = morphAtemplate.replace('Y',str(int(double)+1)).replace('X',double).split('=')[0]
     morph2B = morphBtemplate.replace('Y',str(int(double)+1)).replace('X',double).split('=')[0]
-    #morph2A = morph2A+'='+str(eval(morph2A))
-    morph2B = morph2B+'='+str(eval(morph2B))
+    #morph2A = morph2A+'='+str(evaluator.evaluate(morph2A))
+    morph2B = morph2B+'='+str(evaluator.evaluate(morph2B))
     
     #Check only if 1A commutes with either 1B or 2B
     if (commutativeCheck(morph1A,morph1B)) | (commutativeCheck(morph1A,morph2B)) & commutativeCheck(a,b):
@@ -155,21 +169,19 @@ def commutativeCheck(a,b):
     #print(jitterA, jitterB)
 
     #check valid inputs
-    if eval("".join(al))==eval(ar):
+    if evaluator.evaluate("".join(al))==evaluator.evaluate(ar):
         #print("a valid")
         pass
     else:
-        print("a not valid") 
-        sys.exit()
-    if eval("".join(bl))==eval(br):
+        raise ValueError("a not valid: "+"".join(al)+"="+ar)
+    if evaluator.evaluate("".join(bl))==evaluator.evaluate(br):
         #print("b valid")
         pass
     else:
-        print("b not valid") 
-        sys.exit()
+        raise ValueError("b not valid: "+"".join(bl)+"="+br)
 
     #check commutative
-    if (abs(eval("".join(jitterA))-eval("".join(jitterB)))<0.00000001):
+    if (abs(evaluator.evaluate("".join(jitterA))-evaluator.evaluate("".join(jitterB)))<0.00000001):
         commutative=True
     else:
         commutative=False
@@ -206,6 +218,8 @@ def checkRearrangement(a,b):
     return(False)
             
 def visualise(nanagram,fixed):
+    import cv2 #only required to visualise puzzles
+
     letters = nanagram.copy()
 
     letters+=" "*(9-len(letters))
@@ -245,86 +259,82 @@ def visualise(nanagram,fixed):
     return(puzzle,k==27)
 
 
-words={}
-words['9nz'] = pandas.read_csv('input/nerdlewords9.txt', header=None, names=['word'])
-words[9] = pandas.read_csv('input/nerdlewords9z.txt', header=None, names=['word'])
-words[9] = words[9][words[9].word.apply(lambda x: x[4]!="=")] #remove words such as 1234=1234
-words[8] = pandas.read_csv('input/nerdlewords8z.txt', header=None, names=['word'])
-words[7] = pandas.read_csv('input/nerdlewords7z.txt', header=None, names=['word'])
-words[6] = pandas.read_csv('input/nerdlewords6z.txt', header=None, names=['word'])
-words[5] = pandas.read_csv('input/nerdlewords5z.txt', header=None, names=['word'])
-words[3] = pd.DataFrame(['0=0','1=1','2=2','3=3','4=4','5=5','6=6','7=7','8=8','9=9'], columns=['word'])
-#words[3] = pd.DataFrame(['1=1','2=2','3=3','4=4','5=5','6=6','7=7','8=8','9=9'], columns=['word'])
-
-#clean files for correct length)
-print("CLEANING FILES") 
-for length in [3,5,6,7,8,9]:
-    #print("LENGTH", length) 
-    words[length] = words[length][words[length]['word'].apply(lambda x: len(x)==length)]
-    words[length] = words[length].drop_duplicates()
-
-
-#add sorted word for matching
-print("ADDING SORTED KEY") 
-for length in [3,5,6,7,8,9]:
-    #print("LENGTH", length) 
-    words[length]['sorted'] = words[length]['word'].apply(lambda x: "".join(sorted(x.replace("=",""))))
-
-puzzles=[]
-p=-1
-
-while len(puzzles)<targetPuzzles:
-    p+=1
-    print()
-    print("***CREATING PUZZLE", p)
+def questionCandidates(targetLength, maxDoubles):
+    #calculations that can be used as questions: (word array, ids of the allowed rows), found once per process
+    key = (targetLength, maxDoubles)
+    if key not in _questions:
+        #word lists are compiled memmapped arrays (see nerdle/lexicon.py), already cleaned for length and duplicates at build time
+        #length 9 questions are chosen from the non zero list otherwise too likely to contain a zero
+        questionZeros = targetLength!=9
+        with metrics.stage('lexicon load'):
+            questionWords = lexicon.loadLexicon(targetLength, zeros=questionZeros)
+            f = features.loadFeatures(targetLength, zeros=questionZeros)
+
+        #check that puzzle meets certain critera, for the whole list at once using its feature columns (see nerdle/features.py)
+        questionIds = np.flatnonzero(~(((f['nMultiply']+f['nDivide'])>0) & (f['digitCounts'][:,1]>0)) #remove possibility of *1 or /1
+                                     & (f['duplicates']<=maxDoubles) #fail doubles
+                                     & (f['digitCounts'][:,0]==0)) #no zero
+        metrics.log(1, "candidate questions:", len(questionIds), "of", len(questionWords))
+        _questions[key] = (questionWords, questionIds)
+    return(_questions[key])
+
+def answerIndex(length):
+    #character-multiset index of each word list for finding answers (see nerdle/anagramindex.py), saved with the lexicons
+    with metrics.stage('lexicon load'):
+        return(anagramindex.loadIndex(length, zeros=True))
+
+def levelSettings(targetLength, **overrides):
+    #game parameters for a level: the defaults above, then the level's own, then any given
+    settings = {'maxDoubles': maxDoubles, 'minSolutions': minSolutions, 'maxSolutions': maxSolutions, 'maxAtTargetLength': maxAtTargetLength}
+    settings.update(LEVEL_SETTINGS.get(targetLength, {}))
+    settings.update(overrides)
+    return(settings)
+
+def duplicateKey(puzzle):
+    #puzzles with the same answers are the same puzzle (see nerdle/dedupe.py)
+    return(dedupe.contentKey(json.loads(puzzle['answersLong'])))
+
+def createPuzzle(targetLength, settings, rng=random, seen=()):
+    #one puzzle (dict of output columns) that meets the settings
+    #seen: keys (see duplicateKey) of puzzles not to repeat
+    import pandas as pd
+
+    questionWords, questionIds = questionCandidates(targetLength, settings['maxDoubles'])
     found=False
     while found==False:
-        if targetLength==9: 
-            calcQuestion= [x for x in words['9nz'].sample(1).word.tolist()[0]] #choose from non zero list otherwise too likely to contain a zero
-
-        else:
-            calcQuestion= [x for x in words[targetLength].sample(1).word.tolist()[0]]
-
-        
+        metrics.count('attempts')
+        #question chosen from those meeting the criteria in questionCandidates
+        calcQuestion= [x for x in lexicon.toStrings(questionWords[[rng.choice(questionIds)]])[0]]
 
         #force first puzzle to check commutativity issue
         calcQuestionNoEquals = calcQuestion.copy() 
         calcQuestionNoEquals.remove("=")
-    
-        #check that puzzle meets certain critera
-        if (("*" in calcQuestion) or ("/" in calcQuestion)) & ("1" in calcQuestion):
-            #remove possibility of *1 or /1
-            pass 
-            print("REJECT: *1 or /1; ", end="")
-
-        elif len(calcQuestion)-len(set(calcQuestion))>maxDoubles:
-            pass 
-            print("REJECT: fail doubles; ", end="")
-        elif len(calcQuestion)-len([x for x in calcQuestion if x!='0'])>0:
-            pass
-            print("REJECT: no double zero;", end="")
-        
-        
-        else:
-            #print("pass doubles", calcQuestion)
-            
-            #start game creation
-            randomQuestion = calcQuestion.copy()
-            random.shuffle(randomQuestion)
-            
-            #get all answers of length 3-9
-            answers=[]
-            for length in [x for x in [3,5,6,7,8,9] if x<=targetLength]:
-                newAnswers=[]
-                combos = set(itertools.combinations(sorted(calcQuestionNoEquals), length-1))
-                #filter out only combos that exist as an entry in the sorted word list
-                for c in combos:
-                    co = "".join(c) 
-                    matches = words[length][words[length]['sorted']==co]
-                    if len(matches)>0:
-                        newAnswers+=matches.word.tolist()
-                answers+=newAnswers
 
+        #start game creation
+        randomQuestion = calcQuestion.copy()
+        rng.shuffle(randomQuestion)
+        
+        #get all answers of length 3-9
+        answers=[]
+        for length in [x for x in [3,5,6,7,8,9] if x<=targetLength]:
+            index = answerIndex(length)
+            with metrics.stage('candidate enumeration'):
+                #every word whose characters (other than =) are a subset of the question characters
+                ids = index.within(calcQuestionNoEquals)
+                if length==9:
+                    ids = ids[index.rows[ids,4]!=ord("=")] #remove words such as 1234=1234
+                answers+=index.words(ids)
+
+        #Version 2: random fixed
+        centre = rng.sample([x for x in randomQuestion if x!="="],1)[0] 
+
+        #the puzzle's answers (answersLong) are known now, so a repeat is rejected before the answers are grouped
+        if dedupe.contentKey(sorted([x for x in answers if centre in x], key=lambda x: (len(x), x))) in seen:
+            metrics.reject('duplicate puzzle')
+            metrics.log(2, "REJECT: duplicate puzzle")
+            continue
+
+        with metrics.stage('commutativity'):
             answersDf = pd.DataFrame(answers, columns=['word'])
             answersDf['length']=answersDf['word'].apply(lambda x: len(x))
             answersDf['commutativeWith'] = 9999
@@ -341,37 +351,40 @@ while len(puzzles)<targetPuzzles:
             #sort answers by length and then alphabetically
             answersDf = answersDf.sort_values(by=['length','word'])
 
-            
+        
             #now create shorter list combining commutatives together
             uniqueList = set(answersDf.commutativeWith)
             reducedAnswers = []
             for u in [u for u in uniqueList if u!=9999]:
                 subset = answersDf[answersDf.commutativeWith==u]
                 reducedAnswers+=[[subset.word.iloc[0],subset.length.iloc[0],subset.commutativeWith.iloc[0],len(subset)]]
-            
+        
             subset999 = answersDf[answersDf.commutativeWith==9999]
             for i,row in subset999.iterrows():
                 reducedAnswers+=[[row.word,row.length,9999,1]]
-                
+            
             reducedAnswersDf = pd.DataFrame(reducedAnswers, columns=['word','length','commutativeWith','commutations'])
             #reducedAnswersDf = reducedAnswersDf.sort_values(by=['length','commutations'])
             reducedAnswersDf = reducedAnswersDf.sort_values(by=['length','word'])
-        
-            #Version 2: random fixed
-            centre = random.sample([x for x in randomQuestion if x!="="],1)[0] 
-            answersDfSelect = answersDf[answersDf['word'].apply(lambda x: centre in x)]
-            reducedAnswersDfSelect = reducedAnswersDf[reducedAnswersDf['word'].apply(lambda x: centre in x)].copy()
     
-            if len(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength])<=maxAtTargetLength:
-                if (len(reducedAnswersDfSelect)<=maxSolutions) & (len(reducedAnswersDfSelect)>=minSolutions):
-                    found=True
-                else:
-                    print("REJECT: wrong number of solutions:", len(reducedAnswersDfSelect))
+        answersDfSelect = answersDf[answersDf['word'].apply(lambda x: centre in x)]
+        reducedAnswersDfSelect = reducedAnswersDf[reducedAnswersDf['word'].apply(lambda x: centre in x)].copy()
+
+        if len(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength])<=settings['maxAtTargetLength']:
+            if (len(reducedAnswersDfSelect)<=settings['maxSolutions']) & (len(reducedAnswersDfSelect)>=settings['minSolutions']):
+                found=True
             else:
-                print("REJECT: too many solutions at max length:", len(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength]))
-                #print(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength])
-            
+                metrics.reject('wrong number of solutions')
+                metrics.log(2, "REJECT: wrong number of solutions:", len(reducedAnswersDfSelect))
+                continue
+        else:
+            metrics.reject('too many solutions at max length')
+            metrics.log(2, "REJECT: too many solutions at max length:", len(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength]))
+            #print(reducedAnswersDfSelect[reducedAnswersDfSelect.length==targetLength])
+            continue
+        
 
+        with metrics.stage('rearrangements'):
             #Add calculation of rearrangements
             reducedAnswersDfSelect.loc[:,'rearrangesWith'] = 9999
             for index1, row1 in reducedAnswersDfSelect.iterrows():
@@ -383,7 +396,7 @@ while len(puzzles)<targetPuzzles:
                         if checkRearrangement(a,b):
                             reducedAnswersDfSelect.at[index1,'rearrangesWith']=min(index1,index2,reducedAnswersDfSelect.at[index1,'rearrangesWith'],reducedAnswersDfSelect.at[index2,'rearrangesWith'])
                             reducedAnswersDfSelect.at[index2,'rearrangesWith']=min(index1,index2,reducedAnswersDfSelect.at[index1,'rearrangesWith'],reducedAnswersDfSelect.at[index2,'rearrangesWith'])
-            
+        
     #Pad question with spaces to length 9
     randomQuestion+=" "*(9-len(randomQuestion))
 
@@ -416,45 +429,102 @@ while len(puzzles)<targetPuzzles:
     puzzleItem['questionFixed']=letters2
     
     
-    puzzles+=[puzzleItem]
-        
-
-    print()
-    print("SUCCESS: question =", calcQuestion)
-
-#remove duplicates
-newPuzzles = [puzzles[0]]
-
-print()
-print("REMOVING DUPLICATES")
-for i,puzzle in enumerate(puzzles[1:]):
-    if puzzle['answersLong'] == newPuzzles[-1]['answersLong']:
-        print("same 2 days in a row, skipping", i)
-    else:
-        if puzzle['answersLong'] in list(pd.DataFrame(newPuzzles).answersLong):
-            print("already in file, skipping", i)
+    metrics.count('puzzles')
+    metrics.log(1)
+    metrics.log(1, "SUCCESS: question =", calcQuestion)
+    return(puzzleItem)
+
+def removeDuplicates(puzzles):
+    newPuzzles = [puzzles[0]]
+    answersSeen = set([puzzles[0]['answersLong']])
+
+    metrics.log(2)
+    metrics.log(2, "REMOVING DUPLICATES")
+    for i,puzzle in enumerate(puzzles[1:]):
+        if puzzle['answersLong'] == newPuzzles[-1]['answersLong']:
+            metrics.reject('duplicate (same 2 days in a row)')
+            metrics.log(2, "same 2 days in a row, skipping", i)
         else:
-           print("adding new game")
-           newPuzzles+=[puzzle]
-
-print("file length, de-duped file length", len(puzzles), len(newPuzzles))    
-
-#save file
-puzzleFileName = filePrefix+'_'+str(targetPuzzles)+"(LN).json".replace('LN','L'+str(targetLength))
-with open('output/'+puzzleFileName, 'w') as f:
-        json.dump(newPuzzles, f)
-
-#visualise final puzzle in CV2 window
-if visualisePuzzles:    
-    escape=False
-    while escape==False:
-        random.shuffle(randomQuestion)
-        puzzle,escape=visualise(randomQuestion.copy(),centre)
-    
-#Check unique solutions
-print("unique questions", len(pd.DataFrame(newPuzzles).question.apply(lambda x: "".join(x)).unique()))
-print("unique answers", len(pd.DataFrame(newPuzzles).answersLong.apply(lambda x: "".join(x)).unique()))
-
-newpuzzlesDf = pd.DataFrame(newPuzzles)
+            if puzzle['answersLong'] in answersSeen:
+                metrics.reject('duplicate (already in file)')
+                metrics.log(2, "already in file, skipping", i)
+            else:
+               metrics.log(2, "adding new game")
+               newPuzzles+=[puzzle]
+               answersSeen.add(puzzle['answersLong'])
+
+    metrics.log(1, "file length, de-duped file length", len(puzzles), len(newPuzzles))    
+    return(newPuzzles)
+
+def seededPuzzle(index, batchId, length=targetLength, seen=(), **settings):
+    #puzzle number index of batch batchId, the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    #seen: published keys not to repeat (see nerdle/dedupe.py)
+    metrics.log(1)
+    metrics.log(1, "***CREATING PUZZLE", index)
+    return(createPuzzle(length, levelSettings(length, **settings), seeding.puzzleRng('nanagrams'+str(length), batchId, index), seen))
+
+def generate(length=targetLength, count=targetPuzzles, seed=None, batchId=None, sink=None, seen=None, **settings):
+    #count puzzles of the given length (level), with duplicates removed (so there may be fewer than count)
+    #seed: any value accepted by random.seed, None for a different set each time
+    #batchId: if given, each puzzle is seeded from its index instead (see seededPuzzle)
+    #sink: JsonlSink (see nerdle/sink.py) - puzzles already in it are kept (resume) and each new one is appended
+    #seen: keys of puzzles not to repeat, eg dedupe.loadIndex('nanagrams') for those already published (see nerdle/dedupe.py)
+    #   without a batchId, puzzles made earlier in this run are not repeated either
+    #settings: overrides for maxDoubles, minSolutions, maxSolutions, maxAtTargetLength
+    rng = random.Random(seed)
+    puzzleSettings = levelSettings(length, **settings)
+    puzzles = [] if sink is None else sink.records()
+    keys = set(seen or ())|set([duplicateKey(p) for p in puzzles])
+    while len(puzzles)<count:
+        if batchId is None:
+            metrics.log(1)
+            metrics.log(1, "***CREATING PUZZLE", len(puzzles))
+            puzzle = quarantine.isolate('nanagrams', lambda: createPuzzle(length, puzzleSettings, rng, keys),
+                                        quarantine.rngInputs(rng, seed=seed, length=length, puzzle=len(puzzles)))
+            if puzzle is None:
+                continue
+            puzzles+=[puzzle]
+            keys.add(duplicateKey(puzzles[-1]))
+        else:
+            puzzles+=[quarantine.seeded('nanagrams', lambda i, b: seededPuzzle(i, b, length, seen or (), **settings), len(puzzles), batchId,
+                                        dict(settings, length=length))]
+        if sink is not None:
+            sink.append(puzzles[-1])
+    return(removeDuplicates(puzzles))
+
+def puzzleFileName(targetLength=targetLength, targetPuzzles=targetPuzzles):
+    return(filePrefix+'_'+str(targetPuzzles)+"(LN).json".replace('LN','L'+str(targetLength)))
+
+def savePuzzles(puzzles, targetLength=targetLength, targetPuzzles=targetPuzzles, outputDir=None):
+    #save file
+    path = os.path.join(outputDir or os.path.join(HERE, 'output'), puzzleFileName(targetLength, targetPuzzles))
+    with open(path, 'w') as f:
+            json.dump(puzzles, f)
+    return(path)
+
+
+if __name__ == '__main__':
+    #puzzles are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', puzzleFileName()+'l'), header=dict(game='nanagrams', length=targetLength, count=targetPuzzles, **levelSettings(targetLength)))
+    #puzzles published by earlier runs are not repeated
+    published = dedupe.loadIndex('nanagrams')
+    newPuzzles = generate(targetLength, targetPuzzles, sink=sink, seen=published)
+    path = savePuzzles(newPuzzles)
+    published.addAll([duplicateKey(p) for p in newPuzzles])
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(metrics.outputPath(path), game='nanagrams', length=targetLength, count=targetPuzzles)
+
+    #visualise final puzzle in CV2 window
+    if visualisePuzzles:    
+        randomQuestion = newPuzzles[-1]['question'].copy()
+        centre = "".join(newPuzzles[-1]['fixed'])
+        escape=False
+        while escape==False:
+            random.shuffle(randomQuestion)
+            puzzle,escape=visualise(randomQuestion.copy(),centre)
 
-print(newpuzzlesDf[['question','answersShort']])
\ No newline at end of file
+    import pandas as pd
+    #Check unique solutions
+    print("unique questions", len(pd.DataFrame(newPuzzles).question.apply(lambda x: "".join(x)).unique()))
+    print("unique answers", len(pd.DataFrame(newPuzzles).answersLong.apply(lambda x: "".join(x)).unique()))
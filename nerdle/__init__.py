@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Shared modules used by the game creator scripts in this repository.
+
+Each game folder adds the repository root to sys.path and imports what it needs, eg:
+
+    from nerdle import lexicon
+
+"""
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Character-multiset (anagram) index over a lexicon.
+
+Two calculations are anagrams when they use the same characters the same number of times, ignoring '=' (eg 12+3=15 and
+13+2=15 both use 1,1,2,3,5,+).  Nanagrams needs, for a set of question characters, every calculation that can be
+made from some or all of them.
+
+Algorithm:
+    - Count each character (digits and + - * /) in every calculation, and pack the counts into one uint64 'signature'
+      (4 bits per character, so counts up to 15)
+    - Sort calculation ids by signature (CSR layout: unique signatures, offsets into the sorted ids)
+    - lookup(chars): calculations with exactly these characters - a binary search
+    - within(chars): calculations whose characters fit inside chars (each used at most as often as it appears in chars),
+      found by comparing the counts of each distinct signature with chars in one numpy operation, so the
+      combinations of chars never have to be enumerated
+
+File output:
+    - lexicon/nerdlewords[n][z].anagram.npz - the index tables, saved next to the compiled lexicon the first time they
+      are built and rebuilt if the lexicon changes (ids are row numbers in the compiled lexicon)
+
+Usage:
+    from nerdle import anagramindex
+    index = anagramindex.loadIndex(7, zeros=True)
+    index.words(index.lookup("12+3=15"))            #every calculation using exactly 1,1,2,3,5,+
+    index.words(index.within("123456+*"))           #every length 7 calculation that can be made from these characters
+
+"""
+
+import numpy as np
+
+from nerdle import lexicon, memory
+
+#characters counted in a signature ('=' is always present so it is ignored)
+ALPHABET = '0123456789+-*/'
+BITS = 4
+TABLES = ['order', 'signatures', 'offsets', 'counts', 'inverse']
+
+_CODES = np.full(256, -1, dtype=np.int64)
+for _k, _c in enumerate(ALPHABET):
+    _CODES[ord(_c)] = _k
+
+#per-process cache of built indexes (cleared when over a memory budget, see nerdle/memory.py)
+_indexes = {}
+memory.register('anagram indexes', _indexes.clear)
+
+
+def countVectors(words):
+    #uint8 rows -> (number of rows, len(ALPHABET)) counts of each character
+    words = np.asarray(words)
+    counts = np.zeros((len(words), len(ALPHABET)), dtype=np.uint8)
+    for k, c in enumerate(ALPHABET):
+        counts[:, k] = (words == ord(c)).sum(axis=1)
+    return(counts)
+
+
+def packCounts(counts):
+    #count vectors -> uint64 signatures
+    weights = np.left_shift(np.uint64(1), np.arange(len(ALPHABET), dtype=np.uint64)*np.uint64(BITS))
+    return((counts.astype(np.uint64)*weights).sum(axis=-1, dtype=np.uint64))
+
+
+def countChars(chars):
+    #string / list of characters -> count vector (characters outside ALPHABET, eg '=', are ignored)
+    codes = _CODES[np.frombuffer("".join(chars).encode('ascii'), dtype=np.uint8)]
+    return(np.bincount(codes[codes >= 0], minlength=len(ALPHABET)).astype(np.uint8))
+
+
+def buildTables(words):
+    #CSR layout: ids sorted by signature, the distinct signatures with their offsets and counts, and for each sorted id
+    #the number of its signature
+    counts = countVectors(words)
+    if counts.size and counts.max() >= (1 << BITS):
+        raise ValueError("character repeated too often to pack into a signature")
+    signatures = packCounts(counts)
+    order = np.argsort(signatures, kind='stable')
+    unique, starts, inverse = np.unique(signatures[order], return_index=True, return_inverse=True)
+    return({'order': order.astype(np.int32), 'signatures': unique, 'offsets': np.append(starts, len(words)),
+            'counts': counts[order[starts]], 'inverse': inverse.astype(np.int32)})
+
+
+class AnagramIndex:
+
+    def __init__(self, words, tables=None):
+        #words: uint8 array (number of calculations, length), eg from lexicon.loadLexicon
+        #tables: from buildTables (built here if not given)
+        self.rows = words
+        self.size, self.length = words.shape
+        if tables is None:
+            tables = buildTables(words)
+        self.order, self.signatures, self.offsets, self.counts, self.inverse = [tables[k] for k in TABLES]
+
+    def lookup(self, chars):
+        #ids of calculations using exactly the characters in chars (ignoring '=')
+        signature = packCounts(countChars(chars))
+        i = np.searchsorted(self.signatures, signature)
+        if i == len(self.signatures) or self.signatures[i] != signature:
+            return(np.zeros(0, dtype=np.int64))
+        return(np.sort(self.order[self.offsets[i]:self.offsets[i+1]]))
+
+    def within(self, chars):
+        #ids of calculations whose characters all fit inside chars (each used at most as often as in chars)
+        fits = np.all(self.counts <= countChars(chars), axis=1)
+        return(np.sort(self.order[fits[self.inverse]]))
+
+    def words(self, ids):
+        return(lexicon.toStrings(self.rows[ids]))
+
+
+def loadIndex(length, zeros=False, compiledDir=None):
+    #index over a compiled lexicon, read from disk (or built and saved) once per process
+    key = (length, zeros, compiledDir)
+    if key not in _indexes:
+        tables = lexicon.loadTables(length, zeros, 'anagram', buildTables, compiledDir)
+        _indexes[key] = AnagramIndex(lexicon.loadLexicon(length, zeros, compiledDir), tables)
+    return(_indexes[key])
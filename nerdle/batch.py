@@ -0,0 +1,647 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Batch runner: creates every game listed in one job config, running the jobs in a process pool.
+
+Replaces editing the params at the top of each creator script and running them one at a time.
+
+File inputs:
+    - job config (json), eg batch.json in the repository root:
+        {
+            "workers": 4,
+            "batchId": "2024-06",
+            "jobs": [
+                {"game": "nanagrams", "length": 6, "count": 10},
+                {"game": "shuffleNumbers", "mode": "swapBoth", "count": 10, "seed": 1},
+                ...
+            ]
+        }
+    - each job has a game (see nerdle/games.py), an optional name, and the game's own keys (see JOB_KEYS):
+        - nanagrams: length, count, seed, plus any of maxDoubles, minSolutions, maxSolutions, maxAtTargetLength
+        - crossnerdle1: fileStem (patterns file in crossnerdle/input), countPerPattern, seed
+        - crossnerdle2: fileStem (answers file in crossnerdle/output), seed
+        - targets: count, seed
+        - shuffleNumbers: mode, count, seed
+        - shuffleWords: count, seed
+    - optional "outputDir": all output files go there instead of each game's output folder
+    - optional "batchId" (or a job's own batchId): seed each puzzle from (game, batch id, puzzle index) instead of
+      seeding a job from its seed (see nerdle/seeding.py), and split each job into shards
+
+Algorithm:
+    - Load everything the jobs need (lexicons, indexes, allowed calculations) once in this process (see WARM)
+    - Run the jobs in a process pool.  Workers are forked from this process so jobs that use the same lexicon share
+      one loaded copy (on platforms without fork each worker loads its own, but memmapped lexicons are still shared
+      through the OS page cache)
+    - With a batch id, each job is run as shards (shard k makes puzzles k, k+n, k+2n, ...), each saved to a shard
+      file.  When all shards of a job are made they are merged in index order, steps over the whole batch are run
+      (removing duplicates, crossnerdle grading and days) and the game's files are saved.  The output is the same
+      whatever the number of shards and workers, and shards can be made on different machines (--shard, then --merge)
+    - Each job's puzzles are appended to [shardDir]/[job name].jsonl (or .shard[k]of[n].jsonl) as they are made
+      (see nerdle/sink.py), so running a batch again after it was stopped carries on where each job left off
+      (--restart to start again)
+    - Puzzles already published (see nerdle/dedupe.py) are not made again: each job checks its puzzles against the
+      published keys of its game, and adds its own once its files are saved (crossnerdle2 questions are not checked,
+      as their answers are crossnerdle1's)
+    - Each task's printed output goes to [logDir]/[task name].log.  Every interval seconds the runner prints each
+      running task's latest log line (if it has changed), and a summary when all tasks have finished
+    - With --metrics, each task's stage timers and counters (see nerdle/metrics.py) are saved next to its log, and
+      all of them together in [logDir]/batch.metrics.json.  --verbose sets how much each task prints to its log
+    - With --memory-mb, the total is shared out between the workers as each one's memory budget (see
+      nerdle/memory.py): a worker over its share clears its caches, and the data loaded before the workers start is
+      frozen so they go on sharing it.  With --metrics the summary shows each task's peak memory
+    - With --profile, the chosen stages of each task (every Nth call with --profile-every) are sampled and saved as
+      flamegraph files (see nerdle/profiler.py) in [logDir]/profiles
+    - A puzzle that fails, or takes longer than --puzzle-timeout seconds, is recorded in quarantine/[game].jsonl and
+      skipped, or made again from a retry seed with a batch id (see nerdle/quarantine.py), so one bad puzzle does not
+      stop its task
+
+Note: jobs run at the same time, so a crossnerdle2 job reads the answers file that exists when it starts (not one
+written by a crossnerdle1 job in the same batch).
+
+File output:
+    - the files each game's main code writes (see each creator script), and one log per task
+    - with --metrics, [logDir]/[task name].metrics.json per task and [logDir]/batch.metrics.json
+    - with --profile, [logDir]/profiles/[task name].collapsed, .[stage].collapsed and .profile.json per task
+    - quarantine/[game].jsonl: each puzzle that failed or timed out, with its inputs (see nerdle/quarantine.py)
+    - the keys of every saved puzzle, appended to published/[game].keys (see nerdle/dedupe.py)
+    - while a job runs, [shardDir]/[job name].jsonl (removed when its files are saved)
+    - with a batch id, in [shardDir]: [job name].shard[k]of[n].json for each shard (see nerdle/seeding.py) and
+      [job name].indexes.json - the puzzle index of each saved puzzle, in saved order (to regenerate one)
+
+Usage (from the repository root):
+    python -m nerdle.batch batch.json
+    python -m nerdle.batch batch.json --workers 8 --output-dir /tmp/games
+    python -m nerdle.batch batch.json --metrics --verbose 0       #stage timers and reject counts, quiet logs
+    python -m nerdle.batch batch.json --profile 'grid fill,min solve' --profile-every 50     #flamegraphs of 1 in 50
+    python -m nerdle.batch batch.json --workers 8 --memory-mb 6000 --metrics    #at most ~750MB per worker
+    python -m nerdle.batch batch.json --batch-id 2024-06 --puzzle-timeout 300   #skip puzzles taking over 5 minutes
+
+    #with a batch id: 3 machines make one shard each, then one merges (shard files copied to its shard folder)
+    python -m nerdle.batch batch.json --batch-id 2024-06 --shard 0 --shards 3
+    python -m nerdle.batch batch.json --batch-id 2024-06 --merge
+
+    #print one puzzle of a batch again, by index (see [job name].indexes.json for a saved puzzle's index)
+    python -m nerdle.batch batch.json --batch-id 2024-06 --regenerate "targets count=10" 17
+
+    #or from python
+    from nerdle import batch
+    results = batch.runBatch(batch.loadConfig('batch.json')['jobs'], workers=4)
+
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import gc
+import glob
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+
+from nerdle import dedupe, games, memory, metrics, profiler, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#keys each job may use (besides game, name and batchId)
+JOB_KEYS = {
+    'nanagrams': ['length', 'count', 'seed', 'maxDoubles', 'minSolutions', 'maxSolutions', 'maxAtTargetLength'],
+    'crossnerdle1': ['fileStem', 'countPerPattern', 'seed'],
+    'crossnerdle2': ['fileStem', 'seed'],
+    'targets': ['count', 'seed'],
+    'shuffleNumbers': ['mode', 'count', 'seed'],
+    'shuffleWords': ['count', 'seed'],
+}
+COMMON_KEYS = ['game', 'name', 'batchId']
+
+
+def _nanagramsSettings(job):
+    return({k: job[k] for k in JOB_KEYS['nanagrams'][3:] if k in job})
+
+
+def publishedName(module, job):
+    #name of the published keys a job's puzzles are checked against (see nerdle/dedupe.py), None if they are not checked
+    if job['game']=='crossnerdle2':
+        return(None)
+    if job['game']=='shuffleNumbers':
+        return('shuffleNumbers-'+job.get('mode', module.mode))
+    return(job['game'])
+
+
+def _published(module, job):
+    name = publishedName(module, job)
+    return(() if name is None else dedupe.loadIndex(name))
+
+
+def _publish(module, job, puzzles):
+    #once a job's files are saved, its puzzles are not made again by later batches
+    if publishedName(module, job) is not None:
+        _published(module, job).addAll([module.duplicateKey(p) for p in puzzles])
+
+
+def _nanagrams(module, job, outputDir, sink):
+    length = job.get('length', module.targetLength)
+    count = job.get('count', module.targetPuzzles)
+    puzzles = module.generate(length, count, job.get('seed'), sink=sink, seen=_published(module, job), **_nanagramsSettings(job))
+    module.savePuzzles(puzzles, length, count, outputDir)
+    _publish(module, job, puzzles)
+    return(len(puzzles))
+
+
+def _crossnerdle1(module, job, outputDir, sink):
+    fileStem = job.get('fileStem', module.fileStem)
+    puzzles = module.generate(module.loadPatterns(fileStem), job.get('countPerPattern', module.targetPerPattern), job.get('seed'), sink=sink,
+                              seen=_published(module, job))
+    module.savePuzzles(puzzles, fileStem, outputDir)
+    _publish(module, job, puzzles)
+    return(len(puzzles))
+
+
+def _crossnerdle2(module, job, outputDir, sink):
+    fileStem = job.get('fileStem', module.fileStem)
+    dayList, dayIndex = module.generate(module.loadAnswers(fileStem+'_answers.json'), job.get('seed'), sink=sink)
+    module.savePuzzles(dayList, dayIndex, fileStem, outputDir)
+    return(len(dayList))
+
+
+def _targets(module, job, outputDir, sink):
+    puzzles = module.generate(job.get('count', module.targetQs), job.get('seed'), sink=sink, seen=_published(module, job))
+    module.savePuzzles(puzzles, outputDir)
+    _publish(module, job, puzzles)
+    return(len(puzzles))
+
+
+def _shuffleNumbers(module, job, outputDir, sink):
+    mode = job.get('mode', module.mode)
+    count = job.get('count', module.questions)
+    puzzles = module.generate(count, mode, job.get('seed'), sink=sink, seen=_published(module, job))
+    module.savePuzzles(puzzles, module.filePrefix+'_'+mode+'_'+str(count), outputDir)
+    _publish(module, job, puzzles)
+    return(len(puzzles))
+
+
+def _shuffleWords(module, job, outputDir, sink):
+    count = job.get('count', module.questions)
+    puzzles = module.generate(count, job.get('seed'), sink=sink, seen=_published(module, job))
+    module.savePuzzles(puzzles, module.filePrefix+'_'+str(count), outputDir)
+    _publish(module, job, puzzles)
+    return(len(puzzles))
+
+
+#job -> puzzles created (each also appended to sink, see nerdle/sink.py) and saved
+RUN = {'nanagrams': _nanagrams, 'crossnerdle1': _crossnerdle1, 'crossnerdle2': _crossnerdle2, 'targets': _targets,
+       'shuffleNumbers': _shuffleNumbers, 'shuffleWords': _shuffleWords}
+
+
+#seeded jobs (see nerdle/seeding.py) are split into two parts:
+#   SEEDED: job -> (number of puzzles, function making the puzzle at an index), run for each shard
+#   FINISH: all of a job's puzzles in index order -> the puzzles saved (after any steps over the whole batch), run after the merge
+#seeded puzzles are checked against the published keys when they are made and published once saved (see nerdle/dedupe.py)
+
+def _nanagramsSeeded(module, job):
+    length = job.get('length', module.targetLength)
+    settings = _nanagramsSettings(job)
+    seen = _published(module, job)
+    return(job.get('count', module.targetPuzzles), lambda index, batchId: module.seededPuzzle(index, batchId, length, seen, **settings))
+
+
+def _nanagramsFinish(module, job, puzzles, batchId, outputDir):
+    published = module.removeDuplicates(puzzles)
+    module.savePuzzles(published, job.get('length', module.targetLength), job.get('count', module.targetPuzzles), outputDir)
+    _publish(module, job, published)
+    return(published)
+
+
+def _crossnerdle1Seeded(module, job):
+    patterns = module.loadPatterns(job.get('fileStem', module.fileStem))
+    countPerPattern = job.get('countPerPattern', module.targetPerPattern)
+    seen = _published(module, job)
+    return(len(patterns)*countPerPattern, lambda index, batchId: module.seededPuzzle(index, batchId, patterns, countPerPattern, seen))
+
+
+def _crossnerdle1Finish(module, job, puzzles, batchId, outputDir):
+    published = module.removeDuplicates(puzzles)
+    module.savePuzzles(published, job.get('fileStem', module.fileStem), outputDir)
+    _publish(module, job, published)
+    return(published)
+
+
+def _crossnerdle2Seeded(module, job):
+    answers = module.loadAnswers(job.get('fileStem', module.fileStem)+'_answers.json')
+    return(len(answers), lambda index, batchId: module.seededPuzzle(index, batchId, answers))
+
+
+def _crossnerdle2Finish(module, job, puzzles, batchId, outputDir):
+    dayList, dayIndex = module.finishQuestions(puzzles, batchId)
+    module.savePuzzles(dayList, dayIndex, job.get('fileStem', module.fileStem), outputDir)
+    return(dayList)
+
+
+def _targetsSeeded(module, job):
+    seen = _published(module, job)
+    return(job.get('count', module.targetQs), lambda index, batchId: module.seededPuzzle(index, batchId, seen))
+
+
+def _targetsFinish(module, job, puzzles, batchId, outputDir):
+    module.savePuzzles(puzzles, outputDir)
+    _publish(module, job, puzzles)
+    return(puzzles)
+
+
+def _shuffleNumbersSeeded(module, job):
+    mode = job.get('mode', module.mode)
+    seen = _published(module, job)
+    return(job.get('count', module.questions), lambda index, batchId: module.seededPuzzle(index, batchId, mode, seen))
+
+
+def _shuffleNumbersFinish(module, job, puzzles, batchId, outputDir):
+    module.savePuzzles(puzzles, module.filePrefix+'_'+job.get('mode', module.mode)+'_'+str(job.get('count', module.questions)), outputDir)
+    _publish(module, job, puzzles)
+    return(puzzles)
+
+
+def _shuffleWordsSeeded(module, job):
+    grids = module.loadAnswers()
+    seen = _published(module, job)
+    return(job.get('count', module.questions), lambda index, batchId: module.seededPuzzle(index, batchId, grids, seen))
+
+
+def _shuffleWordsFinish(module, job, puzzles, batchId, outputDir):
+    module.savePuzzles(puzzles, module.filePrefix+'_'+str(job.get('count', module.questions)), outputDir)
+    _publish(module, job, puzzles)
+    return(puzzles)
+
+
+SEEDED = {'nanagrams': _nanagramsSeeded, 'crossnerdle1': _crossnerdle1Seeded, 'crossnerdle2': _crossnerdle2Seeded,
+          'targets': _targetsSeeded, 'shuffleNumbers': _shuffleNumbersSeeded, 'shuffleWords': _shuffleWordsSeeded}
+FINISH = {'nanagrams': _nanagramsFinish, 'crossnerdle1': _crossnerdle1Finish, 'crossnerdle2': _crossnerdle2Finish,
+          'targets': _targetsFinish, 'shuffleNumbers': _shuffleNumbersFinish, 'shuffleWords': _shuffleWordsFinish}
+
+
+def _warmNanagrams(module, job):
+    length = job.get('length', module.targetLength)
+    settings = module.levelSettings(length, **_nanagramsSettings(job))
+    module.questionCandidates(length, settings['maxDoubles'])
+    for answerLength in [x for x in [3,5,6,7,8,9] if x<=length]:
+        module.answerIndex(answerLength)
+
+
+def _warmCrossnerdle1(module, job):
+    for pattern in module.loadPatterns(job.get('fileStem', module.fileStem)):
+        _, _, acrossList, downList = module.findWords(pattern)
+        for length in set([w['length'] for w in acrossList+downList]):
+            if module.hasWordList('_'*length):
+                module.patternIndex(length)
+
+
+def _warmCrossnerdle2(module, job):
+    lengths = set()
+    for puzzle in module.loadAnswers(job.get('fileStem', module.fileStem)+'_answers.json'):
+        across, down = module.findWords(puzzle)
+        lengths.update([end-start+1 for _, (start, end) in across+down])
+    for length in lengths:
+        if length<=9:
+            module.wordIndex(length)
+
+
+def _warmShuffleNumbers(module, job):
+    module.loadPerms(module.calcType(job.get('mode', module.mode)))
+
+
+#job -> loads into the module's per-process caches whatever its generate will need (games not listed load nothing large)
+WARM = {'nanagrams': _warmNanagrams, 'crossnerdle1': _warmCrossnerdle1, 'crossnerdle2': _warmCrossnerdle2,
+        'shuffleNumbers': _warmShuffleNumbers}
+
+
+def loadConfig(path):
+    with open(path) as f:
+        return(json.load(f))
+
+
+def jobName(job):
+    #name used in progress, summary and log file name, eg "nanagrams length=6 count=10"
+    if 'name' in job:
+        return(str(job['name']))
+    return(" ".join([job['game']]+[k+"="+str(job[k]) for k in JOB_KEYS.get(job['game'], []) if k in job]))
+
+
+def checkJob(job):
+    if job.get('game') not in RUN:
+        raise ValueError("unknown game "+str(job.get('game'))+", choose from "+", ".join(RUN))
+    unknown = [k for k in job if k not in JOB_KEYS[job['game']]+COMMON_KEYS]
+    if unknown:
+        raise ValueError(jobName(job)+": unknown keys "+", ".join(unknown))
+
+
+def checkJobs(jobs):
+    for job in jobs:
+        checkJob(job)
+    names = [jobName(job) for job in jobs]
+    if len(set(names))<len(names):
+        raise ValueError("job names must be unique (add a name to jobs with the same settings)")
+
+
+def fileName(name):
+    #task / job name -> safe file name (without extension)
+    return(re.sub(r'[^A-Za-z0-9_.=-]+', '_', name))
+
+
+def logPath(logDir, name):
+    return(os.path.join(logDir, fileName(name)+'.log'))
+
+
+def metricsPath(logDir, name):
+    return(os.path.join(logDir, fileName(name)+'.metrics.json'))
+
+
+def shardPath(shardDir, job, shard, shards):
+    return(os.path.join(shardDir, fileName(jobName(job))+'.shard%dof%d.json' % (shard, shards)))
+
+
+def runJob(job, outputDir=None, shardDir='shards'):
+    #create and save one job's puzzles -> number of puzzles
+    #puzzles are appended to [shardDir]/[job name].jsonl as they are made, so a job that is stopped carries on where it left off
+    sink = JsonlSink(os.path.join(shardDir, fileName(jobName(job))+'.jsonl'), header=job)
+    puzzles = RUN[job['game']](games.load(job['game']), job, outputDir, sink)
+    sink.remove()
+    return(puzzles)
+
+
+def runShard(job, batchId, shard, shards, shardDir):
+    #make one shard of a seeded job and save it to its shard file -> number of puzzles
+    #a shard already made is kept, and one that was stopped carries on from its .jsonl file
+    count, puzzle = SEEDED[job['game']](games.load(job['game']), job)
+    path = shardPath(shardDir, job, shard, shards)
+    if os.path.exists(path):
+        made = seeding.loadShard(path)
+        if (made['batchId'], made['count'])==(batchId, count):
+            print("shard already made")
+            return(len(made['puzzles']))
+
+    indexes = seeding.shardIndexes(count, shard, shards)
+    sink = JsonlSink(path+'l', header={'game': job['game'], 'batchId': batchId, 'count': count, 'shard': shard, 'shards': shards})
+    puzzles = sink.records()
+    for index in indexes[len(puzzles):]:
+        puzzles += [quarantine.seeded(job['game'], puzzle, index, batchId, {'job': job})]
+        sink.append(puzzles[-1])
+    seeding.saveShard(path, job['game'], batchId, count, shard, shards, indexes, puzzles)
+    sink.remove()
+    return(len(puzzles))
+
+
+def mergeJob(job, batchId, shardDir, outputDir=None):
+    #merge every shard file of a seeded job, finish the batch and save the game's files -> number of puzzles saved
+    paths = sorted(glob.glob(os.path.join(shardDir, fileName(jobName(job))+'.shard*of*.json')))
+    shards = [seeding.loadShard(path) for path in paths]
+    if any([s['batchId']!=batchId for s in shards]):
+        raise ValueError("shard files in "+shardDir+" are not all from batch "+str(batchId))
+    puzzles = seeding.mergeShards(shards)
+    print("merged", len(paths), "shards,", len(puzzles), "puzzles")
+
+    #index of each saved puzzle (finish steps drop duplicates and reorder, even in place, but keep the puzzle objects)
+    indexOf = {id(p): i for i, p in enumerate(puzzles)}
+    published = FINISH[job['game']](games.load(job['game']), job, puzzles, batchId, outputDir)
+    with open(os.path.join(shardDir, fileName(jobName(job))+'.indexes.json'), 'w') as f:
+        json.dump({'game': job['game'], 'batchId': batchId, 'indexes': [indexOf[id(p)] for p in published]}, f)
+    return(len(published))
+
+
+def regenerate(job, batchId, index):
+    #the puzzle at index of a seeded job (before any steps over the whole batch, eg crossnerdle grading)
+    count, puzzle = SEEDED[job['game']](games.load(job['game']), job)
+    if not 0<=index<count:
+        raise ValueError("index must be 0 to "+str(count-1))
+    return(quarantine.seeded(job['game'], puzzle, index, batchId, {'job': job}))
+
+
+def runTask(name, function, args, logDir, settings=(False, 1, None)):
+    #run one task (in a worker), printed output going to its log -> {'name', 'puzzles', 'seconds'}
+    #settings: (metrics enabled, verbosity, memory budget in MB) from the runner, as workers are not always forked from it
+    #with metrics on, the task's stage timers and counters are saved next to its log (also if it fails) and returned as 'metrics'
+    #with profiling on, the task's profiles are saved in [logDir]/profiles (also if it fails)
+    start = time.time()
+    metrics.configure(*settings[:2])
+    memory.configure(settings[2])
+    metrics.reset()
+    profiler.reset()
+    try:
+        with open(logPath(logDir, name), 'w', buffering=1) as log, contextlib.redirect_stdout(log):
+            print(name, "started", time.ctime(start))
+            try:
+                puzzles = function(*args)
+            except BaseException:
+                traceback.print_exc(file=log)
+                raise
+            print(name, "finished", puzzles, "puzzles")
+    finally:
+        if metrics.enabled:
+            metrics.saveSummary(metricsPath(logDir, name), task=name)
+        if profiler.stages:
+            profiler.save(os.path.join(logDir, 'profiles'), label=name)
+    result = {'name': name, 'puzzles': puzzles, 'seconds': time.time()-start}
+    if metrics.enabled:
+        result['metrics'] = metrics.summary(task=name)
+    return(result)
+
+
+def lastLine(path, size=400):
+    #latest line printed by a running task ('' if it has not started)
+    if not os.path.exists(path):
+        return('')
+    with open(path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(path)-size))
+        lines = f.read().decode('utf-8', 'replace').strip().splitlines()
+    return(lines[-1] if lines else '')
+
+
+def warmJobs(jobs):
+    #loaded here, before the workers are forked, so each lexicon / index is loaded once for all jobs
+    start = time.time()
+    for job in jobs:
+        if job['game'] in WARM:
+            print("loading data for", jobName(job))
+            try:
+                WARM[job['game']](games.load(job['game']), job)
+            except Exception as e:
+                #the job itself reports the error
+                print("    could not load data for", jobName(job), "-", type(e).__name__, e)
+    print("data loaded in", round(time.time()-start, 1), "s")
+
+
+def runTasks(tasks, workers=None, logDir='logs', interval=10, memoryBudget=None):
+    #tasks: list of (name, function, args) -> one result per task (in task order), with 'error' set for tasks that failed
+    #memoryBudget: MB for all the workers together (see nerdle/memory.py)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    names = [task[0] for task in tasks]
+    results = [None]*len(tasks)
+    reported = {}
+    #(else each worker keeps the runner's own budget, eg from NERDLE_MEMORY_MB)
+    budget = memoryBudget/(workers or os.cpu_count() or 1) if memoryBudget else memory.budget
+    if memoryBudget:
+        #workers forked from here share what has been loaded so far, and the collector would copy it by writing to it
+        gc.collect()
+        gc.freeze()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        settings = (metrics.enabled, metrics.verbosity, budget)
+        futures = {pool.submit(runTask, name, function, args, logDir, settings): i for i, (name, function, args) in enumerate(tasks)}
+        pending = set(futures)
+        while pending:
+            done, pending = concurrent.futures.wait(pending, timeout=interval, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    results[i] = {'name': names[i], 'puzzles': 0, 'seconds': None, 'error': type(e).__name__+": "+str(e)}
+                finished = len(futures)-len(pending)
+                if 'error' in results[i]:
+                    print("[%d/%d] FAILED %s - %s (see %s)" % (finished, len(tasks), names[i], results[i]['error'], logPath(logDir, names[i])))
+                else:
+                    print("[%d/%d] done %s - %d puzzles in %.1fs" % (finished, len(tasks), names[i], results[i]['puzzles'], results[i]['seconds']))
+            if pending and not done:
+                for future in sorted(pending, key=futures.get):
+                    i = futures[future]
+                    line = lastLine(logPath(logDir, names[i]))
+                    if line and line!=reported.get(i):
+                        print("    running %s: %s" % (names[i], line[:100]))
+                        reported[i] = line
+    return(results)
+
+
+def runBatch(jobs, workers=None, outputDir=None, logDir='logs', interval=10, warm=True,
+             batchId=None, shards=None, shard=None, merge=True, shardDir='shards', restart=False, memoryBudget=None):
+    #run every job in a process pool -> one result per task, with 'error' set for tasks that failed
+    #jobs (and shards) that were stopped part way carry on where they left off, unless restart
+    #batchId: seed puzzles from (game, batchId, index) (jobs may set their own batchId) and run each job as shards:
+    #   shards: number of shards per job (default workers, else one per cpu), 0 to only merge shard files already made
+    #   shard: make only this shard of each job (eg one machine's share), saved to shardDir
+    #   merge: merge each job's shard files and save the game's files
+    checkJobs(jobs)
+    os.makedirs(logDir, exist_ok=True)
+    if outputDir is not None:
+        os.makedirs(outputDir, exist_ok=True)
+    jobBatchIds = [job.get('batchId', batchId) for job in jobs]
+    if (shard is not None or shards==0) and None in jobBatchIds:
+        raise ValueError("shards need a batch id (--batch-id, or batchId in the config / job)")
+    shards = shards if shards is not None else (workers or os.cpu_count())
+
+    os.makedirs(shardDir, exist_ok=True)
+
+    start = time.time()
+    tasks = []
+    shardTasks = {}
+    for i, (job, jobBatchId) in enumerate(zip(jobs, jobBatchIds)):
+        name = jobName(job)
+        for path in glob.glob(os.path.join(shardDir, fileName(name)+'.*')):
+            #shards made with a different number of shards cannot be merged with these
+            other = re.search(r'\.shard\d+of(\d+)\.jsonl?$', path)
+            if restart or (other and shards>0 and int(other.group(1))!=shards):
+                os.remove(path)
+        if jobBatchId is None:
+            tasks += [(name, runJob, (job, outputDir, shardDir))]
+            continue
+        shardTasks[i] = []
+        for k in ([shard] if shard is not None else range(shards)):
+            shardTasks[i] += [len(tasks)]
+            tasks += [("%s shard %d of %d" % (name, k, shards), runShard, (job, jobBatchId, k, shards, shardDir))]
+
+    metrics.reset()
+    if warm and tasks:
+        warmJobs([job for i, job in enumerate(jobs) if shardTasks.get(i, True)])
+    results = runTasks(tasks, workers, logDir, interval, memoryBudget) if tasks else []
+
+    if merge and shardTasks:
+        #merge only the jobs whose shards were all made
+        mergeTasks = [(jobName(jobs[i])+" merge", mergeJob, (jobs[i], jobBatchIds[i], shardDir, outputDir))
+                      for i, t in shardTasks.items() if not [j for j in t if 'error' in results[j]]]
+        results += runTasks(mergeTasks, workers, logDir, interval, memoryBudget)
+
+    printSummary(results, time.time()-start)
+    if metrics.enabled:
+        saveMetrics(os.path.join(logDir, 'batch.metrics.json'), results, time.time()-start)
+    return(results)
+
+
+def saveMetrics(path, results, seconds):
+    #every task's metrics (see nerdle/metrics.py) in one file, with the stage and reject totals over all tasks
+    #'runner' is this process's own (data loaded before the workers start)
+    stages, rejects = {}, {}
+    for r in results:
+        for name, t in r.get('metrics', {}).get('stages', {}).items():
+            total = stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak': 0.0})
+            for key in ['calls', 'wall', 'cpu']:
+                total[key] = round(total[key]+t[key], 6)
+            #the most any one task used
+            total['peak'] = max(total['peak'], t.get('peak', 0.0))
+        for reason, n in r.get('metrics', {}).get('rejects', {}).items():
+            rejects[reason] = rejects.get(reason, 0)+n
+    with open(path, 'w') as f:
+        json.dump({'seconds': round(seconds, 3), 'stages': stages, 'rejects': rejects, 'runner': metrics.summary(task='runner'),
+                   'tasks': [dict(r.get('metrics', {}), name=r['name'], puzzles=r['puzzles'], error=r.get('error')) for r in results]}, f, indent=1)
+    print("metrics saved to", path)
+
+
+def printSummary(results, seconds):
+    #with metrics on, each task's peak resident memory as well
+    peaks = any(['metrics' in r for r in results])
+    print()
+    print("%-50s %8s %9s%s  %s" % ("task", "puzzles", "seconds", " peak MB" if peaks else "", "status"))
+    for r in results:
+        peak = ("%8.0f" % r['metrics']['memory']['peak'] if 'metrics' in r else "%8s" % "-") if peaks else ""
+        print("%-50s %8d %9s%s  %s" % (r['name'][:50], r['puzzles'], "-" if r['seconds'] is None else "%.1f" % r['seconds'],
+                                       peak, r.get('error', 'ok')))
+    failed = len([r for r in results if 'error' in r])
+    print("%d tasks, %d failed in %.1fs" % (len(results), failed, seconds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="create every game in a job config, in parallel")
+    parser.add_argument('config', help="json job config (see nerdle/batch.py)")
+    parser.add_argument('--workers', type=int, default=None, help="default: the config's workers, else one per cpu")
+    parser.add_argument('--output-dir', default=None, help="write every job's files here instead of each game's output folder")
+    parser.add_argument('--log-dir', default=None, help="default: logs folder next to the config")
+    parser.add_argument('--interval', type=float, default=10, help="seconds between progress reports")
+    parser.add_argument('--batch-id', default=None, help="seed each puzzle from (game, batch id, index), see nerdle/seeding.py")
+    parser.add_argument('--shards', type=int, default=None, help="shards per job (default: one per worker)")
+    parser.add_argument('--shard', type=int, default=None, help="make only this shard of each job (0 to shards-1), then stop")
+    parser.add_argument('--merge', action='store_true', help="only merge shard files already made and save the games")
+    parser.add_argument('--shard-dir', default=None, help="default: shards folder next to the config")
+    parser.add_argument('--restart', action='store_true', help="start jobs again instead of carrying on from where they were stopped")
+    parser.add_argument('--metrics', action='store_true', help="save stage timers and counters for each task (see nerdle/metrics.py)")
+    parser.add_argument('--memory-mb', type=float, default=None, help="memory budget for all the workers together, see nerdle/memory.py")
+    parser.add_argument('--profile', default=None, metavar='STAGES', help="sample these stages (comma separated, 'run' for the whole task) for flamegraphs, see nerdle/profiler.py")
+    parser.add_argument('--profile-every', type=int, default=None, metavar='N', help="profile only every Nth call of each stage")
+    parser.add_argument('--puzzle-timeout', type=float, default=None, metavar='SECONDS', help="skip (quarantine) a puzzle taking longer than this, see nerdle/quarantine.py")
+    parser.add_argument('--verbose', type=int, default=None, help="0 quiet, 1 a line per puzzle (default), 2 every attempt and rejection")
+    parser.add_argument('--regenerate', nargs=2, metavar=('JOB', 'INDEX'), help="print the puzzle at INDEX of job JOB (by name)")
+    args = parser.parse_args()
+    metrics.configure(enabled=args.metrics or None, verbosity=args.verbose)
+    quarantine.configure(timeout=args.puzzle_timeout)
+
+    config = loadConfig(args.config)
+    here = os.path.dirname(os.path.abspath(args.config))
+    if args.profile:
+        #in the environment as well, for workers that are not forked from this process
+        os.environ['NERDLE_PROFILE'] = args.profile
+        os.environ['NERDLE_PROFILE_EVERY'] = str(args.profile_every or profiler.every)
+        os.environ['NERDLE_PROFILE_DIR'] = os.path.join(args.log_dir or os.path.join(here, 'logs'), 'profiles')
+        profiler.configure(args.profile, every=args.profile_every, outputDir=os.environ['NERDLE_PROFILE_DIR'])
+    batchId = args.batch_id or config.get('batchId')
+    if args.regenerate:
+        jobs = [job for job in config['jobs'] if jobName(job)==args.regenerate[0]]
+        if not jobs:
+            raise SystemExit("no job named "+args.regenerate[0]+", choose from: "+", ".join([jobName(job) for job in config['jobs']]))
+        print(json.dumps(regenerate(jobs[0], jobs[0].get('batchId', batchId), int(args.regenerate[1]))))
+        raise SystemExit(0)
+
+    results = runBatch(config['jobs'], workers=args.workers or config.get('workers'),
+                       outputDir=args.output_dir or config.get('outputDir'),
+                       logDir=args.log_dir or os.path.join(here, 'logs'), interval=args.interval,
+                       batchId=batchId, shards=0 if args.merge else (args.shards or config.get('shards')), shard=args.shard,
+                       merge=args.shard is None, shardDir=args.shard_dir or os.path.join(here, 'shards'), restart=args.restart,
+                       memoryBudget=args.memory_mb)
+    if any(['error' in r for r in results]):
+        raise SystemExit(1)
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Compact bundle format for the creator scripts' output files: one binary file holding one or more json files (eg a
+shuffle game's _A, _Q and _S files), several times smaller than the json and faster to read in bulk.  Decoding gives
+back exactly what json.load of each file gives, so unpacking writes the same json files again.
+
+Encoding (any json value; the container is chosen from the value, so it works for every game's files):
+    - string table: every distinct string (eg grid characters, calculations, dict keys) is stored once and referred to
+      by its number
+    - arrays: a list nested to any depth with the same length at each level (eg a grid, a list of 9 question
+      characters, a list of equal shape grids) whose items are all strings or all integers is stored as its shape and
+      one packed numpy array (string numbers as uint8 / uint16 / uint32, integers in the smallest int type that holds them)
+    - records: dicts with the same keys, in a list nested as for arrays (eg nanagram puzzles, crossnerdle solveLists,
+      shuffle moves), are stored column by column, so each column can be an array
+    - lists of lists of different lengths (eg a nanagram's answers) are stored as the lengths and the items of them all
+    - json text inside a string (eg nanagrams' answersLong, written by pandas to_json) is stored as the value it
+      holds, if writing that value again gives exactly the same text (else as the string)
+    - anything else: tagged values (None, bool, int as a zigzag varint, float as 8 bytes, list, dict)
+    - optional zlib over the whole body
+
+File format (.nrdb):
+    - b'NRDB', version byte, flags byte (1 = body is zlib compressed)
+    - body: string table (count, then length and utf-8 bytes of each) followed by one value, a dict of file name -> the
+      file's json value
+    - counts, lengths, shapes and string numbers are unsigned LEB128 varints
+
+Decoding turns each array back into nested lists with one numpy indexing and tolist() (string arrays through an object
+array of the string table, so each string is made once however often it is used), and records back into dicts with one
+zip per column, so grids are never rebuilt a character at a time in python.
+
+Usage (from the repository root):
+    python -m nerdle.bundle pack crossnerdle.nrdb crossnerdle/output/*.json
+    python -m nerdle.bundle unpack crossnerdle.nrdb /tmp/crossnerdle       #the same json files again
+    python -m nerdle.bundle pack shuffle.nrdb shuffleNumbers/output/*.json --no-zlib
+
+    #or from python
+    from nerdle import bundle
+    data = bundle.encode(puzzles)                       #bytes
+    puzzles = bundle.decode(data)                       #== puzzles
+    bundle.saveBundle('games.nrdb', {'targets_questions.json': questions})
+    files = bundle.loadBundle('games.nrdb')             #{file name: value}
+
+Benchmark (sizes, json.load against decode): python benchmarks/bench_bundle.py
+
+"""
+
+import argparse
+import gc
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'NRDB'
+VERSION = 1
+ZLIB = 1
+
+#value tags
+NULL, FALSE, TRUE, INT, FLOAT, STR, LIST, DICT, STRARRAY, INTARRAY, RECORDS, JSONTEXT, JSONTEXTS, RAGGED = range(14)
+
+#int array types, by the code stored after the shape
+INT_TYPES = [np.dtype('<i1'), np.dtype('<i2'), np.dtype('<i4'), np.dtype('<i8')]
+
+#ways json text inside a string may have been written (see jsonText)
+TEXT_STYLES = [
+    lambda value: json.dumps(value),
+    lambda value: json.dumps(value, separators=(',', ':')),
+    lambda value: json.dumps(value, separators=(',', ':')).replace('/', '\\/'),  #pandas to_json
+]
+
+
+class BundleError(ValueError):
+    pass
+
+
+def writeVarint(out, n):
+    while n>0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def readVarint(data, pos):
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b<0x80:
+            return(n, pos)
+        shift += 7
+
+
+def idType(count):
+    #smallest unsigned type for string numbers 0 to count-1
+    return(np.dtype('<u1') if count<=1<<8 else np.dtype('<u2') if count<=1<<16 else np.dtype('<u4'))
+
+
+def arrayShape(value):
+    #(shape, kind, leaves) of a nested list with the same length at each level and leaves all str ('str'), all int
+    #('int') or all dicts with the same keys ('dict'), else None
+    shape = []
+    level = [value]
+    while isinstance(level[0], list):
+        lengths = set([len(x) if isinstance(x, list) else -1 for x in level])
+        if len(lengths)!=1 or lengths=={0} or lengths=={-1}:
+            return(None)
+        shape += [lengths.pop()]
+        level = [y for x in level for y in x]
+    if not shape:
+        return(None)
+    types = set([type(x) for x in level])
+    if types=={str}:
+        return(tuple(shape), 'str', level)
+    if types=={int} and min(level)>=-(1<<63) and max(level)<(1<<63):
+        return(tuple(shape), 'int', level)
+    if types=={dict} and len(set([tuple(x) for x in level]))==1 and level[0]:
+        return(tuple(shape), 'dict', level)
+    return(None)
+
+
+def nest(flat, shape):
+    #flat list -> nested lists of shape
+    for n in reversed(shape[1:]):
+        flat = [flat[i:i+n] for i in range(0, len(flat), n)]
+    return(flat)
+
+
+def jsonText(text):
+    #(style, value) if text is json of a list / dict that TEXT_STYLES writes back exactly, else None
+    if not text or text[0] not in '[{':
+        return(None)
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return(None)
+    for style, dump in enumerate(TEXT_STYLES):
+        if dump(value)==text:
+            return(style, value)
+    return(None)
+
+
+class _Encoder:
+
+    def __init__(self):
+        self.strings = {}
+        self.out = bytearray()
+
+    def stringId(self, s):
+        if s not in self.strings:
+            self.strings[s] = len(self.strings)
+        return(self.strings[s])
+
+    def value(self, v):
+        out = self.out
+        if v is None:
+            out.append(NULL)
+        elif v is True:
+            out.append(TRUE)
+        elif v is False:
+            out.append(FALSE)
+        elif type(v) is int:
+            out.append(INT)
+            writeVarint(out, (v << 1) if v>=0 else ((-v << 1)-1))
+        elif type(v) is float:
+            out.append(FLOAT)
+            out += struct.pack('<d', v)
+        elif type(v) is str:
+            text = jsonText(v)
+            if text is None:
+                out.append(STR)
+                writeVarint(out, self.stringId(v))
+            else:
+                out.append(JSONTEXT)
+                out.append(text[0])
+                self.value(text[1])
+        elif type(v) is list:
+            self.list(v)
+        elif type(v) is dict:
+            out.append(DICT)
+            writeVarint(out, len(v))
+            for key, item in v.items():
+                writeVarint(out, self.stringId(key))
+                self.value(item)
+        else:
+            raise BundleError("cannot encode "+type(v).__name__)
+
+    def shape(self, shape):
+        writeVarint(self.out, len(shape))
+        for n in shape:
+            writeVarint(self.out, n)
+
+    def list(self, v):
+        out = self.out
+        array = arrayShape(v) if v else None
+        if array is not None:
+            shape, kind, leaves = array
+            if kind=='str':
+                out.append(STRARRAY)
+                self.shape(shape)
+                #written once the string table is complete (see encode), so the numbers use the smallest type
+                self.arrays += [(len(out), np.array([self.stringId(s) for s in leaves], dtype=np.uint32))]
+            elif kind=='int':
+                out.append(INTARRAY)
+                self.shape(shape)
+                values = np.array(leaves, dtype=np.int64)
+                code = [k for k, t in enumerate(INT_TYPES) if np.iinfo(t).min<=values.min() and values.max()<=np.iinfo(t).max][0]
+                out.append(code)
+                out += values.astype(INT_TYPES[code]).tobytes()
+            else:
+                #column by column
+                keys = list(leaves[0])
+                out.append(RECORDS)
+                self.shape(shape)
+                writeVarint(out, len(keys))
+                for key in keys:
+                    writeVarint(out, self.stringId(key))
+                for key in keys:
+                    self.list([x[key] for x in leaves])
+            return
+        texts = [jsonText(x) if type(x) is str else None for x in v] if v else [None]
+        if None not in texts and len(set([t[0] for t in texts]))==1:
+            #a column of json text (eg answersLong) -> the values it holds
+            out.append(JSONTEXTS)
+            out.append(texts[0][0])
+            self.list([t[1] for t in texts])
+            return
+        if v and all([type(x) is list for x in v]):
+            #lists of different lengths -> the lengths and the items of them all
+            out.append(RAGGED)
+            self.list([len(x) for x in v])
+            self.list([y for x in v for y in x])
+            return
+        out.append(LIST)
+        writeVarint(out, len(v))
+        for item in v:
+            self.value(item)
+
+    def encode(self, v):
+        #string arrays are written once the table is complete, so their numbers use the smallest type
+        self.arrays = []
+        self.value(v)
+        body = bytearray()
+        writeVarint(body, len(self.strings))
+        for s in self.strings:
+            data = s.encode('utf-8')
+            writeVarint(body, len(data))
+            body += data
+        dtype = idType(len(self.strings))
+        previous = 0
+        for pos, ids in self.arrays:
+            body += self.out[previous:pos]
+            body += ids.astype(dtype).tobytes()
+            previous = pos
+        body += self.out[previous:]
+        return(bytes(body))
+
+
+class _Decoder:
+
+    def __init__(self, body):
+        self.data = body
+        count, pos = readVarint(body, 0)
+        strings = []
+        for i in range(count):
+            n, pos = readVarint(body, pos)
+            strings += [body[pos:pos+n].decode('utf-8')]
+            pos += n
+        self.strings = strings
+        self.table = np.array(strings+[None], dtype=object)[:-1] if strings else np.zeros(0, dtype=object)
+        self.idType = idType(count)
+        self.pos = pos
+
+    def varint(self):
+        n, self.pos = readVarint(self.data, self.pos)
+        return(n)
+
+    def shape(self):
+        return(tuple([self.varint() for i in range(self.varint())]))
+
+    def value(self):
+        tag = self.data[self.pos]
+        self.pos += 1
+        if tag==STRARRAY or tag==INTARRAY:
+            shape = self.shape()
+            size = int(np.prod(shape))
+            if tag==INTARRAY:
+                dtype = INT_TYPES[self.data[self.pos]]
+                self.pos += 1
+            else:
+                dtype = self.idType
+            values = np.frombuffer(self.data, dtype=dtype, count=size, offset=self.pos).reshape(shape)
+            self.pos += size*dtype.itemsize
+            return((self.table[values] if tag==STRARRAY else values).tolist())
+        if tag==STR:
+            return(self.strings[self.varint()])
+        if tag==RECORDS:
+            shape = self.shape()
+            keys = [self.strings[self.varint()] for i in range(self.varint())]
+            columns = [self.value() for key in keys]
+            return(nest([dict(zip(keys, row)) for row in zip(*columns)], shape))
+        if tag==JSONTEXTS:
+            dump = TEXT_STYLES[self.data[self.pos]]
+            self.pos += 1
+            return([dump(x) for x in self.value()])
+        if tag==RAGGED:
+            lengths = self.value()
+            items = self.value()
+            ends = np.cumsum(lengths).tolist()
+            return([items[end-n:end] for n, end in zip(lengths, ends)])
+        if tag==LIST:
+            return([self.value() for i in range(self.varint())])
+        if tag==DICT:
+            return({self.strings[self.varint()]: self.value() for i in range(self.varint())})
+        if tag==INT:
+            n = self.varint()
+            return(n >> 1 if not n & 1 else -((n+1) >> 1))
+        if tag==FLOAT:
+            self.pos += 8
+            return(struct.unpack_from('<d', self.data, self.pos-8)[0])
+        if tag==JSONTEXT:
+            style = self.data[self.pos]
+            self.pos += 1
+            return(TEXT_STYLES[style](self.value()))
+        if tag==NULL:
+            return(None)
+        if tag==TRUE:
+            return(True)
+        if tag==FALSE:
+            return(False)
+        raise BundleError("unknown tag %d at byte %d" % (tag, self.pos-1))
+
+
+def encode(value, compress=True, level=6):
+    #json value -> bundle bytes
+    body = _Encoder().encode(value)
+    if compress:
+        body = zlib.compress(body, level)
+    return(MAGIC+bytes([VERSION, ZLIB if compress else 0])+body)
+
+
+def decode(data):
+    #bundle bytes -> json value
+    if data[:4]!=MAGIC:
+        raise BundleError("not a bundle")
+    if data[4]!=VERSION:
+        raise BundleError("bundle version %d, expected %d" % (data[4], VERSION))
+    body = zlib.decompress(data[6:]) if data[5] & ZLIB else bytes(data[6:])
+    #decoding only makes new lists and dicts (no cycles), so the collector passes it would set off find nothing
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return(_Decoder(body).value())
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def saveBundle(path, files, compress=True):
+    #files: {file name: json value} -> path
+    with open(path, 'wb') as f:
+        f.write(encode(files, compress))
+    return(path)
+
+
+def loadBundle(path):
+    #-> {file name: json value}
+    with open(path, 'rb') as f:
+        return(decode(f.read()))
+
+
+def pack(path, jsonPaths, compress=True):
+    #bundle of json files (by file name, so names must be unique)
+    files = {}
+    for jsonPath in jsonPaths:
+        name = os.path.basename(jsonPath)
+        if name in files:
+            raise BundleError("two files named "+name)
+        with open(jsonPath) as f:
+            files[name] = json.load(f)
+    return(saveBundle(path, files, compress))
+
+
+def unpack(path, outputDir):
+    #write each file of a bundle as json (as json.dump writes it, ie as the creator scripts do) -> paths
+    os.makedirs(outputDir, exist_ok=True)
+    paths = []
+    for name, value in loadBundle(path).items():
+        paths += [os.path.join(outputDir, name)]
+        with open(paths[-1], 'w') as f:
+            json.dump(value, f)
+    return(paths)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="pack json output files into a compact bundle, or unpack one")
+    sub = parser.add_subparsers(dest='command', required=True)
+    packParser = sub.add_parser('pack', help="bundle json files")
+    packParser.add_argument('bundle')
+    packParser.add_argument('files', nargs='+')
+    packParser.add_argument('--no-zlib', action='store_true', help="do not compress the bundle")
+    unpackParser = sub.add_parser('unpack', help="write a bundle's json files again")
+    unpackParser.add_argument('bundle')
+    unpackParser.add_argument('outputDir')
+    args = parser.parse_args()
+
+    if args.command=='pack':
+        pack(args.bundle, args.files, not args.no_zlib)
+        size = sum([os.path.getsize(p) for p in args.files])
+        print("%d files, %d bytes -> %s %d bytes" % (len(args.files), size, args.bundle, os.path.getsize(args.bundle)))
+    else:
+        for p in unpack(args.bundle, args.outputDir):
+            print(p)
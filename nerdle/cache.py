@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Content addressed cache for expensive intermediate tables that the creator scripts would otherwise rebuild from
+scratch every run (eg shuffleNumbers' allowed calculations, crossnerdle's possible words for each slot of a pattern).
+
+Key (sha256 of):
+    - the artifact name and its parameters (json, sorted keys)
+    - the contents of the input files it is built from (eg compiled lexicons), so a rebuilt lexicon is a new key
+    - the code version: the source of the functions / modules that build it, so editing them is a new key
+    - file hashes are kept per process by (path, size, mtime), so each input file is read once
+
+File output:
+    - cache/[name]-[key].nrdb (see nerdle/bundle.py), written to a temporary file then renamed so readers never see
+      half a file.  Values must be json values (tuples come back as lists)
+    - a hit touches the file's mtime, and after each write the least recently used files are removed until the
+      cache is at most MAX_BYTES (NERDLE_CACHE_MB, default 2048)
+    - a file that cannot be read is rebuilt
+    - NERDLE_CACHE=0 turns the cache off (every artifact is built), NERDLE_CACHE_DIR moves it
+
+Usage:
+    from nerdle import cache
+    perms = cache.cached('shufflePermutations', lambda: permutations(x=4, type='50x4', stripBoring=True),
+                         params={'x': 4, 'type': '50x4', 'stripBoring': True}, code=[permutations, evaluator])
+    words = cache.cached('slots', build, params={'pattern': pattern}, files=[lexicon.compiledPath(9)])
+
+    #from the repository root
+    python -m nerdle.cache                  #list artifacts, most recently used first
+    python -m nerdle.cache --evict 500      #keep at most 500MB
+    python -m nerdle.cache --clear
+
+"""
+
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+import zlib
+
+from nerdle import bundle, metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.environ.get('NERDLE_CACHE_DIR') or os.path.join(ROOT, 'cache')
+MAX_BYTES = int(float(os.environ.get('NERDLE_CACHE_MB', '2048'))*1e6)
+ENABLED = os.environ.get('NERDLE_CACHE', '1') not in ('', '0')
+SUFFIX = '.nrdb'
+
+#per-process cache of input file hashes: (path, size, mtime_ns) -> sha256
+_fileHashes = {}
+
+
+def fileHash(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _fileHashes:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _fileHashes[key] = h.hexdigest()
+    return(_fileHashes[key])
+
+
+def codeVersion(code):
+    #function / class -> hash of its source, module -> hash of its file, str -> hash of that file
+    if isinstance(code, str):
+        return(fileHash(code))
+    if inspect.ismodule(code):
+        return(fileHash(code.__file__))
+    return(hashlib.sha256(inspect.getsource(code).encode()).hexdigest())
+
+
+def artifactKey(name, params=None, files=(), code=()):
+    h = hashlib.sha256()
+    h.update(json.dumps([name, params], sort_keys=True).encode())
+    for path in files:
+        h.update(fileHash(path).encode())
+    for c in code:
+        h.update(codeVersion(c).encode())
+    return(h.hexdigest())
+
+
+def artifactPath(name, key, cacheDir=None):
+    return(os.path.join(cacheDir or CACHE_DIR, name+'-'+key[:32]+SUFFIX))
+
+
+def load(path):
+    #-> (True, value) on a hit, (False, None) if missing or unreadable
+    try:
+        with open(path, 'rb') as f:
+            value = bundle.decode(f.read())
+    except (OSError, bundle.BundleError, zlib.error, IndexError, ValueError):
+        return(False, None)
+    #most recently used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return(True, value)
+
+
+def save(path, value, maxBytes=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmpPath = path+'.tmp.'+str(os.getpid())
+    try:
+        with open(tmpPath, 'wb') as f:
+            f.write(bundle.encode(value))
+        os.replace(tmpPath, path)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+    evict(MAX_BYTES if maxBytes is None else maxBytes, os.path.dirname(path), keep=[path])
+    return(path)
+
+
+def entries(cacheDir=None):
+    #-> [(path, bytes, mtime)], most recently used first
+    cacheDir = cacheDir or CACHE_DIR
+    if not os.path.isdir(cacheDir):
+        return([])
+    found = []
+    for f in os.listdir(cacheDir):
+        if f.endswith(SUFFIX):
+            try:
+                stat = os.stat(os.path.join(cacheDir, f))
+            except OSError:
+                #removed by another process
+                continue
+            found += [(os.path.join(cacheDir, f), stat.st_size, stat.st_mtime)]
+    return(sorted(found, key=lambda e: -e[2]))
+
+
+def evict(maxBytes, cacheDir=None, keep=()):
+    #remove least recently used artifacts until the cache is at most maxBytes -> removed paths
+    removed = []
+    total = 0
+    for path, size, _ in entries(cacheDir):
+        total += size
+        if (total > maxBytes) and (path not in keep):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            removed += [path]
+            total -= size
+    return(removed)
+
+
+def cached(name, build, params=None, files=(), code=(), cacheDir=None, maxBytes=None):
+    #value of build() (a json value), loaded from the cache if an artifact with the same key was saved before
+    if not ENABLED:
+        return(build())
+    path = artifactPath(name, artifactKey(name, params, files, code), cacheDir)
+    hit, value = load(path)
+    if hit:
+        metrics.count('cache hits')
+        metrics.log(2, "cache hit", name, os.path.basename(path))
+        return(value)
+    metrics.count('cache misses')
+    value = build()
+    try:
+        save(path, value, maxBytes)
+    except OSError as e:
+        #a read-only or full disk only costs the rebuild next time
+        metrics.log(1, "could not cache", name, "-", e)
+    return(value)
+
+
+def clear(cacheDir=None):
+    return(evict(-1, cacheDir))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="list, evict or clear cached intermediate tables")
+    parser.add_argument('--dir', default=None, help="cache folder (default cache/ or NERDLE_CACHE_DIR)")
+    parser.add_argument('--evict', type=float, default=None, metavar='MB', help="keep at most this many MB")
+    parser.add_argument('--clear', action='store_true', help="remove every artifact")
+    args = parser.parse_args()
+
+    if args.clear:
+        print("removed", len(clear(args.dir)), "artifacts")
+    elif args.evict is not None:
+        print("removed", len(evict(int(args.evict*1e6), args.dir)), "artifacts")
+    found = entries(args.dir)
+    for path, size, mtime in found:
+        print("%-60s %10d  %s" % (os.path.basename(path), size, time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime))))
+    print(len(found), "artifacts,", sum([e[1] for e in found]), "bytes in", args.dir or CACHE_DIR)
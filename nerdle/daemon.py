@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Puzzle daemon: a long-running local service that keeps lexicons, indexes and allowed calculations loaded and a pool of
+ready puzzles for each game and level, so a request for puzzles is answered at once instead of paying the cold start
+(imports, lexicon loading, shuffleNumbers' permutations) every time.
+
+File inputs:
+    - pool config (json), eg daemon.json in the repository root:
+        {
+            "workers": 4,
+            "pools": [
+                {"game": "nanagrams", "length": 6, "size": 20},
+                {"game": "shuffleNumbers", "mode": "swapBoth", "size": 10},
+                ...
+            ]
+        }
+    - each pool is a batch job (see nerdle/batch.py, without count / seed) plus:
+        - size: puzzles kept ready (default 10)
+        - parallel: puzzles made at the same time to refill it (default 1)
+    - crossnerdle2 cannot be pooled (its questions are made from a crossnerdle1 answers file)
+
+Algorithm:
+    - Load everything the pools need once in this process (see batch.WARM), then fork the worker processes, so every
+      worker starts warm
+    - Each pool refills itself in the background (asyncio): while it has fewer than size puzzles ready, workers make
+      the next one.  Puzzles are seeded (see nerdle/seeding.py) from (game, daemon batch id, index), so any served
+      puzzle can be made again with batch.regenerate.  A puzzle already published (see nerdle/dedupe.py) or already
+      made by this daemon is dropped.  A puzzle that fails is recorded in quarantine/[game].jsonl and made again from
+      a retry seed (see nerdle/quarantine.py)
+    - Requests take puzzles from the pool (waiting for the refill only if it has fewer than asked for)
+
+Request API (HTTP on localhost, or on a unix socket with --socket):
+    - GET /puzzles?pool=[pool name]&n=5 or GET /puzzles?game=nanagrams&length=6&n=5 (the first pool whose keys match)
+        -> {"pool", "puzzles": [{"batchId", "index", "puzzle"}, ...]}
+    - GET /status -> {"pools": [{"pool", "job", "size", "ready", "making", "made", "dropped", "served"}, ...]}
+    - errors -> {"error"} with status 400 (bad request), 404 (no such pool) or 500
+
+Usage (from the repository root):
+    python -m nerdle.daemon daemon.json                        #http://127.0.0.1:8765
+    python -m nerdle.daemon daemon.json --socket /tmp/nerdle.sock --workers 8
+    curl "http://127.0.0.1:8765/puzzles?game=targets&n=3"
+
+    #or from python
+    from nerdle import daemon
+    puzzles = daemon.fetch('nanagrams', 5, length=6)              #list of puzzles
+    status = daemon.request('/status', socketPath='/tmp/nerdle.sock')
+
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+import urllib.parse
+
+from nerdle import batch, dedupe, games, metrics, quarantine
+
+PORT = 8765
+
+#pool keys (the rest of a pool is its batch job)
+POOL_KEYS = ['size', 'parallel']
+
+#per-process cache of puzzle functions (see batch.SEEDED), by job
+_puzzleFns = {}
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+def makePuzzle(job, batchId, index):
+    #(in a worker) the puzzle at index of batch batchId for a pool's job
+    key = json.dumps(job, sort_keys=True)
+    if key not in _puzzleFns:
+        _puzzleFns[key] = batch.SEEDED[job['game']](games.load(job['game']), job)[1]
+    return(quarantine.seeded(job['game'], _puzzleFns[key], index, batchId, {'job': job}))
+
+
+def initWorker(verbosity):
+    #workers print nothing to the daemon's output unless asked to
+    metrics.configure(verbosity=verbosity)
+
+
+def checkPool(pool):
+    job = {k: v for k, v in pool.items() if k not in POOL_KEYS}
+    batch.checkJob(job)
+    if job['game']=='crossnerdle2':
+        raise ValueError("crossnerdle2 cannot be pooled (its questions are made from a crossnerdle1 answers file)")
+    return(job)
+
+
+class Pool:
+    #ready puzzles for one job, refilled in the background
+
+    def __init__(self, job, size=10, parallel=1, daemonId='daemon'):
+        self.job = job
+        self.name = batch.jobName(job)
+        self.size = size
+        self.parallel = parallel
+        self.module = games.load(job['game'])
+        #puzzles per batch id: later puzzles use the next batch id (crossnerdle1 patterns run out at count)
+        self.count = max(1, batch.SEEDED[job['game']](self.module, job)[0])
+        self.daemonId = daemonId
+        self.publishedName = batch.publishedName(self.module, job)
+        self.published = () if self.publishedName is None else dedupe.loadIndex(self.publishedName)
+        self.ready = collections.deque()
+        self.keys = set()
+        self.nextIndex = 0
+        self.making = 0
+        self.made = 0
+        self.dropped = 0
+        self.served = 0
+        self.changed = asyncio.Condition()
+
+    def nextSeed(self):
+        #(batch id, index) of the next puzzle to make
+        n = self.nextIndex
+        self.nextIndex += 1
+        return(self.daemonId+'-'+str(n//self.count), n%self.count)
+
+    def matches(self, query):
+        #query keys (other than n) all equal to the job's
+        return(all([str(self.job.get(k))==v for k, v in query.items()]))
+
+    def add(self, batchId, index, puzzle):
+        if self.publishedName is not None:
+            key = self.module.duplicateKey(puzzle)
+            if key in self.published or key in self.keys:
+                self.dropped += 1
+                return
+            self.keys.add(key)
+        self.ready.append({'batchId': batchId, 'index': index, 'puzzle': puzzle})
+        self.made += 1
+
+    async def refill(self, executor):
+        #one of parallel loops keeping the pool full
+        loop = asyncio.get_running_loop()
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.ready)+self.making<self.size)
+                self.making += 1
+            batchId, index = self.nextSeed()
+            try:
+                puzzle = await loop.run_in_executor(executor, makePuzzle, self.job, batchId, index)
+            except Exception:
+                print(self.name, "failed to make puzzle", batchId, index)
+                traceback.print_exc()
+                puzzle = None
+                await asyncio.sleep(1)
+            async with self.changed:
+                self.making -= 1
+                if puzzle is not None:
+                    self.add(batchId, index, puzzle)
+                self.changed.notify_all()
+
+    async def take(self, n):
+        #n puzzles, waiting for the refill if fewer are ready
+        async with self.changed:
+            await self.changed.wait_for(lambda: len(self.ready)>=n)
+            puzzles = [self.ready.popleft() for i in range(n)]
+            self.served += n
+            self.changed.notify_all()
+        return(puzzles)
+
+    def status(self):
+        return({'pool': self.name, 'job': self.job, 'size': self.size, 'ready': len(self.ready), 'making': self.making,
+                'made': self.made, 'dropped': self.dropped, 'served': self.served})
+
+
+class Daemon:
+
+    def __init__(self, pools, workers=None, verbosity=0):
+        #pools: list of pool configs (see File inputs)
+        jobs = [checkPool(pool) for pool in pools]
+        names = [batch.jobName(job) for job in jobs]
+        if len(set(names))<len(names):
+            raise ValueError("pool names must be unique (add a name to pools with the same settings)")
+        self.daemonId = 'daemon-'+time.strftime('%Y%m%d%H%M%S')
+        self.configs = list(zip(jobs, pools))
+        self.workers = workers
+        self.verbosity = verbosity
+        self.pools = []
+
+    def findPool(self, query):
+        if 'pool' in query:
+            pools = [pool for pool in self.pools if pool.name==query['pool']]
+        else:
+            pools = [pool for pool in self.pools if pool.matches(query)]
+        return(pools[0] if pools else None)
+
+    async def handle(self, path):
+        #request path -> (status, response)
+        url = urllib.parse.urlsplit(path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path=='/status':
+            return(200, {'daemonId': self.daemonId, 'pools': [pool.status() for pool in self.pools]})
+        if url.path!='/puzzles':
+            return(404, {'error': "unknown path "+url.path+", use /puzzles or /status"})
+        try:
+            n = int(query.pop('n', 1))
+        except ValueError:
+            return(400, {'error': "n must be a number"})
+        pool = self.findPool(query)
+        if pool is None:
+            return(404, {'error': "no pool matches "+urllib.parse.urlencode(query)+", pools: "+", ".join([p.name for p in self.pools])})
+        if not 0<n<=pool.size:
+            return(400, {'error': "n must be 1 to "+str(pool.size)+" (the pool size)"})
+        return(200, {'pool': pool.name, 'puzzles': await pool.take(n)})
+
+    async def serveClient(self, reader, writer):
+        #one HTTP request per connection
+        try:
+            line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(line)<2 or line[0]!='GET':
+                status, response = 400, {'error': "only GET requests"}
+            else:
+                status, response = await self.handle(line[1])
+        except Exception as e:
+            traceback.print_exc()
+            status, response = 500, {'error': type(e).__name__+": "+str(e)}
+        body = json.dumps(response).encode('utf-8')
+        writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n"
+                      % (status, STATUS_TEXT[status], len(body))).encode('latin-1')+body)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def run(self, host='127.0.0.1', port=PORT, socketPath=None):
+        batch.warmJobs([job for job, pool in self.configs])
+        self.pools = [Pool(job, pool.get('size', 10), pool.get('parallel', 1), self.daemonId) for job, pool in self.configs]
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                                    initializer=initWorker, initargs=(self.verbosity,)) as executor:
+            refills = [asyncio.create_task(pool.refill(executor)) for pool in self.pools for i in range(pool.parallel)]
+            if socketPath:
+                if os.path.exists(socketPath):
+                    os.remove(socketPath)
+                server = await asyncio.start_unix_server(self.serveClient, socketPath)
+            else:
+                server = await asyncio.start_server(self.serveClient, host, port)
+            print("serving", len(self.pools), "pools on", socketPath or "http://%s:%d" % (host, port), "- batch id", self.daemonId)
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                for task in refills:
+                    task.cancel()
+
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(path, host='127.0.0.1', port=PORT, socketPath=None, timeout=600):
+    #(client) GET path from a running daemon -> response; raises RuntimeError with the daemon's error
+    connection = _UnixConnection(socketPath, timeout) if socketPath else http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request('GET', path)
+        reply = connection.getresponse()
+        response = json.loads(reply.read())
+    finally:
+        connection.close()
+    if reply.status!=200:
+        raise RuntimeError(response.get('error', reply.reason))
+    return(response)
+
+
+def fetch(game, n=1, host='127.0.0.1', port=PORT, socketPath=None, **level):
+    #(client) n puzzles of a game from a running daemon, level: the pool's keys (eg length=6, mode='swapBoth')
+    query = urllib.parse.urlencode(dict(level, game=game, n=n))
+    return([p['puzzle'] for p in request('/puzzles?'+query, host, port, socketPath)['puzzles']])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="keep pools of ready puzzles and serve them on request")
+    parser.add_argument('config', help="json pool config (see nerdle/daemon.py)")
+    parser.add_argument('--workers', type=int, default=None, help="default: the config's workers, else one per cpu")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', default=None, help="serve on this unix socket instead of http on host:port")
+    parser.add_argument('--verbose', type=int, default=0, help="what the workers print (see nerdle/metrics.py), default 0")
+    args = parser.parse_args()
+
+    config = batch.loadConfig(args.config)
+    daemon = Daemon(config['pools'], workers=args.workers or config.get('workers'), verbosity=args.verbose)
+    try:
+        asyncio.run(daemon.run(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        print("stopped")
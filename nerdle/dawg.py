@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Compressed prefix trie (DAWG - directed acyclic word graph) over a lexicon of same length words, eg a compiled
+equation lexicon or shuffleWords' 5 letter words.
+
+A trie has one node per distinct prefix; the DAWG merges every two nodes with the same set of endings (eg the nodes
+after '12+3=' and '13+2=' both end in '15'), so the lengths 9 and 10 equation lexicons need far fewer nodes than words.
+
+Queries:
+    - hasPrefix / contains / count: walk one edge per character, so O(length) whatever the size of the lexicon
+    - children: the characters that can follow a prefix (the node's child set, one bitmask)
+    - step: the next node for many (node, character) pairs at once, eg to prune a grid a column at a time
+    - positional constraints: for a pattern ('_' = any character) and optional impossible characters at each position,
+      count, possible (the characters found at each position in at least one match) and words - found level by level
+      over the DAWG's edges with numpy, without going through the matching words one at a time
+
+Algorithm (build):
+    - Sort and deduplicate the words, as codes (the position of each character in the lexicon's alphabet)
+    - Nodes are made from the last level up: a node at depth d is the set of its (character, child node) edges, and
+      nodes with the same edges are one node (rows of the nodes' edge lists, padded to the alphabet size, grouped by hash), so
+      the DAWG is minimal and is built without a python loop over the words
+
+Layout (saved to / loaded from an .npz, see save / loadDawg):
+    - masks: per node, bit c set if the node has an edge for character code c
+    - offsets: per node, its first edge (edges are sorted by node then character, so the edge for code c is
+      offsets[node] + the number of mask bits below c)
+    - labels / targets: per edge, its character code and the node it leads to
+    - counts: per node, the number of words through it (for count and choosing)
+    - levels: the first node at each depth (node 0 is the root, the last node the end of every word)
+    - alphabet: the characters, as bytes
+
+File output:
+    - lexicon/nerdlewords[n][z].dawg.npz - the tables, saved next to the compiled lexicon the first time they are built
+      and rebuilt if the lexicon changes (see lexicon.loadTables)
+
+Usage:
+    from nerdle import dawg
+    d = dawg.loadDawg(10)
+    d.hasPrefix('12+3')                 #True
+    d.children('12+3')                  #characters that can come next, eg '*+-/0123456789='
+    d.count('12+3')                     #words starting 12+3
+    d.countMatches('1_+__=__')          #words matching a pattern, also possible() and words()
+
+    words = dawg.Dawg(dawg.buildTables(['CRANE', 'CRATE', 'TRACE']))   #any list of same length strings
+
+"""
+
+import numpy as np
+
+from nerdle import lexicon, memory
+
+TABLES = ['alphabet', 'levels', 'masks', 'offsets', 'labels', 'targets', 'counts']
+
+#per-process cache of loaded DAWGs (cleared when over a memory budget, see nerdle/memory.py)
+_dawgs = {}
+memory.register('dawgs', _dawgs.clear)
+
+
+def toRows(words):
+    #list of str or uint8 rows -> uint8 rows
+    if isinstance(words, np.ndarray):
+        return(np.asarray(words, dtype=np.uint8))
+    words = list(words)
+    return(lexicon.fromStrings(words) if words else np.zeros((0, 0), dtype=np.uint8))
+
+
+def sortedRows(codes, width):
+    #distinct rows of codes (each 0 to width-1) in sorted order: one integer per row when they fit, else lexsort
+    size, length = codes.shape
+    if size==0:
+        return(codes)
+    if width**length<(1 << 63):
+        keys = codes@(width**np.arange(length-1, -1, -1, dtype=np.int64))
+        order = np.argsort(keys, kind='stable')
+        new = np.concatenate([[True], np.diff(keys[order])!=0])
+    else:
+        order = np.lexsort(codes.T[::-1])
+        new = np.concatenate([[True], np.any(codes[order][1:]!=codes[order][:-1], axis=1)])
+    return(codes[order][new])
+
+
+def uniqueRows(table):
+    #(distinct rows, index of each row's distinct row) - like np.unique(axis=0, return_inverse=True), which sorts the
+    #whole table, but rows are grouped by a 64 bit hash (falling back to lexsort if two different rows share a hash)
+    weights = np.random.default_rng(0).integers(1, 1 << 62, size=table.shape[1]).astype(np.uint64) | np.uint64(1)
+    hashes = (table.astype(np.uint64)*weights).sum(axis=1, dtype=np.uint64)
+    order = np.argsort(hashes)
+    rows = table[order]
+    new = np.concatenate([[True], hashes[order][1:]!=hashes[order][:-1]])
+    if np.any(rows[1:][~new[1:]]!=rows[:-1][~new[1:]]):
+        order = np.lexsort(table.T[::-1])
+        rows = table[order]
+        new = np.concatenate([[True], np.any(rows[1:]!=rows[:-1], axis=1)])
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(new)-1
+    return(rows[new], inverse)
+
+
+def buildTables(words):
+    #same length words (list of str or uint8 rows) -> dict of arrays (see Layout)
+    rows = toRows(words)
+    if len(rows)==0:
+        #no words: a root without edges and the end node (an empty list has no length, it is given one level)
+        levels = np.array([0]+[1]*max(rows.shape[1], 1)+[2], dtype=np.int64)
+        return({'alphabet': np.zeros(0, dtype=np.uint8), 'levels': levels, 'masks': np.zeros(2, dtype=np.uint64),
+                'offsets': np.zeros(3, dtype=np.int64), 'labels': np.zeros(0, dtype=np.uint8),
+                'targets': np.zeros(0, dtype=np.int32), 'counts': np.array([0, 1], dtype=np.int64)})
+    alphabet = np.unique(rows)
+    if len(alphabet)>64:
+        raise ValueError("a DAWG holds at most 64 different characters")
+    lookup = np.zeros(256, dtype=np.int64)
+    lookup[alphabet] = np.arange(len(alphabet))
+    width = len(alphabet)
+    codes = sortedRows(lookup[rows], width)
+    size, length = codes.shape
+
+    #new[d][i]: row i starts a new prefix of length d (rows are sorted, so each prefix is one run of rows)
+    firstDiff = np.argmax(codes[1:]!=codes[:-1], axis=1) if size>1 else np.zeros(0, dtype=np.int64)
+    newPrefix = lambda d: np.concatenate([[True], firstDiff<d])
+
+    #nodes from the last level up: level[d] = (node of each prefix of length d, edge lists of the level's nodes)
+    nodeOf = np.zeros(1 if size else 0, dtype=np.int64)
+    childCount = 1
+    levelEdges = []
+    for d in range(length-1, -1, -1):
+        starts = np.flatnonzero(newPrefix(d+1))
+        parents = np.cumsum(newPrefix(d))[starts]-1
+        edgeCodes = codes[starts, d]*childCount+nodeOf
+        parentCount = int(parents[-1])+1 if len(parents) else 0
+        firstEdge = np.searchsorted(parents, np.arange(parentCount))
+        table = np.full((parentCount, width), -1, dtype=np.int64)
+        table[parents, np.arange(len(parents))-firstEdge[parents]] = edgeCodes
+        unique, nodeOf = uniqueRows(table)
+        levelEdges = [(unique, childCount)]+levelEdges
+        childCount = len(unique)
+
+    #number the nodes level by level from the root, the end node last
+    levelSizes = [len(unique) for unique, _ in levelEdges]+[1]
+    levels = np.concatenate([[0], np.cumsum(levelSizes)]).astype(np.int64)
+    masks, degrees, labels, targets = [], [], [], []
+    for d, (unique, childCount) in enumerate(levelEdges):
+        present = unique>=0
+        label = np.where(present, unique//max(childCount, 1), 0)
+        masks += [np.bitwise_or.reduce(np.where(present, np.left_shift(np.uint64(1), label.astype(np.uint64)), np.uint64(0)), axis=1)]
+        degrees += [present.sum(axis=1)]
+        labels += [label[present]]
+        targets += [unique[present]%childCount+levels[d+1]]
+    masks += [np.zeros(1, dtype=np.uint64)]
+    degrees += [np.zeros(1, dtype=np.int64)]
+    masks = np.concatenate(masks).astype(np.uint64)
+    offsets = np.concatenate([[0], np.cumsum(np.concatenate(degrees))]).astype(np.int64)
+    labels = np.concatenate(labels+[np.zeros(0, dtype=np.int64)]).astype(np.uint8)
+    targets = np.concatenate(targets+[np.zeros(0, dtype=np.int64)]).astype(np.int32)
+
+    #words through each node, from the end node back up
+    counts = np.zeros(len(masks), dtype=np.int64)
+    counts[-1] = 1
+    for d in range(length-1, -1, -1):
+        first, last = offsets[levels[d]], offsets[levels[d+1]]
+        sources = np.repeat(np.arange(levels[d], levels[d+1]), np.diff(offsets[levels[d]:levels[d+1]+1]))
+        counts[levels[d]:levels[d+1]] = np.bincount(sources-levels[d], weights=counts[targets[first:last]], minlength=levels[d+1]-levels[d])
+    return({'alphabet': alphabet.astype(np.uint8), 'levels': levels, 'masks': masks, 'offsets': offsets,
+            'labels': labels, 'targets': targets, 'counts': counts})
+
+
+class Dawg:
+
+    def __init__(self, tables):
+        for name in TABLES:
+            setattr(self, name, tables[name])
+        self.length = len(self.levels)-2
+        self.size = int(self.counts[0]) if len(self.counts) else 0
+        self.chars = self.alphabet.tobytes().decode('latin-1')
+        self.codeOf = dict([(c, i) for i, c in enumerate(self.chars)])
+        #the same tables as python lists, for walks one character at a time
+        self._masks = self.masks.tolist()
+        self._offsets = self.offsets.tolist()
+        self._targets = self.targets.tolist()
+        self._lookup = np.full(256, -1, dtype=np.int64)
+        self._lookup[self.alphabet] = np.arange(len(self.alphabet))
+
+    @property
+    def nbytes(self):
+        return(sum([getattr(self, name).nbytes for name in TABLES]))
+
+    def __len__(self):
+        return(self.size)
+
+    def child(self, node, c):
+        #node after character c from node, -1 if there is none
+        code = self.codeOf.get(c)
+        if node<0 or code is None:
+            return(-1)
+        mask = self._masks[node]
+        if not (mask >> code) & 1:
+            return(-1)
+        return(self._targets[self._offsets[node]+(mask & ((1 << code)-1)).bit_count()])
+
+    def walk(self, prefix, node=0):
+        #node reached by prefix, -1 if no word starts with it
+        for c in prefix:
+            node = self.child(node, c)
+            if node<0:
+                break
+        return(node)
+
+    def hasPrefix(self, prefix):
+        return(self.walk(prefix)>=0)
+
+    def __contains__(self, word):
+        return(len(word)==self.length and self.walk(word)>=0)
+
+    def count(self, prefix=''):
+        #words starting with prefix
+        node = self.walk(prefix)
+        return(0 if node<0 else int(self.counts[node]))
+
+    def children(self, prefix='', node=None):
+        #characters that can follow prefix (or come next from node), in alphabet order
+        node = self.walk(prefix) if node is None else node
+        if node<0:
+            return('')
+        mask = self._masks[node]
+        return("".join([c for i, c in enumerate(self.chars) if (mask >> i) & 1]))
+
+    def codes(self, chars):
+        #str / uint8 array of characters -> codes (-1 for characters not in the alphabet)
+        if isinstance(chars, str):
+            chars = np.frombuffer(chars.encode('latin-1'), dtype=np.uint8)
+        return(self._lookup[np.asarray(chars, dtype=np.uint8)])
+
+    def step(self, nodes, codes):
+        #next node for each (node, character code) pair, -1 where there is none (or the node is already -1)
+        nodes = np.asarray(nodes, dtype=np.int64)
+        codes = np.asarray(codes, dtype=np.int64)
+        if not len(self.targets):
+            #no edges (no words)
+            return(np.full(np.broadcast(nodes, codes).shape, -1, dtype=np.int64))
+        ok = (nodes>=0) & (codes>=0)
+        safeNodes = np.where(ok, nodes, 0)
+        safeCodes = np.where(ok, codes, 0).astype(np.uint64)
+        masks = self.masks[safeNodes]
+        ok &= ((masks >> safeCodes) & np.uint64(1)).astype(bool)
+        below = masks & ((np.uint64(1) << safeCodes)-np.uint64(1))
+        edges = self.offsets[safeNodes]+popcount64(below)
+        return(np.where(ok, self.targets[np.where(ok, edges, 0)], -1))
+
+    def hasPrefixes(self, prefixes):
+        #bool per prefix (list of same length str, or uint8 rows)
+        rows = toRows(prefixes)
+        nodes = np.zeros(len(rows), dtype=np.int64)
+        for d in range(rows.shape[1]):
+            nodes = self.step(nodes, self.codes(rows[:, d]))
+        return(nodes>=0)
+
+    def allowed(self, pattern, impossibles=None):
+        #(length, alphabet size) bool: character code allowed at each position ('_' = any)
+        if len(pattern)!=self.length:
+            raise ValueError("pattern "+repr("".join(pattern))+" is not length "+str(self.length))
+        allowed = np.zeros((self.length, len(self.chars)), dtype=bool)
+        for position, c in enumerate(pattern):
+            if c=='_':
+                allowed[position] = True
+            elif c in self.codeOf:
+                allowed[position, self.codeOf[c]] = True
+            for c in (impossibles[position] if impossibles else []):
+                if c in self.codeOf:
+                    allowed[position, self.codeOf[c]] = False
+        return(allowed)
+
+    def _alive(self, allowed):
+        #per level, bool per edge: edge allowed and on a path from the root to the end using allowed edges only
+        levels, offsets = self.levels, self.offsets
+        usable = [allowed[d][self.labels[offsets[levels[d]]:offsets[levels[d+1]]]] for d in range(self.length)]
+        #forward: nodes reached from the root
+        reached = np.zeros(len(self.masks), dtype=bool)
+        reached[0] = True
+        for d in range(self.length):
+            first, last = offsets[levels[d]], offsets[levels[d+1]]
+            sources = np.repeat(reached[levels[d]:levels[d+1]], np.diff(offsets[levels[d]:levels[d+1]+1]))
+            usable[d] &= sources
+            reached[self.targets[first:last][usable[d]]] = True
+        #backward: nodes that reach the end
+        ends = np.zeros(len(self.masks), dtype=bool)
+        ends[-1] = True
+        for d in range(self.length-1, -1, -1):
+            first, last = offsets[levels[d]], offsets[levels[d+1]]
+            usable[d] &= ends[self.targets[first:last]]
+            sources = np.repeat(np.arange(levels[d], levels[d+1]), np.diff(offsets[levels[d]:levels[d+1]+1]))
+            ends[sources[usable[d]]] = True
+        return(usable)
+
+    def countMatches(self, pattern, impossibles=None):
+        #words matching pattern (see allowed)
+        usable = self._alive(self.allowed(pattern, impossibles))
+        counts = np.zeros(len(self.masks), dtype=np.int64)
+        counts[-1] = 1
+        levels, offsets = self.levels, self.offsets
+        for d in range(self.length-1, -1, -1):
+            first, last = offsets[levels[d]], offsets[levels[d+1]]
+            sources = np.repeat(np.arange(levels[d], levels[d+1]), np.diff(offsets[levels[d]:levels[d+1]+1]))
+            weights = np.where(usable[d], counts[self.targets[first:last]], 0)
+            counts[levels[d]:levels[d+1]] = np.bincount(sources-levels[d], weights=weights, minlength=levels[d+1]-levels[d])
+        return(int(counts[0]))
+
+    def possible(self, pattern, impossibles=None):
+        #for each position, the characters (in alphabet order) found there in at least one matching word
+        usable = self._alive(self.allowed(pattern, impossibles))
+        found = []
+        for d in range(self.length):
+            labels = self.labels[self.offsets[self.levels[d]]:self.offsets[self.levels[d+1]]][usable[d]]
+            found += ["".join([self.chars[i] for i in np.unique(labels)])]
+        return(found)
+
+    def words(self, pattern=None, impossibles=None):
+        #matching words (every word if no pattern), in sorted order
+        pattern = '_'*self.length if pattern is None else pattern
+        usable = self._alive(self.allowed(pattern, impossibles))
+        nodes = np.zeros(1, dtype=np.int64)
+        prefixes = np.zeros((1, 0), dtype=np.uint8)
+        for d in range(self.length):
+            first = self.offsets[self.levels[d]]
+            starts, degrees = self.offsets[nodes], self.offsets[nodes+1]-self.offsets[nodes]
+            owner = np.repeat(np.arange(len(nodes)), degrees)
+            edges = starts[owner]+np.arange(len(owner))-np.repeat(np.cumsum(degrees)-degrees, degrees)
+            keep = usable[d][edges-first]
+            edges, owner = edges[keep], owner[keep]
+            prefixes = np.concatenate([prefixes[owner], self.alphabet[self.labels[edges]][:, None]], axis=1)
+            nodes = self.targets[edges].astype(np.int64)
+        return(lexicon.toStrings(prefixes))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, **{name: getattr(self, name) for name in TABLES})
+
+
+def popcount64(values):
+    #bits set in each uint64
+    if hasattr(np, 'bitwise_count'):
+        return(np.bitwise_count(values).astype(np.int64))
+    values = values.copy()
+    count = np.zeros(values.shape, dtype=np.int64)
+    while values.any():
+        count += (values & np.uint64(1)).astype(np.int64)
+        values >>= np.uint64(1)
+    return(count)
+
+
+def load(path):
+    with np.load(path) as f:
+        return(Dawg(dict((k, f[k]) for k in f.files)))
+
+
+def loadDawg(length, zeros=False):
+    #DAWG over a compiled lexicon, built once and saved next to it (see lexicon.loadTables), loaded once per process
+    key = (length, zeros)
+    if key not in _dawgs:
+        _dawgs[key] = Dawg(lexicon.loadTables(length, zeros, 'dawg', buildTables))
+    return(_dawgs[key])
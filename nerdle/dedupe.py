@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Index of every puzzle already published, kept on disk so that a new batch does not repeat a puzzle from an earlier one.
+
+Each creator script has a duplicateKey(puzzle): a short hash of what makes two puzzles the same for that game (eg the
+answers of a nanagram, the solved grid of a crossnerdle or shuffle puzzle).  Generators check a candidate's key as soon
+as it is known (eg for nanagrams, before the answers are grouped into commutative and rearrangement sets) against the
+published keys and the keys made earlier in the same run, so a repeat is rejected before the rest of the work is done.
+Every check is one set lookup.
+
+File format:
+    - published/[name].keys in the repository root, one key (16 hex characters) per line, appended to as puzzles are
+      published (the script's main code / batch runner, once the output files are saved)
+    - name is the game, or the game variant where variants are separate games (eg 'shuffleNumbers-swapBoth')
+    - a line cut off part way (eg by a crash) is ignored when the file is read
+
+Note: the keys are part of what seeded puzzles are made from (a seeded puzzle that would be a repeat is replaced by the
+next one its seed gives), so every shard of a batch should see the same published keys - publish between batches.
+
+Usage:
+    from nerdle import dedupe
+    published = dedupe.loadIndex('nanagrams')
+    puzzles = nanagrams.generate(length=7, count=20, seen=published)   #no repeats of earlier batches (or within this one)
+    nanagrams.savePuzzles(puzzles)
+    published.addAll([nanagrams.duplicateKey(p) for p in puzzles])
+
+"""
+
+import hashlib
+import json
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_DIR = os.path.join(ROOT, 'published')
+
+KEY_LENGTH = 16
+
+#per-process cache of opened indexes
+_indexes = {}
+
+
+def contentKey(content):
+    #hash of any json-able content (eg a grid, a list of answers): the same content always gives the same key
+    data = json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return(hashlib.sha256(data).hexdigest()[:KEY_LENGTH])
+
+
+def indexPath(name, indexDir=None):
+    return(os.path.join(indexDir or INDEX_DIR, name+'.keys'))
+
+
+class KeyIndex:
+    #published keys, read into a set when opened, new ones appended to the file
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = set()
+        if os.path.exists(path):
+            with open(path) as f:
+                self._keys = set([line[:KEY_LENGTH] for line in f if len(line)==KEY_LENGTH+1])
+
+    def __contains__(self, key):
+        return(key in self._keys)
+
+    def __len__(self):
+        return(len(self._keys))
+
+    def __iter__(self):
+        return(iter(self._keys))
+
+    def addAll(self, keys):
+        #record keys as published -> number that were new
+        new = []
+        for key in keys:
+            if key not in self._keys:
+                self._keys.add(key)
+                new += [key]
+        if new:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a+') as f:
+                #start a new line after a line that was cut off, so the first new key is not joined to it
+                if f.tell()>0:
+                    f.seek(f.tell()-1)
+                    if f.read(1)!='\n':
+                        f.write('\n')
+                f.write("".join([key+'\n' for key in new]))
+                f.flush()
+                os.fsync(f.fileno())
+        return(len(new))
+
+
+def loadIndex(name, indexDir=None):
+    #published keys for a game, read the first time they are needed in this process
+    path = indexPath(name, indexDir)
+    if path not in _indexes:
+        _indexes[path] = KeyIndex(path)
+    return(_indexes[path])
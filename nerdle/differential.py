@@ -0,0 +1,640 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Differential tests: run a reference function and a candidate side by side on the same inputs and report every case
+where they disagree, with a minimal reproducer.  The references are the functions as they were before the shared
+engines (see nerdle/legacy.py) or a shipped engine, the candidates are the shipped functions or a new engine.
+
+Checks (see CHECKS; reference - inputs - built-in candidate):
+    - evaluate: python eval(), as the generators used before nerdle/evaluator.py - random calculations (numbers,
+      + - * /, unary minus, brackets) and the calculations in the output files - evaluator.evaluate(exact=False)
+    - patterns: PatternIndex.query (nerdle/patternindex.py) - patterns (some characters blanked, some impossible
+      characters) made from random words of the lexicons - the same query on the DAWG (nerdle/dawg.py)
+    - removable: crossnerdle2.find_pos_quick, whether a cell can be blanked and the word still have one solution -
+      random words with some cells blanked - the same check on a DAWG of crossnerdle2's word lists
+    - commutative / rearrangement: the eval() commutativeCheckSpecial / checkRearrangement - pairs of answers found
+      for random questions, and the answers of each puzzle in the output files - the shipped nanagrams functions
+    - minCalc: the eval() minCalcOrdered - random bracketed calculations and the output files' calculations - the
+      shipped targets.minCalcOrdered
+    - minSwap: the original findSolutionMinSwap (its rng seeded per case) - answers from the output files with random
+      swaps, and the output files' questions - the shipped shuffleNumbers.findSolutionMinSwap
+    - under5: the original findSolutionAnyUnder5 - magic squares unshuffled 1-6 times, and the output files'
+      questions - the shipped shuffleWords.findSolutionAnyUnder5
+    - magicSquares: the word list create_all_games - random words with the rows and columns of some shipped magic
+      squares - the shipped shuffleWords.create_all_games (on a DAWG)
+    - patternMatch: the DataFrame patternMatch - patterns (some characters blanked or 'n' / 's', some impossible
+      characters) made from crossnerdle1's words - the shipped crossnerdle1.patternMatch (on a PatternIndex)
+    - solve: the regular expression find_pos, the full solve that checks a question has one solution - crossnerdle
+      answers with random cells blanked, and the output files' questions - the shipped crossnerdle2.find_pos
+--candidate replaces the built-in candidate, eg to try a faster commutativity check before it replaces the shipped
+one.
+
+Algorithm:
+    - Case i of a run is made from its own random.Random, seeded from (check, seed, i) (see nerdle/seeding.py), so any
+      case can be made again from its index, and the cases are split into chunks run in a process pool
+    - History cases (--history) are read from the games' output files, so the shipped outputs are re-checked too
+    - Each case: reference and candidate are called on their own copies of the inputs; an outcome is the result
+      (numpy arrays, tuples and sets turned into lists, nan into 'nan') or the error raised
+    - A disagreement is made smaller by the check's shrink function (eg drop a term, blank a character) for as long
+      as the smaller case still disagrees, and is reported with both outcomes and a command that re-runs it
+
+File output:
+    - --out: one json line per disagreement {"check", "source", "case", "minimal", "reference", "candidate"}
+
+Usage (from the repository root):
+    python -m nerdle.differential                                   #every check
+    python -m nerdle.differential evaluate --cases 1000000 --workers 8
+    python -m nerdle.differential rearrangement --candidate mypackage.fastcheck:checkRearrangement --history
+    python -m nerdle.differential evaluate --case '["2*(3-1)/4"]'   #one case, eg a reproducer
+    python -m nerdle.differential --list
+
+    #or from python
+    from nerdle import differential
+    report = differential.run('patterns', cases=5000)             #{'check', 'cases', 'disagreements', ...}
+
+"""
+
+import argparse
+import concurrent.futures
+import copy
+import glob
+import importlib
+import importlib.util
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import time
+
+import numpy as np
+
+from nerdle import dawg, games, lexicon, metrics, patternindex, seeding
+
+#most disagreements kept (shrunk and reported) per chunk of cases
+KEEP = 10
+#most smaller cases tried when shrinking one disagreement
+MAX_SHRINK = 2000
+#pattern queries with more matches than this compare counts and possible characters only
+MAX_WORDS = 5000
+
+#lexicons used for pattern cases: (length, zeros)
+PATTERN_LEXICONS = [(5, False), (5, True), (6, False), (6, True), (7, False), (7, True), (8, False), (8, True),
+                    (9, False), (9, True), (10, False)]
+
+_TOKENS = re.compile(r"\d+\.?\d*|.")
+
+#per-process caches: loaded engines, DAWGs over crossnerdle2's word lists, case material
+_functions = {}
+_removableDawgs = {}
+_material = {}
+
+
+#####REFERENCES AND CANDIDATES
+
+
+def evaluateFloat(calculation):
+    from nerdle import evaluator
+    return(evaluator.evaluate(calculation, exact=False))
+
+
+def matchResult(count, possible, words):
+    return([int(count), ["".join(sorted(p)) for p in possible], sorted(words) if count<=MAX_WORDS else None])
+
+
+def indexQuery(length, zeros, pattern, impossibles):
+    match = patternindex.loadIndex(length, zeros).query(pattern, impossibles)
+    return(matchResult(match.count, match.possible, match.words() if match.count<=MAX_WORDS else []))
+
+
+def dawgQuery(length, zeros, pattern, impossibles):
+    d = dawg.loadDawg(length, zeros)
+    count = d.countMatches(pattern, impossibles)
+    return(matchResult(count, d.possible(pattern, impossibles), d.words(pattern, impossibles) if count<=MAX_WORDS else []))
+
+
+def removableDawg(length):
+    #DAWG over the same words as crossnerdle2.wordIndex (the compiled lexicon with leading zeros, plus nnn=nnn)
+    if length not in _removableDawgs:
+        index = games.load('crossnerdle2').wordIndex(length)
+        _removableDawgs[length] = dawg.Dawg(dawg.buildTables(index.words))
+    return(_removableDawgs[length])
+
+
+def dawgFindPosQuick(word, wordNew):
+    #crossnerdle2.find_pos_quick on a DAWG: the blanked cell can be removed if every match has the same character there
+    ix = [i for i in range(len(word)) if word[i]!=wordNew[i]]
+    if len(ix)!=1:
+        raise RuntimeError("ERROR - MORE THAN ONE CHAR CHANGED")
+    d = removableDawg(len(wordNew))
+    pattern = "".join(wordNew)
+    if d.countMatches(pattern)>0 and d.possible(pattern)[ix[0]]==word[ix[0]]:
+        return([word])
+    return([])
+
+
+#####CASES
+
+
+def shrinkTokens(case):
+    #smaller calculations: drop a number with the operator next to it, drop a pair of brackets, shorten a number
+    tokens = _TOKENS.findall(case[0])
+    smaller = []
+    for i, t in enumerate(tokens):
+        if t[0].isdigit():
+            smaller += [tokens[:i]+tokens[i+2:], tokens[:max(i-1, 0)]+tokens[i+1:]]
+            if len(t)>1:
+                smaller += [tokens[:i]+[t[:-1]]+tokens[i+1:], tokens[:i]+['1']+tokens[i+1:]]
+        elif t=='(':
+            for j in range(i+1, len(tokens)):
+                if tokens[j]==')':
+                    smaller += [tokens[:i]+tokens[i+1:j]+tokens[j+1:]]
+        elif t=='-' and (i==0 or tokens[i-1] in '(+-*/'):
+            smaller += [tokens[:i]+tokens[i+1:]]
+    smaller = ["".join(s) for s in smaller]
+    return([[s] for s in dict.fromkeys(smaller) if s and s!=case[0]])
+
+
+def randomCalculation(rng, depth=3):
+    if depth==0 or rng.random()<0.3:
+        number = str(rng.choice([rng.randint(0, 9), rng.randint(10, 99), rng.randint(100, 999)]))
+        return(("-" if rng.random()<0.05 else "")+number)
+    calc = randomCalculation(rng, depth-1)+rng.choice('+-*/')+randomCalculation(rng, depth-1)
+    return("("+calc+")" if rng.random()<0.3 else calc)
+
+
+def evaluateCase(rng):
+    return([randomCalculation(rng, rng.randint(1, 4))])
+
+
+def outputFiles(folder, pattern):
+    return(sorted(glob.glob(os.path.join(games.ROOT, folder, 'output', pattern))))
+
+
+def loadJson(path):
+    with open(path) as f:
+        return(json.load(f))
+
+
+def targetsCalculations():
+    cases = []
+    for path in outputFiles('targets', 'targets_calculations*.json'):
+        for i, calcs in enumerate(loadJson(path)):
+            cases += [(os.path.basename(path)+" #"+str(i), [c]) for c in calcs]
+    return(cases)
+
+
+def nanagramAnswers():
+    #(puzzle name, answers) for every puzzle in the nanagrams output files
+    found = []
+    for path in outputFiles('nanagrams', 'nanagramPuzzles_*.json'):
+        for i, puzzle in enumerate(loadJson(path)):
+            found += [(os.path.basename(path)+" #"+str(i), json.loads(puzzle['answersLong']))]
+    return(found)
+
+
+def evaluateHistory():
+    cases = targetsCalculations()
+    for source, answers in nanagramAnswers():
+        cases += [(source, [side]) for a in answers for side in a.split('=')]
+    return(cases)
+
+
+def patternCase(rng):
+    length, zeros = rng.choice(PATTERN_LEXICONS)
+    words = lexicon.loadLexicon(length, zeros)
+    word = lexicon.toStrings(words[[rng.randrange(len(words))]])[0]
+    blank = rng.choice([0.3, 0.6, 0.9])
+    pattern = "".join(['_' if rng.random()<blank else c for c in word])
+    impossibles = [rng.sample(lexicon.SYMBOLS, rng.randint(1, 3)) if rng.random()<0.2 else [] for _ in range(length)]
+    return([length, zeros, pattern, impossibles])
+
+
+def shrinkPattern(case):
+    length, zeros, pattern, impossibles = case
+    smaller = [[length, zeros, pattern[:i]+'_'+pattern[i+1:], impossibles] for i, c in enumerate(pattern) if c!='_']
+    for i, chars in enumerate(impossibles):
+        for c in chars:
+            smaller += [[length, zeros, pattern, impossibles[:i]+[[x for x in chars if x!=c]]+impossibles[i+1:]]]
+    return(smaller)
+
+
+def removableCase(rng):
+    length = rng.randint(5, 9)
+    index = games.load('crossnerdle2').wordIndex(length)
+    word = list(lexicon.toStrings(index.words[[rng.randrange(index.size)]])[0])
+    for i in rng.sample(range(length), rng.randint(0, length-2)):
+        word[i] = '_'
+    wordNew = word.copy()
+    wordNew[rng.choice([i for i, c in enumerate(word) if c!='_'])] = '_'
+    return([word, wordNew])
+
+
+def shrinkRemovable(case):
+    word, wordNew = case
+    return([[word[:i]+['_']+word[i+1:], wordNew[:i]+['_']+wordNew[i+1:]] for i, c in enumerate(word) if c!='_' and wordNew[i]!='_'])
+
+
+def nanagramMaterial(length):
+    #question words / ids for nanagrams of a length (as createPuzzle chooses them)
+    key = ('nanagrams', length)
+    if key not in _material:
+        nanagrams = games.load('nanagrams')
+        _material[key] = nanagrams.questionCandidates(length, nanagrams.levelSettings(length)['maxDoubles'])
+    return(_material[key])
+
+
+def answerPairCase(rng):
+    #two answers that can be made from the characters of a random question
+    nanagrams = games.load('nanagrams')
+    while True:
+        length = rng.choice([6, 7, 8, 9])
+        questionWords, questionIds = nanagramMaterial(length)
+        question = [x for x in lexicon.toStrings(questionWords[[rng.choice(questionIds)]])[0] if x!='=']
+        answers = []
+        for answerLength in [x for x in [3, 5, 6, 7] if x<=length]:
+            index = nanagrams.answerIndex(answerLength)
+            answers += index.words(index.within(question))
+        if len(answers)>=2:
+            return(rng.sample(answers, 2))
+
+
+def answerPairHistory():
+    return([(source, [a, b]) for source, answers in nanagramAnswers() for a in answers for b in answers if a!=b])
+
+
+def minCalcCase(rng):
+    targets = games.load('targets')
+    numbers = rng.sample(targets.numberListBottom, targets.nFromBottom)+rng.choices(targets.numberListTop, k=targets.nFromTop)
+    calc = ''
+    for group in rng.choice(targets.nGroupsInAnswer):
+        selected = [str(x) for x in rng.sample(numbers, group)]
+        calc += (selected[0] if group==1 else "("+selected[0]+rng.choice(targets.symbols)+selected[1]+")")
+        calc += rng.choice(targets.symbols)
+    return([calc[:-1]])
+
+
+def shuffleGrids(folder, pattern):
+    #(file name, answers, questions) for the output files of a shuffle game
+    found = []
+    for path in outputFiles(folder, pattern):
+        questions = path[:-len('_A.json')]+'_Q.json'
+        if os.path.exists(questions):
+            found += [(os.path.basename(path), loadJson(path), loadJson(questions))]
+    return(found)
+
+
+def minSwapCase(rng):
+    shuffleNumbers = games.load('shuffleNumbers')
+    answers = [a for _, answerList, _ in shuffleGrids('shuffleNumbers', 'shufflePuzzles_*_A.json') for a in answerList]
+    grid = rng.choice(answers)
+    gridQ, _ = shuffleNumbers.random_swap(grid, rng.randint(1, 4), rng=rng)
+    if rng.random()<0.5:
+        gridQ, _ = shuffleNumbers.random_swap_sym(gridQ, rng.randint(1, 2), rng=rng)
+    return([grid, gridQ, rng.getrandbits(32)])
+
+
+def minSwapHistory():
+    return([(name+" #"+str(i), [a, q, 0]) for name, answers, questions in shuffleGrids('shuffleNumbers', 'shufflePuzzles_*_A.json')
+            for i, (a, q) in enumerate(zip(answers, questions))])
+
+
+def callMinSwap(function, case):
+    grid, gridQ, seed = case
+    return(function(grid, gridQ, rng=random.Random(seed)))
+
+
+def under5Case(rng):
+    shuffleWords = games.load('shuffleWords')
+    grid = rng.choice(shuffleWords.loadAnswers())
+    return([grid, shuffleWords.unShuffle(grid, rng.randint(1, 6), rng=rng)[0]])
+
+
+def under5History():
+    return([(name+" #"+str(i), [a, q]) for name, answers, questions in shuffleGrids('shuffleWords', 'shufflePuzzlesWords_*_A.json')
+            for i, (a, q) in enumerate(zip(answers, questions))])
+
+
+def magicSquaresCase(rng):
+    #the rows and columns of 1-3 shipped magic squares, among random words of the original list (in a random order)
+    shuffleWords = games.load('shuffleWords')
+    key = ('shuffleWords', 'words')
+    if key not in _material:
+        with open(os.path.join(games.ROOT, 'shuffleWords', 'input', '5letterOriginals.txt')) as f:
+            _material[key] = sorted(set([x.strip().upper() for x in f.readlines()[1:] if x.strip()]))
+    words = set(rng.sample(_material[key], rng.randint(0, 40)))
+    for grid in rng.sample(shuffleWords.loadAnswers(), rng.randint(1, 3)):
+        words.update(["".join(row) for row in grid]+["".join(column) for column in zip(*grid)])
+    words = sorted(words)
+    rng.shuffle(words)
+    return([words, rng.choice([1, 9999])])
+
+
+def shrinkMagicSquares(case):
+    words, target = case
+    return([[words[:i]+words[i+1:], target] for i in range(len(words))])
+
+
+def callMagicSquares(function, case):
+    import pandas as pd
+    words, target = case
+    return(function(pd.DataFrame({'words': words}), target, 0, len(words)))
+
+
+def patternMatchCase(rng):
+    crossnerdle1 = games.load('crossnerdle1')
+    length = rng.choice([3, 5, 6, 7, 8, 9])
+    words = crossnerdle1.wordList(length)
+    word = lexicon.toStrings(words[[rng.randrange(len(words))]])[0]
+    blank = rng.choice([0.3, 0.6, 0.9])
+    pattern = ""
+    for c in word:
+        if rng.random()<blank:
+            pattern += '_'
+        elif rng.random()<0.2 and c!='=':
+            pattern += 'n' if c.isdigit() else 's'
+        else:
+            pattern += c
+    impossibles = [rng.sample(lexicon.SYMBOLS, rng.randint(1, 3)) if rng.random()<0.2 else [] for _ in range(length)]
+    return([pattern, impossibles if rng.random()<0.5 else []])
+
+
+def shrinkPatternMatch(case):
+    pattern, impossibles = case
+    smaller = [[pattern[:i]+'_'+pattern[i+1:], impossibles] for i, c in enumerate(pattern) if c!='_']
+    for i, chars in enumerate(impossibles):
+        for c in chars:
+            smaller += [[pattern, impossibles[:i]+[[x for x in chars if x!=c]]+impossibles[i+1:]]]
+    return(smaller)
+
+
+def callPatternMatch(function, case):
+    #every match, sorted ('fail' when there are none)
+    pattern, impossibles = case
+    found = function(pattern, returnAll=True, impossibles=impossibles)
+    return(found if isinstance(found, str) else sorted(found))
+
+
+def solveCase(rng):
+    #a crossnerdle answer with random cells blanked (only cells whose words have a word list, as in gen)
+    crossnerdle2 = games.load('crossnerdle2')
+    answer = np.array(rng.choice(crossnerdle2.loadAnswers()))
+    across, down = crossnerdle2.findWords(answer)
+    long = set()
+    for row, (start, end) in across:
+        if end-start+1>9:
+            long.update([(row, c) for c in range(start, end+1)])
+    for col, (start, end) in down:
+        if end-start+1>9:
+            long.update([(r, col) for r in range(start, end+1)])
+    cells = [(r, c) for r in range(len(answer)) for c in range(len(answer[0])) if answer[r, c] not in ' X@' and (r, c) not in long]
+    question = answer.copy()
+    for r, c in rng.sample(cells, rng.randint(1, max(1, len(cells)//2))):
+        question[r, c] = '_'
+    return([question.tolist(), [[row, list(span)] for row, span in across], [[col, list(span)] for col, span in down]])
+
+
+def solveHistory():
+    #questions as gen leaves them: the intersection cells ('~') still filled in
+    crossnerdle2 = games.load('crossnerdle2')
+    cases = []
+    for path in outputFiles('crossnerdle', '*_questions.json'):
+        for i, puzzle in enumerate(loadJson(path)):
+            answer = np.array(puzzle['answer'])
+            question = np.where(np.array(puzzle['question'])=='~', answer, np.array(puzzle['question']))
+            across, down = crossnerdle2.findWords(answer)
+            cases += [(os.path.basename(path)+" #"+str(i), [question.tolist(), [[row, list(span)] for row, span in across],
+                                                           [[col, list(span)] for col, span in down]])]
+    return(cases)
+
+
+def callSolve(function, case):
+    question, across, down = case
+    return(function(np.array(question), across, down))
+
+
+#check name -> reference, candidate, case(rng), history() -> [(source, case)], shrink(case), call(function, case),
+#errors (True: any two errors agree), cases (default number of random cases)
+CHECKS = {
+    'evaluate': {'reference': 'nerdle.legacy:evaluate', 'candidate': 'nerdle.differential:evaluateFloat',
+                 'case': evaluateCase, 'history': evaluateHistory, 'shrink': shrinkTokens, 'errors': True, 'cases': 100000},
+    'patterns': {'reference': 'nerdle.differential:indexQuery', 'candidate': 'nerdle.differential:dawgQuery',
+                 'case': patternCase, 'shrink': shrinkPattern, 'cases': 5000},
+    'removable': {'reference': 'crossnerdle2:find_pos_quick', 'candidate': 'nerdle.differential:dawgFindPosQuick',
+                  'case': removableCase, 'shrink': shrinkRemovable, 'cases': 20000},
+    'commutative': {'reference': 'nerdle.legacy:commutativeCheckSpecial', 'candidate': 'nanagrams:commutativeCheckSpecial',
+                    'case': answerPairCase, 'history': answerPairHistory, 'cases': 20000},
+    'rearrangement': {'reference': 'nerdle.legacy:checkRearrangement', 'candidate': 'nanagrams:checkRearrangement',
+                      'case': answerPairCase, 'history': answerPairHistory, 'cases': 20000},
+    'minCalc': {'reference': 'nerdle.legacy:minCalcOrdered', 'candidate': 'targets:minCalcOrdered', 'case': minCalcCase,
+                'history': targetsCalculations, 'shrink': shrinkTokens, 'cases': 10},
+    'minSwap': {'reference': 'nerdle.legacy:findSolutionMinSwap', 'candidate': 'shuffleNumbers:findSolutionMinSwap',
+                'case': minSwapCase, 'history': minSwapHistory, 'call': callMinSwap, 'cases': 200},
+    'under5': {'reference': 'nerdle.legacy:findSolutionAnyUnder5', 'candidate': 'shuffleWords:findSolutionAnyUnder5',
+               'case': under5Case, 'history': under5History, 'cases': 20},
+    'magicSquares': {'reference': 'nerdle.legacy:create_all_games', 'candidate': 'shuffleWords:create_all_games',
+                     'case': magicSquaresCase, 'shrink': shrinkMagicSquares, 'call': callMagicSquares, 'cases': 100},
+    'patternMatch': {'reference': 'nerdle.legacy:patternMatch', 'candidate': 'crossnerdle1:patternMatch',
+                     'case': patternMatchCase, 'shrink': shrinkPatternMatch, 'call': callPatternMatch, 'cases': 200},
+    'solve': {'reference': 'nerdle.legacy:find_pos', 'candidate': 'crossnerdle2:find_pos', 'case': solveCase,
+              'history': solveHistory, 'call': callSolve, 'cases': 20},
+}
+
+
+#####RUNNING
+
+
+def loadFunction(spec):
+    #'module:function' -> function; module is a game (see nerdle/games.py), an importable module or a .py file
+    if spec not in _functions:
+        if ':' not in spec:
+            raise ValueError("expected module:function, got "+repr(spec))
+        module, name = spec.rsplit(':', 1)
+        if module in games.GAMES:
+            loaded = games.load(module)
+        elif module.endswith('.py'):
+            moduleSpec = importlib.util.spec_from_file_location('nerdle_candidate_'+str(len(_functions)), module)
+            loaded = importlib.util.module_from_spec(moduleSpec)
+            moduleSpec.loader.exec_module(loaded)
+        else:
+            loaded = importlib.import_module(module)
+        _functions[spec] = getattr(loaded, name)
+    return(_functions[spec])
+
+
+def normalise(value):
+    #result -> comparable json-like value
+    if isinstance(value, np.ndarray):
+        return(normalise(value.tolist()))
+    if isinstance(value, np.generic):
+        return(normalise(value.item()))
+    if isinstance(value, (list, tuple)):
+        return([normalise(v) for v in value])
+    if isinstance(value, (set, frozenset)):
+        return(sorted([normalise(v) for v in value], key=repr))
+    if isinstance(value, dict):
+        return(dict((k, normalise(v)) for k, v in value.items()))
+    if isinstance(value, float) and math.isnan(value):
+        return('nan')
+    return(value)
+
+
+def outcome(check, function, case):
+    call = CHECKS[check].get('call', lambda f, c: f(*c))
+    try:
+        return({'result': normalise(call(function, copy.deepcopy(case)))})
+    except Exception as e:
+        if CHECKS[check].get('errors'):
+            return({'error': 'ZeroDivisionError' if isinstance(e, ZeroDivisionError) else 'error'})
+        return({'error': type(e).__name__})
+
+
+def shownOutcome(result):
+    #outcome as it is reported (results that are not json, eg Fraction, as their repr)
+    return(json.loads(json.dumps(result, default=repr)))
+
+
+def compareCase(check, reference, candidate, case):
+    #(agrees, reference outcome, candidate outcome)
+    a = outcome(check, loadFunction(reference), case)
+    b = outcome(check, loadFunction(candidate), case)
+    return(a==b, a, b)
+
+
+def shrink(check, reference, candidate, case):
+    #smallest case found (greedily) that still disagrees
+    function = CHECKS[check].get('shrink')
+    tried = 0
+    while function is not None and tried<MAX_SHRINK:
+        for smaller in function(case):
+            tried += 1
+            if not compareCase(check, reference, candidate, smaller)[0]:
+                case = smaller
+                break
+            if tried>=MAX_SHRINK:
+                break
+        else:
+            break
+    return(case)
+
+
+def disagreement(check, reference, candidate, source, case):
+    minimal = shrink(check, reference, candidate, case)
+    _, a, b = compareCase(check, reference, candidate, minimal)
+    return({'check': check, 'source': source, 'case': shownOutcome(case), 'minimal': shownOutcome(minimal),
+            'reference': shownOutcome(a), 'candidate': shownOutcome(b)})
+
+
+def runCases(check, reference, candidate, sourcedCases, keep=KEEP):
+    #[(source, case)] -> (cases run, disagreements found, reports of the first keep)
+    found, reports = 0, []
+    for source, case in sourcedCases:
+        if not compareCase(check, reference, candidate, case)[0]:
+            found += 1
+            if len(reports)<keep:
+                reports += [disagreement(check, reference, candidate, source, case)]
+    return(len(sourcedCases), found, reports)
+
+
+def randomCases(check, seed, start, stop):
+    return([("seed "+str(seed)+" case "+str(i), CHECKS[check]['case'](seeding.puzzleRng('differential-'+check, seed, i)))
+            for i in range(start, stop)])
+
+
+def runChunk(check, reference, candidate, seed, start, stop, keep=KEEP):
+    return(runCases(check, reference, candidate, randomCases(check, seed, start, stop), keep))
+
+
+def run(check, cases=None, seed=0, candidate=None, reference=None, history=False, workers=None, chunk=None, keep=KEEP):
+    #-> {'check', 'reference', 'candidate', 'cases', 'disagreements', 'reports', 'seconds'}
+    settings = CHECKS[check]
+    reference = reference or settings['reference']
+    candidate = candidate or settings['candidate']
+    cases = settings['cases'] if cases is None else cases
+    start = time.time()
+    workers = workers or os.cpu_count() or 1
+    #tasks: chunks of history cases (passed as they are) and chunks of random case indexes (made in the worker)
+    tasks = []
+    if history and 'history' in settings:
+        sourced = settings['history']()
+        size = chunk or max(1, -(-len(sourced)//(workers*4)))
+        tasks += [(runCases, (check, reference, candidate, sourced[i:i+size], keep)) for i in range(0, len(sourced), size)]
+    size = chunk or max(1, min(10000, -(-cases//(workers*4))))
+    tasks += [(runChunk, (check, reference, candidate, seed, i, min(i+size, cases), keep)) for i in range(0, cases, size)]
+    #the functions' own output (eg word list sizes) is turned off while the cases run
+    if workers==1 or len(tasks)<=1:
+        verbosity = metrics.verbosity
+        metrics.configure(verbosity=0)
+        try:
+            results = [function(*args) for function, args in tasks]
+        finally:
+            metrics.configure(verbosity=verbosity)
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=metrics.configure,
+                                                    initargs=(None, 0)) as pool:
+            results = [future.result() for future in [pool.submit(function, *args) for function, args in tasks]]
+    total, found, reports = 0, 0, []
+    for n, f, r in results:
+        total, found, reports = total+n, found+f, reports+r
+    return({'check': check, 'reference': reference, 'candidate': candidate, 'cases': total, 'disagreements': found,
+            'reports': reports[:keep], 'seconds': time.time()-start})
+
+
+def reproduceCommand(report, candidate=None):
+    command = "python -m nerdle.differential "+report['check']
+    if candidate and candidate!=CHECKS[report['check']]['candidate']:
+        command += " --candidate "+candidate
+    return(command+" --case '"+json.dumps(report['minimal'])+"'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="run shipped functions and new engines side by side and report disagreements")
+    parser.add_argument('checks', nargs='*', help="checks to run (default: every check)")
+    parser.add_argument('--candidate', help="module:function to compare with the reference (game:function, module or file.py)")
+    parser.add_argument('--reference', help="module:function to use in place of the shipped function")
+    parser.add_argument('--cases', type=int, help="random cases per check (default: the check's own, see CHECKS)")
+    parser.add_argument('--seed', default=0, help="seed for the random cases (case i is the same for a seed)")
+    parser.add_argument('--history', action='store_true', help="also check the cases in the games' output files")
+    parser.add_argument('--workers', type=int, help="processes (default: one per cpu)")
+    parser.add_argument('--keep', type=int, default=KEEP, help="disagreements reported per check")
+    parser.add_argument('--case', help="run one case (json list of arguments) and print both outcomes")
+    parser.add_argument('--out', help="append the disagreements to this json lines file")
+    parser.add_argument('--list', action='store_true', help="list the checks")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, settings in CHECKS.items():
+            print(name.ljust(14), settings['reference'].ljust(40), settings['candidate'])
+        raise SystemExit(0)
+    checks = args.checks or list(CHECKS)
+    unknown = [name for name in checks if name not in CHECKS]
+    if unknown:
+        parser.error("unknown check "+", ".join(unknown)+", choose from "+", ".join(CHECKS))
+    if args.case:
+        for name in checks:
+            agrees, a, b = compareCase(name, args.reference or CHECKS[name]['reference'],
+                                       args.candidate or CHECKS[name]['candidate'], json.loads(args.case))
+            print(name, "agree" if agrees else "DISAGREE")
+            print("    reference:", json.dumps(shownOutcome(a)))
+            print("    candidate:", json.dumps(shownOutcome(b)))
+        raise SystemExit(0)
+
+    failed = 0
+    for name in checks:
+        print("checking", name, end=" ", flush=True)
+        report = run(name, args.cases, args.seed, args.candidate, args.reference, args.history, args.workers, keep=args.keep)
+        print("- %d cases, %d disagreements in %.1fs" % (report['cases'], report['disagreements'], report['seconds']))
+        for r in report['reports']:
+            print("    "+r['source']+": reference", json.dumps(r['reference']), "candidate", json.dumps(r['candidate']))
+            print("        "+reproduceCommand(r, report['candidate']))
+        if args.out and report['reports']:
+            with open(args.out, 'a') as f:
+                for r in report['reports']:
+                    f.write(json.dumps(r)+"\n")
+        failed += report['disagreements']
+    if failed:
+        raise SystemExit(1)
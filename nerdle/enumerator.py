@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Enumerator for every valid Nerdle calculation of a given length (3 to 12).
+
+Rules (these give the same set of calculations as every shipped list, nerdlewords3.txt - nerdlewords9.txt and
+nerdlewords5z.txt - nerdlewords8z.txt, in a different order):
+    - format is [left hand side]=[right hand side]
+    - left hand side is numbers separated by at least one operator (+-*/), evaluated with normal precedence
+    - the result must be exactly right in double precision arithmetic, as in the game (so 1/49*49=1 is not valid).  exact=True also accepts these.
+    - right hand side is a single non-negative integer
+    - no number has a leading zero (eg 05 is never allowed)
+    - 'zeros' lists (nerdlewords[n]z.txt) also allow 0 as a number on the left hand side (eg 0+1=1, 5*0=0)
+    - identities (eg 1234=1234) are only included when asked for (the shipped length 3 and length 9 lists include them)
+
+Algorithm:
+    - Split the work into 'skeletons': left hand side length, digits per number and operators (eg NN*N-NNN)
+    - For each skeleton, pick the widest number that is not a divisor as the unknown N
+    - Enumerate every combination of the other numbers with numpy, so that the calculation becomes value = A + C*N
+    - Solve for the range of N that gives a right hand side of the correct length, then keep only exact integer results
+    - Work done is roughly proportional to (number of combinations of the other numbers + number of answers), so length 10 and 11 lists are practical
+    - Skeletons are spread across a process pool and results are streamed to disk in a fixed order (output is identical whatever the worker count)
+
+File output:
+    - one calculation per line, eg lexicon/nerdlewords10.txt (see buildLexicon)
+
+Usage:
+    python -m nerdle.enumerator 10                  #writes lexicon/nerdlewords10.txt and compiles it
+    python -m nerdle.enumerator 11 --zeros --workers 8
+
+"""
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+MIN_LENGTH = 3
+MAX_LENGTH = 12
+OPERATORS = '+-*/'
+
+#lengths whose shipped lists include identities such as 1234=1234
+LEGACY_IDENTITY_LENGTHS = (3, 9)
+
+#max number of rows enumerated in one numpy block (keeps memory per worker bounded)
+BLOCK_ROWS = 1 << 20
+
+
+def numberRange(digits, zeros):
+    #smallest and largest number with the given number of digits (no leading zeros)
+    if digits == 1:
+        return((0 if zeros else 1), 9)
+    return(10**(digits-1), 10**digits-1)
+
+
+def resultRange(digits):
+    #right hand side can always be 0
+    return(numberRange(digits, True))
+
+
+def skeletons(length, identities=False):
+    #all (digits per number, operators) for a given calculation length, in a fixed order
+    out = []
+    for lhsLength in range(1, length-1):
+        rhsLength = length-1-lhsLength
+        if identities and lhsLength == rhsLength:
+            out += [((lhsLength,), ())]
+        for k in range(1, (lhsLength+1)//2):
+            nDigits = lhsLength-k
+            #compositions of nDigits into k+1 numbers
+            for cuts in itertools.combinations(range(1, nDigits), k):
+                bounds = (0,)+cuts+(nDigits,)
+                digits = tuple(bounds[i+1]-bounds[i] for i in range(k+1))
+                for ops in itertools.product(OPERATORS, repeat=k):
+                    out += [(digits, ops)]
+    return(out)
+
+
+def skeletonSize(skeleton, zeros):
+    #rough amount of work for a skeleton (used to split large ones into blocks)
+    digits, ops = skeleton
+    free = freeIndex(digits, ops)
+    size = 1
+    for i, d in enumerate(digits):
+        if i != free:
+            lo, hi = numberRange(d, zeros)
+            size *= hi-lo+1
+    return(size)
+
+
+def freeIndex(digits, ops):
+    #widest number that is not a divisor - the calculation is linear in this number
+    best = 0
+    for i in range(len(digits)):
+        if i > 0 and ops[i-1] == '/':
+            continue
+        if digits[i] > digits[best]:
+            best = i
+    return(best)
+
+
+def terms(ops):
+    #split numbers into additive terms: [(sign, [(number index, '*' or '/'), ...]), ...]
+    out = [[1, [(0, '*')]]]
+    for i, op in enumerate(ops):
+        if op in '+-':
+            out += [[1 if op == '+' else -1, [(i+1, '*')]]]
+        else:
+            out[-1][1] += [(i+1, op)]
+    return(out)
+
+
+def reduceFraction(num, den):
+    g = np.gcd(num, den)
+    g[g == 0] = 1
+    return(num//g, den//g)
+
+
+def solveBlock(digits, ops, length, others, free, zeros, exact=False):
+    #others: dict number index -> int64 array (all the same length)
+    #yields (values of every number, right hand side) for the valid calculations in the block, in chunks
+    n = len(next(iter(others.values()))) if others else 1
+    lhsLength = sum(digits)+len(ops)
+    rhsLength = length-1-lhsLength
+    rlo, rhi = resultRange(rhsLength)
+
+    valid = np.ones(n, dtype=bool)
+    aNum = np.zeros(n, dtype=np.int64)
+    aDen = np.ones(n, dtype=np.int64)
+    cNum = np.zeros(n, dtype=np.int64)
+    cDen = np.ones(n, dtype=np.int64)
+
+    for sign, factors in terms(ops):
+        tNum = np.full(n, sign, dtype=np.int64)
+        tDen = np.ones(n, dtype=np.int64)
+        hasFree = False
+        for index, op in factors:
+            if index == free:
+                hasFree = True
+                continue
+            if op == '*':
+                tNum = tNum*others[index]
+            else:
+                valid &= (others[index] != 0)
+                tDen = tDen*np.where(others[index] == 0, 1, others[index])
+            tNum, tDen = reduceFraction(tNum, tDen)
+        if hasFree:
+            cNum, cDen = tNum, tDen
+        else:
+            aNum, aDen = reduceFraction(aNum*tDen+tNum*aDen, aDen*tDen)
+
+    nlo, nhi = numberRange(digits[free], zeros)
+
+    #rows where C == 0: value is A whatever N is
+    constant = valid & (cNum == 0) & (aNum % aDen == 0)
+    constant &= (aNum//aDen >= rlo) & (aNum//aDen <= rhi)
+
+    #rows where C != 0: N between (rlo-A)/C and (rhi-A)/C
+    linear = valid & (cNum != 0)
+    safeC = np.where(cNum == 0, 1, cNum)
+    #(r - A)/C = (r*aDen - aNum)*cDen / (aDen*cNum)
+    bound1Num = (rlo*aDen-aNum)*cDen
+    bound2Num = (rhi*aDen-aNum)*cDen
+    boundDen = aDen*safeC
+    flip = boundDen < 0
+    bound1Num = np.where(flip, -bound1Num, bound1Num)
+    bound2Num = np.where(flip, -bound2Num, bound2Num)
+    boundDen = np.abs(boundDen)
+    lowNum = np.minimum(bound1Num, bound2Num)
+    highNum = np.maximum(bound1Num, bound2Num)
+    lo = np.maximum(-((-lowNum)//boundDen), nlo)
+    hi = np.minimum(highNum//boundDen, nhi)
+    counts = np.where(linear, np.maximum(hi-lo+1, 0), 0)
+    counts = np.where(constant, nhi-nlo+1, counts)
+    lo = np.where(constant, nlo, lo)
+
+    #expand (row, N) pairs a slice of rows at a time, so at most about BLOCK_ROWS candidates are held at once
+    ends = np.cumsum(counts)
+    start = 0
+    while start < n:
+        stop = max(int(np.searchsorted(ends, ends[start]-counts[start]+BLOCK_ROWS, side='right')), start+1)
+        chunk = expandRows(ops, others, free, exact, start, stop, counts, lo, aNum, aDen, cNum, cDen, rlo, rhi)
+        if chunk is not None:
+            yield(chunk)
+        start = stop
+
+
+def expandRows(ops, others, free, exact, start, stop, counts, lo, aNum, aDen, cNum, cDen, rlo, rhi):
+    #all candidate N for rows start..stop-1, keeping exact integer results of the right length
+    total = int(counts[start:stop].sum())
+    if total == 0:
+        return(None)
+
+    rows = start+np.repeat(np.arange(stop-start), counts[start:stop])
+    starts = np.cumsum(counts[start:stop])-counts[start:stop]
+    freeValues = lo[rows]+(np.arange(total)-starts[rows-start])
+
+    num = aNum[rows]*cDen[rows]+cNum[rows]*freeValues*aDen[rows]
+    den = aDen[rows]*cDen[rows]
+    integral = (num % den == 0)
+    rhs = num//den
+    keep = integral & (rhs >= rlo) & (rhs <= rhi)
+
+    rows = rows[keep]
+    values = {index: others[index][rows] for index in others}
+    values[free] = freeValues[keep]
+    rhs = rhs[keep]
+
+    if not exact:
+        #the shipped lists (and the game) use double precision arithmetic, which rejects eg 1/49*49=1
+        floatOk = floatValue(ops, values) == rhs
+        values = {index: values[index][floatOk] for index in values}
+        rhs = rhs[floatOk]
+    if len(rhs) == 0:
+        return(None)
+    return(values, rhs)
+
+
+def floatValue(ops, values):
+    #evaluate in float64 exactly as python / javascript would (terms left to right, then sum left to right)
+    total = None
+    for sign, factors in terms(ops):
+        term = values[factors[0][0]].astype(np.float64)
+        for index, op in factors[1:]:
+            if op == '*':
+                term = term*values[index]
+            else:
+                term = term/values[index]
+        if total is None:
+            total = term
+        elif sign > 0:
+            total = total+term
+        else:
+            total = total-term
+    return(total)
+
+
+def formatRows(digits, ops, length, values, rhs):
+    #build (n, length) uint8 array of characters
+    n = len(rhs)
+    out = np.empty((n, length), dtype=np.uint8)
+    col = 0
+    for i, d in enumerate(digits):
+        for t in range(d):
+            out[:, col] = (values[i]//10**(d-1-t)) % 10+48
+            col += 1
+        if i < len(ops):
+            out[:, col] = ord(ops[i])
+            col += 1
+    out[:, col] = ord('=')
+    col += 1
+    rhsLength = length-col
+    for t in range(rhsLength):
+        out[:, col] = (rhs//10**(rhsLength-1-t)) % 10+48
+        col += 1
+    return(out)
+
+
+def enumerateSkeleton(task):
+    #worker: all valid calculations for one skeleton (or one block of a large skeleton), as bytes
+    length, zeros, exact, digits, ops, block, nBlocks = task
+
+    if len(ops) == 0:
+        #identity n=n
+        lo, hi = numberRange(digits[0], True)
+        values = np.arange(lo, hi+1, dtype=np.int64)
+        rows = formatRows(digits, ops, length, {0: values}, values)
+        return(rows.tobytes())
+
+    free = freeIndex(digits, ops)
+    otherIndexes = [i for i in range(len(digits)) if i != free]
+    lows = [numberRange(digits[i], zeros)[0] for i in otherIndexes]
+    sizes = [numberRange(digits[i], zeros)[1]-lows[n]+1 for n, i in enumerate(otherIndexes)]
+
+    #this block's share of the cartesian product of the other numbers
+    total = int(np.prod(sizes)) if sizes else 1
+    flat = np.arange(block*total//nBlocks, (block+1)*total//nBlocks, dtype=np.int64)
+    others = {}
+    if otherIndexes:
+        for i, position in zip(otherIndexes, np.unravel_index(flat, sizes)):
+            others[i] = position.astype(np.int64)+lows[otherIndexes.index(i)]
+
+    chunks = solveBlock(digits, ops, length, others, free, zeros, exact)
+    return(b''.join(formatRows(digits, ops, length, values, rhs).tobytes() for values, rhs in chunks))
+
+
+def tasks(length, zeros=False, identities=False, exact=False):
+    out = []
+    for digits, ops in skeletons(length, identities):
+        size = skeletonSize((digits, ops), zeros) if ops else 1
+        nBlocks = max(1, -(-size//BLOCK_ROWS))
+        for block in range(nBlocks):
+            out += [(length, zeros, exact, digits, ops, block, nBlocks)]
+    return(out)
+
+
+def generate(length, zeros=False, identities=False, workers=None, exact=False):
+    #yield blocks of calculations as bytes (each calculation followed by a newline), in a fixed order
+    if length < MIN_LENGTH or length > MAX_LENGTH:
+        raise ValueError("length must be between "+str(MIN_LENGTH)+" and "+str(MAX_LENGTH))
+
+    taskList = tasks(length, zeros, identities, exact)
+    if workers == 1:
+        results = map(enumerateSkeleton, taskList)
+        for block in results:
+            if block:
+                yield(addNewlines(block, length))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        #bounded window of tasks in flight so results stream to disk without piling up in memory
+        window = 2*(pool._max_workers)
+        pending = []
+        taskIter = iter(taskList)
+        for task in itertools.islice(taskIter, window):
+            pending += [pool.submit(enumerateSkeleton, task)]
+        while pending:
+            block = pending.pop(0).result()
+            for task in itertools.islice(taskIter, 1):
+                pending += [pool.submit(enumerateSkeleton, task)]
+            if block:
+                yield(addNewlines(block, length))
+
+
+def addNewlines(block, length):
+    rows = np.frombuffer(block, dtype=np.uint8).reshape(-1, length)
+    out = np.empty((len(rows), length+1), dtype=np.uint8)
+    out[:, :length] = rows
+    out[:, length] = ord('\n')
+    return(out.tobytes())
+
+
+def writeWordList(path, length, zeros=False, identities=False, workers=None, exact=False, verbose=False):
+    #stream all calculations to a text file (written to a temporary file then renamed)
+    start = time.time()
+    count = 0
+    tmpPath = path+'.tmp.'+str(os.getpid())
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(tmpPath, 'wb') as f:
+        for block in generate(length, zeros, identities, workers, exact):
+            f.write(block)
+            count += len(block)//(length+1)
+            if verbose:
+                print("length", length, "calculations so far:", count, end="\r")
+    os.replace(tmpPath, path)
+    if verbose:
+        print("length", length, "zeros" if zeros else "", "calculations:", count, "time:", round(time.time()-start, 1))
+    return(count)
+
+
+def buildLexicon(length, zeros=False, identities=None, workers=None, exact=False, verbose=False):
+    #generate lexicon/nerdlewords[n][z].txt and compile it to .npy
+    from nerdle import lexicon
+
+    if identities is None:
+        identities = length in LEGACY_IDENTITY_LENGTHS
+    path = os.path.join(lexicon.COMPILED_DIR, lexicon.lexiconName(length, zeros)+'.txt')
+    count = writeWordList(path, length, zeros, identities, workers, exact, verbose)
+    lexicon.compileLexicon(length, zeros, path)
+    return(path, count)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="enumerate every valid nerdle calculation of a given length")
+    parser.add_argument('length', type=int, nargs='+')
+    parser.add_argument('--zeros', action='store_true', help="allow 0 as a number on the left hand side ('z' lists)")
+    parser.add_argument('--identities', action='store_true', default=None, help="include calculations such as 1234=1234")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--exact', action='store_true', help="accept calculations that are only correct in exact arithmetic (eg 1/49*49=1)")
+    parser.add_argument('--out', default=None, help="write to this file instead of lexicon/ (no compile step)")
+    args = parser.parse_args()
+
+    for length in args.length:
+        if args.out:
+            writeWordList(args.out, length, args.zeros, bool(args.identities), args.workers, args.exact, verbose=True)
+        else:
+            buildLexicon(length, args.zeros, args.identities, args.workers, args.exact, verbose=True)
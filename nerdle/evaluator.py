@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Safe arithmetic evaluator used in place of python eval() by every generator.
+
+eval() re-parses and compiles its text on every call, can run any python code, and works in floating point
+(so 1/3*3 is 1.0 but 1/49*49 is 0.9999999999999999).  This module only understands calculations:
+    - integers (no leading zeros, as in the game and as in python) and decimals such as 2.5
+    - + - * / with normal precedence, left to right
+    - unary + and - (eg -3+5, 2*-3) and brackets
+
+Algorithm:
+    - Split a calculation into its numbers and its 'shape' with one regular expression, eg 12+3*45 -> n+n*n, [12, 3, 45]
+    - Shunting-yard parse each distinct shape once (with operator precedence, unary signs and brackets)
+    - Compile the shape into a small python function of its numbers, eg lambda a0, a1, a2: (a0+(a1*a2)).  The code is built
+      only from our own tokens (never from the input text), so nothing but arithmetic can run
+    - Exact arithmetic: results stay int until a division is not exact, then fractions.Fraction.
+      Whole results are always returned as int (6/3 -> 2, not 2.0), everything else as Fraction
+    - exact=False compiles the same shape with python's int / float arithmetic instead, giving exactly what eval() (and
+      the game, which works in double precision) gives, eg 15/11*11 is 15.000000000000002.  Use this where the game
+      has to agree with the result, eg when choosing answers
+    - Compiled shapes and results of evaluate() are memoised (lru_cache), so repeated calculations cost a dictionary lookup
+      (setCacheSize bounds how many results are kept, eg under a memory budget, see nerdle/memory.py)
+
+Errors:
+    - ZeroDivisionError for division by zero (same as eval)
+    - EvaluationError (a ValueError) for anything that is not a valid calculation
+
+Usage:
+    from nerdle import evaluator
+    evaluator.evaluate("10+50/5")                       #15
+    evaluator.evaluate("7/2")                           #Fraction(7, 2)
+    evaluator.evaluate("7/2", exact=False)              #3.5
+    evaluator.isValid("12*3=36")                        #True (every side of = has the same value)
+    evaluator.evaluateMany(["1+1", "1/0"], errors=None) #[2, None]
+
+Benchmarks against eval: python benchmarks/bench_evaluator.py
+
+"""
+
+import operator
+import re
+from fractions import Fraction
+from functools import lru_cache
+
+#number of distinct calculations remembered by evaluate()
+CACHE_SIZE = 1 << 18
+#number of distinct shapes remembered by compileShape()
+SHAPE_CACHE_SIZE = 1 << 14
+
+_NUMBER = re.compile(r"\d+\.\d*|\.\d+|\d+")
+_LEADING_ZERO = re.compile(r"(?<![\d.])0+[1-9]")
+_PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, 'neg': 3, 'pos': 3}
+#sentinel for evaluateMany: raise errors rather than replacing them
+_RAISE = object()
+
+
+class EvaluationError(ValueError):
+    pass
+
+
+def divide(a, b):
+    #exact division: int when it divides exactly, otherwise Fraction
+    if b == 0:
+        raise ZeroDivisionError("division by zero")
+    if type(a) is int and type(b) is int:
+        if a % b == 0:
+            return(a//b)
+        return(Fraction(a, b))
+    return(normalise(Fraction(a)/b))
+
+
+def normalise(value):
+    #whole Fractions become int
+    if type(value) is Fraction and value.denominator == 1:
+        return(value.numerator)
+    return(value)
+
+
+OPERATIONS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': divide}
+FLOAT_OPERATIONS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv}
+
+
+def applyOperator(a, op, b, exact=True):
+    #a op b (eg for left-to-right evaluation of a list of tokens)
+    if exact:
+        return(normalise(OPERATIONS[op](a, b)))
+    return(FLOAT_OPERATIONS[op](a, b))
+
+
+def split(expression):
+    #calculation -> (shape, number strings), eg "12+3*45" -> ("n+n*n", ["12", "3", "45"])
+    return(_NUMBER.sub('n', expression), _NUMBER.findall(expression))
+
+
+def parse(shape):
+    #shunting-yard: shape -> (postfix program, number of numbers)
+    #the program is a tuple of number positions (int) and operators ('neg' / 'pos' for unary signs)
+    program = []
+    stack = []
+    expectNumber = True
+    position = 0
+    for token in shape:
+        if token == 'n':
+            if not expectNumber:
+                raise EvaluationError("missing operator in "+repr(shape))
+            program += [position]
+            position += 1
+            expectNumber = False
+        elif token == '(':
+            if not expectNumber:
+                raise EvaluationError("missing operator before bracket in "+repr(shape))
+            stack += [token]
+        elif token == ')':
+            if expectNumber:
+                raise EvaluationError("missing number before bracket in "+repr(shape))
+            while stack and stack[-1] != '(':
+                program += [stack.pop()]
+            if not stack:
+                raise EvaluationError("unmatched ) in "+repr(shape))
+            stack.pop()
+        elif token in '+-*/':
+            if expectNumber:
+                if token in '*/':
+                    raise EvaluationError("missing number before "+token+" in "+repr(shape))
+                #unary signs are right associative so nothing is popped
+                stack += ['neg' if token == '-' else 'pos']
+            else:
+                while stack and stack[-1] != '(' and _PRECEDENCE[stack[-1]] >= _PRECEDENCE[token]:
+                    program += [stack.pop()]
+                stack += [token]
+                expectNumber = True
+        elif not token.isspace():
+            raise EvaluationError("unexpected character "+repr(token)+" in "+repr(shape))
+
+    if expectNumber:
+        raise EvaluationError("incomplete calculation "+repr(shape))
+    while stack:
+        op = stack.pop()
+        if op == '(':
+            raise EvaluationError("unmatched ( in "+repr(shape))
+        program += [op]
+    return(tuple(program), position)
+
+
+def toSource(program, exact=True):
+    #postfix program -> fully bracketed python expression of a0, a1, ...
+    stack = []
+    for token in program:
+        if type(token) is int:
+            stack += ['a'+str(token)]
+        elif token == 'neg':
+            stack[-1] = '(-'+stack[-1]+')'
+        elif token == 'pos':
+            pass
+        else:
+            b = stack.pop()
+            a = stack.pop()
+            if token == '/' and exact:
+                stack += ['_divide('+a+','+b+')']
+            else:
+                stack += ['('+a+token+b+')']
+    return(stack[0])
+
+
+@lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def compileShape(shape, exact=True):
+    #shape -> (function of the numbers, number of numbers)
+    program, count = parse(shape)
+    source = toSource(program, exact)
+    if exact and '/' in program:
+        #only division can make a Fraction from ints
+        source = '_normalise('+source+')'
+    arguments = ','.join('a'+str(i) for i in range(count))
+    #source only contains a0, a1, ..., brackets, + - * / and the two helpers below (see toSource)
+    function = eval('lambda '+arguments+': '+source, {'__builtins__': {}, '_divide': divide, '_normalise': normalise})
+    return(function, count)
+
+
+def parseNumber(text, exact=True):
+    if '.' in text:
+        return(Fraction(text) if exact else float(text))
+    return(int(text))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def evaluate(expression, exact=True):
+    #value of a calculation (int or Fraction, or int / float if not exact); raises ZeroDivisionError / EvaluationError
+    shape, numbers = split(expression)
+    function, count = compileShape(shape, exact)
+    if len(numbers) != count:
+        #an 'n' in the text itself
+        raise EvaluationError("unexpected character in "+repr(expression))
+    if _LEADING_ZERO.search(expression):
+        #python rejects leading zeros (eg 05) and so does the game
+        raise EvaluationError("leading zero in "+repr(expression))
+    if '.' in expression:
+        value = function(*[parseNumber(x, exact) for x in numbers])
+        return(normalise(value) if exact else value)
+    return(function(*map(int, numbers)))
+
+
+def setCacheSize(size):
+    #number of calculations evaluate() remembers (its results so far are forgotten)
+    global evaluate
+    evaluate = lru_cache(maxsize=size)(evaluate.__wrapped__)
+
+
+def evaluateMany(expressions, exact=True, errors=_RAISE):
+    #batch evaluate; if errors is given, it is returned in place of the value of any invalid calculation
+    results = []
+    for expression in expressions:
+        try:
+            results += [evaluate(expression, exact)]
+        except (ZeroDivisionError, EvaluationError):
+            if errors is _RAISE:
+                raise
+            results += [errors]
+    return(results)
+
+
+def isValid(equation, exact=True):
+    #true if every side of = has the same value (eg 12*3=36); invalid or undefined calculations are not valid
+    sides = equation.split('=')
+    if len(sides) < 2:
+        return(False)
+    try:
+        values = [evaluate(side, exact) for side in sides]
+    except (ZeroDivisionError, EvaluationError):
+        return(False)
+    return(all(v == values[0] for v in values[1:]))
+
+
+def clearCache():
+    evaluate.cache_clear()
+    compileShape.cache_clear()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Per-calculation feature columns, so that filters over a whole lexicon are single numpy expressions.
+
+Columns (one row per calculation id, ie row number in the compiled lexicon):
+    - nPlus, nMinus, nMultiply, nDivide - number of each operator
+    - digitCounts - (n, 10) number of each digit 0-9
+    - value - the value of the calculation (its right hand side)
+    - leadingZero - true if any number starts with 0 (eg 05)
+    - duplicates - number of repeated characters, counting every character (length - number of distinct characters)
+    - duplicateDigits - number of repeated digits
+    - n3digits - number of 3 digit groups, counted as re.findall('[0-9][0-9][0-9]', word) does (1234 counts once)
+    - oneFactor - multiplying or dividing by a lone 1 (eg 5*1, 1*5, 5/1)
+    - zeroTerm - adding or subtracting a lone 0 (eg 5+0, 0+5, 5-0)
+    - zeroFactor - multiplying by a lone 0 or dividing 0 (eg 5*0, 0*5, 0/5)
+
+File output:
+    - lexicon/nerdlewords[n][z].features.npz - saved next to the compiled lexicon the first time it is needed
+
+Usage:
+    from nerdle import features
+    f = features.loadFeatures(9)
+    ids = np.flatnonzero((f['nDivide'] > 0) & (f['n3digits'] == 0) & ~f['oneFactor'])
+
+    #or for any list of words (of any lengths)
+    f = features.computeFeatures(features.toRows(["12+3=15", "100-1=99"]))
+
+"""
+
+import numpy as np
+
+from nerdle import lexicon, memory
+
+COLUMNS = ['nPlus', 'nMinus', 'nMultiply', 'nDivide', 'digitCounts', 'value', 'leadingZero', 'duplicates',
+           'duplicateDigits', 'n3digits', 'oneFactor', 'zeroTerm', 'zeroFactor']
+OPERATOR_COLUMNS = {'+': 'nPlus', '-': 'nMinus', '*': 'nMultiply', '/': 'nDivide'}
+#padding character used by toRows for words shorter than the longest
+PAD = ' '
+
+#per-process cache of loaded feature tables (cleared when over a memory budget, see nerdle/memory.py)
+_features = {}
+memory.register('features', _features.clear)
+
+
+def toRows(wordList):
+    #list of str (any lengths) -> uint8 rows, padded on the right
+    width = max([len(w) for w in wordList]+[1])
+    return(lexicon.fromStrings([w.ljust(width, PAD) for w in wordList], width))
+
+
+def isIn(rows, chars):
+    return(np.isin(rows, np.frombuffer(chars.encode('ascii'), dtype=np.uint8)))
+
+
+def computeFeatures(words):
+    #uint8 rows (eg from lexicon.loadLexicon or toRows) -> dict of feature columns
+    words = np.asarray(words)
+    n, length = words.shape
+    columns = {}
+
+    for op, name in OPERATOR_COLUMNS.items():
+        columns[name] = (words == ord(op)).sum(axis=1).astype(np.uint8)
+    digits = isIn(words, '0123456789')
+    columns['digitCounts'] = np.stack([(words == ord(str(d))).sum(axis=1) for d in range(10)], axis=1).astype(np.uint8)
+
+    #value: digits after the '='
+    value = np.zeros(n, dtype=np.int64)
+    afterEquals = np.cumsum(words == ord('='), axis=1) > 0
+    for j in range(length):
+        use = afterEquals[:, j] & digits[:, j]
+        value = np.where(use, value*10+(words[:, j].astype(np.int64)-ord('0')), value)
+    columns['value'] = value
+
+    #numbers: where each run of digits starts and ends, and lone single digit numbers
+    before = np.zeros((n, 1), dtype=bool)
+    previousDigit = np.hstack([before, digits[:, :-1]])
+    nextDigit = np.hstack([digits[:, 1:], before])
+    start = digits & ~previousDigit
+    columns['leadingZero'] = np.any(start & nextDigit & (words == ord('0')), axis=1)
+    lone = digits & ~previousDigit & ~nextDigit
+
+    distinct = np.zeros(n, dtype=np.int64)
+    for c in np.unique(words):
+        if c != ord(PAD):
+            distinct += np.any(words == c, axis=1)
+    columns['duplicates'] = ((words != ord(PAD)).sum(axis=1)-distinct).astype(np.uint8)
+    columns['duplicateDigits'] = np.maximum(columns['digitCounts'].astype(np.int64)-1, 0).sum(axis=1).astype(np.uint8)
+
+    #3 digit groups: each run of r digits holds r//3 non-overlapping groups
+    run = np.zeros(n, dtype=np.int64)
+    groups = np.zeros(n, dtype=np.int64)
+    for j in range(length):
+        run = np.where(digits[:, j], run+1, 0)
+        groups += (run > 0) & (run % 3 == 0)
+    columns['n3digits'] = groups.astype(np.uint8)
+
+    #trivial operations on lone 1s and 0s
+    blank = np.full((n, 1), ord(PAD), dtype=words.dtype)
+    previousChar = np.hstack([blank, words[:, :-1]])
+    nextChar = np.hstack([words[:, 1:], blank])
+    one = lone & (words == ord('1'))
+    zero = lone & (words == ord('0'))
+    columns['oneFactor'] = np.any(one & (isIn(previousChar, '*/') | (nextChar == ord('*'))), axis=1)
+    columns['zeroTerm'] = np.any(zero & (isIn(previousChar, '+-') | (nextChar == ord('+'))), axis=1)
+    columns['zeroFactor'] = np.any(zero & ((previousChar == ord('*')) | isIn(nextChar, '*/')), axis=1)
+    return(columns)
+
+
+def loadFeatures(length, zeros=False, compiledDir=None):
+    #feature columns for a compiled lexicon, read from disk (or computed and saved) once per process
+    key = (length, zeros, compiledDir)
+    if key not in _features:
+        _features[key] = lexicon.loadTables(length, zeros, 'features', computeFeatures, compiledDir)
+    return(_features[key])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Registry of the game creator scripts, so they can be used as a library.
+
+Each creator script keeps its own folder (input files and output folder are found relative to the script) and only runs
+its main code when run directly.  Importing one does not load cv2 or pandas - they are imported by the functions that
+need them (visualising puzzles, reading csv files).
+
+Games (name: script, generate function):
+    - crossnerdle1 - crossnerdle/crossnerd_generator_1_answer.py, generate(patterns, countPerPattern, seed)
+    - crossnerdle2 - crossnerdle/crossnerd_generator_2_question.py, generate(answers, seed)
+    - nanagrams - nanagrams/nanagram_generator_v2.py, generate(length, count, seed, **settings)
+    - targets - targets/targets_generator.py, generate(count, seed)
+    - shuffleNumbers - shuffleNumbers/shuffleCreator.py, generate(count, mode, seed)
+    - shuffleWords - shuffleWords/shuffleCreatorWords.py, generate(count, seed)
+
+Every generate returns a list of puzzles (python objects) and writes nothing; each script also has a save function
+that writes the files its main code does.
+
+Usage:
+    from nerdle import games
+    puzzles = games.generate('nanagrams', length=7, count=5, seed=1)
+
+    #or the script module itself
+    targets = games.load('targets')
+    targets.savePuzzles(targets.generate(10, seed=1))
+
+"""
+
+import importlib.util
+import os
+
+#repository root (the folder holding the game folders)
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+GAMES = {
+    'crossnerdle1': ('crossnerdle', 'crossnerd_generator_1_answer'),
+    'crossnerdle2': ('crossnerdle', 'crossnerd_generator_2_question'),
+    'nanagrams': ('nanagrams', 'nanagram_generator_v2'),
+    'targets': ('targets', 'targets_generator'),
+    'shuffleNumbers': ('shuffleNumbers', 'shuffleCreator'),
+    'shuffleWords': ('shuffleWords', 'shuffleCreatorWords'),
+}
+
+#per-process cache of loaded script modules
+_modules = {}
+
+
+def load(name):
+    #script module for a game, imported the first time it is needed in this process
+    if name not in GAMES:
+        raise ValueError("unknown game "+str(name)+", choose from "+", ".join(GAMES))
+    if name not in _modules:
+        folder, script = GAMES[name]
+        spec = importlib.util.spec_from_file_location('nerdle_game_'+name, os.path.join(ROOT, folder, script+'.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _modules[name] = module
+    return(_modules[name])
+
+
+def generate(name, *args, **kwargs):
+    #run a game's generate function (see GAMES for its arguments)
+    return(load(name).generate(*args, **kwargs))
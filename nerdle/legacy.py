@@ -0,0 +1,643 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+The game functions as they were before the shared engines replaced their insides (eval() in place of
+nerdle/evaluator.py, list and DataFrame filtering in place of the pattern index and the DAWG), kept as references for
+the differential tests (see nerdle/differential.py).
+
+Each function is the original code with its prints removed, sys.exit() replaced by the error the shipped function
+raises, and a rng argument where the shipped function has one.  They are slow and not used by the generators.
+
+Functions (original script - function):
+    - evaluate - python eval(), as every generator used it
+    - nanagrams - commutativeCheckSpecial, commutativeCheck, checkRearrangement
+    - targets - minCalcOrdered
+    - shuffleNumbers - findSolutionMinSwap
+    - shuffleWords - findSolutionAnyUnder5, create_all_games
+    - crossnerdle1 - patternMatch (pandas DataFrames of the word lists)
+    - crossnerdle2 - find_pos (regular expressions over the word lists)
+
+File inputs:
+    - the word lists in the game input folders (see nerdle/lexicon.py), read the first time a function needs them
+
+Usage:
+    from nerdle import legacy
+    legacy.checkRearrangement('12+3=15', '15-3=12')
+
+"""
+
+import itertools
+import random
+import re
+
+import numpy as np
+
+from nerdle import lexicon
+
+#word lists, read the first time they are needed: crossnerdle1 DataFrames and crossnerdle2 lists by length
+_frames = {}
+_wordslist = {}
+
+
+def evaluate(calculation):
+    #what the generators did before nerdle/evaluator.py
+    return(eval(calculation, {'__builtins__': {}}))
+
+
+#####NANAGRAMS
+
+
+def components(a):
+    [al, ar] = a.split("=")
+    for x in '()+-*/':
+        al=al.replace(x,"~"+x+"~")
+    #double ~ can only appear with brackets eg +()
+    al.replace("~~","~")
+    al.replace("~~","~")
+    al = al.split("~")
+    al = [x for x in al if x!=""] #blanks can occur at the start if a bracket
+    return(al,ar)
+
+
+def jitter(al):
+    jitterA=[]
+    for x in al:
+        if x in '()+-*/':
+            jitterA+=x
+        else:
+            jitterA+=[str(int(x)+int(x)*int(x)/(int(x)+1))]
+    return(jitterA)
+
+
+def commutativeCheckSpecial(a,b):
+
+    if not commutativeCheck(a,b):
+        return False
+    #The code is currently only designed to work with max 1 double
+
+    #does question not have a double?
+    if (len(set([x for x in a if x not in '+-*/']))==len([x for x in a if x not in '+-*/'])):
+        return (True)
+
+    #Does double cancel out (4/4) (check by replacing both 4s with the same new number)
+
+    dupes = [x for n, x in enumerate(a) if (x in a[:n]) & (x not in '+-*/')]
+
+    double = dupes[0]
+
+    morphAtemplate = a.replace(double,'X',1).replace(double,'Y',1)
+    morphBtemplate = b.replace(double,'X',1).replace(double,'Y',1)
+    morphA = a.replace(double,str(int(double)+1))
+
+    if not (evaluate(morphA.replace('=','=='))):
+        return (True)
+
+    #Is till commutative if replace one of doubles with something else (check both combos)?
+    morph1A = morphAtemplate.replace('X',str(int(double)+1)).replace('Y',double).split('=')[0]
+    morph1B = morphBtemplate.replace('X',str(int(double)+1)).replace('Y',double).split('=')[0]
+    morph1A = morph1A+'='+str(evaluate(morph1A))
+    morph1B = morph1B+'='+str(evaluate(morph1B))
+
+    morph2B = morphBtemplate.replace('Y',str(int(double)+1)).replace('X',double).split('=')[0]
+    morph2B = morph2B+'='+str(evaluate(morph2B))
+
+    #Check only if 1A commutes with either 1B or 2B
+    if (commutativeCheck(morph1A,morph1B)) | (commutativeCheck(morph1A,morph2B)) & commutativeCheck(a,b):
+        return(True)
+
+    return(False)
+
+
+def commutativeCheck(a,b):
+    if len(a)!=len(b):
+        #different lenghts, cant be commutative
+        return(False)
+
+    al,ar = components(a)
+    bl,br = components(b)
+
+    altemp = al.copy()
+    altemp.sort()
+    bltemp = bl.copy()
+    bltemp.sort()
+
+    if altemp!=bltemp:
+        #different constituen parts, cant be commutative
+        return(False)
+
+    jitterA = jitter(al)
+    jitterB = jitter(bl)
+
+    #check valid inputs
+    if evaluate("".join(al))!=evaluate(ar):
+        raise ValueError("a not valid: "+"".join(al)+"="+ar)
+    if evaluate("".join(bl))!=evaluate(br):
+        raise ValueError("b not valid: "+"".join(bl)+"="+br)
+
+    #check commutative
+    return(abs(evaluate("".join(jitterA))-evaluate("".join(jitterB)))<0.00000001)
+
+
+def shiftLeft(x):
+    l,r = x.split("=")
+    return(l+"-"+r+"=0")
+
+
+def shiftLeft2(x):
+    l,r = x.split("=")
+    return("("+l+")/"+r+"=1")
+
+
+def checkRearrangement(a,b):
+    aLeft = shiftLeft(a)
+    bLeft = shiftLeft(b)
+
+    aLeftPlus = "+"+aLeft
+    bLeftPlus = "+"+bLeft
+    bLeftMinus = bLeftPlus.replace("+","@").replace("-","+").replace("@","-")
+    if commutativeCheckSpecial(aLeft,bLeft):
+        return(True)
+    if commutativeCheckSpecial(aLeftPlus,bLeftMinus):
+        return(True)
+
+    aLeft2 = shiftLeft2(a)
+    bLeft2 = shiftLeft2(b)
+    if commutativeCheckSpecial(aLeft2,bLeft2):
+        return(True)
+
+    return(False)
+
+
+#####TARGETS
+
+
+def combine(dig, sym):
+    m=len(sym)
+    calc=[]
+    for i in range(m):
+        calc+=[dig[i]]+[sym[i]]
+    calc+=[dig[-1]]
+    return(calc)
+
+
+def minCalcOrdered(calculation):
+    symbolsLong =  ["+","-","/","*"]
+    symbolsLong +=  ["+(","-(","/(","*("]
+    symbolsLong +=  [")+",")-",")/",")*"]
+    symbolsLong +=  [")+(",")-(",")/(",")*("]
+
+    ans = evaluate(calculation)
+    calcn = calculation
+    for s in '+-*/()':
+        calcn = calcn.replace(s,"|")
+    question = [x for x in calcn.split('|') if x!='']
+    n = len(question)
+
+    digitsList = [question]
+    symbolsList  = list(itertools.product(symbolsLong,repeat=n-1))
+
+    calcList = []
+    for sym in symbolsList:
+        for dig in digitsList:
+            combo=combine(dig,sym)
+            diffBrackets = len("".join(combo).replace("(",""))-len("".join(combo).replace(")",""))
+            if diffBrackets==0:
+                calcList += [combo]
+                calcList += [['('+combo[0]]+combo[1:-1]+[combo[-1]+')']]
+            elif diffBrackets==1:
+                calcList += [['('+combo[0]]+combo[1:-1]+[combo[-1]+'']]
+            elif diffBrackets==-1:
+                calcList += [[''+combo[0]]+combo[1:-1]+[combo[-1]+')']]
+
+    matchCalcList=[]
+    minLength=99
+    for i,c in enumerate(calcList):
+        try:
+          ev = evaluate("".join(c))
+          clc="".join(c)
+          if (ev==ans) & (len(clc)<minLength):
+              minLength=len(clc)
+              matchCalcList+=[{'calc':clc,'nDigits':(len(c)+1)/2}]
+        except:
+          pass
+
+    if len(calcList)>0:
+        minCalc = matchCalcList[-1]
+
+    return(minCalc)
+
+
+#####SHUFFLE NUMBERS
+
+
+def swap(gridQ,ab): #ab = RCRC eg 00,55 to swap R0C0 with R4C4
+    (a,b) = ([int(ab[0]),int(ab[1])],[int(ab[2]),int(ab[3])])
+    newGridQ = [g.copy() for g in gridQ]
+
+    buffer = newGridQ[a[0]][a[1]]
+    newGridQ[a[0]][a[1]]=newGridQ[b[0]][b[1]]
+    newGridQ[b[0]][b[1]]=buffer
+    return newGridQ
+
+
+def findSolutionMinSwap(grid,gridQtemp,attempts=20,rng=random):
+
+    bestAttempt = []
+    gridQmaster = [g.copy() for g in gridQtemp]
+
+    for attempt in range(attempts):
+        gridQtemp = [g.copy() for g in gridQmaster]
+
+        repeats = {}
+        for g in grid:
+            for d in g:
+                if d not in repeats:
+                    repeats[d]=1
+                else:
+                    repeats[d]+=1
+
+        solved=False
+        solveList = []
+
+        while not solved:
+            singleGreenMove = []
+            singleGreenMaxCount = 99
+            doubleAchieved = False
+
+            for row1 in range(len(grid)):
+                for col1 in range(len(grid)):
+                    for row2 in range(len(grid)):
+                        for col2 in range(len(grid)):
+
+                                if row1==row2 & col1==col2:
+                                    pass
+                                elif grid[row1][col1]==gridQtemp[row1][col1]: #already green
+                                    pass
+                                elif grid[row2][col2]==gridQtemp[row2][col2]: #already green
+                                    pass
+                                elif grid[row1][col1]==grid[row2][col2]: #the same
+                                    pass
+                                elif (grid[row1][col1]==gridQtemp[row2][col2]) & (gridQtemp[row1][col1]==grid[row2][col2]):
+                                     doubleAchieved=True
+                                     solveList+= [[{'R':row1,'C':col1,'D':grid[row1][col1]},{'R':row2,'C':col2,'D':grid[row2][col2]}]]
+                                     gridQtemp = swap(gridQtemp,str(row1)+str(col1)+str(row2)+str(col2))
+                                elif (grid[row1][col1]==gridQtemp[row2][col2]) | (gridQtemp[row1][col1]==grid[row2][col2]):
+                                    #we prefer single gren moves that don't move a repeated digit
+                                    repeatCount = max(repeats[gridQtemp[row1][col1]],repeats[gridQtemp[row2][col2]])
+                                    if repeatCount<=singleGreenMaxCount:
+                                        randomChoice = 1
+                                        #if several 'best' single moves, need to randomise
+                                        if repeatCount==singleGreenMaxCount:
+                                            randomChoice = rng.randint(0,1)
+                                        if randomChoice == 1:
+                                            singleGreenMove = [{'R':row1,'C':col1},{'R':row2,'C':col2}]
+                                            singleGreenMaxCount = repeatCount
+
+            if (singleGreenMove == []) or (doubleAchieved==True):
+                pass
+            else:
+                row1 = singleGreenMove[0]['R']
+                row2 = singleGreenMove[1]['R']
+                col1 = singleGreenMove[0]['C']
+                col2 = singleGreenMove[1]['C']
+                solveList+= [[{'R':row1,'C':col1,'D':grid[row1][col1]},{'R':row2,'C':col2,'D':grid[row2][col2]}]]
+
+                gridQtemp = swap(gridQtemp,str(row1)+str(col1)+str(row2)+str(col2))
+
+            if grid == gridQtemp:
+                solved = True
+
+        if bestAttempt == []:
+            bestAttempt=solveList
+
+        if len(solveList)<len(bestAttempt):
+            bestAttempt=solveList
+
+    return(bestAttempt)
+
+
+#####SHUFFLE WORDS
+
+
+def shuff(line,lineTrue, right=True, fixGreens=True):
+    if line==lineTrue:
+        return line
+
+    if fixGreens:
+        #shuffle but keep greens fixed
+        lineDiff = [line[x] for x in range(len(line)) if line[x]!=lineTrue[x]]
+
+        if right:
+            lineDiffShuff = [lineDiff[-1]]+lineDiff[0:-1]
+        else:
+            lineDiffShuff = lineDiff[1:]+[lineDiff[0]]
+
+        lineNew = []
+        lineDiffCount = 0
+        for x in range(len(line)):
+            if line[x]==lineTrue[x]:
+                lineNew.append(line[x])
+            else:
+                lineNew.append(lineDiffShuff[lineDiffCount])
+                lineDiffCount+=1
+    else:
+        #shuffle ignoring greens (i.e shuffle all numbers)
+        lineDiff = line
+
+        if right:
+            lineDiffShuff = [lineDiff[-1]]+lineDiff[0:-1]
+        else:
+            lineDiffShuff = lineDiff[1:]+[lineDiff[0]]
+
+        lineNew = lineDiffShuff
+
+    return lineNew
+
+
+def shuffle(gridQ,grid,instruction):
+    gridNew = [g.copy() for g in gridQ]
+    rowcol = instruction[0]
+    n = instruction[1]
+    rightleft = instruction[2]
+
+    fixGreens = len(instruction)==3
+    choice2 = int(n)
+    choice3 = (0 if (rightleft=='R' or rightleft=='D') else 1)
+
+    if rowcol == 'R':
+        #choose row
+        gridNew[choice2]=shuff(gridQ[choice2],grid[choice2],right=(choice3==0),fixGreens=fixGreens)
+
+    #col shuffle
+    if rowcol == 'C':
+        #choose column
+        column = [row[choice2] for row in grid]
+        columnQ = [row[choice2] for row in gridQ]
+        columnQ = shuff(columnQ,column,right=(choice3==0),fixGreens=fixGreens)
+        for r in range(len(gridQ)):
+            gridNew[r][choice2]=columnQ[r]
+
+    return gridNew
+
+
+def findSolutionAnyUnder5(grid,gridQ):
+
+    allGoes = []
+    for part1 in ['R','C']:
+        for part2 in ['0','1','2','3','4']:
+            for part3 in ['R','L']:
+                    allGoes.append(part1+part2+part3)
+
+    allGoPerms = list(itertools.product(allGoes, repeat=4))
+
+    minSolved=99
+    minSolution=''
+    for j, goList in enumerate(allGoPerms):
+        tempGrid = [g.copy() for g in gridQ]
+        for i in range(len(goList)):
+            go = goList[i]
+            tempGrid = shuffle(tempGrid,grid,go)
+            if tempGrid==grid:
+                if i+1<minSolved:
+                    minSolved=i+1
+                    minSolution=goList[:i+1]
+                    return(minSolved, goList[:i+1])
+
+    return(minSolved, minSolution)
+
+
+def next_letters(words):
+   allCombos = []
+   allCombos+=(list(set([x[0:2] for x in words])))
+   allCombos+=(list(set([x[0:3] for x in words])))
+   allCombos+=(list(set([x[0:4] for x in words])))
+   return(allCombos)
+
+
+def create_all_games(perms, target, start, end):
+
+    words = perms.words.values
+
+    #get all word stems
+    allCombos=next_letters(words)
+    allCombos2=[x for x in allCombos if len(x)==2]
+    allCombos3=[x for x in allCombos if len(x)==3]
+    allCombos4=[x for x in allCombos if len(x)==4]
+    allCombos5=words
+
+    (r0,r1,r2,r3,r4)=("","","","","")
+    magicSquares = []
+    counter=0
+    for i, r0 in enumerate(words[start:end]):
+        foundThisWords=0
+        found=False
+        possibleC0 = [x for x in words if (x[0]==r0[0]) & (x not in [r0])]  #exclude r0/c0 same
+        for c0 in possibleC0:
+            if found:
+                break
+            #all words starting with column 0
+            possibleR1 = [x for x in words if (x[0]==c0[1])]
+            #then filter out impossible columns
+            possibleR1 = [x for x in possibleR1 if r0[1]+x[1] in allCombos2]
+            possibleR1 = [x for x in possibleR1 if r0[2]+x[2] in allCombos2]
+            possibleR1 = [x for x in possibleR1 if r0[3]+x[3] in allCombos2]
+            possibleR1 = [x for x in possibleR1 if r0[4]+x[4] in allCombos2]
+
+            for r1 in possibleR1:
+                if found:
+                    break
+                #all words starting with column 0
+                possibleR2 = [x for x in words if (x[0]==c0[2])]
+                #then filter out impossible columns
+                possibleR2 = [x for x in possibleR2 if r0[1]+r1[1]+x[1] in allCombos3]
+                possibleR2 = [x for x in possibleR2 if r0[2]+r1[2]+x[2] in allCombos3]
+                possibleR2 = [x for x in possibleR2 if r0[3]+r1[3]+x[3] in allCombos3]
+                possibleR2 = [x for x in possibleR2 if r0[4]+r1[4]+x[4] in allCombos3]
+
+                for r2 in possibleR2:
+                    if found:
+                        break
+                    #all words starting with column 0
+                    possibleR3 = [x for x in words if (x[0]==c0[3])]
+                    #then filter out impossible columns
+                    possibleR3 = [x for x in possibleR3 if r0[1]+r1[1]+r2[1]+x[1] in allCombos4]
+                    possibleR3 = [x for x in possibleR3 if r0[2]+r1[2]+r2[2]+x[2] in allCombos4]
+                    possibleR3 = [x for x in possibleR3 if r0[3]+r1[3]+r2[3]+x[3] in allCombos4]
+                    possibleR3 = [x for x in possibleR3 if r0[4]+r1[4]+r2[4]+x[4] in allCombos4]
+
+                    for r3 in possibleR3:
+                        if found:
+                            break
+                        counter+=1
+                        #all words starting with column 0
+                        possibleR4 = [x for x in words if (x[0]==c0[4])]
+                        #then filter out impossible columns
+                        possibleR4 = [x for x in possibleR4 if (r0[1]+r1[1]+r2[1]+r3[1]+x[1] in allCombos5)]
+                        possibleR4 = [x for x in possibleR4 if (r0[2]+r1[2]+r2[2]+r3[2]+x[2] in allCombos5)]
+                        possibleR4 = [x for x in possibleR4 if (r0[3]+r1[3]+r2[3]+r3[3]+x[3] in allCombos5)]
+                        possibleR4 = [x for x in possibleR4 if (r0[4]+r1[4]+r2[4]+r3[4]+x[4] in allCombos5)]
+
+                        if len(possibleR4)>0:
+                            for r4 in possibleR4:
+                                magicSquares.append([r0,r1,r2,r3,r4])
+                            r4=""
+                            foundThisWords+=1
+                            #max n magic squares per starting column
+                            if foundThisWords>=1000:
+                                found=True
+        if len(magicSquares)>=target:
+            return(magicSquares)
+
+    return(magicSquares)
+
+
+#####CROSSNERDLE
+
+
+def wordFrame(length):
+    #crossnerdle1's word lists as DataFrames (without leading zeros)
+    import pandas as pd
+    if length not in _frames:
+        if length==3:
+            words = pd.DataFrame(['1=1','2=2','3=3','4=4','5=5','6=6','7=7','8=8','9=9'], columns=['word'])  #intentionally omits 0=0 as this breaks the leading zero rule
+        else:
+            words = pd.read_csv(lexicon.sourcePath(length), header=None, names=['word'], dtype=str)
+        if length==9:
+            words = words[words.word.apply(lambda x: x[4]!="=")] #remove words such as 1234=1234
+        _frames[length] = words
+    return(_frames[length])
+
+
+def patternMatch(toMatch,returnAll=False, impossibles=[], rng=random):
+    toMatch="".join(toMatch)
+    if len(toMatch)>9 or len(toMatch) in [2,4]:
+        if "_" in toMatch:
+            raise ValueError("no word list exists for length "+str(len(toMatch))+" "+toMatch)
+        else:
+            return([toMatch])
+
+    words=wordFrame(len(toMatch)).copy()
+    for j in range(len(toMatch)):
+        if len(words)>0:
+            if toMatch[j]=="n":
+                words=words[words.word.apply(lambda x: x[j] in '0123456789')]
+            elif toMatch[j]=="s":
+                words=words[words.word.apply(lambda x: x[j] in '+-/*')]
+            elif toMatch[j]!="_":
+                words=words[words.word.apply(lambda x: x[j]==toMatch[j])]
+
+    if impossibles!=[]:
+        #remove impossibles
+        if len(toMatch)!=len(impossibles):
+            return("fail")
+        else:
+            for j in range(len(toMatch)):
+                if len(words)>0:
+                    words=words[words.word.apply(lambda x: x[j] not in impossibles[j])]
+
+    if len(words)==0:
+        return("fail")
+    if returnAll:
+        return(words['word'].tolist())
+    else:
+        return(words.sample(random_state=rng.getrandbits(32)).iloc[0]['word'])
+
+
+def wordslist(length):
+    #crossnerdle2's word lists: with leading zeros (to ensure we don't create a question that can be solved with
+    #leading zeros), plus nnn=nnn (once)
+    if length not in _wordslist:
+        path = lexicon.sourcePath(length, zeros=True)
+        if path is None:
+            #not shipped (eg length 9): enumerated into lexicon/ when it is first compiled
+            lexicon.loadLexicon(length, zeros=True)
+            path = lexicon.sourcePath(length, zeros=True)
+        with open(path, 'r') as f:
+            words = [x.replace('\n','') for x in f.readlines()]
+        words += [str(l)+"="+str(l) for l in range(10,10000) if len(str(l)+"="+str(l))==length and str(l)+"="+str(l) not in words]
+        _wordslist[length] = words
+    return(_wordslist[length])
+
+
+def find_pos(cn, acr, dow):
+    #find possible solutions
+
+    #loop through all across then all down words
+    #find possible words that match letter pattern
+    #if no possible solutions, return []
+    #if one possible solution, update word in puzzle with that solution
+
+    found = True
+    difficulty=0
+    solveList=[]
+    while found:
+        difficulty+=1
+        found = False
+        acrpos, dowpos = [], []
+        for i, word in enumerate(acr):
+            wordstr = ''.join(cn[word[0], word[1][0]:(word[1][1]+1)])
+            if '_' in wordstr:
+                acrpos.append([x for x in wordslist(len(wordstr)) if re.search(wordstr.replace("_",r"([0-9]|[*+-=]|[\/])").replace("+",r"\+").replace("*",r"\*").replace("/",r"\/"), x) != None])
+                if len(acrpos[i]) == 0:
+                    #no solutions, give up and return
+                    raise RuntimeError("no solutions point 1")
+                elif len(acrpos[i]) == 1:
+                    #only 1 solution: adopt it
+                    for m,k in enumerate(range(word[1][0],(word[1][1]+1))):
+                        if cn[word[0], k] != list(acrpos[i][0])[m]:
+                            solveList+=[{"R":word[0],"C":k,"A":list(acrpos[i][0])[m]}]
+                    cn[word[0], word[1][0]:(word[1][1]+1)] = list(acrpos[i][0])
+                    found = True
+                else:
+                    #more than one solution, adopt solution anyway for any digits where all solutions have same digit
+                    for e in range(len(wordstr)):
+                        if wordstr[e] == '_':
+                            posdig = [x[e] for x in acrpos[i]]
+                            if all(x==posdig[0] for x in posdig):
+                                solveList+=[{"R":word[0],"C":word[1][0]+e,"A":posdig[0]}]
+                                cn[word[0], word[1][0]+e] = posdig[0]
+                                found = True
+            else:
+                acrpos.append([])
+        for i, word in enumerate(dow):
+            wordstr = ''.join(cn[word[1][0]:(word[1][1]+1), word[0]])
+            if '_' in wordstr:
+                dowpos.append([x for x in wordslist(len(wordstr)) if re.search(wordstr.replace("_",r"([0-9]|[*+-=]|[\/])").replace("+",r"\+").replace("*",r"\*").replace("/",r"\/"), x) != None])
+                if len(dowpos[i]) == 0:
+                    #no solutions, give up and return
+                    raise RuntimeError("no solutions point 2")
+
+                elif len(dowpos[i]) == 1:
+                    #only 1 solution: adopt it
+                    for m,k in enumerate(range(word[1][0],(word[1][1]+1))):
+                        if cn[k, word[0]] != list(dowpos[i][0])[m]:
+                            solveList+=[{"R":k,"C":word[0],"A":list(dowpos[i][0])[m]}]
+                    cn[word[1][0]:(word[1][1]+1), word[0]] = list(dowpos[i][0])
+                    found = True
+                else:
+                    #more than one solution, adopt solution anyway for any digits where all solutions have same digit
+                    for e in range(len(wordstr)):
+                        if wordstr[e] == '_':
+                            posdig = [x[e] for x in dowpos[i]]
+                            if all(x==posdig[0] for x in posdig):
+                                solveList+=[{"R":word[1][0]+e,"C":word[0],"A":posdig[0]}]
+                                cn[word[1][0]+e, word[0]] = posdig[0]
+                                found = True
+            else:
+                dowpos.append([])
+
+        #remove solved words from the list
+        for i in range(len(acr)-1,-1,-1):
+            if len(acrpos[i]) <= 1:
+                acr.pop(i)
+                acrpos.pop(i)
+        for i in range(len(dow)-1,-1,-1):
+            if len(dowpos[i]) <= 1:
+                dow.pop(i)
+                dowpos.pop(i)
+    for x in cn:
+        if '_' in x:
+            #not solvable
+            return ([], np.nan, [])
+    return (cn, difficulty, solveList)
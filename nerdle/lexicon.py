@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Compiled equation lexicons shared by every generator.
+
+The word lists nerdlewords3.txt - nerdlewords9z.txt are plain text files with one valid calculation per line.
+Parsing them with pandas / readlines takes seconds and creates one python string per calculation in every process.
+This module compiles each list once into a fixed-width uint8 array (one row per calculation, one byte per character)
+and opens it again with np.memmap, which takes milliseconds.
+
+File inputs:
+    - nerdlewords[n].txt / nerdlewords[n]z.txt from the game input folders (see SOURCE_DIRS)
+    - 'z' lists also contain calculations where 0 is used as a number on the left hand side (eg 0+1=1)
+
+File output:
+    - lexicon/nerdlewords[n].npy and lexicon/nerdlewords[n]z.npy - uint8 array of shape (number of calculations, n)
+    - wrong-length lines and duplicates are removed at build time (so generators no longer need to clean the lists)
+
+Build step (run from the repository root):
+    python -m nerdle.lexicon
+
+Usage:
+    from nerdle import lexicon
+    words9 = lexicon.loadLexicon(9)                 #np.memmap, shape (n, 9), dtype uint8
+    words8z = lexicon.loadLexicon(8, zeros=True)
+    wordList = lexicon.loadWords(7)                 #list of str for code that still works on strings
+
+Tables derived from a lexicon (eg nerdle/anagramindex.py, nerdle/features.py) are saved next to it with loadTables and
+rebuilt whenever the lexicon is.
+
+Arrays are opened read-only so the pages are shared via the OS page cache: worker processes that load the same
+lexicon (or inherit it through fork) use one physical copy of the data.
+If a compiled file is missing or older than its source .txt, it is (re)built automatically on first load.
+Lists that are not shipped (eg nerdlewords9z.txt, or lengths 10 - 12) are generated once with nerdle.enumerator
+and kept in lexicon/ next to the compiled arrays.
+
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DIRS = [os.path.join(ROOT, 'crossnerdle', 'input'), os.path.join(ROOT, 'nanagrams', 'input')]
+COMPILED_DIR = os.path.join(ROOT, 'lexicon')
+
+LENGTHS = range(3, 10)
+SYMBOLS = '0123456789+-*/='
+
+#per-process cache of opened lexicons
+_loaded = {}
+
+
+def lexiconName(length, zeros=False):
+    return 'nerdlewords'+str(length)+('z' if zeros else '')
+
+
+def compiledPath(length, zeros=False, compiledDir=None):
+    return os.path.join(compiledDir or COMPILED_DIR, lexiconName(length, zeros)+'.npy')
+
+
+def sourcePath(length, zeros=False, sourceDirs=None):
+    #first input folder containing the word list (then lists generated into lexicon/), or None
+    for folder in (sourceDirs or SOURCE_DIRS+[COMPILED_DIR]):
+        path = os.path.join(folder, lexiconName(length, zeros)+'.txt')
+        if os.path.exists(path):
+            return(path)
+    return(None)
+
+
+def parseWords(data, length):
+    #convert raw file bytes into a (n, length) uint8 array, dropping wrong-length lines and duplicates
+    data = data.replace(b'\r', b'')
+    if len(data) and not data.endswith(b'\n'):
+        data += b'\n'
+
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) % (length+1) == 0:
+        rows = raw.reshape(-1, length+1)
+        if np.all(rows[:, length] == ord('\n')) and not np.any(rows[:, :length] == ord('\n')):
+            #fast path: every line has the right length
+            words = rows[:, :length]
+        else:
+            words = None
+    else:
+        words = None
+
+    if words is None:
+        lines = [x for x in data.split(b'\n') if len(x) == length]
+        words = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(-1, length)
+
+    #remove duplicates, keeping the first occurrence and the original order
+    if len(words):
+        _, first = np.unique(words.view('S'+str(length)).ravel(), return_index=True)
+        if len(first) < len(words):
+            words = words[np.sort(first)]
+
+    return(np.ascontiguousarray(words, dtype=np.uint8))
+
+
+def compileLexicon(length, zeros=False, source=None, compiledDir=None):
+    #compile one word list to .npy and return the output path
+    source = source or sourcePath(length, zeros)
+    if source is None:
+        raise FileNotFoundError("no word list found for "+lexiconName(length, zeros))
+
+    with open(source, 'rb') as f:
+        words = parseWords(f.read(), length)
+
+    path = compiledPath(length, zeros, compiledDir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    #write then rename so readers never see a half written file
+    tmpPath = path+'.tmp.'+str(os.getpid())
+    with open(tmpPath, 'wb') as f:
+        np.save(f, words)
+    os.replace(tmpPath, path)
+    return(path)
+
+
+def compileAll(sourceDirs=None, compiledDir=None, verbose=True):
+    #build step: compile every nerdlewords{3..9}{,z}.txt that exists
+    paths = []
+    for length in LENGTHS:
+        for zeros in [False, True]:
+            source = sourcePath(length, zeros, sourceDirs)
+            if source is None:
+                if verbose:
+                    print("missing", lexiconName(length, zeros))
+                continue
+            path = compileLexicon(length, zeros, source, compiledDir)
+            if verbose:
+                print("compiled", source, "->", path, np.load(path, mmap_mode='r').shape)
+            paths += [path]
+    return(paths)
+
+
+def loadLexicon(length, zeros=False, compiledDir=None):
+    #open compiled lexicon as read-only memmap, compiling it first if missing or stale
+    key = (length, zeros, compiledDir)
+    if key not in _loaded:
+        path = compiledPath(length, zeros, compiledDir)
+        source = sourcePath(length, zeros)
+        if source is None and not os.path.exists(path):
+            #no shipped list: enumerate it (slow for length 11+, run python -m nerdle.enumerator in advance)
+            from nerdle import enumerator
+            source, _ = enumerator.buildLexicon(length, zeros)
+        stale = (source is not None) and os.path.exists(path) and (os.path.getmtime(source) > os.path.getmtime(path))
+        if (not os.path.exists(path)) or stale:
+            compileLexicon(length, zeros, source, compiledDir)
+        _loaded[key] = np.load(path, mmap_mode='r')
+    return(_loaded[key])
+
+
+def tablesPath(length, zeros=False, name='', compiledDir=None):
+    return(compiledPath(length, zeros, compiledDir)[:-len('.npy')]+'.'+name+'.npz')
+
+
+def loadTables(length, zeros, name, build, compiledDir=None):
+    #dict of arrays derived from a lexicon (eg an index), saved next to it as nerdlewords[n][z].[name].npz
+    #build(words) -> dict of arrays is only called if the saved tables are missing or older than the lexicon
+    words = loadLexicon(length, zeros, compiledDir)
+    path = tablesPath(length, zeros, name, compiledDir)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(compiledPath(length, zeros, compiledDir)):
+        with np.load(path) as f:
+            return(dict((k, f[k]) for k in f.files))
+    tables = build(words)
+    #write then rename so readers never see a half written file
+    tmpPath = path+'.tmp.'+str(os.getpid())
+    with open(tmpPath, 'wb') as f:
+        np.savez(f, **tables)
+    os.replace(tmpPath, path)
+    return(tables)
+
+
+def toStrings(words):
+    #uint8 rows -> list of str
+    words = np.ascontiguousarray(words)
+    if len(words) == 0:
+        return([])
+    return(words.view('S'+str(words.shape[1])).ravel().astype(str).tolist())
+
+
+def fromStrings(wordList, length=None):
+    #list of str -> uint8 rows (all strings must have the same length)
+    if length is None:
+        length = len(wordList[0]) if len(wordList) else 0
+    return(np.frombuffer("".join(wordList).encode('ascii'), dtype=np.uint8).reshape(-1, length).copy())
+
+
+def loadWords(length, zeros=False, compiledDir=None):
+    return(toStrings(loadLexicon(length, zeros, compiledDir)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="compile nerdle word lists to memory-mappable arrays")
+    parser.add_argument('--source', action='append', help="input folder(s) to read word lists from")
+    parser.add_argument('--out', default=None, help="output folder (default lexicon/)")
+    args = parser.parse_args()
+    compileAll(args.source, args.out)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Memory accounting and a memory budget for the creator scripts, so several generators can run side by side on one
+machine without running out of RAM.
+
+Accounting (with metrics on, see nerdle/metrics.py):
+    - usage() -> (resident MB now, highest resident MB so far) of this process, from /proc/self/status (VmRSS, VmHWM),
+      or ru_maxrss for both where there is no /proc
+    - each stage's 'peak' in the metrics summary: the highest resident memory while it ran (exact when the stage
+      raised the process's high-water mark, otherwise at least the resident memory at its start and end)
+    - the summary's 'memory': resident and peak MB of the process.  metrics.reset() resets the high-water mark (Linux),
+      so a batch task's peak is its own and not that of an earlier task in the same worker
+
+Budget (off unless set):
+    - environment: NERDLE_MEMORY_MB=1500 (per process), code: memory.configure(budget=1500)
+    - batch runner: python -m nerdle.batch batch.json --memory-mb 6000 (the total, shared out between the workers)
+    - under a budget, evaluate() remembers BUDGET_EVALUATIONS calculations instead of 262144 (see nerdle/evaluator.py)
+    - caches of things that can be made again (indexes, feature tables, question candidates, evaluate() results,
+      see register) are cleared, cheapest to make again first, when a metrics stage ends with the process over its
+      budget.  Memory that clearing does not give back is not cleared for again until the process has grown by
+      SLACK more, so a process that cannot get under its budget does not rebuild its indexes on every stage
+    - the batch runner freezes the data it loaded before forking the workers (gc.freeze), so the collector in the
+      workers does not write to, and so copy, the pages they share
+
+Representations that are always compact (budget or not):
+    - lexicons are read-only memmaps, shared between processes through the OS page cache (see nerdle/lexicon.py)
+    - lexicon-derived indexes and tables are numpy arrays (nerdle/patternindex.py, anagramindex.py, features.py)
+    - shuffleNumbers' allowed calculations share one string object per distinct number or symbol
+
+Usage:
+    from nerdle import memory
+    rss, peak = memory.usage()
+    memory.register('pattern indexes', _indexes.clear)      #at import, in a module with a cache
+    memory.configure(budget=1500)
+    memory.check()                                          #clear caches if over budget (metrics stages call this)
+
+"""
+
+import gc
+import os
+import sys
+
+try:
+    import resource
+except ImportError:
+    #windows
+    resource = None
+
+#MB per process (None: no budget), see configure
+budget = None
+#calculations evaluate() remembers under a budget
+BUDGET_EVALUATIONS = 1 << 14
+#fraction of the budget a process must grow by, after clearing left it over budget, before clearing again
+SLACK = 0.1
+
+#caches by how cheap they are to make again (others after these), cleared in this order
+CLEAR_ORDER = dict((name, i) for i, name in enumerate([
+    'evaluations', 'question candidates', 'word indexes', 'pattern indexes', 'dawgs', 'anagram indexes', 'features']))
+
+#caches that can be cleared: [(name, function clearing it)]
+_caches = []
+#resident MB after the last clearing
+_floor = [0.0]
+
+
+def usage():
+    #-> (resident MB, highest resident MB) of this process
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f if line.startswith(('VmRSS', 'VmHWM')))
+        return(int(fields['VmRSS'].split()[0])/1024, int(fields['VmHWM'].split()[0])/1024)
+    except (OSError, KeyError, ValueError):
+        pass
+    if resource is None:
+        return(0.0, 0.0)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macos, KB elsewhere
+    peak = peak/1024/1024 if sys.platform=='darwin' else peak/1024
+    return(peak, peak)
+
+
+def rss():
+    return(usage()[0])
+
+
+def resetPeak():
+    #start the high-water mark again from the resident memory now (Linux only, elsewhere it is the process's)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def register(name, clear):
+    #a cache that can be cleared under a budget (name: see CLEAR_ORDER), registered when its module is imported
+    _caches.append((name, clear))
+
+
+def configure(budget=None):
+    #budget: MB for this process (0 or less turns it off)
+    #(set in the environment as well, for processes started from this one)
+    from nerdle import evaluator
+    module = sys.modules[__name__]
+    before = module.budget
+    module.budget = budget if budget and budget>0 else None
+    _floor[0] = 0.0
+    if module.budget is not None:
+        os.environ['NERDLE_MEMORY_MB'] = str(module.budget)
+    else:
+        os.environ.pop('NERDLE_MEMORY_MB', None)
+    if (before is None)!=(module.budget is None):
+        evaluator.setCacheSize(evaluator.CACHE_SIZE if module.budget is None else BUDGET_EVALUATIONS)
+
+
+def check():
+    #clear caches if this process is over its budget -> names of the caches cleared
+    if budget is None:
+        return([])
+    now = rss()
+    if now<=budget or now<=_floor[0]*(1+SLACK):
+        return([])
+    cleared = []
+    for name, clear in sorted(_caches, key=lambda c: CLEAR_ORDER.get(c[0], len(CLEAR_ORDER))):
+        clear()
+        cleared += [name]
+        if rss()<=budget:
+            break
+    gc.collect()
+    _floor[0] = rss()
+    #(metrics imports this module)
+    from nerdle import metrics
+    metrics.count('memory budget clears')
+    metrics.log(1, "memory: %.0fMB over budget %.0fMB, cleared %s -> %.0fMB" % (now, budget, ", ".join(cleared), _floor[0]))
+    return(cleared)
+
+
+def _clearEvaluations():
+    from nerdle import evaluator
+    evaluator.evaluate.cache_clear()
+    evaluator.compileShape.cache_clear()
+
+
+register('evaluations', _clearEvaluations)
+
+
+if os.environ.get('NERDLE_MEMORY_MB'):
+    configure(float(os.environ['NERDLE_MEMORY_MB']))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Stage timers, counters and verbosity for the creator scripts, so a run shows where its time goes without printing
+from every loop.
+
+Metrics (off unless turned on, when off a stage or count costs one check):
+    - stages: wall (time.perf_counter) and CPU (time.process_time) seconds and number of calls per named stage,
+      eg 'lexicon load', 'candidate enumeration', 'commutativity', 'grid fill', 'removal', 'min solve'
+      (stages can be nested, each one includes the time of those inside it), and the peak resident memory (MB) while
+      the stage ran (see nerdle/memory.py)
+    - counts: named counters, eg attempts or puzzles made
+    - rejects: counters of why a candidate puzzle was thrown away, eg 'wrong number of solutions'
+
+Verbosity (what log prints):
+    - 0: nothing
+    - 1: one line or so per puzzle (default)
+    - 2: per attempt and per rejection detail (the old print in every loop)
+
+Turning on:
+    - environment: NERDLE_METRICS=1, NERDLE_VERBOSE=0/1/2 (read on import, so they work for every script)
+    - code: metrics.configure(enabled=True, verbosity=2)
+    - batch runner: python -m nerdle.batch batch.json --metrics --verbose 2
+    - why a stage is slow: NERDLE_PROFILE='grid fill' samples it for flamegraphs (see nerdle/profiler.py)
+    - memory budget: NERDLE_MEMORY_MB=1500 clears caches when a stage ends over it (see nerdle/memory.py)
+
+File output (saveSummary):
+    - json {"info": {...}, "wall", "cpu", "memory": {"rss", "peak"}, "stages": {name: {"calls", "wall", "cpu", "peak"}},
+      "counts": {...}, "rejects": {...}}
+    - the creator scripts save it as output/[output file]_metrics.json when metrics are on, the batch runner as
+      logs/[job name].metrics.json
+
+Usage:
+    from nerdle import metrics
+    with metrics.stage('grid fill'):
+        ...
+    metrics.count('attempts')
+    metrics.reject('too many solutions at max length')
+    metrics.log(2, "REJECT: too many solutions")
+    metrics.saveSummary('output/run_metrics.json', game='targets')
+
+"""
+
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+from nerdle import memory
+
+#settings, from the environment so that they reach scripts run directly and batch workers alike
+enabled = os.environ.get('NERDLE_METRICS', '0') not in ('', '0')
+verbosity = int(os.environ.get('NERDLE_VERBOSE', '1'))
+
+#per-process totals since the last reset
+_stages = {}
+_counts = {}
+_rejects = {}
+_started = (time.perf_counter(), time.process_time())
+
+#shared by every stage while metrics are off
+_off = contextlib.nullcontext()
+
+#hook set by nerdle/profiler.py while profiling: (name, stage timer) -> context manager
+profiling = None
+
+
+def configure(enabled=None, verbosity=None):
+    #change the settings (None leaves a setting as it is)
+    module = sys.modules[__name__]
+    if enabled is not None:
+        module.enabled = bool(enabled)
+    if verbosity is not None:
+        module.verbosity = int(verbosity)
+
+
+def reset():
+    #start the totals again (eg for each batch job run in a worker process)
+    global _started
+    _stages.clear()
+    _counts.clear()
+    _rejects.clear()
+    _started = (time.perf_counter(), time.process_time())
+    memory.resetPeak()
+
+
+def log(level, *args, **kwargs):
+    #print, if the verbosity is level or more
+    if verbosity>=level:
+        print(*args, **kwargs)
+
+
+class _Stage:
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if enabled:
+            self.memory = memory.usage()
+        self.start = (time.perf_counter(), time.process_time())
+        return(self)
+
+    def __exit__(self, *exc):
+        if enabled:
+            wall, cpu = time.perf_counter()-self.start[0], time.process_time()-self.start[1]
+            rss, peak = memory.usage()
+            #the process's high-water mark if the stage raised it, else the most seen at its start and end
+            peak = peak if peak>self.memory[1] else max(rss, self.memory[0])
+            totals = _stages.setdefault(self.name, [0, 0.0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] = max(totals[3], peak)
+        if memory.budget is not None:
+            memory.check()
+
+
+def stage(name):
+    #context manager timing everything inside it as stage name (and sampling it, if profiled, see nerdle/profiler.py)
+    #under a memory budget, caches are cleared as it ends if the process is over the budget (see nerdle/memory.py)
+    timer = _Stage(name) if (enabled or memory.budget is not None) else _off
+    if profiling is not None:
+        return(profiling(name, timer))
+    return(timer)
+
+
+def count(name, n=1):
+    if enabled:
+        _counts[name] = _counts.get(name, 0)+n
+
+
+def reject(reason, n=1):
+    if enabled:
+        _rejects[reason] = _rejects.get(reason, 0)+n
+
+
+def summary(**info):
+    #totals since the last reset as a dict (see File output), info is any details of the run to keep with them
+    info.update(python=platform.python_version(), pid=os.getpid())
+    rss, peak = memory.usage()
+    return({'info': info,
+            'wall': round(time.perf_counter()-_started[0], 6),
+            'cpu': round(time.process_time()-_started[1], 6),
+            'memory': {'rss': round(rss, 1), 'peak': round(peak, 1)},
+            'stages': {name: {'calls': t[0], 'wall': round(t[1], 6), 'cpu': round(t[2], 6), 'peak': round(t[3], 1)}
+                       for name, t in _stages.items()},
+            'counts': dict(_counts),
+            'rejects': dict(_rejects)})
+
+
+def saveSummary(path, **info):
+    with open(path, 'w') as f:
+        json.dump(summary(**info), f, indent=1)
+    return(path)
+
+
+def outputPath(path):
+    #metrics file saved next to an output file, eg output/targets_questions.json -> output/targets_questions_metrics.json
+    return(os.path.splitext(path)[0]+'_metrics.json')
+
+
+if os.environ.get('NERDLE_PROFILE'):
+    #profiling from the environment (see nerdle/profiler.py), so it reaches scripts run directly and batch workers alike
+    from nerdle import profiler
+    profiler.configure(os.environ['NERDLE_PROFILE'], every=os.environ.get('NERDLE_PROFILE_EVERY'),
+                       interval=float(os.environ.get('NERDLE_PROFILE_INTERVAL', '1'))/1000,
+                       outputDir=os.environ.get('NERDLE_PROFILE_DIR'))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Positional bitset index for pattern queries such as "which calculations match 2*_=__ ?".
+
+For each lexicon length, the index holds one packed bitset over calculation ids for every (position, character) pair,
+plus one for each character class (n = any digit, s = any operator).  Bit i of a bitset is set when calculation i has
+that character at that position, so a pattern query is one AND per position that is not '_'.
+
+Patterns:
+    - '_' = any character
+    - 'n' = any digit 0-9
+    - 's' = any operator + - * /
+    - anything else must match exactly (eg 2*_=__)
+    - impossibles (optional): per position, a list of characters that are not allowed there
+    - within (optional): the mask of an earlier query, to search only inside its results
+
+Each query returns a PatternMatch holding the matching ids (as a bitset), the count, and the characters still possible
+at each position (used eg to work out which cells of a crossnerdle have only one solution).
+
+Memory: (length x 18) bitsets of (number of calculations / 8) bytes, eg about 19MB for nerdlewords9z.
+
+Usage:
+    from nerdle import patternindex
+    index = patternindex.loadIndex(8)
+    match = index.query("2*__=__")
+    match.count                 #number of matching calculations
+    match.possible              #characters still possible at each position, eg ['2', '*', '0123456789', ...]
+    match.words()               #matching calculations as strings
+    match.choice()              #one at random
+
+"""
+
+import random
+
+import numpy as np
+
+from nerdle import lexicon, memory
+
+SYMBOLS = lexicon.SYMBOLS
+DIGITS = '0123456789'
+OPERATORS = '+-*/'
+#bitset rows: one per symbol then the two character classes
+CLASSES = {'n': DIGITS, 's': OPERATORS}
+ROWS = dict([(c, i) for i, c in enumerate(SYMBOLS)]+[(c, len(SYMBOLS)+i) for i, c in enumerate(CLASSES)])
+
+#per-process cache of built indexes (cleared when over a memory budget, see nerdle/memory.py)
+_indexes = {}
+memory.register('pattern indexes', _indexes.clear)
+
+
+def pack(flags):
+    #bool array -> little-endian uint64 bitset (bit i of the result = flags[i])
+    packed = np.packbits(flags, bitorder='little')
+    packed = np.pad(packed, (0, -len(packed) % 8))
+    return(packed.view('<u8'))
+
+
+def unpack(bits, size):
+    #uint64 bitset -> bool array of the first size flags
+    return(np.unpackbits(bits.view(np.uint8), bitorder='little')[:size].astype(bool))
+
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(bits):
+        return(int(np.bitwise_count(bits).sum()))
+else:
+    def popcount(bits):
+        return(int(np.unpackbits(bits.view(np.uint8)).sum()))
+
+
+class PatternIndex:
+
+    def __init__(self, words):
+        #words: uint8 array (number of calculations, length), eg from lexicon.loadLexicon
+        self.words = words
+        self.size, self.length = words.shape
+        self.chunks = -(-self.size//64)
+        self.bits = np.zeros((self.length, len(ROWS), self.chunks), dtype='<u8')
+        for position in range(self.length):
+            column = np.asarray(words[:, position])
+            for c, row in ROWS.items():
+                chars = CLASSES.get(c, c)
+                self.bits[position, row] = pack(np.isin(column, np.frombuffer(chars.encode('ascii'), dtype=np.uint8)))
+        self.all = pack(np.ones(self.size, dtype=bool))
+
+    def mask(self, pattern, impossibles=None, within=None):
+        #bitset of calculations matching pattern
+        if len(pattern) != self.length:
+            raise ValueError("pattern "+repr("".join(pattern))+" is not length "+str(self.length))
+        mask = self.all.copy() if within is None else within.copy()
+        for position, c in enumerate(pattern):
+            if c == '_':
+                continue
+            if c not in ROWS:
+                #character that never appears in a calculation
+                mask[:] = 0
+                return(mask)
+            mask &= self.bits[position, ROWS[c]]
+        if impossibles:
+            for position, chars in enumerate(impossibles):
+                for c in chars:
+                    if c in ROWS:
+                        mask &= ~self.bits[position, ROWS[c]]
+        return(mask)
+
+    def query(self, pattern, impossibles=None, within=None):
+        return(PatternMatch(self, self.mask(pattern, impossibles, within)))
+
+
+class PatternMatch:
+
+    def __init__(self, index, mask):
+        self.index = index
+        self.mask = mask
+        self._chunks = np.flatnonzero(mask)
+        self._count = None
+        self._possible = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = popcount(self.mask[self._chunks])
+        return(self._count)
+
+    def __len__(self):
+        return(self.count)
+
+    def ids(self):
+        #sorted ids of the matching calculations
+        bits = np.unpackbits(self.mask[self._chunks].view(np.uint8), bitorder='little').reshape(-1, 64)
+        chunk, bit = np.nonzero(bits)
+        return(self._chunks[chunk]*64+bit)
+
+    def words(self):
+        return(lexicon.toStrings(self.index.words[self.ids()]))
+
+    def choice(self, rng=random):
+        #one matching calculation at random (None if there are none)
+        if self.count == 0:
+            return(None)
+        ids = self.ids()
+        return(lexicon.toStrings(self.index.words[[ids[rng.randrange(len(ids))]]])[0])
+
+    @property
+    def possible(self):
+        #for each position, the characters (in SYMBOLS order) found there in at least one matching calculation
+        if self._possible is None:
+            symbols = len(SYMBOLS)
+            found = np.any(self.index.bits[:, :symbols, self._chunks] & self.mask[self._chunks], axis=2)
+            self._possible = ["".join(SYMBOLS[i] for i in np.flatnonzero(row)) for row in found]
+        return(self._possible)
+
+
+def loadIndex(length, zeros=False):
+    #index over a compiled lexicon, built once per process
+    key = (length, zeros)
+    if key not in _indexes:
+        _indexes[key] = PatternIndex(lexicon.loadLexicon(length, zeros))
+    return(_indexes[key])
@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Pipeline from generation to scheduling: a calendar's puzzles (see nerdle/schedule.py) go through a chain of stages,
+each with its own pool of worker processes, joined by bounded queues.  Puzzles stream through: each one is in its
+calendar as soon as it is scored, rather than when the whole batch has been made.
+
+Stages:
+    - crossnerdle2 calendars: fill grid (the crossnerdle1 answer) -> remove clues (the crossnerdle2 question) ->
+      verify uniqueness -> score (its difficulty, which is its tier) -> bucket by day
+    - other games: make (the game's seeded puzzle, see batch.SEEDED) -> validate (see nerdle/validate.py, games it
+      has a check for) -> bucket by day
+    - verify uniqueness: the question's words are valid, its solveList gives the answer, and solving it by deduction
+      alone (with the intersection squares given) gives the answer and nothing else
+    - bucket by day runs in this process: a puzzle already in the calendar or published is dropped, the rest fill the
+      earliest open day of their tier, else are spares, and are appended to the calendar at once (see
+      schedule.placePuzzle)
+
+Algorithm:
+    - Seeds are numbered from the calendar's seed counter as schedule.py does (batch id 'calendar-[name]-[n//count]',
+      index n%count), so a seed gives the same puzzle whichever of the two makes it, and no seed is used twice
+    - A feeder thread puts seeds into the first queue (tiers in turn, for tiers known before the puzzle is made) until
+      every open slot is filled, or attempts seeds (the calendar's, default 5) per open slot have been used
+    - A queue holds at most queueSize puzzles: a stage whose next queue is full waits until there is room
+      (backpressure), so a fast stage never runs far ahead of a slow one and memory stays bounded
+    - Each stage starts with one worker (or as many as asked for).  Every second, while there are fewer than workers,
+      the stage whose queue is fullest (at least half full) gets another, so the slowest stages end up with the most
+    - A puzzle a stage rejects, or fails on (the error is printed and quarantined, see nerdle/quarantine.py), or that
+      takes longer than --puzzle-timeout seconds in a stage, is dropped and the rest go on to the next stage.  A worker
+      that dies (eg killed for memory) loses the puzzle it was working on, which is dropped as well, as are seeds still
+      outstanding once no queue or worker has anything left (a puzzle put out just before a worker died can be lost)
+    - Once the feeder stops each stage is stopped in turn, after the one before it has finished, so nothing in the
+      pipeline is lost (puzzles for days already filled become spares)
+    - Lexicons and indexes are loaded once before the workers are forked (see schedule.warmCalendars)
+
+Usage (from the repository root):
+    python -m nerdle.pipeline schedule.json crossnerdle --start 2024-07-01 --days 28 --workers 8
+    python -m nerdle.pipeline schedule.json nanagrams --days 7 --stage-workers make=3 --queue 16
+    python -m nerdle.pipeline schedule.json crossnerdle --stages          #list the stages
+
+    #or from python
+    from nerdle import pipeline
+    stats = pipeline.runCalendar('crossnerdle', config['calendars']['crossnerdle'], '2024-07-01', 28, workers=8)
+
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from nerdle import batch, dedupe, games, metrics, quarantine, schedule, seeding, validate
+
+#puzzles a queue holds
+QUEUE_SIZE = 8
+#seconds between worker changes
+SCALE_SECONDS = 1
+#a stage gets another worker when its queue is at least this full
+SCALE_FILL = 0.5
+
+#per-process things a job's stages need, see context
+_contexts = {}
+
+
+class Stage:
+    #one step of the pipeline: function(context, item) -> the item for the next stage, or None to drop it
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+
+def context(job, tierJobs):
+    #{'game', ...} what a job's stages need for tierJobs ({tier: job}), made once per process
+    key = json.dumps([job, tierJobs], sort_keys=True)
+    if key not in _contexts:
+        if job['game']=='crossnerdle2':
+            patterns = schedule.crossnerdlePatterns(job, list(tierJobs))
+            _contexts[key] = {'game': job['game'], 'count': len(patterns), 'patterns': patterns,
+                              'seen': dedupe.loadIndex('crossnerdle1')}
+        else:
+            module = games.load(job['game'])
+            makers = {tier: batch.SEEDED[job['game']](module, tierJob) for tier, tierJob in tierJobs.items()}
+            _contexts[key] = {'game': job['game'], 'makers': makers}
+    return(_contexts[key])
+
+
+#####STAGES (item: {'seed', 'batchId', 'index', 'tier', 'puzzle'}, tier None until scored for crossnerdle2)
+
+def fillGrid(ctx, item):
+    answers = games.load('crossnerdle1')
+    item['answer'] = answers.seededPuzzle(item['index'], item['batchId'], ctx['patterns'], 1, ctx['seen'])
+    return(item)
+
+
+def removeClues(ctx, item):
+    questions = games.load('crossnerdle2')
+    item['puzzle'] = questions.createQuestion(item.pop('answer'), seeding.puzzleRng('crossnerdle2', item['batchId'], item['index']))
+    return(item)
+
+
+def verifyUniqueness(ctx, item):
+    question = item['puzzle']
+    failures = validate.checkCrossnerdleQuestions([question])
+    if failures:
+        metrics.reject(failures[0][1])
+        return(None)
+    #intersection squares ('~') given, every other blank by deduction
+    questions = games.load('crossnerdle2')
+    grid = np.array([[a if q=='~' else q for q, a in zip(qRow, aRow)] for qRow, aRow in zip(question['question'], question['answer'])])
+    across, down = questions.findWords(grid)
+    try:
+        solved, _, _ = questions.find_pos(grid, across, down)
+    except RuntimeError:
+        solved = []
+    if not len(solved) or np.array(solved).tolist()!=question['answer']:
+        metrics.reject('not unique')
+        return(None)
+    return(item)
+
+
+def score(ctx, item):
+    item['puzzle'] = games.load('crossnerdle2').gradeQuestions([item['puzzle']])[0]
+    item['tier'] = str(item['puzzle']['difficulty'])
+    return(item)
+
+
+def make(ctx, item):
+    item['puzzle'] = ctx['makers'][item['tier']][1](item['index'], item['batchId'])
+    return(item)
+
+
+def check(ctx, item):
+    checker = VALIDATORS.get(ctx['game'])
+    failures = checker(item['puzzle']) if checker else []
+    if failures:
+        metrics.reject(failures[0][1])
+        return(None)
+    return(item)
+
+
+#game -> function(puzzle) -> [(index, reason)]
+VALIDATORS = {
+    'nanagrams': lambda p: validate.checkNanagrams([p]),
+    'crossnerdle1': lambda p: validate.checkCrossnerdle([p]),
+    'shuffleNumbers': lambda p: validate.checkShuffleNumbers([p['answer']], [p['question']]),
+    'shuffleWords': lambda p: validate.checkShuffleWords([p['answer']], [p['question']]),
+}
+
+
+def jobStages(job):
+    if job['game']=='crossnerdle2':
+        return([Stage('fill grid', fillGrid), Stage('remove clues', removeClues),
+                Stage('verify uniqueness', verifyUniqueness), Stage('score', score)])
+    return([Stage('make', make), Stage('validate', check)])
+
+
+#####RUNNING
+
+def stageWorker(k, stage, setup, inbox, outbox, events, verbosity):
+    #(in a worker) run stage k on items from inbox until a None, putting the ones kept in outbox
+    #events: (k, pid, seed, None) as each item is taken, (k, pid, seed, (seconds, kept, error)) once it is done
+    metrics.configure(verbosity=verbosity)
+    ctx = context(*setup)
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        events.put((k, os.getpid(), item['seed'], None))
+        start = time.time()
+        try:
+            with quarantine.Deadline(quarantine.timeout):
+                result = stage.function(ctx, item)
+            error = None
+        except Exception as e:
+            result, error = None, "seed %d: %s: %s" % (item['seed'], type(e).__name__, e)
+            quarantine.record(ctx['game'], {'stage': stage.name, 'seed': item['seed'], 'batchId': item['batchId'], 'index': item['index']},
+                              e, time.time()-start)
+        if result is not None:
+            outbox.put(result)
+        events.put((k, os.getpid(), item['seed'], (time.time()-start, result is not None, error)))
+
+
+def runPipeline(stages, items, place, setup, workers=None, queueSize=QUEUE_SIZE, interval=10, verbosity=0, drop=None):
+    #run items (an iterable of dicts with a 'seed') through stages, each kept item going to place(item), which returns
+    #True once no more are needed, and the seed of each one dropped (or lost with a worker that died) to drop(seed)
+    #-> [{'stage', 'workers', 'in', 'out', 'errors', 'seconds'}]
+    #setup: (job, tierJobs) for context, verbosity: the workers' (see metrics.configure)
+    methods = multiprocessing.get_all_start_methods()
+    mp = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    workers = max(workers or os.cpu_count() or 1, len(stages), sum([s.workers for s in stages]))
+    queues = [mp.Queue(queueSize) for _ in range(len(stages)+1)]
+    events = mp.Queue()
+    procs = [[] for _ in stages]
+    stats = [{'stage': s.name, 'workers': 0, 'in': 0, 'out': 0, 'errors': 0, 'seconds': 0.0} for s in stages]
+    #stop messages still to send, None until a stage is stopping
+    stops = [None]*len(stages)
+    #worker pid: (stage, seed) it is working on, and the seeds fed that are not yet placed or dropped
+    working = {}
+    outstanding = set()
+    counted = [0]
+    enough = threading.Event()
+    fed = threading.Event()
+
+    def start(k):
+        p = mp.Process(target=stageWorker, args=(k, stages[k], setup, queues[k], queues[k+1], events, verbosity), daemon=True)
+        p.start()
+        procs[k] += [p]
+        stats[k]['workers'] = max(stats[k]['workers'], len([x for x in procs[k] if x.is_alive()]))
+
+    def feed():
+        try:
+            for item in items:
+                outstanding.add(item['seed'])
+                while not enough.is_set():
+                    try:
+                        queues[0].put(item, timeout=0.5)
+                        break
+                    except queue.Full:
+                        pass
+                if enough.is_set():
+                    outstanding.discard(item['seed'])
+                    break
+        finally:
+            fed.set()
+
+    def fill(k):
+        try:
+            return(queues[k].qsize()/queueSize)
+        except NotImplementedError:
+            #macos
+            return(0)
+
+    def lose(seed):
+        outstanding.discard(seed)
+        if drop:
+            drop(seed)
+
+    def count(events, timeout=0):
+        while True:
+            try:
+                k, pid, seed, outcome = events.get(timeout=timeout) if timeout else events.get_nowait()
+            except queue.Empty:
+                return
+            counted[0] += 1
+            if outcome is None:
+                working[pid] = (k, seed)
+                continue
+            working.pop(pid, None)
+            seconds, kept, error = outcome
+            stats[k]['in'] += 1
+            stats[k]['out'] += kept
+            stats[k]['seconds'] += seconds
+            if not kept:
+                lose(seed)
+            if error:
+                stats[k]['errors'] += 1
+                print(stages[k].name, "failed:", error, flush=True)
+
+    def reap():
+        #a worker that died (eg killed for memory) never finishes its puzzle: its seed is dropped
+        dead = [p.pid for stage in procs for p in stage if p.pid in working and not p.is_alive()]
+        if dead:
+            #what it put out before it died
+            count(events)
+        for pid in dead:
+            if pid in working:
+                k, seed = working.pop(pid)
+                stats[k]['in'] += 1
+                stats[k]['errors'] += 1
+                print(stages[k].name, "worker died on seed", seed, flush=True)
+                lose(seed)
+
+    def idle():
+        #-> (events so far, seeds outstanding) while no worker is working on any and every stage has workers, else None
+        #the same at two checks in a row: they are not coming back (a puzzle put out just before its worker died is
+        #lost, though the queue it was put in can still count it)
+        if outstanding and not working and not [k for k in range(len(stages)) if not [p for p in procs[k] if p.is_alive()]]:
+            return((counted[0], frozenset(outstanding)))
+        return(None)
+
+    def report():
+        print("  ".join(["%s: %dw %d/%d in %d out %d" % (stats[k]['stage'], len([p for p in procs[k] if p.is_alive()]),
+                                                          int(fill(k)*queueSize), queueSize, stats[k]['in'], stats[k]['out'])
+                         for k in range(len(stages))]), flush=True)
+
+    for k, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            start(k)
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    lastScale = lastReport = time.time()
+    wasIdle = None
+    while True:
+        #bucket what has come out of the last stage
+        try:
+            for _ in range(queueSize):
+                item = queues[-1].get(timeout=0.1)
+                outstanding.discard(item['seed'])
+                if place(item):
+                    enough.set()
+        except queue.Empty:
+            pass
+        count(events)
+        reap()
+
+        #stop each stage once everything before it has finished
+        for k in range(len(stages)):
+            if stops[k] is None and (fed.is_set() if k==0 else (stops[k-1]==0 and not [p for p in procs[k-1] if p.is_alive()])):
+                stops[k] = len([p for p in procs[k] if p.is_alive()])
+            while stops[k]:
+                try:
+                    queues[k].put_nowait(None)
+                    stops[k] -= 1
+                except queue.Full:
+                    break
+        if stops[-1]==0 and not [p for stage in procs for p in stage if p.is_alive()]:
+            break
+
+        now = time.time()
+        if now-lastScale>=SCALE_SECONDS:
+            lastScale = now
+            running = [k for k in range(len(stages)) if stops[k] is None]
+            for k in running:
+                if not [p for p in procs[k] if p.is_alive()]:
+                    #every worker of a running stage has died (eg killed for memory)
+                    print(stages[k].name, "has no workers, starting one", flush=True)
+                    start(k)
+            if running and len([p for k in running for p in procs[k] if p.is_alive()])<workers:
+                fullest = max(running, key=fill)
+                if fill(fullest)>=SCALE_FILL:
+                    start(fullest)
+            isIdle = idle()
+            if isIdle is not None and isIdle==wasIdle:
+                print(len(outstanding), "seeds lost in the pipeline, dropped", flush=True)
+                for seed in sorted(outstanding):
+                    lose(seed)
+                isIdle = None
+            wasIdle = isIdle
+        if now-lastReport>=interval:
+            lastReport = now
+            report()
+
+    #whatever the last stage put out before stopping
+    while True:
+        try:
+            place(queues[-1].get(timeout=0.5))
+        except queue.Empty:
+            break
+    count(events, timeout=0.5)
+    feeder.join()
+    return(stats)
+
+
+def runCalendar(name, config, start, days, workers=None, calendarDir=None, queueSize=QUEUE_SIZE, stageWorkers=None,
+                interval=10, verbosity=0, warm=True):
+    #fill one calendar's open slots from start to start+days-1 through the pipeline -> (Calendar, stage stats)
+    #stageWorkers: {stage name: workers to start with}
+    schedule.checkCalendar(name, config)
+    job = config['job']
+    graded = job['game']=='crossnerdle2'
+    calendar = schedule.loadCalendar(name, job, calendarDir)
+    slots = schedule.openSlots(calendar, schedule.daySlots(config, start, days))
+    missing = calendar.useSpares(slots)
+    needed = collections.Counter([tier for _, tier in missing])
+    if not missing:
+        calendar.close()
+        return(calendar, [])
+    tierJobs = {tier: job if graded else dict(job, **config.get('tiers', {}).get(tier, {})) for tier in sorted(needed)}
+    if warm:
+        schedule.warmCalendars({name: config})
+    ctx = context(job, tierJobs)
+    counts = {tier: max(1, ctx['count'] if graded else ctx['makers'][tier][0]) for tier in tierJobs}
+    attempts = config.get('attempts', 5)
+    published = schedule.publishedIndex(job)
+    #per tier: seeds fed, puzzles placed, and seeds placed or dropped; the tier each seed in the pipeline was fed for
+    fed, placed, done = collections.Counter(), collections.Counter(), collections.Counter()
+    tierOf = {}
+    last = [calendar.next-1]
+
+    def items():
+        #graded tiers are only known once made, so they share seeds; the rest take turns, each with no more seeds in
+        #the pipeline than it still needs
+        n = calendar.next
+        while True:
+            if graded:
+                tiers = ready = [None] if fed[None]<len(missing)*attempts else []
+            else:
+                tiers = [t for t in sorted(needed) if placed[t]<needed[t] and fed[t]<needed[t]*attempts]
+                ready = [t for t in tiers if fed[t]-done[t]<needed[t]-placed[t]]
+            if not tiers:
+                return
+            if not ready:
+                time.sleep(0.1)
+            for tier in ready:
+                count = counts[tier or sorted(needed)[0]]
+                tierOf[n] = tier
+                fed[tier] += 1
+                last[0] = n
+                yield {'seed': n, 'batchId': 'calendar-'+name+'-'+str(n//count), 'index': n%count, 'tier': tier}
+                n += 1
+
+    def drop(seed):
+        #(a puzzle put out by a worker that then died is dropped with it, and placed as well)
+        if seed in tierOf:
+            done[tierOf.pop(seed)] += 1
+
+    def place(item):
+        record = {'key': schedule.puzzleKey(job, item['puzzle']), 'tier': item['tier'], 'batchId': item['batchId'],
+                  'index': item['index'], 'puzzle': item['puzzle']}
+        if schedule.placePuzzle(calendar, slots, published, record):
+            placed[tierOf.get(item['seed'], item['tier'])] += 1
+            metrics.log(1, name, "tier", item['tier'], "puzzle placed, missing:", len(calendar.missing(slots)))
+        else:
+            metrics.count('repeats dropped')
+        drop(item['seed'])
+        return(not calendar.missing(slots))
+
+    stages = jobStages(job)
+    for stage in stages:
+        stage.workers = (stageWorkers or {}).get(stage.name, stage.workers)
+    try:
+        stats = runPipeline(stages, items(), place, (job, tierJobs), workers, queueSize, interval,
+                            verbosity=max(verbosity-1, 0), drop=drop)
+    finally:
+        calendar.useSeeds(last[0]+1)
+        calendar.useSpares(slots)
+        calendar.close()
+    return(calendar, stats)
+
+
+def printStats(stats):
+    print()
+    print("%-20s %7s %6s %6s %6s %7s %9s" % ("stage", "workers", "in", "out", "errors", "dropped", "s/puzzle"))
+    for s in stats:
+        print("%-20s %7d %6d %6d %6d %7d %9.3f" % (s['stage'][:20], s['workers'], s['in'], s['out'], s['errors'],
+                                                  s['in']-s['out']-s['errors'], s['seconds']/max(s['in'], 1)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="fill a calendar by streaming its puzzles through a pipeline of stages")
+    parser.add_argument('config', help="json schedule config (see nerdle/schedule.py)")
+    parser.add_argument('calendar', help="name of a calendar in the config")
+    parser.add_argument('--start', default=None, help="first day (yyyy-mm-dd), default today")
+    parser.add_argument('--days', type=int, default=None, help="days to fill (default: the config's days, else 28)")
+    parser.add_argument('--workers', type=int, default=None, help="most workers over every stage (default: the config's workers, else one per cpu)")
+    parser.add_argument('--stage-workers', nargs='+', default=[], metavar='STAGE=N', help="workers a stage starts with (default 1)")
+    parser.add_argument('--queue', type=int, default=QUEUE_SIZE, help="puzzles each queue holds")
+    parser.add_argument('--calendar-dir', default=None, help="default: the config's calendarDir, else calendar in the repository root")
+    parser.add_argument('--interval', type=float, default=10, help="seconds between progress reports")
+    parser.add_argument('--puzzle-timeout', type=float, default=None, metavar='SECONDS', help="drop (quarantine) a puzzle taking longer than this in a stage")
+    parser.add_argument('--stages', action='store_true', help="list the calendar's stages, making nothing")
+    parser.add_argument('--verbose', type=int, default=None, help="0 quiet, 1 a line per puzzle placed (default)")
+    args = parser.parse_args()
+    metrics.configure(verbosity=args.verbose)
+    quarantine.configure(timeout=args.puzzle_timeout)
+
+    config = batch.loadConfig(args.config)
+    calendarConfig = config['calendars'][args.calendar]
+    if args.stages:
+        print(" -> ".join([s.name for s in jobStages(calendarConfig['job'])]+['bucket by day']))
+    else:
+        stageWorkers = dict([(s.split('=')[0], int(s.split('=')[1])) for s in args.stage_workers])
+        calendar, stats = runCalendar(args.calendar, calendarConfig, args.start or datetime.date.today().isoformat(),
+                                      args.days or config.get('days', 28), workers=args.workers or config.get('workers'),
+                                      calendarDir=args.calendar_dir or config.get('calendarDir'), queueSize=args.queue,
+                                      stageWorkers=stageWorkers, interval=args.interval, verbosity=metrics.verbosity)
+        printStats(stats)
+        print()
+        print(args.calendar+":", len(calendar.missing(schedule.daySlots(calendarConfig, args.start or datetime.date.today().isoformat(),
+                                                                         args.days or config.get('days', 28)))), "days missing")
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Sampling profiler for metrics stages (see nerdle/metrics.py), to show why a stage is slow and not only that it is.
+Off unless turned on; when on, only the chosen stages are sampled, so the rest of the run runs at full speed.
+
+Algorithm:
+    - every metrics.stage(name) asks the profiler if that call is to be profiled: the stage is chosen and it is the
+      Nth call of it (every, eg 100 profiles the 'grid fill' of one puzzle in 100 in a production batch)
+    - while a profiled stage runs, a CPU timer (SIGPROF, every interval ms of CPU time) records the python stack
+      (function, file, first line of each frame).  A sample is weighted by the CPU time since the last one, so a long
+      call into numpy or C, during which the timer signals run together, still counts for all its time
+    - where there is no SIGPROF (Windows, or configured from a thread other than the main one) a thread samples
+      the stack every interval ms of wall time instead
+    - samples go to the innermost profiled stage running.  'run' profiles the whole run: samples outside every
+      chosen stage go to 'run'
+    - processes forked while profiling (eg batch workers) start again with no samples
+
+Turning on:
+    - environment: NERDLE_PROFILE=grid fill,min solve (stage names, 'run' for the whole run, '*' for every stage),
+      NERDLE_PROFILE_EVERY=100, NERDLE_PROFILE_INTERVAL=1 (ms), NERDLE_PROFILE_DIR (default logs/profiles)
+    - code: profiler.configure(['removal'], every=10)
+    - batch runner: python -m nerdle.batch batch.json --profile 'commutativity,rearrangements' --profile-every 50
+
+File output (saved at exit, or by the batch runner after each task):
+    - [label].collapsed - collapsed stacks of every stage (the stage as the root frame), one "frame;frame;... count"
+      line per stack with count in samples, for flamegraph.pl, speedscope or inferno
+    - [label].[stage].collapsed - the same for one stage
+    - [label].profile.json - per stage: calls, calls profiled, samples, CPU seconds sampled and the functions with
+      the most samples (self: in the function itself, total: in it or anything it called)
+    - label is the script name and process id (the task name for batch tasks)
+
+Usage:
+    NERDLE_PROFILE='commutativity,rearrangements' python nanagrams/nanagram_generator_v2.py
+    NERDLE_PROFILE='grid fill' NERDLE_PROFILE_EVERY=20 python crossnerdle/crossnerd_generator_1_answer.py
+    NERDLE_PROFILE='removal' python crossnerdle/crossnerd_generator_2_question.py
+    NERDLE_PROFILE='min solve' python shuffleNumbers/shuffleCreator.py
+    flamegraph.pl logs/profiles/shuffleCreator-1234.min_solve.collapsed > minsolve.svg
+
+    from nerdle import profiler
+    profiler.configure(['grid fill'], every=10)
+    ...
+    profiler.save(label='crossnerdle1')
+
+"""
+
+import atexit
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(ROOT, 'logs', 'profiles')
+RUN = 'run'
+MAX_DEPTH = 200
+TOP = 30
+
+#settings (see configure)
+stages = set()
+every = 1
+interval = 0.001
+outputDir = OUTPUT_DIR
+
+#per-process samples since the last reset: {stage: {stack (tuple of code objects, outermost first): samples}}
+_samples = {}
+#{stage: [calls, calls profiled]}
+_calls = {}
+#profiled stages running, innermost last
+_active = []
+_pid = [os.getpid()]
+_sampler = [None]
+_saveAtExit = [False]
+
+
+def frameName(code):
+    #frame name for collapsed stacks (no ';', which separates frames)
+    return(("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)).replace(';', ','))
+
+
+def record(frame, weight):
+    stack = []
+    while frame is not None and len(stack)<MAX_DEPTH:
+        stack += [frame.f_code]
+        frame = frame.f_back
+    stage = _active[-1] if _active else RUN
+    counts = _samples.setdefault(stage, {})
+    key = tuple(reversed(stack))
+    counts[key] = counts.get(key, 0)+weight
+
+
+class _SignalSampler:
+    #SIGPROF every interval of CPU time, in the main thread
+
+    def __init__(self):
+        self.last = time.process_time()
+        signal.signal(signal.SIGPROF, self.sample)
+
+    def sample(self, signum, frame):
+        now = time.process_time()
+        weight = max(1, int(round((now-self.last)/interval)))
+        self.last = now
+        if _active or RUN in stages:
+            record(frame, weight)
+
+    def start(self):
+        self.last = time.process_time()
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+
+
+class _ThreadSampler:
+    #a thread reading the stack of the thread that configured the profiler, every interval of wall time
+
+    def __init__(self):
+        self.target = threading.get_ident()
+        self.running = threading.Event()
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def loop(self):
+        while True:
+            self.running.wait()
+            time.sleep(interval)
+            frame = sys._current_frames().get(self.target)
+            if frame is not None and self.running.is_set() and (_active or RUN in stages):
+                record(frame, 1)
+
+    def start(self):
+        self.running.set()
+
+    def stop(self):
+        self.running.clear()
+
+
+def _newSampler():
+    try:
+        return(_SignalSampler())
+    except (AttributeError, ValueError, OSError):
+        #no SIGPROF, or not the main thread
+        return(_ThreadSampler())
+
+
+def _checkProcess():
+    #a forked process starts again (the parent's timer is not inherited, nor are its samples wanted)
+    if _pid[0]!=os.getpid():
+        _pid[0] = os.getpid()
+        _sampler[0] = _newSampler() if stages else None
+        _active.clear()
+        reset()
+        if RUN in stages:
+            _sampler[0].start()
+
+
+class _Profiled:
+
+    def __init__(self, name, timer):
+        self.name = name
+        self.timer = timer
+
+    def __enter__(self):
+        self.timer.__enter__()
+        _active.append(self.name)
+        if len(_active)==1 and RUN not in stages:
+            _sampler[0].start()
+        return(self)
+
+    def __exit__(self, *exc):
+        if _active and _active[-1]==self.name:
+            _active.pop()
+        if not _active and RUN not in stages and _sampler[0] is not None:
+            _sampler[0].stop()
+        return(self.timer.__exit__(*exc))
+
+
+def wrap(name, timer):
+    #metrics.stage hook: timer (the stage's metrics timer) on its own, or profiled as well
+    _checkProcess()
+    if not ('*' in stages or name in stages):
+        return(timer)
+    calls = _calls.setdefault(name, [0, 0])
+    calls[0] += 1
+    if (calls[0]-1) % every:
+        return(timer)
+    calls[1] += 1
+    return(_Profiled(name, timer))
+
+
+def configure(stageNames=None, every=None, interval=None, outputDir=None, saveAtExit=True):
+    #stageNames: list of stage names (or a comma separated str), 'run' for the whole run, '*' for every stage
+    #interval in seconds.  None leaves a setting as it is; no stages turns the profiler off
+    #(metrics is imported here as it imports this module when profiling is turned on from the environment)
+    from nerdle import metrics
+    module = sys.modules[__name__]
+    if every is not None:
+        module.every = max(1, int(every))
+    if interval is not None:
+        module.interval = float(interval)
+    if outputDir is not None:
+        module.outputDir = outputDir
+    if stageNames is not None:
+        if isinstance(stageNames, str):
+            stageNames = stageNames.split(',')
+        if _sampler[0] is not None:
+            _sampler[0].stop()
+        stages.clear()
+        stages.update([s.strip() for s in stageNames if s.strip()])
+        _pid[0] = os.getpid()
+        _sampler[0] = _newSampler() if stages else None
+        metrics.profiling = wrap if stages else None
+        if RUN in stages:
+            _sampler[0].start()
+        if stages and saveAtExit and not _saveAtExit[0]:
+            _saveAtExit[0] = True
+            atexit.register(_atExit)
+
+
+def reset():
+    #start the samples again (eg for each batch job run in a worker process)
+    _samples.clear()
+    _calls.clear()
+
+
+def fileName(name):
+    return("".join([c if c.isalnum() or c in '-_.' else '_' for c in name]))
+
+
+def collapsed(stage=None):
+    #collapsed stack lines ("frame;frame;... samples") of one stage, or of every stage with the stage as the root frame
+    lines = []
+    for name in ([stage] if stage else sorted(_samples)):
+        for stack, n in sorted(_samples.get(name, {}).items(), key=lambda item: -item[1]):
+            frames = [frameName(code) for code in stack]
+            lines += [";".join(([] if stage else [name])+frames)+" "+str(n)]
+    return(lines)
+
+
+def profile(stage):
+    #summary of one stage (see File output)
+    own = {}
+    total = {}
+    samples = 0
+    for stack, n in _samples.get(stage, {}).items():
+        samples += n
+        if stack:
+            own[frameName(stack[-1])] = own.get(frameName(stack[-1]), 0)+n
+        for name in set([frameName(code) for code in stack]):
+            total[name] = total.get(name, 0)+n
+    calls = _calls.get(stage, [0, 0])
+    top = lambda counts: [[name, n] for name, n in sorted(counts.items(), key=lambda item: -item[1])[:TOP]]
+    return({'calls': calls[0], 'profiled': calls[1], 'samples': samples, 'seconds': round(samples*interval, 6),
+            'self': top(own), 'total': top(total)})
+
+
+def save(outputDir=None, label=None):
+    #write the files (see File output) -> paths, none if nothing was sampled
+    if not _samples:
+        return([])
+    outputDir = outputDir or sys.modules[__name__].outputDir
+    label = fileName(label or os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]+'-'+str(os.getpid()))
+    os.makedirs(outputDir, exist_ok=True)
+    paths = [os.path.join(outputDir, label+'.collapsed')]
+    with open(paths[-1], 'w') as f:
+        f.write("\n".join(collapsed())+"\n")
+    for stage in sorted(_samples):
+        paths += [os.path.join(outputDir, label+'.'+fileName(stage)+'.collapsed')]
+        with open(paths[-1], 'w') as f:
+            f.write("\n".join(collapsed(stage))+"\n")
+    paths += [os.path.join(outputDir, label+'.profile.json')]
+    with open(paths[-1], 'w') as f:
+        json.dump({'interval': interval, 'every': every,
+                   'stages': dict((stage, profile(stage)) for stage in sorted(_samples))}, f, indent=1)
+    return(paths)
+
+
+def _atExit():
+    if _sampler[0] is not None:
+        _sampler[0].stop()
+    if _pid[0]==os.getpid():
+        for path in save()[-1:]:
+            print("profile saved:", path, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    #print a saved profile
+    import argparse
+    parser = argparse.ArgumentParser(description="print the functions with the most samples of their own in a saved profile")
+    parser.add_argument('profile', help="[label].profile.json")
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    with open(args.profile) as f:
+        saved = json.load(f)
+    for stage, p in saved['stages'].items():
+        print("%s: %d of %d calls profiled, %d samples, %.2fs" % (stage, p['profiled'], p['calls'], p['samples'], p['seconds']))
+        #most samples in the function itself first, as the outer frames of every stack have them all in total
+        for name, n in p['self'][:args.top]:
+            totalSamples = dict(p['total']).get(name, n)
+            print("    %6.1f%% self %6.1f%% total  %s" % (100*n/max(p['samples'], 1), 100*totalSamples/max(p['samples'], 1), name))
@@ -0,0 +1,303 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Fault isolation for the creator scripts: a puzzle that fails (an error deep in its generator, eg crossnerdle's
+"ERROR: CANNOT BE SOLVED" or shuffleNumbers' "minSolve fail") or takes too long is recorded and skipped, instead of
+stopping the whole run and losing the work done so far.
+
+Algorithm:
+    - isolate(game, make, inputs) runs make() for one puzzle.  If it raises, or runs for longer than timeout seconds,
+      isolate returns None instead, and the failure is appended to the game's quarantine file with the inputs needed
+      to make the puzzle again
+    - unseeded runs go on to the next puzzle (their rng has moved on); the rng state before the puzzle is recorded
+    - a seeded puzzle (see nerdle/seeding.py) that fails is made again from a retry seed (batch id
+      '[batchId]~retry[n]', same index), up to RETRIES times, see seeded.  An error fails again on any machine, so
+      the puzzle at an index is still the same for any number of shards and workers.  A timeout depends on the
+      machine, so a batch is only made the same again if none of its puzzles timed out
+    - if every retry fails, PuzzleFailed is raised: something is wrong with the job, not with one puzzle.  Unseeded
+      runs that make one puzzle for each of a list of inputs (crossnerdle2 answers, shuffleWords grids) try again with
+      their rng moved on in the same way (see retried)
+    - timeouts (off unless set) use a real time timer (SIGALRM), so they only work in the main thread and not on
+      Windows.  As some generators catch every error, once the timer has gone off PuzzleTimeout is raised again
+      each time it is caught until the puzzle stops, and a puzzle that swallowed it and finished is still a timeout
+      (see Deadline); a long call into C (eg numpy) is only stopped once it returns
+    - each failure is counted as a metrics reject 'quarantined [error]' (see nerdle/metrics.py)
+
+Turning on timeouts:
+    - environment: NERDLE_PUZZLE_TIMEOUT=120 (seconds per puzzle), code: quarantine.configure(timeout=120)
+    - python -m nerdle.batch batch.json --puzzle-timeout 120 (and nerdle.schedule, nerdle.pipeline)
+
+File output:
+    - quarantine/[game].jsonl (NERDLE_QUARANTINE_DIR moves it), a line appended per failure:
+      {"game", "time", "pid", "inputs", "error", "message", "seconds", "traceback"}
+    - inputs: eg {"batchId", "index", "job"} for a seeded puzzle (python -m nerdle.batch --regenerate makes it
+      again), {"seed", "puzzle", "rngState"} for an unseeded one (random.Random().setstate(restoreState(rngState)))
+
+Usage:
+    from nerdle import quarantine
+    puzzle = quarantine.isolate('targets', lambda: createPuzzle(q, rng, keys), quarantine.rngInputs(rng, seed=seed, puzzle=q))
+    puzzle = quarantine.seeded('targets', lambda i, b: seededPuzzle(i, b, seen), index, batchId)
+    question = quarantine.retried('crossnerdle2', lambda: createQuestion(answer, rng), {'seed': seed, 'puzzle': j}, rng)
+    with quarantine.Deadline(120):                  #PuzzleTimeout raised after 120s
+        ...
+
+    #from the repository root
+    python -m nerdle.quarantine                 #failures by game and error
+    python -m nerdle.quarantine --clear
+
+"""
+
+import argparse
+import collections
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from nerdle import metrics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUARANTINE_DIR = os.environ.get('NERDLE_QUARANTINE_DIR') or os.path.join(ROOT, 'quarantine')
+#times a failed seeded puzzle is made again from a retry seed
+RETRIES = 3
+#seconds between timer signals once a puzzle has timed out
+REPEAT = 1.0
+#seconds to the next timer signal once the timeout has been raised at a line (python stops tracing as it is raised,
+#so the handler that catches it gets it again from the signal)
+AGAIN = 0.00001
+
+#settings (see configure)
+timeout = float(os.environ.get('NERDLE_PUZZLE_TIMEOUT') or 0) or None
+quarantineDir = QUARANTINE_DIR
+
+#a timer is running (an isolate inside another uses the outer one's)
+_armed = [False]
+
+
+class PuzzleTimeout(Exception):
+    pass
+
+
+class PuzzleFailed(RuntimeError):
+    #a seeded puzzle failed from its seed and every retry seed
+    pass
+
+
+def configure(timeout=None, quarantineDir=None):
+    #timeout: seconds per puzzle (0 or less turns it off), None leaves a setting as it is
+    #(set in the environment as well, for processes started from this one)
+    module = sys.modules[__name__]
+    if timeout is not None:
+        module.timeout = timeout if timeout>0 else None
+        if module.timeout is None:
+            os.environ.pop('NERDLE_PUZZLE_TIMEOUT', None)
+        else:
+            os.environ['NERDLE_PUZZLE_TIMEOUT'] = str(module.timeout)
+    if quarantineDir is not None:
+        module.quarantineDir = quarantineDir
+
+
+def quarantinePath(game):
+    return(os.path.join(quarantineDir, "".join([c if c.isalnum() or c in '-_.' else '_' for c in str(game)])+'.jsonl'))
+
+
+def rngInputs(rng, **inputs):
+    #inputs of an unseeded puzzle: the state of its rng (random.Random or the random module) before it is made
+    return(dict(inputs, rngState=rng.getstate()))
+
+
+def restoreState(state):
+    #rngState from a quarantine file (json lists) -> a state for random.Random().setstate
+    return(tuple([tuple(s) if isinstance(s, list) else s for s in state]))
+
+
+def record(game, inputs, error, seconds):
+    #append a failure to the game's quarantine file
+    entry = {'game': game, 'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'pid': os.getpid(), 'inputs': inputs,
+             'error': type(error).__name__, 'message': str(error), 'seconds': round(seconds, 3),
+             'traceback': traceback.format_exception(type(error), error, error.__traceback__)[-6:]}
+    try:
+        os.makedirs(quarantineDir, exist_ok=True)
+        #one write per line, so processes appending at once do not mix their lines
+        with open(quarantinePath(game), 'a') as f:
+            f.write(json.dumps(entry, default=str)+'\n')
+    except OSError as e:
+        #a read-only or full disk only loses the record
+        metrics.log(1, "could not write quarantine file -", e)
+
+
+class Deadline:
+    #PuzzleTimeout raised in the block after seconds (nothing where there is no SIGALRM, or not in the main thread)
+    #once it has gone off, it is raised again at the next line run in the block each time it is caught, as some
+    #generators catch every error.  Python stops tracing when a trace function raises, so the timer signal (soon
+    #after) and a profile function (at every call and return) start it again.  A block that swallows it and still
+    #finishes raises it on leaving
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.previous = None
+        self.frame = None
+        self.fired = False
+        #the trace and profile functions before it went off (a list once it has)
+        self.tracing = None
+
+    def __enter__(self):
+        if (not self.seconds or _armed[0] or not hasattr(signal, 'setitimer')
+                or threading.current_thread() is not threading.main_thread()):
+            self.seconds = None
+            return(self)
+        _armed[0] = True
+        self.frame = sys._getframe(1)
+        self.previous = signal.signal(signal.SIGALRM, self.expired)
+        signal.setitimer(signal.ITIMER_REAL, self.seconds, REPEAT)
+        return(self)
+
+    def timedOut(self):
+        return(PuzzleTimeout("took longer than %gs" % self.seconds))
+
+    def restart(self, frame):
+        #trace every line of frame and its callers in the block, and of any frame they call
+        frames = []
+        while frame is not None and frame is not self.frame:
+            frames += [frame]
+            frame = frame.f_back
+        if frame is None:
+            return
+        sys.settrace(self.trace)
+        for frame in frames:
+            frame.f_trace = self.trace
+
+    def expired(self, signum, frame):
+        if frame is not None and frame.f_code is Deadline.__exit__.__code__:
+            #the block has finished
+            return
+        if frame is not None and frame is not self.frame and frame.f_globals is globals():
+            #in the trace or profile function: again soon
+            signal.setitimer(signal.ITIMER_REAL, AGAIN, REPEAT)
+            return
+        self.fired = True
+        if self.tracing is None:
+            self.tracing = [sys.gettrace(), sys.getprofile()]
+            sys.setprofile(self.profile)
+        self.restart(frame)
+        raise self.timedOut()
+
+    def trace(self, frame, event, arg):
+        #not in this module (the signal handler, leaving the block, an isolate in the block)
+        if frame.f_globals is globals():
+            return(None)
+        if event=='line':
+            signal.setitimer(signal.ITIMER_REAL, AGAIN, REPEAT)
+            raise self.timedOut()
+        return(self.trace)
+
+    def profile(self, frame, event, arg):
+        if sys.gettrace() is not self.trace and frame.f_globals is not globals():
+            self.restart(frame)
+
+    def __exit__(self, kind, error, tb):
+        if self.seconds:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            if self.tracing is not None:
+                sys.setprofile(self.tracing[1])
+                sys.settrace(self.tracing[0])
+            signal.signal(signal.SIGALRM, self.previous)
+            _armed[0] = False
+            #a block that caught the timeout and went on made its puzzle from swallowed errors
+            if self.fired and not (kind is not None and issubclass(kind, PuzzleTimeout)):
+                raise self.timedOut()
+        return(False)
+
+
+def isolate(game, make, inputs=None, timeout=None):
+    #make() -> its result, or None if it raised or ran longer than timeout seconds (default: the setting), recorded
+    #in game's quarantine file with inputs (json, what is needed to make the puzzle again)
+    timeout = timeout or sys.modules[__name__].timeout
+    start = time.time()
+    try:
+        with Deadline(timeout):
+            return(make())
+    except Exception as e:
+        metrics.reject('quarantined '+type(e).__name__)
+        shown = {k: v for k, v in (inputs or {}).items() if k!='rngState'}
+        metrics.log(1, "quarantined", game, "puzzle", json.dumps(shown, default=str)[:200], "-", type(e).__name__, e)
+        record(game, inputs, e, time.time()-start)
+        return(None)
+
+
+def retryBatchId(batchId, attempt):
+    return(batchId if attempt==0 else str(batchId)+'~retry'+str(attempt))
+
+
+def retried(game, make, inputs=None, rng=None, retries=RETRIES, timeout=None):
+    #make() (never None), tried again if it fails, rng (if given, recorded with each try) having moved on
+    #-> its result, PuzzleFailed if every try failed
+    for attempt in range(retries+1):
+        made = isolate(game, make, rngInputs(rng, attempt=attempt, **(inputs or {})) if rng else dict(inputs or {}, attempt=attempt), timeout)
+        if made is not None:
+            return(made)
+    raise PuzzleFailed(game+" puzzle "+json.dumps(inputs or {}, default=str)[:200]+" failed "+str(retries+1)+" times, see "+quarantinePath(game))
+
+
+def seeded(game, puzzle, index, batchId, inputs=None, retries=RETRIES, timeout=None):
+    #puzzle(index, batchId), made from a retry seed if it fails -> the puzzle, PuzzleFailed if every try failed
+    for attempt in range(retries+1):
+        made = isolate(game, lambda: puzzle(index, retryBatchId(batchId, attempt)),
+                       dict(inputs or {}, batchId=retryBatchId(batchId, attempt), index=index), timeout)
+        if made is not None:
+            return(made)
+    raise PuzzleFailed(game+" puzzle "+str(index)+" of batch "+str(batchId)+" failed "+str(retries+1)+" times, see "+quarantinePath(game))
+
+
+def entries(game=None):
+    #-> [failure] from every quarantine file (or one game's), oldest first in each file
+    if not os.path.isdir(quarantineDir):
+        return([])
+    found = []
+    for f in sorted(os.listdir(quarantineDir)):
+        if f.endswith('.jsonl') and (game is None or os.path.join(quarantineDir, f)==quarantinePath(game)):
+            with open(os.path.join(quarantineDir, f)) as lines:
+                for line in lines:
+                    try:
+                        found += [json.loads(line)]
+                    except ValueError:
+                        #a line cut off by a crash
+                        pass
+    return(found)
+
+
+def clear():
+    removed = []
+    if os.path.isdir(quarantineDir):
+        for f in os.listdir(quarantineDir):
+            if f.endswith('.jsonl'):
+                os.remove(os.path.join(quarantineDir, f))
+                removed += [f]
+    return(removed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="list or clear puzzles that failed or timed out")
+    parser.add_argument('--game', default=None, help="only this game's failures")
+    parser.add_argument('--dir', default=None, help="quarantine folder (default quarantine/ or NERDLE_QUARANTINE_DIR)")
+    parser.add_argument('--show', type=int, default=0, metavar='N', help="print the last N failures in full")
+    parser.add_argument('--clear', action='store_true', help="remove every quarantine file")
+    args = parser.parse_args()
+    configure(quarantineDir=args.dir)
+
+    if args.clear:
+        print("removed", len(clear()), "quarantine files")
+    found = entries(args.game)
+    byError = collections.Counter([(e['game'], e['error'], e['message'][:60]) for e in found])
+    for (game, error, message), n in sorted(byError.items(), key=lambda item: -item[1]):
+        last = max([e['time'] for e in found if (e['game'], e['error'], e['message'][:60])==(game, error, message)])
+        print("%-24s %6d  %-16s %-60s last %s" % (game[:24], n, error[:16], message, last))
+    for e in found[len(found)-args.show:] if args.show else []:
+        print()
+        print(json.dumps({k: v for k, v in e.items() if k!='traceback'}, default=str))
+        print("".join(e['traceback']))
+    print(len(found), "failures in", quarantineDir)
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Calendar scheduler: keeps a calendar of planned and published puzzles for each game and makes only the puzzles that
+the calendar is missing, instead of over-generating whole batches to fill it.
+
+File inputs:
+    - schedule config (json), eg schedule.json in the repository root:
+        {
+            "workers": 4,
+            "days": 28,
+            "calendars": {
+                "nanagrams": {"job": {"game": "nanagrams"}, "tiers": {"6": {"length": 6}, "7": {"length": 7}}},
+                "targets": {"job": {"game": "targets"}},
+                "crossnerdle": {"job": {"game": "crossnerdle2", "fileStem": "patterns7x7_to_10x10-x4"},
+                                "weekdays": ["0", "1", "2", "3", "4", "5", "6"]},
+                ...
+            }
+        }
+    - each calendar has a batch job (see nerdle/batch.py, without count / seed) and which tiers (eg levels,
+      difficulties) each day needs:
+        - tiers: {tier name: job keys for that tier}, every day needs one puzzle of each (default one tier, "all")
+        - weekdays: the tier each day needs, Monday to Sunday (instead of one of every tier)
+        - chunk: most puzzles one task makes (default: a tier's missing puzzles spread evenly over the workers)
+    - crossnerdle2 calendars make their own answers (crossnerdle1) from the patterns file fileStem, and a question's
+      tier is its difficulty (0 Monday to 6 Sunday, see gradeQuestions in crossnerd_generator_2_question.py), known only
+      once it is made.  A puzzle made for one tier that grades as another is kept as a spare for that tier.
+      attempts (default 5): most puzzles made per puzzle needed
+
+Algorithm:
+    - Read each calendar (see File output) and list the (day, tier) slots from start to start+days-1 with no puzzle
+    - Fill what it can from the calendar's spares (earliest day first), then split the rest into tasks of at most chunk
+      puzzles of a tier, each with its own range of seeds (see nerdle/seeding.py) from the calendar's seed counter
+    - Run the tasks of every calendar in a process pool (see batch.runTasks), after loading the lexicons and indexes
+      they need once (see batch.warmJobs), each appending its puzzles to [calendarDir]/work/[task].jsonl
+    - Merge each task's puzzles into its calendar: a puzzle already in the calendar, published (see nerdle/dedupe.py)
+      or made by another task is dropped, the rest fill the earliest missing days of their tier or become spares.  Only
+      the new puzzles are appended to the calendar, and their keys added to the published keys, so later batches and
+      the daemon do not make them again
+    - Repeat (up to rounds times, default 3) while days are still missing (eg puzzles dropped as repeats, or
+      crossnerdle questions that graded as other tiers) and the last round added puzzles
+    - A seed whose puzzle fails, or takes longer than --puzzle-timeout seconds, is recorded in quarantine/[game].jsonl
+      and skipped (see nerdle/quarantine.py)
+    - A run that is stopped loses nothing: the next run first merges whatever is in the work files, then makes only
+      what is still missing
+
+File output:
+    - [calendarDir]/[calendar name].jsonl (default calendar folder in the repository root), appended to, never rewritten:
+        - first line: header {"calendar", "job"} (a calendar is only read with the job it was made with)
+        - {"key", "tier", "date", "batchId", "index", "puzzle"}: a puzzle (date null for a spare)
+        - {"key", "date"}: a spare moved to a day
+        - {"next": n}: seeds below n have been used
+        - {"publishedThrough": date}: days up to date are published (their puzzles are never moved)
+
+Usage (from the repository root):
+    python -m nerdle.schedule schedule.json                             #fill the next 28 days (from today)
+    python -m nerdle.schedule schedule.json --start 2024-07-01 --days 91 --workers 8
+    python -m nerdle.schedule schedule.json --status                    #what is missing, making nothing
+    python -m nerdle.schedule schedule.json --publish-through 2024-07-07
+
+    #or from python
+    from nerdle import schedule
+    calendar = schedule.loadCalendar('targets', {'game': 'targets'})
+    puzzles = calendar.day('2024-07-01')                                #{tier: puzzle}
+
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+
+from nerdle import batch, dedupe, games, metrics, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CALENDAR_DIR = os.path.join(ROOT, 'calendar')
+
+#calendar keys (the rest of a calendar config is not allowed)
+CALENDAR_KEYS = ['job', 'tiers', 'weekdays', 'chunk', 'attempts']
+
+#difficulties each crossnerdle grid size can grade as (see gradeQuestions in crossnerd_generator_2_question.py)
+SIZE_DIFFICULTIES = {'R7C7': ['0'], 'R8C8': ['1', '2', '3', '4'], 'R9C9': ['1', '2', '3', '4'], 'R10C10': ['5', '6']}
+
+
+def dates(start, days):
+    start = datetime.date.fromisoformat(str(start))
+    return([(start+datetime.timedelta(days=i)).isoformat() for i in range(days)])
+
+
+def patternSize(pattern):
+    return("R"+str(len(pattern))+"C"+str(len(pattern[0])))
+
+
+class Calendar:
+    #one game's planned and published puzzles, read back from its file and appended to as puzzles are added
+
+    def __init__(self, path, name, job):
+        self.path = path
+        self.name = name
+        self.job = job
+        self.entries = {}
+        self.days = collections.defaultdict(dict)
+        self.spares = collections.defaultdict(list)
+        self.next = 0
+        self.publishedThrough = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._sink = JsonlSink(path, header={'calendar': name, 'job': job})
+        for record in self._sink.records():
+            self._apply(record)
+
+    def _apply(self, record):
+        if 'next' in record:
+            self.next = max(self.next, record['next'])
+        elif 'publishedThrough' in record:
+            self.publishedThrough = max(self.publishedThrough or '', record['publishedThrough'])
+        else:
+            if 'puzzle' in record:
+                self.entries[record['key']] = {k: record[k] for k in ['tier', 'batchId', 'index', 'puzzle']}
+                entry = self.entries[record['key']]
+            else:
+                entry = self.entries[record['key']]
+                self.spares[entry['tier']].remove(record['key'])
+            entry['date'] = record['date']
+            if record['date'] is None:
+                self.spares[entry['tier']] += [record['key']]
+            else:
+                self.days[record['date']][entry['tier']] = record['key']
+
+    def _append(self, record):
+        self._apply(record)
+        self._sink.append(record)
+
+    def __contains__(self, key):
+        return(key in self.entries)
+
+    def day(self, date):
+        #{tier: puzzle} planned or published for a day
+        return({tier: self.entries[key]['puzzle'] for tier, key in self.days.get(str(date), {}).items()})
+
+    def published(self, date):
+        return(self.publishedThrough is not None and str(date)<=self.publishedThrough)
+
+    def missing(self, slots):
+        #(date, tier) slots with no puzzle
+        return([(date, tier) for date, tier in slots if tier not in self.days.get(date, {})])
+
+    def add(self, key, tier, batchId, index, puzzle, date=None):
+        self._append({'key': key, 'tier': tier, 'date': date, 'batchId': batchId, 'index': index, 'puzzle': puzzle})
+
+    def useSpares(self, slots):
+        #fill missing slots from the spares of their tier -> slots still missing
+        missing = []
+        for date, tier in self.missing(slots):
+            if self.spares.get(tier):
+                self._append({'key': self.spares[tier][0], 'date': date})
+            else:
+                missing += [(date, tier)]
+        return(missing)
+
+    def useSeeds(self, stop):
+        if stop>self.next:
+            self._append({'next': stop})
+
+    def publish(self, through):
+        self._append({'publishedThrough': str(through)})
+
+    def close(self):
+        self._sink.close()
+
+
+def calendarPath(name, calendarDir=None):
+    return(os.path.join(calendarDir or CALENDAR_DIR, batch.fileName(name)+'.jsonl'))
+
+
+def loadCalendar(name, job, calendarDir=None):
+    return(Calendar(calendarPath(name, calendarDir), name, job))
+
+
+def checkCalendar(name, config):
+    unknown = [k for k in config if k not in CALENDAR_KEYS]
+    if unknown:
+        raise ValueError(name+": unknown keys "+", ".join(unknown))
+    job = config['job']
+    graded = job['game']=='crossnerdle2'
+    for tierJob in [job]+[dict(job, **keys) for keys in ([] if graded else config.get('tiers', {}).values())]:
+        batch.checkJob(tierJob)
+    if 'weekdays' in config:
+        if len(config['weekdays'])!=7:
+            raise ValueError(name+": weekdays needs a tier for each day, Monday to Sunday")
+        if not graded and [t for t in config['weekdays'] if t not in config.get('tiers', {'all': {}})]:
+            raise ValueError(name+": weekdays has tiers not in tiers")
+    elif graded:
+        raise ValueError(name+": crossnerdle2 calendars need weekdays (the difficulty each day needs)")
+
+
+def daySlots(config, start, days):
+    #every (date, tier) slot a calendar needs
+    slots = []
+    for date in dates(start, days):
+        if 'weekdays' in config:
+            slots += [(date, config['weekdays'][datetime.date.fromisoformat(date).weekday()])]
+        else:
+            slots += [(date, tier) for tier in config.get('tiers', {'all': {}})]
+    return(slots)
+
+
+def publishedIndex(job):
+    #published keys a calendar's puzzles are checked against (crossnerdle2 questions by their crossnerdle1 answers)
+    if job['game']=='crossnerdle2':
+        return(dedupe.loadIndex('crossnerdle1'))
+    return(dedupe.loadIndex(batch.publishedName(games.load(job['game']), job)))
+
+
+def puzzleKey(job, puzzle):
+    if job['game']=='crossnerdle2':
+        return(games.load('crossnerdle1').duplicateKey(puzzle['answer']))
+    return(games.load(job['game']).duplicateKey(puzzle))
+
+
+def crossnerdlePatterns(job, tiers):
+    #patterns of a crossnerdle2 job's patterns file that can give any of tiers (difficulties)
+    answers = games.load('crossnerdle1')
+    patterns = [p for p in answers.loadPatterns(job.get('fileStem', answers.fileStem))
+                if set(SIZE_DIFFICULTIES.get(patternSize(p), [])) & set(tiers)]
+    if not patterns:
+        raise ValueError("no pattern in "+job.get('fileStem', answers.fileStem)+" can give difficulty "+", ".join(tiers))
+    return(patterns)
+
+
+def crossnerdleMaker(job, tiers):
+    #(number of patterns, function making the graded question at (index, batchId)) from patterns that can give tiers
+    answers = games.load('crossnerdle1')
+    questions = games.load('crossnerdle2')
+    patterns = crossnerdlePatterns(job, tiers)
+    seen = dedupe.loadIndex('crossnerdle1')
+
+    def makeQuestion(index, batchId):
+        answer = answers.seededPuzzle(index, batchId, patterns, 1, seen)
+        question = questions.createQuestion(answer, seeding.puzzleRng('crossnerdle2', batchId, index))
+        return(questions.gradeQuestions([question])[0])
+    return(len(patterns), makeQuestion)
+
+
+def makePuzzles(name, job, needs, first, stop, path):
+    #(in a worker) puzzles for needs ({tier: number}) from seeds first to stop-1, appended to path -> puzzles made
+    #seed n is (batch id 'calendar-[name]-[n//count]', index n%count), recorded with the puzzle (see nerdle/seeding.py)
+    #ungraded jobs make puzzles of one tier (with that tier's job), graded (crossnerdle2) ones stop once every need is met
+    graded = job['game']=='crossnerdle2'
+    if graded:
+        count, puzzle = crossnerdleMaker(job, list(needs))
+    else:
+        count, puzzle = batch.SEEDED[job['game']](games.load(job['game']), job)
+    count = max(1, count)
+    still = collections.Counter(needs)
+    with JsonlSink(path, header={'calendar': name, 'job': job, 'needs': needs, 'seeds': [first, stop]}) as sink:
+        for n in range(first, stop):
+            if not +still:
+                break
+            batchId, index = 'calendar-'+name+'-'+str(n//count), n%count
+            #a seed that fails (or times out) is quarantined and skipped, there are seeds to spare
+            p = quarantine.isolate(job['game'], lambda: puzzle(index, batchId), {'job': job, 'batchId': batchId, 'index': index})
+            if p is None:
+                continue
+            tier = str(p['difficulty']) if graded else list(needs)[0]
+            still[tier] -= 1
+            metrics.log(1, "made tier", tier, "puzzle, still needed:", dict(+still))
+            sink.append({'key': puzzleKey(job, p), 'tier': tier, 'batchId': batchId, 'index': index, 'puzzle': p})
+        return(len(sink))
+
+
+def planTasks(name, config, calendar, missing, workDir, workers=None):
+    #split a calendar's missing slots into tasks of at most chunk puzzles -> [(task name, makePuzzles, args)]
+    #each task has its own seeds, from the calendar's seed counter on
+    job = config['job']
+    needed = collections.Counter([tier for _, tier in missing])
+    spread = lambda n: config.get('chunk') or max(1, -(-n//(workers or os.cpu_count())))
+    seed = calendar.next
+    parts = []
+    if job['game']=='crossnerdle2':
+        #tiers in order, so a task's tiers come from the same grid sizes
+        tiers = sorted(needed.elements())
+        chunk = spread(len(tiers))
+        for i in range(0, len(tiers), chunk):
+            part = tiers[i:i+chunk]
+            parts += [(job, dict(collections.Counter(part)), seed, seed+len(part)*config.get('attempts', 5))]
+            seed = parts[-1][3]
+    else:
+        for tier, n in sorted(needed.items()):
+            tierJob = dict(job, **config.get('tiers', {}).get(tier, {}))
+            chunk = spread(n)
+            for i in range(0, n, chunk):
+                parts += [(tierJob, {tier: min(chunk, n-i)}, seed, seed+min(chunk, n-i))]
+                seed = parts[-1][3]
+    tasks = []
+    for tierJob, needs, first, stop in parts:
+        taskName = "%s %s seeds %d-%d" % (name, ",".join(sorted(needs)), first, stop)
+        tasks += [(taskName, makePuzzles, (name, tierJob, needs, first, stop, os.path.join(workDir, batch.fileName(taskName)+'.jsonl')))]
+    return(tasks)
+
+
+def readWork(path):
+    #(header, puzzles) of a task's work file (a line cut off by a crash is dropped)
+    with open(path) as f:
+        lines = f.read().split('\n')
+    return(json.loads(lines[0]), [json.loads(line) for line in lines[1:-1]])
+
+
+def mergeWork(calendars, slots, workDir):
+    #add the puzzles in every work file to their calendars, then remove the files -> {calendar name: (added, dropped)}
+    #a puzzle already in its calendar or published is dropped, the rest fill the earliest open day of their tier, else are spares
+    merged = {}
+    for path in sorted([os.path.join(workDir, f) for f in os.listdir(workDir) if f.endswith('.jsonl')]):
+        header, records = readWork(path)
+        calendar = calendars.get(header['calendar'])
+        if calendar is None:
+            continue
+        published = publishedIndex(header['job'])
+        added = [record['key'] for record in records if placePuzzle(calendar, slots[calendar.name], published, record)]
+        dropped = len(records)-len(added)
+        calendar.useSeeds(header['seeds'][1])
+        os.remove(path)
+        total = merged.get(calendar.name, (0, 0))
+        merged[calendar.name] = (total[0]+len(added), total[1]+dropped)
+    return(merged)
+
+
+def placePuzzle(calendar, slots, published, record):
+    #add a made puzzle ({'key', 'tier', 'batchId', 'index', 'puzzle'}) to its calendar -> False if dropped
+    #a puzzle already in the calendar or published is dropped, else it fills the earliest open day of its tier or is a spare
+    if record['key'] in calendar or record['key'] in published:
+        return(False)
+    free = [date for date, tier in calendar.missing(slots) if tier==record['tier']]
+    calendar.add(record['key'], record['tier'], record['batchId'], record['index'], record['puzzle'], free[0] if free else None)
+    published.addAll([record['key']])
+    return(True)
+
+
+def warmCalendars(calendars):
+    #lexicons and indexes every calendar's tasks need, loaded before the workers are forked (see batch.warmJobs)
+    jobs = []
+    for config in calendars.values():
+        job = config['job']
+        if job['game']=='crossnerdle2':
+            jobs += [{'game': 'crossnerdle1', 'fileStem': job.get('fileStem', games.load('crossnerdle1').fileStem)}]
+            answers = games.load('crossnerdle1')
+            lengths = set()
+            for pattern in answers.loadPatterns(jobs[-1]['fileStem']):
+                _, _, acrossList, downList = answers.findWords(pattern)
+                lengths.update([w['length'] for w in acrossList+downList])
+            for length in [x for x in lengths if x<=9]:
+                games.load('crossnerdle2').wordIndex(length)
+        else:
+            jobs += [dict(job, **keys) for keys in config.get('tiers', {'all': {}}).values()]
+    batch.warmJobs(jobs)
+
+
+def openSlots(calendar, slots):
+    #slots on days not yet published
+    return([(date, tier) for date, tier in slots if not calendar.published(date)])
+
+
+def runSchedule(calendars, start, days, workers=None, calendarDir=None, logDir='logs', interval=10, rounds=3, warm=True):
+    #make the puzzles each calendar is missing from start to start+days-1 -> {calendar name: Calendar}
+    for name, config in calendars.items():
+        checkCalendar(name, config)
+    calendarDir = calendarDir or CALENDAR_DIR
+    workDir = os.path.join(calendarDir, 'work')
+    os.makedirs(workDir, exist_ok=True)
+    os.makedirs(logDir, exist_ok=True)
+    opened = {name: loadCalendar(name, config['job'], calendarDir) for name, config in calendars.items()}
+    slots = {name: openSlots(opened[name], daySlots(config, start, days)) for name, config in calendars.items()}
+
+    #puzzles made by a run that was stopped
+    for name, (added, dropped) in mergeWork(opened, slots, workDir).items():
+        print(name+":", added, "puzzles from a stopped run merged,", dropped, "dropped")
+
+    for n in range(rounds):
+        tasks = []
+        for name, config in calendars.items():
+            missing = opened[name].useSpares(slots[name])
+            tasks += planTasks(name, config, opened[name], missing, workDir, workers)
+        if not tasks:
+            break
+        print("round", n+1, "-", len(tasks), "tasks")
+        if warm and n==0:
+            warmCalendars({name: calendars[name] for name in set([t[2][0] for t in tasks])})
+        batch.runTasks(tasks, workers, logDir, interval)
+        merged = mergeWork(opened, slots, workDir)
+        for name, (added, dropped) in merged.items():
+            print(name+":", added, "puzzles added,", dropped, "dropped")
+        if not sum([added for added, dropped in merged.values()]):
+            break
+    for name in calendars:
+        opened[name].useSpares(slots[name])
+    return(opened)
+
+
+def printStatus(opened, calendars, start, days):
+    print()
+    print("%-30s %6s %6s %7s %7s  %s" % ("calendar", "slots", "filled", "missing", "spares", "published through"))
+    for name, calendar in opened.items():
+        slots = daySlots(calendars[name], start, days)
+        missing = calendar.missing(slots)
+        print("%-30s %6d %6d %7d %7d  %s" % (name[:30], len(slots), len(slots)-len(missing), len(missing),
+                                            sum([len(x) for x in calendar.spares.values()]), calendar.publishedThrough or "-"))
+        if missing:
+            byTier = collections.Counter([tier for _, tier in missing])
+            print("    missing by tier:", ", ".join(["%s: %d (first %s)" % (tier, n, min([d for d, t in missing if t==tier]))
+                                                     for tier, n in sorted(byTier.items())]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="make the puzzles each game's calendar is missing")
+    parser.add_argument('config', help="json schedule config (see nerdle/schedule.py)")
+    parser.add_argument('--start', default=None, help="first day (yyyy-mm-dd), default today")
+    parser.add_argument('--days', type=int, default=None, help="days to fill (default: the config's days, else 28)")
+    parser.add_argument('--only', nargs='+', default=None, help="only these calendars")
+    parser.add_argument('--workers', type=int, default=None, help="default: the config's workers, else one per cpu")
+    parser.add_argument('--calendar-dir', default=None, help="default: the config's calendarDir, else calendar in the repository root")
+    parser.add_argument('--log-dir', default=None, help="default: logs folder next to the config")
+    parser.add_argument('--interval', type=float, default=10, help="seconds between progress reports")
+    parser.add_argument('--rounds', type=int, default=3, help="most rounds of tasks (puzzles dropped as repeats are made again)")
+    parser.add_argument('--status', action='store_true', help="print what each calendar is missing, making nothing")
+    parser.add_argument('--publish-through', default=None, help="mark every day up to this one (yyyy-mm-dd) as published")
+    parser.add_argument('--puzzle-timeout', type=float, default=None, metavar='SECONDS', help="skip (quarantine) a puzzle taking longer than this, see nerdle/quarantine.py")
+    parser.add_argument('--verbose', type=int, default=None, help="0 quiet, 1 a line per puzzle (default), 2 every attempt and rejection")
+    args = parser.parse_args()
+    metrics.configure(verbosity=args.verbose)
+    quarantine.configure(timeout=args.puzzle_timeout)
+
+    config = batch.loadConfig(args.config)
+    calendars = {name: c for name, c in config['calendars'].items() if args.only is None or name in args.only}
+    start = args.start or datetime.date.today().isoformat()
+    days = args.days or config.get('days', 28)
+    calendarDir = args.calendar_dir or config.get('calendarDir')
+    if args.status or args.publish_through:
+        opened = {name: loadCalendar(name, c['job'], calendarDir) for name, c in calendars.items()}
+        if args.publish_through:
+            for calendar in opened.values():
+                calendar.publish(datetime.date.fromisoformat(args.publish_through).isoformat())
+    else:
+        here = os.path.dirname(os.path.abspath(args.config))
+        opened = runSchedule(calendars, start, days, workers=args.workers or config.get('workers'), calendarDir=calendarDir,
+                             logDir=args.log_dir or os.path.join(here, 'logs'), interval=args.interval, rounds=args.rounds)
+    printStatus(opened, calendars, start, days)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Deterministic per-puzzle seeds, so a batch of puzzles can be split into shards and made by any number of workers
+or machines.
+
+Each puzzle gets its own random.Random, seeded from (game, batch id, puzzle index).  The puzzle at an index is then the
+same whichever worker makes it, whatever else that worker makes and in whatever order, so:
+    - shard k of n makes the puzzles at indexes k, k+n, k+2n, ... (shards are disjoint and together cover the batch)
+    - merging the shards by index gives the same puzzles for any number of shards / workers
+    - any single puzzle can be made again from its game, batch id and index
+Steps over the whole batch (eg removing duplicates, arranging crossnerdle questions into days) run after the merge,
+with their own seed (see stepRng).
+
+game is the name of the game variant, eg 'nanagrams6' or 'shuffleNumbers-swapBoth' (so that two games in the same
+batch do not share seeds), batchId any string or number, eg '2024-06'.
+
+Note: random.Random gives the same numbers for the same seed on every platform, but python does not promise
+that shuffle / choice / sample stay the same between python versions - use one version for all shards of a batch.
+
+File output (shard files, see saveShard):
+    - json {"game", "batchId", "count", "shard", "shards", "indexes": [...], "puzzles": [...]}
+
+Usage:
+    from nerdle import seeding
+    rng = seeding.puzzleRng('targets', '2024-06', 17)
+    indexes = seeding.shardIndexes(100, 2, 4)          #range(2, 100, 4)
+    puzzles = seeding.mergeShards([seeding.loadShard(p) for p in paths])
+
+"""
+
+import hashlib
+import json
+import random
+
+
+def puzzleSeed(game, batchId, index):
+    #64 bit seed from (game, batch id, index), the same in every process and on every machine
+    key = "/".join([str(game), str(batchId), str(index)]).encode('utf-8')
+    return(int.from_bytes(hashlib.sha256(key).digest()[:8], 'big'))
+
+
+def puzzleRng(game, batchId, index):
+    return(random.Random(puzzleSeed(game, batchId, index)))
+
+
+def stepRng(game, batchId, step):
+    #random numbers for a step over the whole batch (eg step='days'), kept apart from the puzzle seeds
+    return(puzzleRng(game, batchId, 'step:'+str(step)))
+
+
+def shardIndexes(count, shard=0, shards=1):
+    #puzzle indexes made by shard (0 to shards-1) of shards
+    if shards<1 or not 0<=shard<shards:
+        raise ValueError("shard must be 0 to "+str(shards-1)+", got "+str(shard))
+    return(range(shard, count, shards))
+
+
+def saveShard(path, game, batchId, count, shard, shards, indexes, puzzles):
+    with open(path, 'w') as f:
+        json.dump({'game': game, 'batchId': batchId, 'count': count, 'shard': shard, 'shards': shards,
+                   'indexes': list(indexes), 'puzzles': puzzles}, f)
+
+
+def loadShard(path):
+    with open(path) as f:
+        return(json.load(f))
+
+
+def mergeShards(shards):
+    #shard dicts (see saveShard) -> puzzles in index order, checking that the shards are from one batch and cover it exactly
+    if not shards:
+        raise ValueError("no shards to merge")
+    game, batchId, count = shards[0]['game'], shards[0]['batchId'], shards[0]['count']
+    byIndex = {}
+    for s in shards:
+        if (s['game'], s['batchId'], s['count'])!=(game, batchId, count):
+            raise ValueError("shards are from different batches: "+str((game, batchId, count))+" and "+str((s['game'], s['batchId'], s['count'])))
+        for index, puzzle in zip(s['indexes'], s['puzzles']):
+            if index in byIndex:
+                raise ValueError("puzzle "+str(index)+" is in more than one shard")
+            byIndex[index] = puzzle
+    missing = [i for i in range(count) if i not in byIndex]
+    if missing:
+        raise ValueError(str(len(missing))+" puzzles missing from shards, eg index "+str(missing[0]))
+    return([byIndex[i] for i in range(count)])
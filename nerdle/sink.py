@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Append-only puzzle file (JSON lines), so a long run can be stopped or crash and carry on where it left off.
+
+Each puzzle is written as one line as soon as it is made (flushed every time, fsync'd every fsyncEvery puzzles or
+fsyncSeconds seconds), so saving n puzzles writes each once instead of re-writing the whole list as it grows.
+The creator scripts use a sink while they run and, at the end, assemble their usual output files
+(eg [fileStem]_answers.json, [fileStem]_questions.json, [fileStem]_A.json) from it and remove it.
+
+File format:
+    - first line: header, eg {"game": "nanagrams", "length": 7, "count": 10} - the settings of the run
+    - then one puzzle per line
+Opening an existing file resumes it: puzzles already written are read back (records), anything after the last
+complete line (a line cut off by a crash) is dropped, and new puzzles are appended.  Opening it with a different
+header is an error, so a file is only resumed by the run it belongs to.
+
+Usage:
+    from nerdle.sink import JsonlSink
+    with JsonlSink('output/run.jsonl', header={'game': 'targets', 'count': 10}) as sink:
+        puzzles = sink.records()            #already made (empty for a new file)
+        for i in range(len(puzzles), 10):
+            sink.append(makePuzzle(i))
+
+"""
+
+import json
+import os
+import time
+
+
+class JsonlSink:
+
+    def __init__(self, path, header=None, fsyncEvery=10, fsyncSeconds=5.0):
+        self.path = path
+        self.header = {} if header is None else header
+        self.fsyncEvery = fsyncEvery
+        self.fsyncSeconds = fsyncSeconds
+        self._records = []
+        #header compared as json, so tuples / lists etc. match what was read back
+        headerLine = json.dumps(self.header)
+
+        committed = 0
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            lines = data.split(b'\n')
+            #last item is the part after the final newline: empty, or a line cut off part way
+            for n, line in enumerate(lines[:-1]):
+                if n==0:
+                    if json.dumps(json.loads(line))!=headerLine:
+                        raise ValueError(path+" belongs to a different run: "+line.decode('utf-8')[:200]+", expected "+headerLine[:200])
+                else:
+                    self._records += [json.loads(line)]
+                committed += len(line)+1
+
+        self._file = open(path, 'ab')
+        if committed==0:
+            self._file.truncate(0)
+            self._write(headerLine)
+        elif self._file.tell()!=committed:
+            #drop a line cut off by a crash
+            self._file.truncate(committed)
+        self._file.seek(0, os.SEEK_END)
+        self._sync()
+        if self._records:
+            print("resuming", path, "from", len(self._records), "puzzles")
+
+    def _write(self, line):
+        self._file.write(line.encode('utf-8')+b'\n')
+        self._file.flush()
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._lastSync = time.time()
+
+    def records(self):
+        #puzzles written so far (including those from before a resume)
+        return(list(self._records))
+
+    def __len__(self):
+        return(len(self._records))
+
+    def append(self, record):
+        self._write(json.dumps(record))
+        self._records += [record]
+        self._unsynced += 1
+        if (self._unsynced>=self.fsyncEvery) or (time.time()-self._lastSync>=self.fsyncSeconds):
+            self._sync()
+
+    def close(self):
+        if not self._file.closed:
+            self._sync()
+            self._file.close()
+
+    def remove(self):
+        #once the run's output files have been assembled
+        self.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc):
+        self.close()
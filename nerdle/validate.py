@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Validator for the files the creator scripts write: checks every puzzle in them, fast enough to sweep hundreds of
+thousands of puzzles in seconds.
+
+Checks (each failure is reported with its file, puzzle index and reason):
+    - crossnerdle answers / questions: every across and down word (2 or more squares) is in the game's word list for its
+      length (see crossnerdle1.wordList); for questions, the question with its solveList filled in is the answer
+    - nanagrams: every answer is in the answer word list (nerdlewords[n]z), uses some or all of the question's
+      characters (each at most as often as in the question) and contains the fixed characters
+    - shuffleNumbers: every row and column of numbers (even rows / columns) is a valid calculation, in double
+      precision as in the game; the question uses the same squares as the answer (a permutation, with the blanks in the
+      same places) and is not already solved
+    - shuffleWords: the answer is one of the magic squares (see shuffleCreatorWords.loadAnswers); the question is a
+      permutation of the answer and is not already solved
+    - targets: each calculation equals its target (double precision, as in the game), uses only the keyboard numbers
+      (each at most as often as on the keyboard) and uses the stated number of inputs (see targets.nGroupsInAnswer)
+
+Algorithm:
+    - Words are checked against the word lists as arrays: each word is packed into one uint64 (4 bits per character)
+      and looked up with one np.searchsorted over the sorted packed word list, for all words of a length at once
+    - Crossnerdle grids with the same layout (size and black squares) are stacked, so each across / down word is one
+      column slice over all of them
+    - Calculations that are not in a word list (shuffle rows, targets, crossnerdle lengths without a list) are
+      evaluated once per distinct calculation (see nerdle/evaluator.py)
+
+File inputs (found by name, see FILES):
+    - crossnerdle: [fileStem]_answers.json, [fileStem]_questions.json, [fileStem]_dayIndex.json
+    - nanagrams: nanagramPuzzles_*.json
+    - shuffleNumbers: shufflePuzzles_*_A.json with its _Q.json
+    - shuffleWords: shufflePuzzlesWords_*_Q.json with its _A.json (in the same folder, or the one above)
+    - targets: targets_questions.json with targets_solutions.json and targets_calculations.json
+
+Usage (from the repository root):
+    python -m nerdle.validate                              #every output file of every game
+    python -m nerdle.validate nanagrams/output /tmp/games  #files / folders
+    python -m nerdle.validate --show 50                    #print up to 50 failures per file (default 10)
+
+    #or from python
+    from nerdle import validate
+    failures = validate.checkNanagrams(puzzles)           #[(puzzle index, reason), ...]
+    report = validate.validateFile('targets/output/targets_questions.json')
+
+"""
+
+import argparse
+import fnmatch
+import functools
+import glob
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from nerdle import anagramindex, evaluator, games, lexicon
+
+#characters of a calculation, packed 4 bits each (0 for anything else, so it never matches)
+_CODES = np.zeros(256, dtype=np.uint64)
+for _k, _c in enumerate(lexicon.SYMBOLS):
+    _CODES[ord(_c)] = _k+1
+MAX_PACKED = 16
+
+#per-process cache of sorted packed word lists
+_keys = {}
+
+#numbers in a targets calculation
+_DIGITS = re.compile(r'\d+')
+
+#characters of a crossnerdle grid that are not squares
+BLANKS = ' X@'
+
+
+def packRows(rows):
+    #uint8 rows (n, length) -> uint64 per row
+    rows = np.asarray(rows)
+    codes = _CODES[rows]
+    shifts = (np.arange(rows.shape[1]-1, -1, -1, dtype=np.uint64)*np.uint64(4))
+    return(np.bitwise_or.reduce(codes << shifts, axis=1) if rows.shape[1] else np.zeros(len(rows), dtype=np.uint64))
+
+
+def packedWords(name, words):
+    #sorted packed word list, built the first time it is needed in this process
+    if name not in _keys:
+        _keys[name] = np.sort(packRows(words))
+    return(_keys[name])
+
+
+def inWords(rows, keys):
+    #true for each uint8 row found in sorted packed word list keys
+    packed = packRows(rows)
+    pos = np.minimum(np.searchsorted(keys, packed), max(len(keys)-1, 0))
+    return((keys[pos]==packed) if len(keys) else np.zeros(len(packed), dtype=bool))
+
+
+@functools.lru_cache(maxsize=None)
+def isCalculation(equation):
+    #valid calculation in double precision, as the game checks it
+    return(evaluator.isValid(equation, exact=False))
+
+
+def validEquations(strings):
+    #numpy array of str -> true for each valid calculation, evaluating each distinct one once
+    unique, inverse = np.unique(strings, return_inverse=True)
+    valid = np.array([isCalculation(s) for s in unique.tolist()], dtype=bool)
+    return(valid[inverse.reshape(-1)].reshape(np.shape(strings)))
+
+
+def crossnerdleWords(length):
+    #packed word list crossnerdle fills grids from, None if it has none for this length
+    module = games.load('crossnerdle1')
+    if not module.hasWordList('_'*length):
+        return(None)
+    return(packedWords(('crossnerdle', length), module.wordList(length)))
+
+
+def gridRuns(layout):
+    #bool array (rows, cols), true for squares -> [(flat square indexes, 'across' / 'down', row, col)] of each word
+    runs = []
+    for direction, grid in (('across', layout), ('down', layout.T)):
+        for i, line in enumerate(grid):
+            j = 0
+            while j<len(line):
+                if line[j]:
+                    start = j
+                    while j<len(line) and line[j]:
+                        j += 1
+                    if j-start>1:
+                        cells = [(i, k) for k in range(start, j)] if direction=='across' else [(k, i) for k in range(start, j)]
+                        runs += [([r*layout.shape[1]+c for r, c in cells], direction, cells[0][0], cells[0][1])]
+                else:
+                    j += 1
+    return(runs)
+
+
+def checkCrossnerdle(grids):
+    #grids: list of grids (lists of rows of single characters) -> [(index, reason)]
+    failures = []
+    layouts = {}
+    for i, grid in enumerate(grids):
+        if len(set([len(row) for row in grid]))!=1 or any([len(c)!=1 for row in grid for c in row]):
+            failures += [(i, "grid is not rectangular with one character per square")]
+            continue
+        text = "".join(["".join(row) for row in grid])
+        key = (len(grid), len(grid[0]), "".join(['.' if c in BLANKS else '_' for c in text]))
+        layouts.setdefault(key, []).append((i, text))
+
+    for (nRows, nCols, mask), members in layouts.items():
+        indexes = np.array([i for i, _ in members])
+        cells = lexicon.fromStrings([text for _, text in members], nRows*nCols)
+        layout = (np.frombuffer(mask.encode('ascii'), dtype=np.uint8)==ord('_')).reshape(nRows, nCols)
+        for flat, direction, r, c in gridRuns(layout):
+            words = cells[:, flat]
+            keys = crossnerdleWords(len(flat)) if len(flat)<=MAX_PACKED else None
+            if keys is not None:
+                valid = inWords(words, keys)
+            else:
+                valid = validEquations(np.array(lexicon.toStrings(words)))
+            for k in np.flatnonzero(~valid):
+                failures += [(int(indexes[k]), "invalid %s word at row %d col %d: %s" % (direction, r, c, lexicon.toStrings(words[k:k+1])[0]))]
+    return(sorted(failures))
+
+
+def checkCrossnerdleQuestions(questions):
+    #questions: crossnerdle2 output (dicts with 'answer', 'question', 'solveList') -> [(index, reason)]
+    failures = checkCrossnerdle([q['answer'] for q in questions])
+    for i, q in enumerate(questions):
+        filled = [list(row) for row in q['question']]
+        try:
+            for move in q['solveList']:
+                filled[move['R']][move['C']] = move['A']
+        except (IndexError, KeyError, TypeError):
+            failures += [(i, "solveList does not fit the question")]
+            continue
+        if filled!=q['answer']:
+            failures += [(i, "question with solveList filled in is not the answer")]
+    return(sorted(failures))
+
+
+def checkNanagrams(puzzles):
+    #puzzles: nanagrams output (dicts with 'question', 'answersLong' (json list), 'fixed') -> [(index, reason)]
+    failures = []
+    owners, answers = [], []
+    for i, p in enumerate(puzzles):
+        try:
+            words = json.loads(p['answersLong'])
+        except (KeyError, TypeError, ValueError):
+            failures += [(i, "answersLong is not a json list")]
+            continue
+        if not words:
+            failures += [(i, "no answers")]
+        owners += [i]*len(words)
+        answers += words
+    if not answers:
+        return(failures)
+    owners = np.array(owners)
+    questions = anagramindex.countVectors(lexicon.fromStrings(["".join(p['question']).ljust(9)[:9] for p in puzzles], 9))
+    centres = np.array([ord(p['fixed'][0]) for p in puzzles], dtype=np.uint8)
+
+    byLength = {}
+    for k, word in enumerate(answers):
+        byLength.setdefault(len(word), []).append(k)
+    for length, ks in byLength.items():
+        ks = np.array(ks)
+        rows = lexicon.fromStrings([answers[k] for k in ks], length)
+        own = owners[ks]
+        if lexicon.sourcePath(length, True) is not None or os.path.exists(lexicon.compiledPath(length, True)):
+            valid = inWords(rows, packedWords(('nanagrams', length), lexicon.loadLexicon(length, zeros=True)))
+            if length==9:
+                valid &= rows[:, 4]!=ord('=')
+        else:
+            valid = validEquations(np.array([answers[k] for k in ks]))
+        within = (anagramindex.countVectors(rows)<=questions[own]).all(axis=1)
+        fixed = (rows==centres[own][:, None]).any(axis=1) & (rows==ord('=')).any(axis=1)
+        for reason, ok in (("answer not in word list", valid), ("answer uses characters not in the question", within),
+                           ("answer does not contain the fixed characters", fixed)):
+            failures += [(int(own[j]), reason+": "+answers[ks[j]]) for j in np.flatnonzero(~ok)]
+    return(sorted(failures))
+
+
+def gridShape(grid):
+    #(rows, cols) of a rectangular grid, else None
+    widths = set([len(row) for row in grid])
+    return((len(grid), widths.pop()) if len(widths)==1 else None)
+
+
+def gridArrays(answers, questions):
+    #answer and question grids -> (failures, indexes of grids with the same shape as the first answer, answers, questions as str arrays)
+    shape = gridShape(answers[0]) if answers else None
+    same = [i for i in range(len(answers)) if i<len(questions) and gridShape(answers[i])==shape and gridShape(questions[i])==shape]
+    failures = [(i, "grid shape differs from the first answer or question missing") for i in sorted(set(range(len(answers)))-set(same))]
+    return(failures, same, np.array([answers[i] for i in same], dtype=str), np.array([questions[i] for i in same], dtype=str))
+
+
+def checkPermutation(same, answers, questions):
+    #question grids use the same squares as the answers, blanks in the same places, and are not already solved
+    failures = []
+    n = len(same)
+    permutation = (np.sort(answers.reshape(n, -1), axis=1)==np.sort(questions.reshape(n, -1), axis=1)).all(axis=1)
+    blanks = ((answers==' ')==(questions==' ')).reshape(n, -1).all(axis=1)
+    solved = (answers==questions).reshape(n, -1).all(axis=1)
+    for reason, bad in (("question is not a permutation of the answer", ~permutation), ("question blanks are not the answer's", ~blanks),
+                        ("question is already solved", solved)):
+        failures += [(same[k], reason) for k in np.flatnonzero(bad)]
+    return(failures)
+
+
+def checkShuffleNumbers(answers, questions):
+    #answers, questions: lists of grids of numbers / symbols (shuffleNumbers _A and _Q files) -> [(index, reason)]
+    failures, same, A, Q = gridArrays(answers, questions)
+    if not same:
+        return(failures)
+    lines = [('row', r, A[:, r, :]) for r in range(0, A.shape[1], 2)]+[('column', c, A[:, :, c]) for c in range(0, A.shape[2], 2)]
+    for direction, k, tokens in lines:
+        equations = functools.reduce(np.char.add, [tokens[:, j] for j in range(tokens.shape[1])])
+        for m in np.flatnonzero(~validEquations(equations)):
+            failures += [(same[m], "invalid %s %d: %s" % (direction, k, equations[m]))]
+    return(sorted(failures+checkPermutation(same, A, Q)))
+
+
+def magicSquares():
+    #every valid shuffleWords answer, as 25 character strings
+    if 'shuffleWords' not in _keys:
+        _keys['shuffleWords'] = np.array(sorted(set(["".join(sum(grid, [])) for grid in games.load('shuffleWords').loadAnswers()])))
+    return(_keys['shuffleWords'])
+
+
+def checkShuffleWords(answers, questions):
+    #answers, questions: lists of 5x5 letter grids (shuffleWords _A and _Q files) -> [(index, reason)]
+    failures, same, A, Q = gridArrays(answers, questions)
+    if not same:
+        return(failures)
+    squares = functools.reduce(np.char.add, [A.reshape(len(same), -1)[:, j] for j in range(A[0].size)])
+    failures += [(same[m], "answer is not a magic square") for m in np.flatnonzero(~np.isin(squares, magicSquares()))]
+    return(sorted(failures+checkPermutation(same, A, Q)))
+
+
+def countNumbers(numberLists, universe):
+    #lists of numbers -> (number of lists, len(universe)) counts of each number in sorted universe
+    rows = np.repeat(np.arange(len(numberLists)), [len(numbers) for numbers in numberLists])
+    columns = np.searchsorted(universe, np.array([x for numbers in numberLists for x in numbers], dtype=np.int64))
+    counts = np.zeros((len(numberLists), len(universe)), dtype=np.int16)
+    np.add.at(counts, (rows, columns), 1)
+    return(counts)
+
+
+def checkTargets(questions, calculations, solutions, groups=None):
+    #targets files: keyboard numbers, calculations and targets per game -> [(index, reason)]
+    #groups: numbers in each target's calculation (default targets.nGroupsInAnswer)
+    groups = groups or games.load('targets').nGroupsInAnswer
+    inputs = np.array([sum(g) for g in groups])
+    nGames = min(len(questions), len(calculations), len(solutions))
+    failures = [(i, "expected %d targets" % len(inputs)) for i in range(nGames)
+                if len(calculations[i])!=len(inputs) or len(solutions[i])!=len(inputs)]
+    if len(calculations)!=len(questions) or len(solutions)!=len(questions):
+        failures += [(nGames, "files have different numbers of games")]
+    good = sorted(set(range(nGames))-set([i for i, _ in failures]))
+    if not good:
+        return(failures)
+    calcs = np.array([calculations[i] for i in good]).reshape(-1)
+    targets = np.array([[t[0] for t in solutions[i]] for i in good]).astype(np.int64).reshape(-1)
+    owners = np.repeat(good, len(inputs))
+    slots = np.tile(np.arange(len(inputs)), len(good))
+
+    #value and numbers of each distinct calculation
+    unique, inverse = np.unique(calcs, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    values = np.array([np.nan if v is None else v for v in evaluator.evaluateMany(unique.tolist(), exact=False, errors=None)])
+    correct = values[inverse]==targets
+    used = [[int(x) for x in _DIGITS.findall(c)] for c in unique.tolist()]
+    keyboard = [[int(x) for x in questions[i]] for i in good]
+    universe = np.unique(np.array([x for numbers in used+keyboard for x in numbers], dtype=np.int64))
+    usedCounts = countNumbers(used, universe)[inverse]
+    keyboardCounts = countNumbers(keyboard, universe)
+    within = (usedCounts<=keyboardCounts[np.repeat(np.arange(len(good)), len(inputs))]).all(axis=1)
+    count = usedCounts.sum(axis=1)==inputs[slots]
+
+    for reason, ok in (("does not equal its target", correct), ("uses numbers not on the keyboard", within),
+                       ("does not use the stated number of inputs", count)):
+        failures += [(int(owners[k]), "target %d (%d) %s: %s" % (slots[k], targets[k], reason, calcs[k])) for k in np.flatnonzero(~ok)]
+    return(sorted(failures))
+
+
+def loadJson(path):
+    with open(path) as f:
+        return(json.load(f))
+
+
+def _sibling(path, suffix, newSuffix, up=False):
+    other = path[:-len(suffix)]+newSuffix
+    if up and not os.path.exists(other):
+        #shuffleWords saves answers next to the script and questions in its output folder
+        other = os.path.join(os.path.dirname(os.path.dirname(path)), os.path.basename(other))
+    return(other)
+
+
+def _checkFile(function, *paths):
+    data = [loadJson(p) for p in paths]
+    return(function(*data), len(data[0]))
+
+
+#file name pattern -> (game, check: path -> (failures, puzzles)), the first matching pattern is used
+FILES = [
+    ('targets_questions.json', 'targets', lambda path: _checkFile(checkTargets, path, _sibling(path, '_questions.json', '_calculations.json'),
+                                                                  _sibling(path, '_questions.json', '_solutions.json'))),
+    ('nanagramPuzzles_*.json', 'nanagrams', lambda path: _checkFile(checkNanagrams, path)),
+    ('shufflePuzzlesWords_*_Q.json', 'shuffleWords', lambda path: _checkFile(checkShuffleWords, _sibling(path, '_Q.json', '_A.json', up=True), path)),
+    ('shufflePuzzles_*_A.json', 'shuffleNumbers', lambda path: _checkFile(checkShuffleNumbers, path, _sibling(path, '_A.json', '_Q.json'))),
+    ('*_answers.json', 'crossnerdle1', lambda path: _checkFile(checkCrossnerdle, path)),
+    ('*_questions.json', 'crossnerdle2', lambda path: _checkFile(checkCrossnerdleQuestions, path)),
+    ('*_dayIndex.json', 'crossnerdle2', lambda path: _checkFile(checkCrossnerdleQuestions, path)),
+]
+
+
+def fileGame(path):
+    for pattern, game, check in FILES:
+        if fnmatch.fnmatch(os.path.basename(path), pattern):
+            return(game, check)
+    return(None, None)
+
+
+def validateFile(path):
+    #-> {'path', 'game', 'puzzles', 'failures': [(index, reason)], 'seconds'}; a file that cannot be read is one failure
+    start = time.time()
+    game, check = fileGame(path)
+    if check is None:
+        raise ValueError("not a known output file: "+path)
+    try:
+        failures, puzzles = check(path)
+    except (OSError, ValueError, KeyError, IndexError, TypeError) as e:
+        failures, puzzles = [(None, "cannot check file - "+type(e).__name__+": "+str(e))], 0
+    return({'path': path, 'game': game, 'puzzles': puzzles, 'failures': failures, 'seconds': time.time()-start})
+
+
+def findFiles(paths=None):
+    #output files in paths (files or folders), default every game's output folder
+    if not paths:
+        paths = [os.path.join(games.ROOT, folder, 'output') for folder in sorted(set([f for f, _ in games.GAMES.values()]))]
+    found = []
+    for path in paths:
+        candidates = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        found += [p for p in candidates if fileGame(p)[0] is not None]
+    return(found)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="check every puzzle in the creator scripts' output files")
+    parser.add_argument('paths', nargs='*', help="files or folders (default: every game's output folder)")
+    parser.add_argument('--show', type=int, default=10, help="failures printed per file")
+    args = parser.parse_args()
+
+    start = time.time()
+    reports = [validateFile(path) for path in findFiles(args.paths)]
+    for r in reports:
+        print("%-14s %-60s %7d puzzles %6.2fs  %s" % (r['game'], os.path.relpath(r['path'])[-60:], r['puzzles'], r['seconds'],
+                                                    "ok" if not r['failures'] else "%d FAILURES" % len(r['failures'])))
+        for index, reason in r['failures'][:args.show]:
+            print("    puzzle", index, "-", reason)
+    total = sum([r['puzzles'] for r in reports])
+    failed = sum([len(r['failures']) for r in reports])
+    print("%d files, %d puzzles, %d failures in %.1fs" % (len(reports), total, failed, time.time()-start))
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,446 @@
+# -*- coding: utf-8 -*-
+"""
+@author: richard mann, nerdle
+
+Work queue on a shared folder, to spread a batch over several machines without a broker: a coordinator writes one
+task per job shard, workers on any machine that can see the folder lease tasks, make the shards (see nerdle/batch.py
+and nerdle/seeding.py) and the coordinator merges them into the games' usual output files.
+
+Folder layout ([queue]/):
+    - queue.json: the batch - {"batchId", "shards", "leaseSeconds", "jobs": [...]} (jobs as in a batch.json)
+    - todo/[task].json: a shard waiting for a worker - {"job", "batchId", "shard", "shards", "attempts"}
+      ([task] is [job name].shard[k]of[n], as the shard files are named)
+    - leased/[task]@[worker].json: a shard a worker is making; its modified time is the worker's heartbeat
+    - done/[task].json: a shard that is made - {"worker", "puzzles", "seconds", "finished"}
+    - failed/[task].json: a shard that failed MAX_ATTEMPTS times, with its last error
+    - shards/: the shard files ([task].json) and, while a shard is being made, its puzzles so far ([task].jsonl)
+    - workers/[worker].json: each worker's latest heartbeat - {"worker", "host", "pid", "task", "puzzles", "time"}
+      (task '(idle)' between tasks, '(stopped)' once the worker has finished)
+    - merged/[job name].json: jobs whose shards have been merged and saved
+
+Algorithm:
+    - Lease: a worker renames todo/[task].json to leased/[task]@[worker].json.  Rename is atomic on one file system,
+      so exactly one worker gets each task (the others find it gone and try the next)
+    - Heartbeat: while a shard is made, a thread touches its lease file every leaseSeconds / 4 seconds.  A lease not
+      touched for leaseSeconds (the worker died, or its machine did) is renamed back to todo/ by whichever worker or
+      coordinator sees it first.  Ages are measured against the shared folder's own clock (the modified time of a
+      file just written there), so machines' clocks need not agree
+    - A worker checks it still holds its lease before making each puzzle and again before appending it, and stops if it
+      does not.  Puzzles are appended to the shard's .jsonl as they are made (see nerdle/sink.py), so the next worker
+      to lease a re-queued shard carries on from there.  The shard file is written to a temporary name and renamed
+      into place when complete
+    - A puzzle that fails is recorded in quarantine/[game].jsonl and made again from a retry seed, as in batch.py (see
+      nerdle/quarantine.py).  A shard that still raises an error goes back to todo/ (up to MAX_ATTEMPTS attempts, then
+      to failed/)
+    - Merge: once every shard of a job is done, its shard files are merged and the game's files saved (batch.mergeJob),
+      so the output is the same as batch.py gives for the same batch id, whatever the number of workers or machines
+
+Usage (from the repository root; /shared/q is a folder every machine can see):
+    python -m nerdle.workqueue init /shared/q batch.json --batch-id 2024-06 --shards 24
+    python -m nerdle.workqueue work /shared/q --processes 8           #on each machine
+    python -m nerdle.workqueue coordinate /shared/q                   #re-queue expired leases, merge when all done
+    python -m nerdle.workqueue status /shared/q
+
+    #one machine, several local workers (eg to test)
+    python -m nerdle.workqueue init /tmp/q batch.json --batch-id test --shards 6
+    python -m nerdle.workqueue work /tmp/q --processes 3 && python -m nerdle.workqueue merge /tmp/q
+
+"""
+
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+
+from nerdle import batch, games, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+STATES = ['todo', 'leased', 'done', 'failed']
+FOLDERS = STATES+['shards', 'workers', 'merged']
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+#seconds between looks at an empty todo/ while other workers still hold leases
+POLL_SECONDS = 5
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def taskName(job, shard, shards):
+    return(batch.fileName(batch.jobName(job))+'.shard%dof%d' % (shard, shards))
+
+
+def leaseTask(leaseName):
+    #leased file name -> (task, worker)
+    task, worker = leaseName[:-len('.json')].rsplit('@', 1)
+    return(task, worker)
+
+
+def writeJson(path, value):
+    #written to a temporary name and renamed into place, so readers never see part of a file
+    temp = path+'.'+str(os.getpid())+'.tmp'
+    with open(temp, 'w') as f:
+        json.dump(value, f)
+    os.replace(temp, path)
+
+
+def readJson(path):
+    with open(path) as f:
+        return(json.load(f))
+
+
+def folder(queueDir, name):
+    return(os.path.join(queueDir, name))
+
+
+def listTasks(queueDir, state):
+    return(sorted([f for f in os.listdir(folder(queueDir, state)) if f.endswith('.json')]))
+
+
+def defaultWorkerId():
+    return(batch.fileName(socket.gethostname()+'-'+str(os.getpid())).replace('@', '_'))
+
+
+def writeWorker(queueDir, workerId, task, puzzles=0):
+    writeJson(os.path.join(folder(queueDir, 'workers'), workerId+'.json'),
+              {'worker': workerId, 'host': socket.gethostname(), 'pid': os.getpid(), 'task': task, 'puzzles': puzzles,
+               'time': time.time()})
+
+
+def fsNow(queueDir, workerId):
+    #current time on the shared folder's clock
+    path = os.path.join(folder(queueDir, 'workers'), '.clock-'+workerId)
+    with open(path, 'w') as f:
+        f.write(str(time.time()))
+    return(os.path.getmtime(path))
+
+
+def createQueue(queueDir, jobs, batchId, shards, leaseSeconds=LEASE_SECONDS):
+    #write queue.json and a todo task for every shard not already done or being made -> number of tasks queued
+    #(tasks that failed are queued again with their attempts reset)
+    batch.checkJobs(jobs)
+    if batchId is None:
+        raise ValueError("a queue needs a batch id (--batch-id, or batchId in the config)")
+    for name in FOLDERS:
+        os.makedirs(folder(queueDir, name), exist_ok=True)
+    if os.path.exists(os.path.join(queueDir, 'queue.json')):
+        old = readJson(os.path.join(queueDir, 'queue.json'))
+        if (old['batchId'], old['shards'])!=(batchId, shards):
+            raise ValueError(queueDir+" holds batch "+str(old['batchId'])+" in "+str(old['shards'])+" shards - use a new folder")
+    writeJson(os.path.join(queueDir, 'queue.json'), {'batchId': batchId, 'shards': shards, 'leaseSeconds': leaseSeconds, 'jobs': jobs})
+
+    existing = set([leaseTask(f)[0] for f in listTasks(queueDir, 'leased')])
+    existing.update([f[:-len('.json')] for state in ['todo', 'done'] for f in listTasks(queueDir, state)])
+    queued = 0
+    for job in jobs:
+        for shard in range(shards):
+            name = taskName(job, shard, shards)
+            if name in existing:
+                continue
+            writeJson(os.path.join(folder(queueDir, 'todo'), name+'.json'),
+                      {'job': job, 'batchId': job.get('batchId', batchId), 'shard': shard, 'shards': shards, 'attempts': 0})
+            failed = os.path.join(folder(queueDir, 'failed'), name+'.json')
+            if os.path.exists(failed):
+                os.remove(failed)
+            queued += 1
+    return(queued)
+
+
+def loadQueue(queueDir):
+    return(readJson(os.path.join(queueDir, 'queue.json')))
+
+
+def requeueExpired(queueDir, leaseSeconds, workerId):
+    #move leases whose heartbeat is older than leaseSeconds back to todo -> names of the tasks re-queued
+    now = fsNow(queueDir, workerId)
+    requeued = []
+    for leaseName in listTasks(queueDir, 'leased'):
+        path = os.path.join(folder(queueDir, 'leased'), leaseName)
+        try:
+            if now-os.path.getmtime(path)<leaseSeconds:
+                continue
+            task, _ = leaseTask(leaseName)
+            os.rename(path, os.path.join(folder(queueDir, 'todo'), task+'.json'))
+            requeued += [task]
+        except FileNotFoundError:
+            #finished, or re-queued by someone else, since it was listed
+            pass
+    return(requeued)
+
+
+def lease(queueDir, workerId):
+    #-> (lease path, task) for the first todo task this worker gets, None if there are none
+    for name in listTasks(queueDir, 'todo'):
+        path = os.path.join(folder(queueDir, 'leased'), name[:-len('.json')]+'@'+workerId+'.json')
+        try:
+            os.rename(os.path.join(folder(queueDir, 'todo'), name), path)
+        except FileNotFoundError:
+            continue
+        os.utime(path)
+        return(path, readJson(path))
+    return(None)
+
+
+class Heartbeat(threading.Thread):
+    #touches a lease (and the worker's heartbeat file) until stopped; lost is set once the lease has gone
+
+    def __init__(self, queueDir, workerId, leasePath, task, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.queueDir = queueDir
+        self.workerId = workerId
+        self.leasePath = leasePath
+        self.task = task
+        self.interval = interval
+        self.puzzles = 0
+        self.lost = False
+        self.stopping = threading.Event()
+
+    def beat(self):
+        try:
+            os.utime(self.leasePath)
+        except FileNotFoundError:
+            self.lost = True
+        writeWorker(self.queueDir, self.workerId, self.task, self.puzzles)
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.beat()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+    def holds(self):
+        #still the lease holder (checked before each puzzle, as well as by the heartbeat)
+        if not self.lost and not os.path.exists(self.leasePath):
+            self.lost = True
+        return(not self.lost)
+
+
+def makeShard(queueDir, task, heartbeat):
+    #make a leased shard (carrying on from its .jsonl) and save its shard file -> number of puzzles
+    job, batchId, shard, shards = task['job'], task['batchId'], task['shard'], task['shards']
+    shardDir = folder(queueDir, 'shards')
+    count, puzzle = batch.SEEDED[job['game']](games.load(job['game']), job)
+    path = batch.shardPath(shardDir, job, shard, shards)
+    if os.path.exists(path):
+        made = seeding.loadShard(path)
+        if (made['batchId'], made['count'])==(batchId, count):
+            return(len(made['puzzles']))
+
+    indexes = seeding.shardIndexes(count, shard, shards)
+    sink = JsonlSink(path+'l', header={'game': job['game'], 'batchId': batchId, 'count': count, 'shard': shard, 'shards': shards})
+    puzzles = sink.records()
+
+    def checkLease():
+        if not heartbeat.holds():
+            sink.close()
+            raise LeaseLost(taskName(job, shard, shards))
+
+    for index in indexes[len(puzzles):]:
+        checkLease()
+        made = quarantine.seeded(job['game'], puzzle, index, batchId, {'job': job})
+        #the lease can be re-queued while a puzzle is made: append only while it is still ours, so a worker that has
+        #resumed the shard does not get an extra line
+        checkLease()
+        puzzles += [made]
+        sink.append(made)
+        heartbeat.puzzles = len(puzzles)
+    checkLease()
+    seeding.saveShard(path+'.tmp', job['game'], batchId, count, shard, shards, indexes, puzzles)
+    os.replace(path+'.tmp', path)
+    sink.remove()
+    return(len(puzzles))
+
+
+def runLease(queueDir, workerId, leasePath, task, leaseSeconds):
+    #make one leased task and record the outcome -> {'task', 'puzzles', 'seconds'} with 'error' set if it failed
+    name = taskName(task['job'], task['shard'], task['shards'])
+    start = time.time()
+    heartbeat = Heartbeat(queueDir, workerId, leasePath, name, max(leaseSeconds/4, 0.1))
+    heartbeat.beat()
+    heartbeat.start()
+    try:
+        puzzles = makeShard(queueDir, task, heartbeat)
+    except LeaseLost:
+        heartbeat.stop()
+        return({'task': name, 'puzzles': 0, 'seconds': time.time()-start, 'error': 'lease lost'})
+    except Exception as e:
+        heartbeat.stop()
+        error = type(e).__name__+": "+str(e)
+        print(traceback.format_exc())
+        if heartbeat.holds():
+            task = dict(task, attempts=task.get('attempts', 0)+1, error=error, worker=workerId)
+            state = 'todo' if task['attempts']<MAX_ATTEMPTS else 'failed'
+            writeJson(os.path.join(folder(queueDir, state), name+'.json'), task)
+            os.remove(leasePath)
+        return({'task': name, 'puzzles': 0, 'seconds': time.time()-start, 'error': error})
+    heartbeat.stop()
+    seconds = time.time()-start
+    writeJson(os.path.join(folder(queueDir, 'done'), name+'.json'),
+              {'worker': workerId, 'puzzles': puzzles, 'seconds': round(seconds, 3), 'finished': time.time()})
+    try:
+        os.remove(leasePath)
+    except FileNotFoundError:
+        #re-queued while the shard file was being saved: the next worker finds it made
+        pass
+    return({'task': name, 'puzzles': puzzles, 'seconds': seconds})
+
+
+def work(queueDir, workerId=None, wait=False):
+    #lease and make tasks until there are none left (or, with wait, forever) -> one result per task
+    workerId = workerId or defaultWorkerId()
+    leaseSeconds = loadQueue(queueDir)['leaseSeconds']
+    results = []
+    while True:
+        requeueExpired(queueDir, leaseSeconds, workerId)
+        leased = lease(queueDir, workerId)
+        if leased is None:
+            if wait or listTasks(queueDir, 'leased'):
+                #others' leases may still expire and come back
+                time.sleep(POLL_SECONDS)
+                continue
+            break
+        leasePath, task = leased
+        name = taskName(task['job'], task['shard'], task['shards'])
+        print(workerId, "leased", name, flush=True)
+        results += [runLease(queueDir, workerId, leasePath, task, leaseSeconds)]
+        r = results[-1]
+        if 'error' in r:
+            print(workerId, "FAILED", name, "-", r['error'], flush=True)
+        else:
+            print(workerId, "done", name, "-", r['puzzles'], "puzzles in %.1fs" % r['seconds'], flush=True)
+        writeWorker(queueDir, workerId, '(idle)')
+    writeWorker(queueDir, workerId, '(stopped)')
+    return(results)
+
+
+def _work(queueDir, workerId, wait):
+    return(work(queueDir, workerId, wait))
+
+
+def workProcesses(queueDir, processes=1, wait=False, warm=True):
+    #run processes local workers (forked after loading the queue's data once, as batch.py does) -> all their results
+    if warm:
+        batch.warmJobs(loadQueue(queueDir)['jobs'])
+    if processes<=1:
+        return(work(queueDir, None, wait))
+    base = defaultWorkerId()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, mp_context=context) as pool:
+        futures = [pool.submit(_work, queueDir, base+'-'+str(k), wait) for k in range(processes)]
+        return([r for future in futures for r in future.result()])
+
+
+def status(queueDir):
+    #-> {'tasks': {state: count}, 'jobs': {job name: {state: count}}, 'merged': [...], 'workers': [...]}
+    queue = loadQueue(queueDir)
+    names = dict([(taskName(job, k, queue['shards']), batch.jobName(job)) for job in queue['jobs'] for k in range(queue['shards'])])
+    tasks = dict([(state, 0) for state in STATES])
+    jobs = dict([(batch.jobName(job), dict([(state, 0) for state in STATES])) for job in queue['jobs']])
+    for state in STATES:
+        for f in listTasks(queueDir, state):
+            task = leaseTask(f)[0] if state=='leased' else f[:-len('.json')]
+            if task in names:
+                tasks[state] += 1
+                jobs[names[task]][state] += 1
+    workers = [readJson(os.path.join(folder(queueDir, 'workers'), f)) for f in listTasks(queueDir, 'workers')]
+    merged = [f[:-len('.json')] for f in listTasks(queueDir, 'merged')]
+    return({'tasks': tasks, 'jobs': jobs, 'merged': merged, 'workers': workers})
+
+
+def mergeQueue(queueDir, outputDir=None):
+    #merge and save every job whose shards are all done (and that is not merged yet) -> {job name: puzzles saved}
+    queue = loadQueue(queueDir)
+    if outputDir is not None:
+        os.makedirs(outputDir, exist_ok=True)
+    done = set([f[:-len('.json')] for f in listTasks(queueDir, 'done')])
+    saved = {}
+    for job in queue['jobs']:
+        name = batch.jobName(job)
+        mergedPath = os.path.join(folder(queueDir, 'merged'), batch.fileName(name)+'.json')
+        if os.path.exists(mergedPath) or any([taskName(job, k, queue['shards']) not in done for k in range(queue['shards'])]):
+            continue
+        saved[name] = batch.mergeJob(job, job.get('batchId', queue['batchId']), folder(queueDir, 'shards'), outputDir)
+        writeJson(mergedPath, {'puzzles': saved[name], 'outputDir': outputDir, 'merged': time.time()})
+    return(saved)
+
+
+def printStatus(queueDir):
+    report = status(queueDir)
+    print("%-50s %6s %6s %6s %6s  %s" % (("job",)+tuple(STATES)+("merged",)))
+    for name, counts in report['jobs'].items():
+        print("%-50s %6d %6d %6d %6d  %s" % ((name[:50],)+tuple([counts[s] for s in STATES])+
+                                             ("yes" if batch.fileName(name) in report['merged'] else "-",)))
+    now = time.time()
+    for w in report['workers']:
+        print("worker %-30s %-12s %-50s %6d puzzles, %.0fs ago" % (w['worker'], w['host'], w['task'], w['puzzles'], now-w['time']))
+    return(report)
+
+
+def coordinate(queueDir, outputDir=None, interval=30):
+    #re-queue expired leases and print progress until no task is waiting or leased, then merge -> {job name: puzzles}
+    workerId = 'coordinator-'+defaultWorkerId()
+    leaseSeconds = loadQueue(queueDir)['leaseSeconds']
+    while True:
+        for task in requeueExpired(queueDir, leaseSeconds, workerId):
+            print("lease expired, re-queued", task, flush=True)
+        report = status(queueDir)['tasks']
+        print(time.ctime(), " ".join([state+" "+str(report[state]) for state in STATES]), flush=True)
+        for job, puzzles in mergeQueue(queueDir, outputDir).items():
+            print("merged", job, "-", puzzles, "puzzles", flush=True)
+        if report['todo']+report['leased']==0:
+            break
+        time.sleep(interval)
+    return(report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="spread a batch over machines through a shared folder")
+    commands = parser.add_subparsers(dest='command', required=True)
+    init = commands.add_parser('init', help="write a task for every shard of every job in a batch config")
+    init.add_argument('queue', help="shared folder")
+    init.add_argument('config', help="json job config (see nerdle/batch.py)")
+    init.add_argument('--batch-id', default=None, help="default: the config's batchId")
+    init.add_argument('--shards', type=int, default=None, help="shards per job (default: the config's shards, else 4)")
+    init.add_argument('--lease', type=float, default=LEASE_SECONDS, help="seconds without a heartbeat before a lease expires")
+    worker = commands.add_parser('work', help="lease and make shards until none are left")
+    worker.add_argument('queue')
+    worker.add_argument('--processes', type=int, default=1, help="local worker processes")
+    worker.add_argument('--wait', action='store_true', help="keep waiting for new tasks instead of stopping")
+    coordinator = commands.add_parser('coordinate', help="re-queue expired leases and merge jobs as they finish")
+    coordinator.add_argument('queue')
+    coordinator.add_argument('--output-dir', default=None, help="write the games' files here instead of each game's output folder")
+    coordinator.add_argument('--interval', type=float, default=30, help="seconds between checks")
+    merge = commands.add_parser('merge', help="merge every job whose shards are all done")
+    merge.add_argument('queue')
+    merge.add_argument('--output-dir', default=None)
+    show = commands.add_parser('status', help="tasks per job and state, and each worker's latest heartbeat")
+    show.add_argument('queue')
+    args = parser.parse_args()
+
+    if args.command=='init':
+        config = batch.loadConfig(args.config)
+        queued = createQueue(args.queue, config['jobs'], args.batch_id or config.get('batchId'),
+                             args.shards or config.get('shards') or 4, args.lease)
+        print("queued", queued, "tasks in", args.queue)
+    elif args.command=='work':
+        results = workProcesses(args.queue, args.processes, args.wait)
+        print(len(results), "tasks,", len([r for r in results if 'error' in r]), "failed")
+    elif args.command=='coordinate':
+        report = coordinate(args.queue, args.output_dir, args.interval)
+        if report['failed']:
+            print(report['failed'], "tasks failed (see failed/ - init again to retry them)")
+            raise SystemExit(1)
+    elif args.command=='merge':
+        for job, puzzles in mergeQueue(args.queue, args.output_dir).items():
+            print("merged", job, "-", puzzles, "puzzles")
+    else:
+        printStatus(args.queue)
@@ -19,6 +19,15 @@ File output:
     - [fileStem]_[mode]_[number_of_puzzles]_A.json - solved puzzles
     - [fileStem]_[mode]_[number_of_puzzles]_Q.json - starting questions
     - [fileStem]_[mode]_[number_of_puzzles]_S.json - move sequence to solve (not required for game)
+
+Usage:
+    - script: set params below and run from this folder
+    - library (nothing runs on import; the allowed calculations are loaded once per process and reused by later calls,
+      and are generated only if not in the artifact cache, see nerdle/cache.py):
+        from shuffleNumbers import shuffleCreator
+        puzzles = shuffleCreator.generate(count=20, mode='swapBoth', seed=1)
+        puzzles = shuffleCreator.generate(count=20, mode='swapBoth', batchId='2024-06')  #puzzle i seeded on its own (see nerdle/seeding.py)
+        puzzles = shuffleCreator.generate(count=20, mode='swapBoth', seed=1, seen=dedupe.loadIndex('shuffleNumbers-swapBoth'))  #no repeats of published games (see nerdle/dedupe.py)
     
 """
 import random
@@ -26,8 +35,17 @@ import numpy as np
 import itertools 
 import json  
 import sys
+import os
+
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import cache, dedupe, evaluator, metrics, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#folder holding this script (output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
 
-# setting params
+# setting params (defaults for generate)
 
 #number of games to be created
 questions = 10
@@ -43,13 +61,16 @@ filePrefix = 'shufflePuzzles'
 mode = 'shuffle' 
 fileStem = filePrefix + '_' + mode + '_'+str(questions)
 
-#number of duplicates required.  A few duplicates makes 2d nerdle more interesting. 3-6 used for first generation games for 2d. 0-999 for Shuffle numbers
-if mode == 'shuffle':
-    duplicatesRequiredMin = 0 #0 if no specific requirement
-    duplicatesRequiredMax = 999 #999 if no specific requirement
-else:
-    duplicatesRequiredMin = 3 #0 if no specific requirement
-    duplicatesRequiredMax = 6 #999 if no specific requirement
+#per-process cache of allowed calculations (see loadPerms)
+_perms = {}
+
+def duplicatesRequired(mode):
+    #number of duplicates required.  A few duplicates makes 2d nerdle more interesting. 3-6 used for first generation games for 2d. 0-999 for Shuffle numbers
+    #-> (min, max): 0 if no specific requirement, 999 if no specific requirement
+    if mode == 'shuffle':
+        return(0, 999)
+    else:
+        return(3, 6)
 
 
 def permutations(x=4, type="50x4", stripBoring=False):  
@@ -137,10 +158,10 @@ def permutations(x=4, type="50x4", stripBoring=False):
         ss = ['+']
     
     else:
-        print("undefined type")
-        sys.exit()
+        raise ValueError("undefined type "+str(type))
 
     perms = []
+    #equations are evaluated with the game's (double precision) arithmetic, so eg 15/11*11=15 is not used
     
     if x==4:
         target=len(ns)**3*len(ss)**2
@@ -151,13 +172,13 @@ def permutations(x=4, type="50x4", stripBoring=False):
                         for n3 in ns:
                             equation = [n1,s1,n2,s2,n3]
                             try: 
-                                answer = eval("".join(equation))
+                                answer = evaluator.evaluate("".join(equation), exact=False)
                                 if answer in [n1,n2,n3]:
                                     pass
                                 if (answer==np.round(answer,0)) & (str(int(answer)) in ns0):
                                     perms.append(equation+['=',str(int(answer))])
                                 if len(perms)%10000==0:
-                                    print("Permutations progress:",len(perms),len(perms)/target)
+                                    metrics.log(2, "Permutations progress:",len(perms),len(perms)/target)
         
                             except:
                                 #math errors eg division by zero
@@ -174,18 +195,17 @@ def permutations(x=4, type="50x4", stripBoring=False):
                                 for n4 in ns:
                                     equation = [n1,s1,n2,s2,n3,s3,n4]
                                     try: 
-                                        answer = eval("".join(equation))
+                                        answer = evaluator.evaluate("".join(equation), exact=False)
                                         if (answer==np.round(answer,0)) & (str(int(answer)) in ns0):
                                             perms.append(equation+['=',str(int(answer))])
                                         if len(perms)%10000==0:
-                                            print("Permutations progress:",len(perms),len(perms)/target)
+                                            metrics.log(2, "Permutations progress:",len(perms),len(perms)/target)
                                     except:
                                         #math errors eg division by zero
                                         pass
 
     else:
-        print("invalid perms param")
-        sys.exit()
+        raise ValueError("invalid perms param "+str(x))
 
     if stripBoring:
         perms = [p for p in perms if "*1" not in "".join(p)]        
@@ -194,7 +214,10 @@ def permutations(x=4, type="50x4", stripBoring=False):
         for n in ns:
             perms = [p for p in perms if n+"/"+n not in "".join(p)]
             perms = [p for p in perms if "/"+n+"*"+n not in "".join(p)]
-            
+
+    #one string object per distinct number or symbol rather than one per row (50x4 takes ~30MB instead of ~170MB)
+    strings = {}
+    perms = [[strings.setdefault(c, c) for c in p] for p in perms]
     return(perms)
 
 #create solved puzzle given the following inputs:
@@ -203,7 +226,7 @@ def permutations(x=4, type="50x4", stripBoring=False):
     #minTimesDivide = minimum number of occurrences of a * and / in puzzle
     
 #perms are allowed rows and columns other than final row/col.  permsLast are allowed last row/column
-def create_game(perms,permsLast,minTimesDivide=2):    
+def create_game(perms,permsLast,minTimesDivide=2,rng=random):    
 
     attempts = 0
     maxAttempts = 1000
@@ -214,12 +237,13 @@ def create_game(perms,permsLast,minTimesDivide=2):
     if lengthN==4:
         while (attempts<maxAttempts) & (success==False):
             attempts+=1
-            print("Attempt",attempts, end=", ")
+            metrics.count('grid fill attempts')
+            metrics.log(2, "Attempt",attempts, end=", ")
         
             #calculate grid
             
             #first 3 rows
-            [r1,r2,r3] = random.sample(perms,3)
+            [r1,r2,r3] = rng.sample(perms,3)
             
             #all possible columns that match
             possible_cs = {}
@@ -243,7 +267,7 @@ def create_game(perms,permsLast,minTimesDivide=2):
                 possible_r4s = [p for p in possible_r4s if p[x] in possible_r4[x]] 
         
             if len(possible_r4s)>0:    
-                [r4] = random.sample(possible_r4s,1)
+                [r4] = rng.sample(possible_r4s,1)
                 
                 #fit last column to last row
                 possible_cs[6] = [p for p in possible_cs[6] if p[-1]==r4[-1]]
@@ -258,16 +282,17 @@ def create_game(perms,permsLast,minTimesDivide=2):
         
                 
         if success == False:
-            print("Not found - step 1")
+            metrics.reject('grid not found')
+            metrics.log(1, "Not found - step 1")
             return([])
         
         else:    
             success = False
             while success == False:    
-                [c1] = random.sample([c for c in possible_cs[0] if c[-1]==r4[0]],1)
-                [c2] = random.sample([c for c in possible_cs[2] if c[-1]==r4[2]],1)
-                [c3] = random.sample([c for c in possible_cs[4] if c[-1]==r4[4]],1)
-                [c4] = random.sample([c for c in possible_cs[6] if c[-1]==r4[6]],1)
+                [c1] = rng.sample([c for c in possible_cs[0] if c[-1]==r4[0]],1)
+                [c2] = rng.sample([c for c in possible_cs[2] if c[-1]==r4[2]],1)
+                [c3] = rng.sample([c for c in possible_cs[4] if c[-1]==r4[4]],1)
+                [c4] = rng.sample([c for c in possible_cs[6] if c[-1]==r4[6]],1)
                 
                 sym1 = [c1[1]," ",c2[1]," ",c3[1]," ",c4[1]]
                 sym2 = [c1[3]," ",c2[3]," ",c3[3]," ",c4[3]]
@@ -282,17 +307,18 @@ def create_game(perms,permsLast,minTimesDivide=2):
             
         while (attempts<maxAttempts) & (success==False):
             attempts+=1
-            print("Attempt",attempts)
+            metrics.count('grid fill attempts')
+            metrics.log(2, "Attempt",attempts)
         
             #calculate grid
             
             #first 3 rows
             noduplicates = False
             while noduplicates == False:
-                [r1,r2,r3,r4] = random.sample(perms,4)
+                [r1,r2,r3,r4] = rng.sample(perms,4)
                 numbers = [x for x in sum([r1,r2,r3,r4], []) if x not in ['+','-','*','/','=',' ']]
                 if len(set(numbers))==len(numbers):
-                    print("no duplicates")
+                    metrics.log(2, "no duplicates")
                     noduplicates=True
             #all possible columns that match
             possible_cs = {}
@@ -310,7 +336,7 @@ def create_game(perms,permsLast,minTimesDivide=2):
                 possible_r5s = [p for p in possible_r5s if p[x] in possible_r5[x]] 
         
             if len(possible_r5s)>0:    
-                [r5] = random.sample(possible_r5s,1)
+                [r5] = rng.sample(possible_r5s,1)
                 
                 #fit last column to last row
                 possible_cs[8] = [p for p in possible_cs[8] if p[-1]==r5[-1]]
@@ -324,17 +350,18 @@ def create_game(perms,permsLast,minTimesDivide=2):
                     success=True
         
         if success == False:
-            print("Not found - step 2")
+            metrics.reject('grid not found')
+            metrics.log(1, "Not found - step 2")
             return([])
         
         else:    
             success = False
             while success == False:    
-                [c1] = random.sample([c for c in possible_cs[0] if c[-1]==r5[0]],1)
-                [c2] = random.sample([c for c in possible_cs[2] if c[-1]==r5[2]],1)
-                [c3] = random.sample([c for c in possible_cs[4] if c[-1]==r5[4]],1)
-                [c4] = random.sample([c for c in possible_cs[6] if c[-1]==r5[6]],1)
-                [c5] = random.sample([c for c in possible_cs[8] if c[-1]==r5[8]],1)
+                [c1] = rng.sample([c for c in possible_cs[0] if c[-1]==r5[0]],1)
+                [c2] = rng.sample([c for c in possible_cs[2] if c[-1]==r5[2]],1)
+                [c3] = rng.sample([c for c in possible_cs[4] if c[-1]==r5[4]],1)
+                [c4] = rng.sample([c for c in possible_cs[6] if c[-1]==r5[6]],1)
+                [c5] = rng.sample([c for c in possible_cs[8] if c[-1]==r5[8]],1)
                 
                 sym1 = [c1[1]," ",c2[1]," ",c3[1]," ",c4[1]," ",c5[1]]
                 sym2 = [c1[3]," ",c2[3]," ",c3[3]," ",c4[3]," ",c5[3]]
@@ -376,7 +403,7 @@ def encode_grid(gridQ,grid):
         
 
 #swap numbers only - n times
-def random_swap(grid,n):
+def random_swap(grid,n,rng=random):
     gridQ = [g.copy() for g in grid] 
     solveList = []
     minSolve=0
@@ -386,8 +413,8 @@ def random_swap(grid,n):
         counter=0
         while (swappable==False) & (counter<100):
             counter+=1
-            a = [random.randint(0,3)*2,random.randint(0,3)*2]
-            b = [random.randint(0,3)*2,random.randint(0,3)*2]
+            a = [rng.randint(0,3)*2,rng.randint(0,3)*2]
+            b = [rng.randint(0,3)*2,rng.randint(0,3)*2]
 
             #swappable if at least one of the two is currently green
             if grid[a[0]][a[1]]==gridQ[a[0]][a[1]]:
@@ -413,34 +440,25 @@ def random_swap(grid,n):
                 gridQTemp[b[0]][b[1]]=buffer
                 
                 
-                newMinSolve = len(findSolutionMinSwap(grid,gridQTemp))
-                print("counter", counter, "min solve from", minSolve, "to", newMinSolve)
+                metrics.count('swap attempts')
+                with metrics.stage('min solve'):
+                    newMinSolve = len(findSolutionMinSwap(grid,gridQTemp,rng=rng))
+                metrics.log(2, "counter", counter, "min solve from", minSolve, "to", newMinSolve)
                 if newMinSolve == minSolve+1:
                     minSolve = newMinSolve
                 elif newMinSolve > minSolve+1:
-                    print("error in min solve function")
-                    print("swapping", a[0],a[1],gridQ[a[0]][a[1]], "with", b[0],b[1],gridQ[b[0]][b[1]]) 
-                    for g in gridQ:
-                        print(g)
-                    print()
-                    for g in gridQTemp:
-                        print(g)
-                    print("grid, gridQ, gridQTemp")
-                    print(grid)
-                    print(gridQ)
-                    print(gridQTemp)
-                    print()
-                    print(findSolutionMinSwap(grid,gridQ))                    
-                    print(findSolutionMinSwap(grid,gridQTemp))                    
-                    
-                    sys.exit()
+                    #details go in the error (kept in the quarantine record), not on stdout
+                    raise RuntimeError("error in min solve function: min solve from %d to %d swapping %d%d %s with %d%d %s, grid %s, gridQ %s, gridQTemp %s"
+                                       % (minSolve, newMinSolve, a[0], a[1], gridQ[a[0]][a[1]], b[0], b[1], gridQ[b[0]][b[1]], grid, gridQ, gridQTemp))
                     
                 else:
-                    print("min solve not increased - reject swap")
+                    metrics.reject('swap does not increase min solve')
+                    metrics.log(2, "min solve not increased - reject swap")
                     swappable = False
 
         if counter>=99:
-            print("aborting - swap not found, num")
+            metrics.reject('swap not found')
+            metrics.log(1, "aborting - swap not found, num")
             return([],[])
 
         #print("swapping", a[0],a[1],gridQ[a[0]][a[1]], "with", b[0],b[1],gridQ[b[0]][b[1]]) 
@@ -456,7 +474,7 @@ def random_swap(grid,n):
 
 
 #swap symbols only - n times
-def random_swap_sym(grid,n):
+def random_swap_sym(grid,n,rng=random):
     gridQ = [g.copy() for g in grid] 
     solveList = []
     minSolve=0
@@ -468,12 +486,12 @@ def random_swap_sym(grid,n):
             counter+=1
             sym = False
             while sym==False:
-                a = [random.randint(0,4),random.randint(0,4)]
+                a = [rng.randint(0,4),rng.randint(0,4)]
                 if grid[a[0]][a[1]]  in "+*-/":
                     sym = True
             sym = False
             while sym==False:
-                b = [random.randint(0,4),random.randint(0,4)]
+                b = [rng.randint(0,4),rng.randint(0,4)]
                 if grid[b[0]][b[1]] in "+*-/":
                     sym = True
 
@@ -501,34 +519,25 @@ def random_swap_sym(grid,n):
                 gridQTemp[b[0]][b[1]]=buffer
                 
                 
-                newMinSolve = len(findSolutionMinSwap(grid,gridQTemp))
-                print("counter", counter, "min solve from", minSolve, "to", newMinSolve)
+                metrics.count('swap attempts')
+                with metrics.stage('min solve'):
+                    newMinSolve = len(findSolutionMinSwap(grid,gridQTemp,rng=rng))
+                metrics.log(2, "counter", counter, "min solve from", minSolve, "to", newMinSolve)
                 if newMinSolve == minSolve+1:
                     minSolve = newMinSolve
                 elif newMinSolve > minSolve+1:
-                    print("error in min solve function")
-                    print("swapping", a[0],a[1],gridQ[a[0]][a[1]], "with", b[0],b[1],gridQ[b[0]][b[1]]) 
-                    for g in gridQ:
-                        print(g)
-                    print()
-                    for g in gridQTemp:
-                        print(g)
-                    print("grid, gridQ, gridQTemp")
-                    print(grid)
-                    print(gridQ)
-                    print(gridQTemp)
-                    print()
-                    print(findSolutionMinSwap(grid,gridQ))                    
-                    print(findSolutionMinSwap(grid,gridQTemp))                    
-                    
-                    sys.exit()
+                    #details go in the error (kept in the quarantine record), not on stdout
+                    raise RuntimeError("error in min solve function: min solve from %d to %d swapping %d%d %s with %d%d %s, grid %s, gridQ %s, gridQTemp %s"
+                                       % (minSolve, newMinSolve, a[0], a[1], gridQ[a[0]][a[1]], b[0], b[1], gridQ[b[0]][b[1]], grid, gridQ, gridQTemp))
                     
                 else:
-                    print("min solve not increased - reject swap")
+                    metrics.reject('swap does not increase min solve')
+                    metrics.log(2, "min solve not increased - reject swap")
                     swappable = False
 
         if counter>=99:
-            print("aborting - swap not found, sym")
+            metrics.reject('swap not found')
+            metrics.log(1, "aborting - swap not found, sym")
             return([],[])
 
         #print("swapping", a[0],a[1],gridQ[a[0]][a[1]], "with", b[0],b[1],gridQ[b[0]][b[1]]) 
@@ -581,19 +590,19 @@ def shuff(line,lineTrue, right=True, fixGreens=True):
                 lineNew.append(line[x])
             else:
                 lineNew.append(lineDiffShuff[lineDiffCount])
-                print("b",lineDiffShuff[lineDiffCount])
+                metrics.log(2, "b",lineDiffShuff[lineDiffCount])
                 lineDiffCount+=1
         
     return lineNew
 
-def unShuff(line,lineTrue, right=True):
+def unShuff(line,lineTrue, right=True, rng=random):
     
     counter=0
     changed=False
     while changed==False:
         lineSame = [line[x]==lineTrue[x] for x in range(len(line))]
         #line fix = which greens to hold in place (always hold symbols): 1 for yes, 0 for no, -1 for not green
-        lineFix = [random.randint(0,1) if (lineSame[x] and x%2==0) else (1 if x%2==1 else -1) for x in range(len(line))]
+        lineFix = [rng.randint(0,1) if (lineSame[x] and x%2==0) else (1 if x%2==1 else -1) for x in range(len(line))]
         #print(lineFix) 
         if lineFix.count(0) + lineFix.count(-1) <= 1:
             pass
@@ -615,11 +624,11 @@ def unShuff(line,lineTrue, right=True):
             changed = (line!=lineNew)
         counter+=1
         if counter>1000:
-            print("give up")
+            metrics.log(2, "give up")
             return line #give up and try new line
     return lineNew                                       
 
-def unShuffle(grid,n):
+def unShuffle(grid,n,rng=random):
     gridQ = [g.copy() for g in grid] 
     
     for i in range(n):
@@ -629,34 +638,33 @@ def unShuffle(grid,n):
         while gridTemp == gridQ:
 
             #choose row (0) or column (1)
-            choice = random.randint(0,1)
+            choice = rng.randint(0,1)
             
             #row shuffle
             if choice == 0:
                 #choose row
-                choice2 = random.randint(0,int(len(grid)/2-1))*2
-                choice3 = random.randint(0,1) #0 right, 1 left
-                gridQ[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0))
+                choice2 = rng.randint(0,int(len(grid)/2-1))*2
+                choice3 = rng.randint(0,1) #0 right, 1 left
+                gridQ[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0),rng=rng)
     
             #col shuffle
             if choice == 1:
                 #choose column
-                choice2 = random.randint(0,int(len(grid)/2-1))*2
-                choice3 = random.randint(0,1) #0 right (down), 1 left (up)
+                choice2 = rng.randint(0,int(len(grid)/2-1))*2
+                choice3 = rng.randint(0,1) #0 right (down), 1 left (up)
                 column = [row.copy()[choice2] for row in grid]
                 columnQ = [row.copy()[choice2] for row in gridQ]
-                columnQNew = unShuff(columnQ,column,right=(choice3==0))
+                columnQNew = unShuff(columnQ,column,right=(choice3==0),rng=rng)
                 for r in range(len(gridQ)):
                     gridQ[r][choice2]=columnQNew[r] 
 
             attempts+=1
             if attempts>1000:
-                print("GIVE UP") 
-                sys.exit()
+                raise RuntimeError("GIVE UP")
 
         text1 = "row" if choice==0 else "column"
         text2 = "right" if choice3==0 else "left"
-        print("Choice:", text1, "n=",  choice2, text2)
+        metrics.log(2, "Choice:", text1, "n=",  choice2, text2)
 
     return gridQ
 
@@ -728,19 +736,19 @@ def findSolutionAnyUnder5(grid,gridQ):
     minSolution=''
     for j, goList in enumerate(allGoPerms):
         if j%50000==0:
-            print(j) 
+            metrics.log(2, j) 
         tempGrid = [g.copy() for g in gridQ] 
         for i in range(len(goList)):
             go = goList[i]
             tempGrid = shuffle(tempGrid,grid,go)
             if tempGrid==grid:
                 if i+1<minSolved:
-                    print('solved in ',i+1, "with goes:", goList[:i+1])
+                    metrics.log(2, 'solved in ',i+1, "with goes:", goList[:i+1])
                     minSolved=i+1
                     minSolution=goList[:i+1]
                     return(minSolved, goList[:i+1])
                     
-    print('finished')
+    metrics.log(2, 'finished')
 
     return(minSolved, minSolution)
 
@@ -758,24 +766,24 @@ def findSolutionMin(grid,gridQ):
     minSolution=''
     for j, goList in enumerate(allGoPerms):
         if j%50000==0:
-            print(j) 
+            metrics.log(2, j) 
         tempGrid = [g.copy() for g in gridQ] 
         for i in range(len(goList)):
             go = goList[i]
             tempGrid = shuffle(tempGrid,grid,go)
             if tempGrid==grid:
                 if i+1<minSolved:
-                    print('solved in ',i+1, "with goes:", goList[:i+1])
+                    metrics.log(2, 'solved in ',i+1, "with goes:", goList[:i+1])
                     minSolved=i+1
                     minSolution=goList[:i+1]
                     if minSolved==1:
                         return(minSolved, goList[:i+1])
                     
-    print('finished')
+    metrics.log(2, 'finished')
 
     return(minSolved, minSolution)
 
-def findSolutionMinSwap(grid,gridQtemp,attempts=20):
+def findSolutionMinSwap(grid,gridQtemp,attempts=20,rng=random):
 
     bestAttempt = []
     gridQmaster = [g.copy() for g in gridQtemp]
@@ -829,7 +837,7 @@ def findSolutionMinSwap(grid,gridQtemp,attempts=20):
                                         randomChoice = 1
                                         #if several 'best' single moves, need to randomise
                                         if repeatCount==singleGreenMaxCount:
-                                            randomChoice = random.randint(0,1)
+                                            randomChoice = rng.randint(0,1)
                                         if randomChoice == 1:
                                             #print("repeat count", repeatCount, gridQtemp[row1][col1], repeats[gridQtemp[row1][col1]],gridQtemp[row2][col2], repeats[gridQtemp[row2][col2]])
                                             singleGreenMove = [{'R':row1,'C':col1},{'R':row2,'C':col2}]
@@ -871,27 +879,41 @@ def findSolutionMinSwap(grid,gridQtemp,attempts=20):
 #this separation means that you could have higher numbers in the final row / column if desired
 #calcType determins what format of calculations are allowed.  Default for production games is...
 
-if mode == 'shuffle':
-    calcType = "50x4"
-else:
-    calcType = "12strictx4"
-
-perms = permutations(x=4, type=calcType,stripBoring=True)
-permsLast = permutations(x=4, type=calcType, stripBoring=True)
-
-grids = []
-gridQs = []
-gridSs = []
-
-while len(grids)<questions:
+def calcType(mode):
+    if mode == 'shuffle':
+        return("50x4")
+    else:
+        return("12strictx4")
+
+def loadPerms(calcType):
+    #allowed calculations, generated the first time they are needed in this process
+    #and kept in the artifact cache (see nerdle/cache.py) so later runs load them instead (50x4 takes ~40s to generate)
+    if calcType not in _perms:
+        with metrics.stage('candidate enumeration'):
+            _perms[calcType] = cache.cached('shufflePermutations', lambda: permutations(x=4, type=calcType,stripBoring=True),
+                                            params={'x': 4, 'type': calcType, 'stripBoring': True}, code=[permutations, evaluator])
+    return(_perms[calcType])
+
+def duplicateKey(puzzle):
+    #games with the same solved grid are the same game (see nerdle/dedupe.py)
+    return(dedupe.contentKey(puzzle['answer']))
+
+def createPuzzle(perms, permsLast, mode=mode, q=0, rng=random, seen=()):
+    #one game: {'answer': solved grid, 'question': starting grid} (plus 'solveList' of moves for swap modes), or None if not found
+    #seen: keys (see duplicateKey) of games not to repeat, checked before the question is made
+    duplicatesRequiredMin, duplicatesRequiredMax = duplicatesRequired(mode)
     #create solved game
-    print("FINDING SOLUTION", len(grids))
-    grid = create_game(perms, permsLast, minTimesDivide=2)
+    metrics.log(1, "FINDING SOLUTION", q)
+    with metrics.stage('grid fill'):
+        grid = create_game(perms, permsLast, minTimesDivide=2, rng=rng)
     if grid==[]:
-        print("no grid returned")
+        metrics.log(1, "no grid returned")
+    elif dedupe.contentKey(grid) in seen:
+        metrics.reject('duplicate puzzle')
+        metrics.log(1, "duplicate grid, try again")
     else:
-        print() 
-        print("CREATING QUESTION", len(grids))
+        metrics.log(1) 
+        metrics.log(1, "CREATING QUESTION", q)
         #check if duplicates required has been met
         numbers = [x for x in sum(grid, []) if x not in ['+','-','*','/','=',' ']]
         duplicateNumbers = -len(set(numbers))+len(numbers)
@@ -899,9 +921,10 @@ while len(grids)<questions:
             
             #for shuffle puzzles, unshuffle grid 6 times to create question
             if mode == 'shuffle':
-                gridQ = unShuffle(grid,6)
-                grids.append(grid)
-                gridQs.append(gridQ)
+                with metrics.stage('unshuffle'):
+                    gridQ = unShuffle(grid,6,rng=rng)
+                metrics.count('puzzles')
+                return({'answer': grid, 'question': gridQ})
 
             #for 2d puzzles (called 'swap' mode here), swap puzzle n times to create question
             if mode[:4] == 'swap':
@@ -915,9 +938,9 @@ while len(grids)<questions:
                     movesMinSymbols = 5
                     movesMinNumbers = 6
 
-                    movesNum = random.randint(movesMinNumbers,moves-movesMinSymbols)
+                    movesNum = rng.randint(movesMinNumbers,moves-movesMinSymbols)
                     movesSym = moves - movesNum                        
-                    print(movesNum, movesSym, movesNum+movesSym)
+                    metrics.log(2, movesNum, movesSym, movesNum+movesSym)
                 elif mode == 'swapNum':
                     #15 attempts, solvable in 10 (1-6 stars)
                     movesNum = 9
@@ -933,50 +956,99 @@ while len(grids)<questions:
                     
                     
                 else:
-                    print("invalid mode")
-                    sys.exit()
+                    raise ValueError("invalid mode "+str(mode))
                   
                 solveList1=[]
                 solveList2=[]
                 
                 #different swap functions depending on whether symbols being swapped
-                if movesNum>0: 
-                    gridQ, solveList1 = random_swap(grid,movesNum)
-                if (movesSym>0) & (grid!=[]): 
-                    gridQ, solveList2 = random_swap_sym(gridQ,movesSym)
+                with metrics.stage('swaps'):
+                    if movesNum>0: 
+                        gridQ, solveList1 = random_swap(grid,movesNum,rng=rng)
+                    if (movesSym>0) & (grid!=[]): 
+                        gridQ, solveList2 = random_swap_sym(gridQ,movesSym,rng=rng)
 
                 if gridQ==[]:
-                    print("rejecting grid as question cannot be created")
+                    metrics.reject('question cannot be created')
+                    metrics.log(1, "rejecting grid as question cannot be created")
                 else:
-                    solution = findSolutionMinSwap(grid,gridQ)
+                    with metrics.stage('min solve'):
+                        solution = findSolutionMinSwap(grid,gridQ,rng=rng)
                     if len(solution)==moves:
-                        print("minSolve success")
+                        metrics.log(2, "minSolve success")
                     else:
-                        print("minSolve fail")
-                        print("target moves" ,moves, "actual solve", len(solution))
-                        sys.exit()
+                        raise RuntimeError("minSolve fail: target moves %d, actual solve %d, grid %s, gridQ %s" % (moves, len(solution), grid, gridQ))
 
                     solveList = solveList1+solveList2
-                    grids.append(grid)
-                    gridQs.append(gridQ)
-                    gridSs.append(solveList)
+                    metrics.count('puzzles')
+                    return({'answer': grid, 'question': gridQ, 'solveList': solveList})
                 
         else:
-            print("duplicates required not matched, try again")
-
-    print()
-    print("******************GRIDS FOUND SO FAR:",len(grids))
-    print()
-    print()
-    print()
-    
-#save files
-
-with open("output/"+fileStem+'_A.json', 'w') as f:
-    json.dump(grids, f)
-with open("output/"+fileStem+'_Q.json', 'w') as f:
-    json.dump(gridQs, f)
-with open("output/"+fileStem+'_S.json', 'w') as f:
-    json.dump(gridSs, f)
-
-
+            metrics.reject('duplicates required not matched')
+            metrics.log(1, "duplicates required not matched, try again")
+
+    return(None)
+
+def seededPuzzle(index, batchId, mode=mode, seen=()):
+    #puzzle number index of batch batchId, the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    #seen: published keys not to repeat (see nerdle/dedupe.py)
+    perms = loadPerms(calcType(mode))
+    rng = seeding.puzzleRng('shuffleNumbers-'+mode, batchId, index)
+    puzzle = None
+    while puzzle is None:
+        puzzle = createPuzzle(perms, perms, mode, index, rng, seen)
+    return(puzzle)
+
+def generate(count=questions, mode=mode, seed=None, batchId=None, sink=None, seen=None):
+    #count games (see createPuzzle) for a mode (see setting params)
+    #batchId: if given, each game is seeded from its index instead (see seededPuzzle)
+    #sink: JsonlSink (see nerdle/sink.py) - games already in it are kept (resume) and each new one is appended
+    #seen: keys of games not to repeat, eg dedupe.loadIndex('shuffleNumbers-'+mode) for those already published (see nerdle/dedupe.py)
+    #   without a batchId, games made earlier in this run are not repeated either
+    rng = random.Random(seed)
+    perms = loadPerms(calcType(mode))
+    permsLast = loadPerms(calcType(mode))
+
+    puzzles = [] if sink is None else sink.records()
+    keys = set(seen or ())|set([duplicateKey(p) for p in puzzles])
+    while len(puzzles)<count:
+        if batchId is None:
+            puzzle = quarantine.isolate('shuffleNumbers', lambda: createPuzzle(perms, permsLast, mode, len(puzzles), rng, keys),
+                                        quarantine.rngInputs(rng, seed=seed, mode=mode, puzzle=len(puzzles)))
+        else:
+            puzzle = quarantine.seeded('shuffleNumbers', lambda i, b: seededPuzzle(i, b, mode, seen or ()), len(puzzles), batchId, {'mode': mode})
+        if puzzle is not None:
+            puzzles+=[puzzle]
+            keys.add(duplicateKey(puzzle))
+            if sink is not None:
+                sink.append(puzzle)
+
+        metrics.log(1)
+        metrics.log(1, "******************GRIDS FOUND SO FAR:",len(puzzles))
+        metrics.log(1)
+        metrics.log(1)
+        metrics.log(1)
+    return(puzzles)
+
+def savePuzzles(puzzles, fileStem=fileStem, outputDir=None):
+    #save files
+    path = os.path.join(outputDir or os.path.join(HERE, 'output'), fileStem)
+    with open(path+'_A.json', 'w') as f:
+        json.dump([p['answer'] for p in puzzles], f)
+    with open(path+'_Q.json', 'w') as f:
+        json.dump([p['question'] for p in puzzles], f)
+    with open(path+'_S.json', 'w') as f:
+        json.dump([p['solveList'] for p in puzzles if 'solveList' in p], f)
+
+
+if __name__ == '__main__':
+    #games are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', fileStem+'.jsonl'), header={'game': 'shuffleNumbers', 'mode': mode, 'count': questions})
+    #games published by earlier runs are not repeated
+    published = dedupe.loadIndex('shuffleNumbers-'+mode)
+    puzzles = generate(questions, mode, sink=sink, seen=published)
+    savePuzzles(puzzles)
+    published.addAll([duplicateKey(p) for p in puzzles])
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(os.path.join(HERE, 'output', fileStem+'_metrics.json'), game='shuffleNumbers', mode=mode, count=questions)
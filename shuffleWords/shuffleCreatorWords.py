@@ -11,6 +11,7 @@ File inputs:
 Algorithm step 1 - generate solved puzzles exhaustively:
     - Generate a magic square by selecting random starting word and then attempting to fit other words
     - There are not that many possible magic words so it makes sense to generate an exhaustive list by iterating through the word list and generating a magic square by attempting to fit other words until valid solution found
+    - Rows are fitted against a prefix DAWG of the word list (see nerdle/dawg.py), so each column's letters so far must start a word
     - File output = 'allMagicSqWords_dedupesNew.json' - currently 1006 solutions
     
 Algorithm step 2 - generate question from solved puzzle:
@@ -22,13 +23,19 @@ File output:
     - [fileStem]_[number_of_puzzles]_A.json - solved puzzles
     - [fileStem]_[number_of_puzzles]_Q.json - starting questions
     - [fileStem]_[number_of_puzzles]_Moves.json - move sequence to solve (not required for game)
+
+Usage:
+    - script: set params below and run from this folder
+    - library (nothing runs on import):
+        from shuffleWords import shuffleCreatorWords
+        puzzles = shuffleCreatorWords.generate(count=20, seed=1)
+        puzzles = shuffleCreatorWords.generate(count=20, batchId='2024-06')  #puzzle i seeded on its own (see nerdle/seeding.py)
+        puzzles = shuffleCreatorWords.generate(count=20, seed=1, seen=dedupe.loadIndex('shuffleWords'))  #no repeats of published games (see nerdle/dedupe.py)
     
 """
 
 from collections import Counter
 import random
-import pandas as pd
-import cv2
 import numpy as np
 import os
 import datetime
@@ -37,7 +44,15 @@ import ast
 import json  
 import sys
 
-# setting params
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import dawg, dedupe, metrics, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#folder holding this script (input / output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# setting params (defaults for generate)
 
 #number of games to be created
 questions = 10
@@ -47,8 +62,10 @@ fileStem = filePrefix + '_'+str(questions)
 
 
 def permutations(lngth=5):  
+    import pandas as pd #only required to regenerate the magic squares
+
     #start with original 2309 words
-    di = pd.read_csv('input/5letterOriginals.txt') #2309 words
+    di = pd.read_csv(os.path.join(HERE, 'input', '5letterOriginals.txt')) #2309 words
     di.words = di.words.apply(lambda x: x.upper())
     
     
@@ -84,7 +101,7 @@ def permutations(lngth=5):
            di = di.append(pd.Series({'words':word}),ignore_index=True)
     
     #filter out words with different british/american english spelling
-    with open('input/british-american-words.txt') as fin:
+    with open(os.path.join(HERE, 'input', 'british-american-words.txt')) as fin:
         brit_am=fin.readlines()
     
     brit_am_list = [x.replace("\n","").split(" ") for x in brit_am]
@@ -94,91 +111,73 @@ def permutations(lngth=5):
     
     return(perms)
 
-def next_letters(words):
-   allCombos = []
-   allCombos+=(list(set([x[0:2] for x in words])))
-   allCombos+=(list(set([x[0:3] for x in words])))
-   allCombos+=(list(set([x[0:4] for x in words])))
-   return(allCombos)
-    
+def fitRows(d, codes, candidates, columns):
+    #candidates (indices of words) whose letters in columns 1-4 continue each column's prefix, and the columns' next nodes
+    nodes = np.stack([d.step(columns[j], codes[candidates, j+1]) for j in range(4)], axis=1)
+    fits = (nodes>=0).all(axis=1)
+    return(candidates[fits], nodes[fits])
+
 def create_all_games(perms, target, start, end):    
 
     words = perms.words.values
     #random.shuffle(words)    
     
-    #get all word stems
-    allCombos=next_letters(words)
-    allCombos2=[x for x in allCombos if len(x)==2]
-    allCombos3=[x for x in allCombos if len(x)==3]
-    allCombos4=[x for x in allCombos if len(x)==4]
-    allCombos5=words
+    #prefix DAWG of the words: each column is a node, and a row fits if every column can be continued by its letter
+    d = dawg.Dawg(dawg.buildTables(list(words)))
+    codes = np.stack([d.codes(w) for w in words]) if len(words) else np.zeros((0, 5), dtype=np.int64)
+    byFirst = {}
+    for i, w in enumerate(words):
+        byFirst.setdefault(w[0], []).append(i)
+    byFirst = {c: np.array(ids, dtype=np.int64) for c, ids in byFirst.items()}
+    noRows = np.zeros(0, dtype=np.int64)
     
     (r0,r1,r2,r3,r4)=("","","","","")
     magicSquares = []
     counter=0
-    print("start.end",start,end)
+    metrics.log(2, "start.end",start,end)
     for i, r0 in enumerate(words[start:end]):
-        print('row0',i, r0)
+        metrics.log(2, 'row0',i, r0)
         foundThisWords=0 
         found=False 
         possibleC0 = [x for x in words if (x[0]==r0[0]) & (x not in [r0])]  #exclude r0/c0 same
         #possibleC0 = [x for x in possibleC0 if x>r0] #only check where c0>r0 as can transpose later        
+        columns0 = [d.child(0, c) for c in r0[1:]]
         for c0 in possibleC0:
             if found:
                 break
-            #all words starting with column 0
-            possibleR1 = [x for x in words if (x[0]==c0[1])]
-            #then filter out impossible columns
-            possibleR1 = [x for x in possibleR1 if r0[1]+x[1] in allCombos2] 
-            possibleR1 = [x for x in possibleR1 if r0[2]+x[2] in allCombos2] 
-            possibleR1 = [x for x in possibleR1 if r0[3]+x[3] in allCombos2] 
-            possibleR1 = [x for x in possibleR1 if r0[4]+x[4] in allCombos2] 
-
-            for r1 in possibleR1:
+            #all words starting with column 0, then filter out impossible columns
+            possibleR1, columns1 = fitRows(d, codes, byFirst.get(c0[1], noRows), columns0)
+
+            for r1, col1 in zip(possibleR1, columns1):
                 if found:
                     break
-                #all words starting with column 0
-                possibleR2 = [x for x in words if (x[0]==c0[2])] 
-                #then filter out impossible columns
-                possibleR2 = [x for x in possibleR2 if r0[1]+r1[1]+x[1] in allCombos3] 
-                possibleR2 = [x for x in possibleR2 if r0[2]+r1[2]+x[2] in allCombos3] 
-                possibleR2 = [x for x in possibleR2 if r0[3]+r1[3]+x[3] in allCombos3] 
-                possibleR2 = [x for x in possibleR2 if r0[4]+r1[4]+x[4] in allCombos3] 
+                #all words starting with column 0, then filter out impossible columns
+                possibleR2, columns2 = fitRows(d, codes, byFirst.get(c0[2], noRows), col1)
         
-                for r2 in possibleR2:
+                for r2, col2 in zip(possibleR2, columns2):
                     if found:
                         break
-                    #all words starting with column 0
-                    possibleR3 = [x for x in words if (x[0]==c0[3])] 
-                    #then filter out impossible columns
-                    possibleR3 = [x for x in possibleR3 if r0[1]+r1[1]+r2[1]+x[1] in allCombos4] 
-                    possibleR3 = [x for x in possibleR3 if r0[2]+r1[2]+r2[2]+x[2] in allCombos4] 
-                    possibleR3 = [x for x in possibleR3 if r0[3]+r1[3]+r2[3]+x[3] in allCombos4] 
-                    possibleR3 = [x for x in possibleR3 if r0[4]+r1[4]+r2[4]+x[4] in allCombos4] 
+                    #all words starting with column 0, then filter out impossible columns
+                    possibleR3, columns3 = fitRows(d, codes, byFirst.get(c0[3], noRows), col2)
     
-                    for r3 in possibleR3:
+                    for r3, col3 in zip(possibleR3, columns3):
                         if found:
                             break
                         counter+=1
                         if counter%1000==0:
-                            print(counter, r0,r1,r2,r3)
-                        #all words starting with column 0
-                        possibleR4 = [x for x in words if (x[0]==c0[4])] 
-                        #then filter out impossible columns
-                        possibleR4 = [x for x in possibleR4 if (r0[1]+r1[1]+r2[1]+r3[1]+x[1] in allCombos5)] 
-                        possibleR4 = [x for x in possibleR4 if (r0[2]+r1[2]+r2[2]+r3[2]+x[2] in allCombos5)] 
-                        possibleR4 = [x for x in possibleR4 if (r0[3]+r1[3]+r2[3]+r3[3]+x[3] in allCombos5)] 
-                        possibleR4 = [x for x in possibleR4 if (r0[4]+r1[4]+r2[4]+r3[4]+x[4] in allCombos5)] 
+                            metrics.log(2, counter, r0,words[r1],words[r2],words[r3])
+                        #all words starting with column 0, then filter out impossible columns (every column now a word)
+                        possibleR4, _ = fitRows(d, codes, byFirst.get(c0[4], noRows), col3)
 
                         if len(possibleR4)>0:
                             for r4 in possibleR4:
-                                magicSquares.append([r0,r1,r2,r3,r4])
-                            print(r0)
-                            print(r1)
-                            print(r2)
-                            print(r3)
-                            print(r4)
-                            print(len(magicSquares))
+                                magicSquares.append([r0,words[r1],words[r2],words[r3],words[r4]])
+                            metrics.log(2, r0)
+                            metrics.log(2, words[r1])
+                            metrics.log(2, words[r2])
+                            metrics.log(2, words[r3])
+                            metrics.log(2, words[r4])
+                            metrics.log(2, len(magicSquares))
                             r4=""
                             foundThisWords+=1
                             #max n magic squares per starting column
@@ -214,14 +213,14 @@ def encode_grid(gridQ,grid):
                 
         print()
         
-def random_swap(grid,n):
+def random_swap(grid,n,rng=random):
     gridQ = [g.copy() for g in grid] 
     
     for i in range(n):
         same=True
         while same==True:
-            a = [random.randint(0,3)*2,random.randint(0,3)*2]
-            b = [random.randint(0,3)*2,random.randint(0,3)*2]
+            a = [rng.randint(0,3)*2,rng.randint(0,3)*2]
+            b = [rng.randint(0,3)*2,rng.randint(0,3)*2]
             same = (a==b or grid[a[0]][a[1]]==grid[b[0]][b[1]])
     
         buffer = gridQ[a[0]][a[1]]
@@ -305,14 +304,14 @@ def shuffleMulti(gridQ,grid,instructionList):
         gridNew = shuffle([g.copy() for g in gridNew],grid,instruction)
     return gridNew
 
-def unShuff(line,lineTrue, right=True):
+def unShuff(line,lineTrue, right=True, rng=random):
     
     counter=0
     changed=False
     while changed==False:
         lineSame = [line[x]==lineTrue[x] for x in range(len(line))]
         #line fix = which greens to hold in place (always hold symbols): 1 for yes, 0 for no, -1 for not green
-        lineFix = [random.randint(0,1) if lineSame[x] else -1 for x in range(len(line))]
+        lineFix = [rng.randint(0,1) if lineSame[x] else -1 for x in range(len(line))]
         #print(lineFix) 
         if lineFix.count(0) + lineFix.count(-1) <= 1:
             pass
@@ -334,11 +333,11 @@ def unShuff(line,lineTrue, right=True):
             changed = (line!=lineNew)
         counter+=1
         if counter>1000:
-            print("give up")
+            metrics.log(2, "give up")
             return line #give up and try new line
     return lineNew                                       
 
-def unShuffle(grid,n):
+def unShuffle(grid,n,rng=random):
     gridQ = [g.copy() for g in grid] 
     moves=[]
     for i in range(n):
@@ -350,29 +349,28 @@ def unShuffle(grid,n):
             gridTemp = [g.copy() for g in gridQ]
 
             #choose row (0) or column (1)
-            choice = random.randint(0,1)
+            choice = rng.randint(0,1)
             #row shuffle
             if choice == 0:
                 #choose row
-                choice2 = random.randint(0,int(len(grid))-1)
-                choice3 = random.randint(0,1) #0 right, 1 left
-                gridTemp[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0))
+                choice2 = rng.randint(0,int(len(grid))-1)
+                choice3 = rng.randint(0,1) #0 right, 1 left
+                gridTemp[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0),rng=rng)
     
             #col shuffle
             if choice == 1:
                 #choose column
-                choice2 = random.randint(0,int(len(grid))-1)
-                choice3 = random.randint(0,1) #0 right (down), 1 left (up)
+                choice2 = rng.randint(0,int(len(grid))-1)
+                choice3 = rng.randint(0,1) #0 right (down), 1 left (up)
                 column = [row.copy()[choice2] for row in grid]
                 columnQ = [row.copy()[choice2] for row in gridTemp]
-                columnQNew = unShuff(columnQ,column,right=(choice3==0))
+                columnQNew = unShuff(columnQ,column,right=(choice3==0),rng=rng)
                 for r in range(len(gridQ)):
                     gridTemp[r][choice2]=columnQNew[r] 
 
             attempts+=1
             if attempts>1000:
-                print("GIVE UP") 
-                sys.exit()
+                raise RuntimeError("GIVE UP")
 
             if gridTemp != gridQ:
                 criteria=True
@@ -381,36 +379,36 @@ def unShuffle(grid,n):
                     for y in range(len(grid[0])):
                         if (grid[x][y]==gridTemp[x][y]) & (grid[x][y]!=gridQ[x][y]):
                             criteria=False
-                            print('rejecting green creator', x, y)
+                            metrics.log(2, 'rejecting green creator', x, y)
                 
         gridQ=gridTemp.copy()
         text1 = "R" if choice==0 else "C"
         text2 = "R" if choice3==0 else "L"
-        print("Choice:", text1+str(choice2)+text2)
+        metrics.log(2, "Choice:", text1+str(choice2)+text2)
         #print(gridQ)
         moves.append(text1+str(choice2)+text2)
     return(gridQ, moves)
 
-def unShuffleMoves(grid,move):
+def unShuffleMoves(grid,move,rng=random):
     gridQ = [g.copy() for g in grid] 
     choice = 0 if move[0][0]=="R" else 1
     choice2 = int(move[0][1])
     choice3 = 0 if move[0][2]=="R" else 1
     #row shuffle
     if choice == 0:
-        gridQ[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0))
-        print("row shuffle", choice2, gridQ[choice2])
+        gridQ[choice2] = unShuff(gridQ[choice2],grid[choice2],right=(choice3==0),rng=rng)
+        metrics.log(2, "row shuffle", choice2, gridQ[choice2])
     #col shuffle
     if choice == 1:
         #choose column
         column = [row.copy()[choice2] for row in grid]
         columnQ = [row.copy()[choice2] for row in gridQ]
-        columnQNew = unShuff(columnQ,column,right=(choice3==0))
+        columnQNew = unShuff(columnQ,column,right=(choice3==0),rng=rng)
         for r in range(len(gridQ)):
             gridQ[r][choice2]=columnQNew[r] 
-        print("col shuffle", choice2, columnQNew)
+        metrics.log(2, "col shuffle", choice2, columnQNew)
 
-    print(gridQ)
+    metrics.log(2, gridQ)
 
     return(gridQ)
 
@@ -428,19 +426,19 @@ def findSolutionAnyUnder5(grid,gridQ):
     minSolution=''
     for j, goList in enumerate(allGoPerms):
         if j%50000==0:
-            print(j) 
+            metrics.log(2, j) 
         tempGrid = [g.copy() for g in gridQ] 
         for i in range(len(goList)):
             go = goList[i]
             tempGrid = shuffle(tempGrid,grid,go)
             if tempGrid==grid:
                 if i+1<minSolved:
-                    print('solved in ',i+1, "with goes:", goList[:i+1])
+                    metrics.log(2, 'solved in ',i+1, "with goes:", goList[:i+1])
                     minSolved=i+1
                     minSolution=goList[:i+1]
                     return(minSolved, goList[:i+1])
                     
-    print('finished')
+    metrics.log(2, 'finished')
 
     return(minSolved, minSolution)
 
@@ -458,40 +456,40 @@ def findSolutionMin(grid,gridQ):
     minSolution=''
     for j, goList in enumerate(allGoPerms):
         if j%50000==0:
-            print(j, "trying:",goList) 
+            metrics.log(2, j, "trying:",goList) 
         tempGrid = [g.copy() for g in gridQ] 
         for i in range(len(goList)):
             go = goList[i]
             tempGrid = shuffle(tempGrid,grid,go)
             if tempGrid==grid:
                 if i+1<minSolved:
-                    print('solved in ',i+1, "with goes:", goList[:i+1])
+                    metrics.log(2, 'solved in ',i+1, "with goes:", goList[:i+1])
                     minSolved=i+1
                     minSolution=goList[:i+1]
                     if minSolved==1:
-                        print(minSolved, goList[:i+1])
-                        sys.exit()
-                        #return(minSolved, goList[:i+1])
-    print('finished')
+                        #nothing is shorter
+                        metrics.log(2, minSolved, goList[:i+1])
+                        return(minSolved, goList[:i+1])
+    metrics.log(2, 'finished')
 
     return(minSolved, minSolution)
 
 #####CORE FILE CREATOR SCRIPTS START HERE
 
-#find all magic squares (answers only, not questions).  Note: 150 found.
-x = input("regenerate list of all possible magic squares? (Y or y for yes, anything else for no)") 
-if x.lower()=="y":
+def regenerateMagicSquares():
+    #find all magic squares (answers only, not questions).  Note: 150 found.
     perms = permutations(lngth=5)
     print('word list length:', len(perms))
     all_grids = [] 
     for n in range(0,len(perms),10):
         m = min(n+10,len(perms))
-        print("magic squares for words:",n,m)
-        all_grids_chunk = create_all_games(perms, 9999, n, m)
+        metrics.log(1, "magic squares for words:",n,m)
+        with metrics.stage('grid fill'):
+            all_grids_chunk = create_all_games(perms, 9999, n, m)
         all_grids = all_grids+all_grids_chunk
     all_gridsX=[[[*y] for y in x] for x in all_grids] #separate words into lists of letters
 
-    with open('allMagicSqWords.json', 'w') as f:
+    with open(os.path.join(HERE, 'allMagicSqWords.json'), 'w') as f:
         json.dump(all_gridsX, f)    
     
     #filter out grids which have repeats or undesired words
@@ -522,48 +520,51 @@ if x.lower()=="y":
     
     new_all_grids=[[[*y] for y in x] for x in new_all_grids] #separate words into lists of letters
     
-    with open('input/allMagicSqWords_dedupesNew.json', 'w') as f:
-        json.dump(new_all_grids, f)    
-
-#from list of answers, randomise and repeat to desired length
-with open('input/allMagicSqWords_dedupesNew.json', 'r') as f:
-    grids=json.load(f)         
-   
-#loop 3 times to get 3000 puzzles
-gridsCum = [] 
-
-repeats = int(np.ceil(questions/len(grids)))
-for j in range(repeats):
-    #random sort   
-    random.shuffle(grids)
-    gridsCum += grids
-#cut to desired length
-gridsCum = gridsCum[0:questions]
-    
-with open(fileStem+'_A.json', 'w') as f:
-    json.dump(gridsCum, f)    
-        
-#from list of answers of desired length, create a batch of questions  
-grids=gridsCum         
-    
-#shuffle until conditions met
-gridQs=[]
-gridMoves=[]
-nonGreensList=[]
-num=6
-start=0
-for i,grid in enumerate(grids[start:]):
-    print(i, "of", len(grids))
+    with open(os.path.join(HERE, 'input', 'allMagicSqWords_dedupesNew.json'), 'w') as f:
+        json.dump(new_all_grids, f)
+
+    return(new_all_grids)
+
+def loadAnswers():
+    #list of all magic squares, from regenerateMagicSquares
+    with metrics.stage('lexicon load'):
+        with open(os.path.join(HERE, 'input', 'allMagicSqWords_dedupesNew.json'), 'r') as f:
+            return(json.load(f))
+
+def chooseAnswers(grids, questions=questions, rng=random):
+    #from list of answers, randomise and repeat to desired length
+    grids = grids.copy()
+
+    #loop 3 times to get 3000 puzzles
+    gridsCum = [] 
+
+    repeats = int(np.ceil(questions/len(grids)))
+    for j in range(repeats):
+        #random sort   
+        rng.shuffle(grids)
+        gridsCum += grids
+    #cut to desired length
+    gridsCum = gridsCum[0:questions]
+    return(gridsCum)
+
+def duplicateKey(puzzle):
+    #answers repeat by design, so games are the same only if the starting grid is too (see nerdle/dedupe.py)
+    return(dedupe.contentKey([puzzle['answer'], puzzle['question']]))
+
+def createQuestion(grid, i=0, num=6, rng=random, seen=()):
+    #shuffle (num moves) until conditions met -> (starting grid, moves)
+    #seen: keys (see duplicateKey) of games not to repeat, checked before the min solve
     criteria = False
     while criteria == False:
-        for loop in range(100):
-            gridQ,moves = unShuffle(grid,num)
+        metrics.count('question attempts')
+        with metrics.stage('unshuffle'):
+            for loop in range(100):
+                gridQ,moves = unShuffle(grid,num,rng=rng)
             
-            #check solution works with moves
-            gridCheck = shuffleMulti(gridQ,grid,moves[::-1])
-            if gridCheck != grid:
-                print("mismatch error")
-                sys.exit()
+                #check solution works with moves
+                gridCheck = shuffleMulti(gridQ,grid,moves[::-1])
+                if gridCheck != grid:
+                    raise RuntimeError("mismatch error")
         #filter out grids with less than 10 nonGreens
         minimumNonGreens = 12
         maximumNonGreens = 20
@@ -573,37 +574,97 @@ for i,grid in enumerate(grids[start:]):
             for y in range(len(grid[0])):
                 if grid[x][y]!=gridQ[x][y]:
                     nonGreens.append(grid[x][y])
-        encode_grid(gridQ,grid) 
-        print(len(nonGreens))
-        if (len(nonGreens)>=minimumNonGreens) & (len(nonGreens)<=maximumNonGreens):
-            print("non greens ok:", len(nonGreens))
+        if metrics.verbosity>=2:
+            encode_grid(gridQ,grid) 
+        metrics.log(2, len(nonGreens))
+        if dedupe.contentKey([grid, gridQ]) in seen:
+            metrics.reject('duplicate puzzle')
+            metrics.log(2, "rejecting as duplicate game")
+        elif (len(nonGreens)>=minimumNonGreens) & (len(nonGreens)<=maximumNonGreens):
+            metrics.log(2, "non greens ok:", len(nonGreens))
             #filter out grids which are solvable in less than 5 moves
-            solutionAny = findSolutionAnyUnder5(grid, gridQ)
-            print(i,solutionAny)
+            with metrics.stage('min solve'):
+                solutionAny = findSolutionAnyUnder5(grid, gridQ)
+            metrics.log(2, i,solutionAny)
             if solutionAny[0]==99:
-                print("question can only be solved in >5")
+                metrics.log(2, "question can only be solved in >5")
                 criteria=True
-                gridQs.append(gridQ)
-                gridMoves.append(moves)
-                nonGreensList.append(len(nonGreens))
             else:
-                print("rejecting as can be solved in 5")
+                metrics.reject('solvable in 5 or fewer moves')
+                metrics.log(2, "rejecting as can be solved in 5")
+        else:
+            metrics.reject('wrong number of non greens')
 
         if criteria==False:
-            print("re-retry shuffle, grid #",i)
-
-    '''
-    #save every 50 grids if required    
-    if (i%50 == 0) or (i==len(grids)-start-1):
-        with open(fileStem+'_Q.json'.replace("_Q","_Q"+str(start)+'_'+str(i)), 'w') as f:
-            json.dump(gridQs, f)        
-        with open(fileStem+'_Moves.json'.replace("_Moves","_Moves"+str(start)+'_'+str(i)), 'w') as f:
-            json.dump(gridMoves, f)        
-    '''
-            
-with open('output/'+fileStem+'_Q.json', 'w') as f:
-    json.dump(gridQs, f)        
-
-with open('output/'+fileStem+'_Moves.json', 'w') as f:
-    json.dump(gridMoves, f)        
+            metrics.log(2, "re-retry shuffle, grid #",i)
+    metrics.count('puzzles')
+    return(gridQ, moves)
 
+def seededPuzzle(index, batchId, grids=None, seen=()):
+    #puzzle number index of batch batchId, the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    #answers are chosen for the whole batch with one seed, so (as with generate) no answer repeats until all have been used
+    #seen: published keys not to repeat (see nerdle/dedupe.py)
+    grids = loadAnswers() if grids is None else grids
+    grid = chooseAnswers(grids, index+1, seeding.stepRng('shuffleWords', batchId, 'answers'))[index]
+    gridQ, moves = createQuestion(grid, index, rng=seeding.puzzleRng('shuffleWords', batchId, index), seen=seen)
+    return({'answer': grid, 'question': gridQ, 'moves': moves})
+
+def generate(count=questions, seed=None, grids=None, batchId=None, sink=None, seen=None):
+    #count games: {'answer': solved grid, 'question': starting grid, 'moves': moves}
+    #grids: magic squares to choose answers from (default loadAnswers())
+    #batchId: if given, each game is seeded from its index instead (see seededPuzzle)
+    #sink: JsonlSink (see nerdle/sink.py) - games already in it are kept (resume) and each new one is appended
+    #seen: keys of games not to repeat, eg dedupe.loadIndex('shuffleWords') for those already published (see nerdle/dedupe.py)
+    #   without a batchId, games made earlier in this run are not repeated either
+    grids = loadAnswers() if grids is None else grids
+    puzzles = [] if sink is None else sink.records()
+    if batchId is not None:
+        for i in range(len(puzzles), count):
+            puzzles+=[quarantine.seeded('shuffleWords', lambda index, b: seededPuzzle(index, b, grids, seen or ()), i, batchId)]
+            if sink is not None:
+                sink.append(puzzles[-1])
+        return(puzzles)
+    rng = random.Random(seed)
+    
+    #from list of answers of desired length, create a batch of questions  
+    grids = chooseAnswers(grids, count, rng)
+    keys = set(seen or ())|set([duplicateKey(p) for p in puzzles])
+    for i,grid in enumerate(grids):
+        if i<len(puzzles):
+            continue
+        metrics.log(1, i, "of", len(grids))
+        gridQ, moves = quarantine.retried('shuffleWords', lambda: createQuestion(grid, i, rng=rng, seen=keys), {'seed': seed, 'puzzle': i}, rng)
+        puzzles+=[{'answer': grid, 'question': gridQ, 'moves': moves}]
+        keys.add(duplicateKey(puzzles[-1]))
+        if sink is not None:
+            sink.append(puzzles[-1])
+    return(puzzles)
+
+def savePuzzles(puzzles, fileStem=fileStem, outputDir=None):
+    #answers are saved next to this script (or in outputDir if given)
+    with open(os.path.join(outputDir or HERE, fileStem+'_A.json'), 'w') as f:
+        json.dump([p['answer'] for p in puzzles], f)    
+
+    path = os.path.join(outputDir or os.path.join(HERE, 'output'), fileStem)
+    with open(path+'_Q.json', 'w') as f:
+        json.dump([p['question'] for p in puzzles], f)        
+
+    with open(path+'_Moves.json', 'w') as f:
+        json.dump([p['moves'] for p in puzzles], f)        
+
+
+if __name__ == '__main__':
+    x = input("regenerate list of all possible magic squares? (Y or y for yes, anything else for no)") 
+    if x.lower()=="y":
+        regenerateMagicSquares()
+
+    #games are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', fileStem+'.jsonl'), header={'game': 'shuffleWords', 'count': questions})
+    #games published by earlier runs are not repeated
+    published = dedupe.loadIndex('shuffleWords')
+    puzzles = generate(questions, sink=sink, seen=published)
+    savePuzzles(puzzles)
+    published.addAll([duplicateKey(p) for p in puzzles])
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(os.path.join(HERE, 'output', fileStem+'_metrics.json'), game='shuffleWords', count=questions)
@@ -16,6 +16,15 @@ File output:
     - targets_questions.json - keyboard numbers used for each game
     - targets_calculations.json - solutions that achieve target from keyboard numbers
     - targets_solutions.json - targets for each game, in order of increasing complexity
+
+Usage:
+    - script: set params below and run from this folder
+    - library (nothing runs on import):
+        from targets import targets_generator as targets
+        puzzles = targets.generate(count=20, seed=1)
+        puzzles = targets.generate(count=20, batchId='2024-06')  #puzzle i seeded on its own (see nerdle/seeding.py)
+        puzzle = targets.seededPuzzle(17, '2024-06')              #puzzle 17 of that batch again
+        puzzles = targets.generate(count=20, seed=1, seen=dedupe.loadIndex('targets'))  #no repeats of published games (see nerdle/dedupe.py)
     
 """
 
@@ -23,9 +32,18 @@ import numpy as np
 import random
 import json
 import sys
+import os
 from itertools import combinations, permutations, product
 
-# setting params
+#shared nerdle modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from nerdle import dedupe, evaluator, metrics, quarantine, seeding
+from nerdle.sink import JsonlSink
+
+#folder holding this script (output paths are relative to it)
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# setting params (defaults for generate)
 targetQs = 10 #number of games to produce
 
 numberListBottom = [1,2,3,4,5,6,7,8,9,10,11,12] #possible small numbers to use
@@ -55,11 +73,12 @@ def combine(dig, sym):
     return(calc)
 
 def calcLeftToRight(calc):
-    miniCalc = calc[0] 
+    #running total, applying each symbol in turn (ignoring precedence)
+    #targets use the game's (double precision) arithmetic throughout so that every answer can be entered in the game
+    value = evaluator.evaluate(calc[0], exact=False)
     for i in range(1,len(calc),2):
-        miniCalc+=calc[i]+calc[i+1]
-        miniCalc=str(eval(miniCalc))
-    return(eval(miniCalc))
+        value = evaluator.applyOperator(value, calc[i], evaluator.evaluate(calc[i+1], exact=False), exact=False)
+    return(value)
 
 def createDisallowed(question,n):
     
@@ -86,15 +105,15 @@ def stripBrackets(calculation):
     nBrackets = len(calculation)-len(calculation.replace("(",""))
     newCalc = calculation
     for n in range(nBrackets,0,-1):
-        print(n)
+        metrics.log(2, n)
         tempCalc = replace_nth(replace_nth(newCalc, "(", "", n),")","",n)
-        print(tempCalc)
-        if (eval(tempCalc)==eval(calculation)):
+        metrics.log(2, tempCalc)
+        if (evaluator.evaluate(tempCalc, exact=False)==evaluator.evaluate(calculation, exact=False)):
             newCalc=tempCalc
     return(newCalc)
 
 def minCalc(calculation):
-    ans = eval(calculation)
+    ans = evaluator.evaluate(calculation, exact=False)
     calcn = calculation
     for s in '+-*/()':
         calcn = calcn.replace(s,"|")
@@ -160,7 +179,7 @@ def minCalc(calculation):
     minLength=99
     for i,c in enumerate(calcList):
         try:
-          ev = eval("".join(c))  
+          ev = evaluator.evaluate("".join(c), exact=False)  
           clc="".join(c)
           if (ev==ans) & (len(clc)<minLength): 
               #print(clc,ev, len(clc))
@@ -181,7 +200,7 @@ def minCalcOrdered(calculation):
     symbolsLong +=  [")+",")-",")/",")*"]
     symbolsLong +=  [")+(",")-(",")/(",")*("]
 
-    ans = eval(calculation)
+    ans = evaluator.evaluate(calculation, exact=False)
     calcn = calculation
     for s in '+-*/()':
         calcn = calcn.replace(s,"|")
@@ -210,7 +229,7 @@ def minCalcOrdered(calculation):
     minLength=99
     for i,c in enumerate(calcList):
         try:
-          ev = eval("".join(c))  
+          ev = evaluator.evaluate("".join(c), exact=False)  
           clc="".join(c)
           if (ev==ans) & (len(clc)<minLength): 
               #print(clc,ev, len(clc))
@@ -224,36 +243,38 @@ def minCalcOrdered(calculation):
 
     return(minCalc)        
     
-questionList = []
-solutionList = []
-calculationList = []
+def duplicateKey(puzzle):
+    #games with the same keyboard numbers and targets are the same game (see nerdle/dedupe.py)
+    return(dedupe.contentKey([puzzle['question'], puzzle['solutions']]))
 
-while len(solutionList)<targetQs:
+def createPuzzle(q=0, rng=random, seen=()):
+    #one game: {'question': keyboard numbers, 'calculations': solutions, 'solutions': targets}, or None if targets not found
+    #seen: keys (see duplicateKey) of games not to repeat
     #determine number list first
-    q=len(solutionList) 
     #generate question
-    question = random.sample(numberListBottom, k=nFromBottom)  #without replacement
-    question += random.choices(numberListTop, k=nFromTop)  #with replacement
+    question = rng.sample(numberListBottom, k=nFromBottom)  #without replacement
+    question += rng.choices(numberListTop, k=nFromTop)  #with replacement
     question.sort()
     
     questionRandom = question.copy() 
 
     #disallowed list = numbers that can be generated with fewer questions    
-    disallowed = {}
-    disallowed[1] = question.copy() 
-    disallowed[2] = list(set(createDisallowed(question,2)+disallowed[1]))
-    disallowed[3] = list(set(createDisallowed(question,3)+disallowed[2]))
-    disallowed[4] = list(set(createDisallowed(question,4)+disallowed[3]))
-    disallowed[5] = list(set(createDisallowed(question,5)+disallowed[4]))
+    with metrics.stage('disallowed targets'):
+        disallowed = {}
+        disallowed[1] = question.copy() 
+        disallowed[2] = list(set(createDisallowed(question,2)+disallowed[1]))
+        disallowed[3] = list(set(createDisallowed(question,3)+disallowed[2]))
+        disallowed[4] = list(set(createDisallowed(question,4)+disallowed[3]))
+        disallowed[5] = list(set(createDisallowed(question,5)+disallowed[4]))
     
     
     #generate possible answers defined by nGroupsInAnswer
     calculations = []
     calcGroups = []
     evaluations = []
-    print()    
-    print()    
-    print("GENERATING QUESTION NUMBER:", q, ":", question)
+    metrics.log(1)    
+    metrics.log(1)    
+    metrics.log(1, "GENERATING QUESTION NUMBER:", q, ":", question)
     groupSuccess=True
     for i,nGroups in enumerate(nGroupsInAnswer):
         attempts=0
@@ -262,8 +283,9 @@ while len(solutionList)<targetQs:
             attempts=0
             while ((success==False) & (attempts<10000)):
                 attempts+=1
+                metrics.count('attempts')
     
-                random.shuffle(questionRandom)
+                rng.shuffle(questionRandom)
                 counter = 0
                 groups = {}
                 digits = sum(nGroups)
@@ -276,59 +298,105 @@ while len(solutionList)<targetQs:
                     if len(selected) == 1: 
                         groups[j]=str(selected[0])
                     else: 
-                        sym = random.choice(symbols) 
+                        sym = rng.choice(symbols) 
                         groups[j]="("+str(selected[0])+sym+str(selected[1])+")"
             
                     sym = ''
                     if j<len(nGroups)-1: 
-                        sym = random.choice(symbols) 
+                        sym = rng.choice(symbols) 
                     calculation+=groups[j]+sym
                     counter+=n
                 
                 try: 
-                    evaluation = eval(calculation)
+                    evaluation = evaluator.evaluate(calculation, exact=False)
                 except:
                    evaluation = -9999 
+                   metrics.reject('calculation does not evaluate')
                    
                 if (evaluation>0) & (int(evaluation)==evaluation) & (int(evaluation)>=nDigitsRangeAnswer[i][0]) & (int(evaluation)<=nDigitsRangeAnswer[i][1]) & (int(evaluation) not in disallowedList) & (evaluation not in evaluations):
                     success=True 
-                    print("EVAL", evaluation)
-                    print("checking min calculation")
-                    minClc = minCalcOrdered(calculation)
-                    print("calc", calculation, "min calc", minClc['calc'], "shorter by", len(calculation)-len(minClc['calc']))
+                    metrics.log(2, "EVAL", evaluation)
+                    metrics.log(2, "checking min calculation")
+                    with metrics.stage('min calc'):
+                        minClc = minCalcOrdered(calculation)
+                    metrics.log(2, "calc", calculation, "min calc", minClc['calc'], "shorter by", len(calculation)-len(minClc['calc']))
                     
                     if (minClc['nDigits']!= digits):
-                        print("******************")
-                        print("******************")
-                        print("*****mis-matched min calc")
-                        print("target digits", digits)
-                        print("minCalc digits", minClc['nDigits'])
-                        print("calculation", calculation)
-                        print("minCalc", minClc['calc'])
-                        sys.exit()
+                        #details go in the error (kept in the quarantine record), not on stdout
+                        raise RuntimeError("mis-matched min calc: target digits %s, minCalc digits %s, calculation %s, minCalc %s"
+                                           % (digits, minClc['nDigits'], calculation, minClc['calc']))
                     calculations+=[minClc['calc']]
                     evaluations+=[[str(int(evaluation))]]
-                else:
-                    pass
+                elif evaluation!=-9999:
+                    metrics.reject('target not allowed')
         
         if success==False:
             groupSuccess=False
-            print("fail at group", i)
+            metrics.reject('no target found for group')
+            metrics.log(1, "fail at group", i)
     
     if groupSuccess:
-        print("Q", q, question, calculations, evaluations)     
-        questionList+=[[str(qu) for qu in question]]
-        calculationList+=[calculations]
-        solutionList+=[evaluations]
-
-       
-fileName = "targets_questions.json"    
-with open('output/'+fileName, 'w') as f:
-        json.dump(questionList, f)
-
-with open('output/'+fileName.replace('_questions.json','_solutions.json'), 'w') as f:
-        json.dump(solutionList, f)
-
-with open('output/'+fileName.replace('_questions.json','_calculations.json'), 'w') as f:
-        json.dump(calculationList, f)
-
+        puzzle = {'question': [str(qu) for qu in question], 'calculations': calculations, 'solutions': evaluations}
+        if duplicateKey(puzzle) in seen:
+            metrics.reject('duplicate puzzle')
+            metrics.log(1, "duplicate game, try again")
+            return(None)
+        metrics.count('puzzles')
+        metrics.log(1, "Q", q, question, calculations, evaluations)     
+        return(puzzle)
+    return(None)
+
+def seededPuzzle(index, batchId, seen=()):
+    #puzzle number index of batch batchId, the same in whichever process (or shard) it is made (see nerdle/seeding.py)
+    #seen: published keys not to repeat (see nerdle/dedupe.py)
+    rng = seeding.puzzleRng('targets', batchId, index)
+    puzzle = None
+    while puzzle is None:
+        puzzle = createPuzzle(index, rng, seen)
+    return(puzzle)
+
+def generate(count=targetQs, seed=None, batchId=None, sink=None, seen=None):
+    #count games (see createPuzzle)
+    #batchId: if given, each game is seeded from its index instead (see seededPuzzle)
+    #sink: JsonlSink (see nerdle/sink.py) - games already in it are kept (resume) and each new one is appended
+    #seen: keys of games not to repeat, eg dedupe.loadIndex('targets') for those already published (see nerdle/dedupe.py)
+    #   without a batchId, games made earlier in this run are not repeated either
+    rng = random.Random(seed)
+    puzzles = [] if sink is None else sink.records()
+    keys = set(seen or ())|set([duplicateKey(p) for p in puzzles])
+    while len(puzzles)<count:
+        if batchId is None:
+            puzzle = quarantine.isolate('targets', lambda: createPuzzle(len(puzzles), rng, keys),
+                                        quarantine.rngInputs(rng, seed=seed, puzzle=len(puzzles)))
+        else:
+            puzzle = quarantine.seeded('targets', lambda i, b: seededPuzzle(i, b, seen or ()), len(puzzles), batchId)
+        if puzzle is not None:
+            puzzles+=[puzzle]
+            keys.add(duplicateKey(puzzle))
+            if sink is not None:
+                sink.append(puzzle)
+    return(puzzles)
+
+def savePuzzles(puzzles, outputDir=None):
+    fileName = os.path.join(outputDir or os.path.join(HERE, 'output'), "targets_questions.json")
+    with open(fileName, 'w') as f:
+            json.dump([p['question'] for p in puzzles], f)
+
+    with open(fileName.replace('_questions.json','_solutions.json'), 'w') as f:
+            json.dump([p['solutions'] for p in puzzles], f)
+
+    with open(fileName.replace('_questions.json','_calculations.json'), 'w') as f:
+            json.dump([p['calculations'] for p in puzzles], f)
+
+
+if __name__ == '__main__':
+    #games are saved as they are made, so an interrupted run carries on where it stopped
+    sink = JsonlSink(os.path.join(HERE, 'output', 'targets.jsonl'), header={'game': 'targets', 'count': targetQs})
+    #games published by earlier runs are not repeated
+    published = dedupe.loadIndex('targets')
+    puzzles = generate(targetQs, sink=sink, seen=published)
+    savePuzzles(puzzles)
+    published.addAll([duplicateKey(p) for p in puzzles])
+    sink.remove()
+    if metrics.enabled:
+        metrics.saveSummary(os.path.join(HERE, 'output', 'targets_metrics.json'), game='targets', count=targetQs)